@@ -0,0 +1,381 @@
+"""Prueba de carga de los seis microservicios con mezcla de operaciones realista.
+
+Arranca los servicios localmente (igual que start-services.sh, con las URLs
+entre servicios apuntando a localhost) o usa los que ya estén corriendo con
+--externos. Durante --duracion segundos, --concurrencia clientes repiten
+escenarios elegidos al azar según la mezcla:
+
+    orden       crear una orden, agregarle de 1 a 5 items y consultarla
+    catalogo    listar productos por categoría o rango de precio y abrir uno
+    escaneo     buscar un producto por código de barras
+    reserva     reservar una unidad en una bodega o en un lote
+    alertas     consultar alertas de vencimiento, órdenes, demanda o certificaciones
+
+Informa por endpoint (con la ruta como plantilla) cantidad, throughput,
+p50/p95/p99 y errores; --salida guarda el resultado en JSON. Con
+--linea-base compara contra un resultado guardado y termina con código 1 si
+algún endpoint empeoró más de --tolerancia (y de --margen-ms) en p95 o p99,
+si el throughput total cayó más de --tolerancia o si aparecieron errores.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/carga.py --duracion 30 --salida linea_base.json
+    python benchmarks/carga.py --duracion 30 --linea-base linea_base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICIOS = {
+    "ms-bodega": 8001,
+    "ms-lote": 8002,
+    "ms-producto": 8003,
+    "ms-proyeccion-demanda": 8004,
+    "ms-orden-compra": 8005,
+    "ms-proveedor": 8006,
+}
+
+MEZCLA_DEFECTO = "orden=1,catalogo=4,escaneo=3,reserva=2,alertas=1"
+
+ALERTAS = (
+    ("ms-lote", "/alertas/vencimiento"),
+    ("ms-orden-compra", "/alertas/ordenes"),
+    ("ms-proyeccion-demanda", "/alertas/demanda"),
+    ("ms-proveedor", "/alertas/certificaciones"),
+)
+
+
+# --- Servicios ---
+
+@contextmanager
+def servicios_locales(host: str, directorio_registros: str, espera: float):
+    """Arrancar los seis servicios como subprocesos y detenerlos al salir"""
+    entorno = dict(os.environ)
+    entorno["PYTHONPATH"] = os.pathsep.join(filter(None, (RAIZ, entorno.get("PYTHONPATH"))))
+    for servicio, puerto in SERVICIOS.items():
+        variable = "MS_" + servicio[3:].upper().replace("-", "_") + "_URL"
+        entorno[variable] = f"http://{host}:{puerto}"
+    procesos = []
+    try:
+        for servicio in SERVICIOS:
+            registro = open(os.path.join(directorio_registros, f"{servicio}.log"), "w")
+            procesos.append((servicio, registro, subprocess.Popen(
+                [sys.executable, "main.py"], cwd=os.path.join(RAIZ, servicio),
+                env=entorno, stdout=registro, stderr=subprocess.STDOUT
+            )))
+        esperar_servicios(host, espera, procesos)
+        yield
+    finally:
+        for _, _, proceso in procesos:
+            proceso.terminate()
+        for _, registro, proceso in procesos:
+            try:
+                proceso.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+            registro.close()
+
+
+def esperar_servicios(host: str, espera: float, procesos=()):
+    """Esperar a que todos los servicios respondan en su endpoint de salud"""
+    limite = time.monotonic() + espera
+    pendientes = dict(SERVICIOS)
+    with httpx.Client(timeout=1.0) as cliente:
+        while pendientes:
+            for _, _, proceso in procesos:
+                if proceso.poll() is not None:
+                    raise RuntimeError(f"Un servicio terminó al arrancar (código {proceso.returncode}); ver sus registros")
+            for servicio, puerto in list(pendientes.items()):
+                try:
+                    if cliente.get(f"http://{host}:{puerto}/").status_code == 200:
+                        del pendientes[servicio]
+                except httpx.HTTPError:
+                    pass
+            if pendientes and time.monotonic() > limite:
+                raise RuntimeError(f"Servicios sin responder: {', '.join(pendientes)}")
+            if pendientes:
+                time.sleep(0.2)
+
+
+# --- Mediciones ---
+
+class Mediciones:
+    """Latencias por endpoint (método y ruta como plantilla)"""
+
+    def __init__(self):
+        self.latencias: Dict[str, List[float]] = {}
+        self.errores: Dict[str, int] = {}
+        self.rechazos: Dict[str, int] = {}
+        self.activo = False
+
+    def registrar(self, endpoint: str, segundos: float, estado: Optional[int]):
+        if not self.activo:
+            return
+        self.latencias.setdefault(endpoint, []).append(segundos * 1000)
+        if estado is None or estado >= 500:
+            self.errores[endpoint] = self.errores.get(endpoint, 0) + 1
+        elif estado >= 400:
+            # Rechazos de negocio esperables bajo carga (p. ej. stock insuficiente al reservar)
+            self.rechazos[endpoint] = self.rechazos.get(endpoint, 0) + 1
+
+    def resumen(self, segundos: float) -> dict:
+        endpoints = {}
+        for endpoint, latencias in sorted(self.latencias.items()):
+            endpoints[endpoint] = estadisticas(latencias, segundos)
+            endpoints[endpoint]["errores"] = self.errores.get(endpoint, 0)
+            endpoints[endpoint]["rechazos"] = self.rechazos.get(endpoint, 0)
+        todas = [latencia for latencias in self.latencias.values() for latencia in latencias]
+        total = estadisticas(todas, segundos)
+        total["errores"] = sum(self.errores.values())
+        total["rechazos"] = sum(self.rechazos.values())
+        return {"total": total, "endpoints": endpoints}
+
+
+def percentil(ordenadas: List[float], p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ordenada"""
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, max(0, round(p / 100 * len(ordenadas)) - 1))]
+
+
+def estadisticas(latencias: List[float], segundos: float) -> dict:
+    ordenadas = sorted(latencias)
+    return {
+        "solicitudes": len(ordenadas),
+        "por_segundo": round(len(ordenadas) / segundos, 2) if segundos else 0.0,
+        "p50_ms": round(percentil(ordenadas, 50), 2),
+        "p95_ms": round(percentil(ordenadas, 95), 2),
+        "p99_ms": round(percentil(ordenadas, 99), 2),
+        "max_ms": round(ordenadas[-1], 2) if ordenadas else 0.0,
+    }
+
+
+# --- Escenarios ---
+
+class Carga:
+    """Escenarios sobre los datos descubiertos en los servicios"""
+
+    def __init__(self, cliente: httpx.AsyncClient, host: str, mediciones: Mediciones, azar: random.Random):
+        self.cliente = cliente
+        self.urls = {servicio: f"http://{host}:{puerto}" for servicio, puerto in SERVICIOS.items()}
+        self.mediciones = mediciones
+        self.azar = azar
+        self.productos: List[dict] = []
+        self.bodegas: List[str] = []
+        self.lotes: List[str] = []
+        self.proveedores: List[str] = []
+
+    async def pedir(self, servicio: str, metodo: str, ruta: str, plantilla: Optional[str] = None, **opciones):
+        """Hacer la solicitud y registrar su latencia bajo "MÉTODO plantilla" """
+        inicio = time.perf_counter()
+        estado = None
+        try:
+            respuesta = await self.cliente.request(metodo, self.urls[servicio] + ruta, **opciones)
+            estado = respuesta.status_code
+            return respuesta
+        except httpx.HTTPError:
+            return None
+        finally:
+            self.mediciones.registrar(f"{metodo} {servicio}{plantilla or ruta}", time.perf_counter() - inicio, estado)
+
+    async def descubrir(self, muestra: int):
+        """Leer IDs y productos existentes para armar las solicitudes"""
+        async def ids(servicio: str, ruta: str) -> List[dict]:
+            respuesta = await self.cliente.get(self.urls[servicio] + ruta, params={"limit": muestra})
+            respuesta.raise_for_status()
+            return respuesta.json()[:muestra]
+
+        productos, bodegas, lotes, proveedores = await asyncio.gather(
+            ids("ms-producto", "/productos"), ids("ms-bodega", "/bodegas"),
+            ids("ms-lote", "/lotes"), ids("ms-proveedor", "/proveedores")
+        )
+        self.productos = productos
+        self.bodegas = [b["id"] for b in bodegas]
+        # Reservar de lotes vencidos o agotados solo mide rechazos
+        hoy = date.today().isoformat()
+        vigentes = [l["id"] for l in lotes if l["fecha_vencimiento"] >= hoy and l["cantidad_disponible"] > 0]
+        self.lotes = vigentes or [l["id"] for l in lotes]
+        self.proveedores = [p["id"] for p in proveedores]
+        if not self.productos or not self.proveedores:
+            raise RuntimeError("Se necesitan productos y proveedores cargados para la prueba de carga")
+
+    async def orden(self):
+        respuesta = await self.pedir("ms-orden-compra", "POST", "/ordenes", json={
+            "id_proveedor": self.azar.choice(self.proveedores),
+            "tipo_orden": self.azar.choice(("regular", "urgente")),
+            "fecha_requerida": (date.today() + timedelta(days=self.azar.randint(7, 60))).isoformat(),
+        })
+        if respuesta is None or respuesta.status_code != 200:
+            return
+        orden_id = respuesta.json()["id"]
+        for _ in range(self.azar.randint(1, 5)):
+            producto = self.azar.choice(self.productos)
+            await self.pedir("ms-orden-compra", "POST", f"/ordenes/{orden_id}/items", "/ordenes/{orden_id}/items", json={
+                "id_producto": producto["id"],
+                "cantidad": self.azar.randint(1, 100),
+                "precio_unitario": str(producto["precio_unitario"]),
+            })
+        await self.pedir("ms-orden-compra", "GET", f"/ordenes/{orden_id}", "/ordenes/{orden_id}")
+
+    async def catalogo(self):
+        producto = self.azar.choice(self.productos)
+        if self.azar.random() < 0.5:
+            params = {"categoria": producto["categoria"], "limit": 20}
+        else:
+            precio = float(producto["precio_unitario"])
+            params = {"precio_min": precio * 0.5, "precio_max": precio * 2, "sort": "precio", "limit": 20}
+        await self.pedir("ms-producto", "GET", "/productos", params=params)
+        await self.pedir("ms-producto", "GET", f"/productos/{producto['id']}", "/productos/{producto_id}")
+
+    async def escaneo(self):
+        codigos = [p["codigo_barras"] for p in self.productos if p.get("codigo_barras")]
+        codigo = self.azar.choice(codigos) if codigos else "0000000000000"
+        await self.pedir(
+            "ms-producto", "GET", f"/productos/buscar/codigo-barras/{codigo}",
+            "/productos/buscar/codigo-barras/{codigo_barras}"
+        )
+
+    async def reserva(self):
+        if self.lotes and (not self.bodegas or self.azar.random() < 0.5):
+            lote_id = self.azar.choice(self.lotes)
+            await self.pedir("ms-lote", "PATCH", f"/lotes/{lote_id}/reservar/1", "/lotes/{lote_id}/reservar/{cantidad}")
+        elif self.bodegas:
+            bodega_id = self.azar.choice(self.bodegas)
+            await self.pedir("ms-bodega", "PATCH", f"/bodegas/{bodega_id}/reservar/1", "/bodegas/{bodega_id}/reservar/{cantidad}")
+
+    async def alertas(self):
+        servicio, ruta = self.azar.choice(ALERTAS)
+        await self.pedir(servicio, "GET", ruta)
+
+
+async def cliente_carga(carga: Carga, escenarios: List[str], pesos: List[float], fin: float):
+    while time.monotonic() < fin:
+        await getattr(carga, carga.azar.choices(escenarios, pesos)[0])()
+
+
+async def ejecutar(args) -> dict:
+    mezcla = dict(parte.split("=") for parte in args.mezcla.split(","))
+    escenarios = [nombre for nombre in mezcla if float(mezcla[nombre]) > 0]
+    desconocidos = [nombre for nombre in escenarios if not hasattr(Carga, nombre)]
+    if desconocidos:
+        raise SystemExit(f"Escenarios desconocidos en la mezcla: {', '.join(desconocidos)}")
+    pesos = [float(mezcla[nombre]) for nombre in escenarios]
+
+    mediciones = Mediciones()
+    limites = httpx.Limits(max_connections=args.concurrencia * 2, max_keepalive_connections=args.concurrencia * 2)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limites) as cliente:
+        cargas = [Carga(cliente, args.host, mediciones, random.Random(args.semilla + i)) for i in range(args.concurrencia)]
+        await cargas[0].descubrir(args.muestra)
+        for carga in cargas[1:]:
+            carga.productos, carga.bodegas = cargas[0].productos, cargas[0].bodegas
+            carga.lotes, carga.proveedores = cargas[0].lotes, cargas[0].proveedores
+
+        if args.calentamiento:
+            fin = time.monotonic() + args.calentamiento
+            await asyncio.gather(*(cliente_carga(c, escenarios, pesos, fin) for c in cargas))
+
+        mediciones.activo = True
+        inicio = time.monotonic()
+        await asyncio.gather(*(cliente_carga(c, escenarios, pesos, inicio + args.duracion) for c in cargas))
+        segundos = time.monotonic() - inicio
+        mediciones.activo = False
+
+    resultado = mediciones.resumen(segundos)
+    resultado["parametros"] = {
+        "duracion": args.duracion, "concurrencia": args.concurrencia, "mezcla": args.mezcla, "semilla": args.semilla,
+    }
+    resultado["fecha"] = datetime.now().isoformat(timespec="seconds")
+    return resultado
+
+
+# --- Informe y comparación ---
+
+def imprimir(resultado: dict):
+    encabezado = f"{'endpoint':<62} {'n':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5} {'rech':>5}"
+    print(encabezado)
+    print("-" * len(encabezado))
+    filas = list(resultado["endpoints"].items()) + [("TOTAL", resultado["total"])]
+    for endpoint, e in filas:
+        print(
+            f"{endpoint:<62} {e['solicitudes']:>7} {e['por_segundo']:>8.1f} {e['p50_ms']:>8.2f} "
+            f"{e['p95_ms']:>8.2f} {e['p99_ms']:>8.2f} {e['errores']:>5} {e['rechazos']:>5}"
+        )
+
+
+def comparar(resultado: dict, linea_base: dict, tolerancia: float, margen_ms: float) -> List[str]:
+    """Regresiones respecto de la línea base (vacío si no hay)"""
+    regresiones = []
+    for endpoint, actual in resultado["endpoints"].items():
+        base = linea_base["endpoints"].get(endpoint)
+        if base is None:
+            continue
+        for metrica in ("p95_ms", "p99_ms"):
+            if actual[metrica] > base[metrica] * (1 + tolerancia) and actual[metrica] - base[metrica] > margen_ms:
+                regresiones.append(f"{endpoint}: {metrica} {base[metrica]} -> {actual[metrica]}")
+        if actual["errores"] > base.get("errores", 0):
+            regresiones.append(f"{endpoint}: errores {base.get('errores', 0)} -> {actual['errores']}")
+    total, base_total = resultado["total"], linea_base["total"]
+    if total["por_segundo"] < base_total["por_segundo"] * (1 - tolerancia):
+        regresiones.append(f"throughput total {base_total['por_segundo']} -> {total['por_segundo']} req/s")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duracion", type=float, default=30, help="Segundos medidos")
+    parser.add_argument("--calentamiento", type=float, default=5, help="Segundos de carga previa sin medir")
+    parser.add_argument("--concurrencia", type=int, default=16, help="Clientes simultáneos")
+    parser.add_argument("--mezcla", default=MEZCLA_DEFECTO, help="Pesos de los escenarios (nombre=peso,...)")
+    parser.add_argument("--semilla", type=int, default=1, help="Semilla de la elección de escenarios y datos")
+    parser.add_argument("--muestra", type=int, default=500, help="Registros leídos de cada servicio para armar solicitudes")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Timeout por solicitud en segundos")
+    parser.add_argument("--host", default="127.0.0.1", help="Host de los servicios")
+    parser.add_argument("--externos", action="store_true", help="Usar servicios ya iniciados en vez de arrancarlos")
+    parser.add_argument("--espera", type=float, default=60, help="Segundos máximos para que respondan los servicios")
+    parser.add_argument("--registros", help="Directorio para la salida de los servicios (por defecto uno temporal)")
+    parser.add_argument("--salida", help="Archivo JSON donde guardar el resultado")
+    parser.add_argument("--linea-base", help="Resultado JSON guardado contra el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Empeoramiento relativo admitido")
+    parser.add_argument("--margen-ms", type=float, default=2.0, help="Empeoramiento absoluto de p95/p99 que se ignora")
+    args = parser.parse_args()
+
+    if args.externos:
+        esperar_servicios(args.host, args.espera)
+        resultado = asyncio.run(ejecutar(args))
+    else:
+        directorio = args.registros or tempfile.mkdtemp(prefix="carga-")
+        os.makedirs(directorio, exist_ok=True)
+        print(f"Registros de los servicios en {directorio}")
+        with servicios_locales(args.host, directorio, args.espera):
+            resultado = asyncio.run(ejecutar(args))
+
+    imprimir(resultado)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+    if args.linea_base:
+        with open(args.linea_base, "r", encoding="utf-8") as f:
+            regresiones = comparar(resultado, json.load(f), args.tolerancia, args.margen_ms)
+        if regresiones:
+            print("\nRegresiones respecto de la línea base:")
+            for regresion in regresiones:
+                print(f"  {regresion}")
+            sys.exit(1)
+        print("\nSin regresiones respecto de la línea base")
+
+
+if __name__ == "__main__":
+    main()
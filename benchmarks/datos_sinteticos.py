@@ -0,0 +1,558 @@
+"""Generador determinista de datos sintéticos para pruebas a escala.
+
+Produce datos consistentes entre los seis servicios: los lotes están en
+bodegas existentes y son del producto de esa bodega, las órdenes son de
+proveedores existentes con items de productos existentes y las proyecciones
+son de productos existentes. Con la misma semilla y --fecha-base el resultado
+es idéntico byte a byte.
+
+Distribuciones:
+- Popularidad de productos, bodegas y proveedores tipo Zipf: pocos concentran
+  la mayoría de lotes, items, órdenes y demanda.
+- Antigüedad de los lotes sesgada hacia lotes frescos según la vida útil del
+  producto, con una cola de lotes ya vencidos (~5%) y por vencer.
+- Cantidades y precios log-normales; estados de las órdenes según su antigüedad
+  con fechas de aprobación, envío y recepción coherentes.
+- Demanda diaria por producto proporcional a su popularidad, con estacionalidad
+  semanal, tendencia y picos ocasionales; los productos poco populares tienen
+  demanda intermitente (muchos días en cero).
+
+Los atributos de cada entidad se derivan de su índice con un hash, así que
+las referencias no obligan a tener los datos en memoria: la memoria no depende
+del tamaño pedido.
+
+Salidas:
+    --salida DIR   DIR/<servicio>/test_data.json en el formato de los cargadores
+    --importar     NDJSON en streaming a POST /<recurso>/importar (bodegas,
+                   lotes, productos, proveedores) y la demanda en bloques a
+                   POST /historial/demanda; órdenes y proyecciones no tienen
+                   importación y solo se escriben con --salida
+
+La demanda se escribe en DIR/ms-proyeccion-demanda/historial_demanda.json
+(registros del formato de POST /historial/demanda) y cubre los --dias-historial
+días que terminan en --fecha-base.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/datos_sinteticos.py --productos 100000 --salida /tmp/datos
+    python benchmarks/datos_sinteticos.py --productos 1000000 --importar --host 127.0.0.1
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import struct
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from statistics import NormalDist
+from typing import Callable, Dict, Iterable, Iterator, Tuple
+
+from carga import SERVICIOS
+
+NORMAL = NormalDist()
+
+# Cantidad de cada entidad por producto (se redondea y nunca baja de minimo)
+PROPORCIONES = {
+    "productos": (1.0, 1),
+    "proveedores": (0.02, 10),
+    "bodegas": (0.2, 5),
+    "lotes": (3.0, 1),
+    "ordenes": (2.0, 1),
+    "proyecciones": (1.0, 1),
+}
+
+# Recurso de importación y servicio de cada entidad
+DESTINOS = {
+    "proveedores": ("ms-proveedor", "/proveedores/importar"),
+    "productos": ("ms-producto", "/productos/importar"),
+    "bodegas": ("ms-bodega", "/bodegas/importar"),
+    "lotes": ("ms-lote", "/lotes/importar"),
+    "ordenes": ("ms-orden-compra", None),
+    "proyecciones": ("ms-proyeccion-demanda", None),
+    "demanda": ("ms-proyeccion-demanda", "/historial/demanda"),
+}
+ARCHIVO_DEMANDA = "historial_demanda.json"
+
+# Multiplicador de la demanda por día de la semana (lunes a domingo)
+SEMANA = (0.9, 0.85, 0.9, 1.0, 1.2, 1.35, 0.8)
+
+# categoría -> (nombres base, unidades, precio mediano, vida útil típica en días, fracción refrigerada)
+CATEGORIAS = {
+    "alimentos": (("Arroz", "Pasta", "Harina", "Avena", "Lentejas"), ("kg", "paquetes"), 3.0, 365, 0.0),
+    "bebidas": (("Jugo", "Agua", "Gaseosa", "Té frío", "Bebida energética"), ("l", "ml", "cajas"), 2.0, 270, 0.1),
+    "lacteos": (("Leche", "Yogur", "Queso", "Mantequilla", "Kumis"), ("l", "kg", "unidades"), 2.5, 21, 1.0),
+    "carnes": (("Pechuga", "Carne molida", "Lomo", "Chorizo", "Costilla"), ("kg",), 8.0, 10, 1.0),
+    "vegetales": (("Tomate", "Cebolla", "Zanahoria", "Lechuga", "Papa"), ("kg", "unidades"), 1.5, 14, 0.4),
+    "frutas": (("Banano", "Manzana", "Mango", "Fresa", "Naranja"), ("kg", "unidades"), 2.0, 12, 0.3),
+    "congelados": (("Helado", "Vegetales mixtos", "Pescado", "Papas prefritas", "Pizza"), ("kg", "cajas"), 6.0, 180, 1.0),
+    "secos": (("Café", "Azúcar", "Sal", "Galletas", "Cereal"), ("kg", "g", "paquetes"), 4.0, 540, 0.0),
+    "otros": (("Paracetamol", "Ibuprofeno", "Alcohol", "Jabón", "Vitamina C"), ("unidades", "cajas", "ml"), 1.0, 730, 0.05),
+}
+NOMBRES_CATEGORIA = tuple(CATEGORIAS)
+PESOS_CATEGORIA = (18, 12, 10, 8, 10, 10, 7, 15, 10)
+VARIANTES = ("Clásico", "Premium", "Económico", "Orgánico", "Light", "Familiar", "Extra", "Natural")
+ESPECIALIDADES = {
+    "alimentos": "abarrotes", "bebidas": "bebidas", "lacteos": "lácteos", "carnes": "cárnicos",
+    "vegetales": "hortalizas", "frutas": "frutas", "congelados": "congelados", "secos": "abarrotes",
+    "otros": "farmacéuticos",
+}
+
+# (ciudad, país, latitud, longitud, peso)
+CIUDADES = (
+    ("Bogotá", "Colombia", 4.711, -74.0721, 30), ("Medellín", "Colombia", 6.2442, -75.5812, 15),
+    ("Cali", "Colombia", 3.4516, -76.532, 10), ("Barranquilla", "Colombia", 10.9685, -74.7813, 7),
+    ("Bucaramanga", "Colombia", 7.1193, -73.1227, 5), ("Lima", "Perú", -12.0464, -77.0428, 8),
+    ("Quito", "Ecuador", -0.1807, -78.4678, 6), ("Ciudad de México", "México", 19.4326, -99.1332, 8),
+    ("Santiago", "Chile", -33.4489, -70.6693, 5), ("Panamá", "Panamá", 8.9824, -79.5199, 3),
+    ("Valparaíso", "Chile", -33.0472, -71.6127, 3),
+)
+PESOS_CIUDAD = tuple(c[4] for c in CIUDADES)
+
+# Estado de una orden según sus días de antigüedad: (hasta_dias, [(estado, peso)])
+ESTADOS_POR_ANTIGUEDAD = (
+    (3, (("borrador", 50), ("pendiente", 30), ("aprobada", 20))),
+    (15, (("borrador", 10), ("pendiente", 15), ("aprobada", 25), ("enviada", 40), ("cancelada", 10))),
+    (math.inf, (("borrador", 3), ("enviada", 7), ("recibida", 80), ("cancelada", 10))),
+)
+
+
+# --- Derivación determinista por índice ---
+
+def uniformes(semilla: int, clave: str, indice: int) -> Tuple[float, ...]:
+    """Cuatro números en [0, 1) que dependen solo de la semilla, la clave y el índice"""
+    resumen = hashlib.blake2b(f"{semilla}:{clave}:{indice}".encode(), digest_size=32).digest()
+    return tuple(n / 2 ** 64 for n in struct.unpack("<4Q", resumen))
+
+
+def identificador(semilla: int, tipo: str, indice: int) -> str:
+    resumen = hashlib.blake2b(f"{semilla}:id:{tipo}:{indice}".encode(), digest_size=16).digest()
+    return str(uuid.UUID(bytes=resumen, version=4))
+
+
+def elegir(opciones, pesos, u: float):
+    """Opción con probabilidad proporcional a su peso, a partir de u en [0, 1)"""
+    objetivo = u * sum(pesos)
+    for opcion, peso in zip(opciones, pesos):
+        objetivo -= peso
+        if objetivo < 0:
+            return opcion
+    return opciones[-1]
+
+
+def lognormal(mediana: float, sigma: float, u: float) -> float:
+    return mediana * math.exp(sigma * NORMAL.inv_cdf(min(max(u, 1e-12), 1 - 1e-12)))
+
+
+def codigo_ean13(indice: int) -> str:
+    """EAN-13 con prefijo 770 (Colombia) y dígito de control"""
+    base = f"770{indice:09d}"
+    suma = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(base))
+    return base + str((10 - suma % 10) % 10)
+
+
+class Zipf:
+    """Índices en [0, n) con frecuencia ~ 1 / rango^s.
+
+    Los rangos se reparten entre los índices con una permutación fija
+    (multiplicación por un paso coprimo con n), para que los más populares
+    no sean siempre los primeros.
+    """
+
+    def __init__(self, n: int, s: float = 1.1):
+        self.n = n
+        self.s = s
+        self._a = n ** (1 - s) - 1
+        paso = max(1, int(n * 0.6180339887)) | 1
+        while math.gcd(paso, n) != 1:
+            paso += 2
+        self._paso = paso % n if n > 1 else 0
+        self._inverso = pow(self._paso, -1, n) if n > 1 else 0
+
+    def indice(self, u: float) -> int:
+        rango = min(self.n, int((1 + u * self._a) ** (1 / (1 - self.s))))
+        return ((rango - 1) * self._paso) % self.n
+
+    def peso(self, indice: int) -> float:
+        """Peso relativo del índice (1.0 para el más popular)"""
+        rango = (indice * self._inverso) % self.n + 1 if self.n > 1 else 1
+        return rango ** -self.s
+
+
+# --- Entidades ---
+
+class Generador:
+    def __init__(self, semilla: int, fecha_base: date, cantidades: Dict[str, int], dias_historial: int = 365):
+        self.semilla = semilla
+        self.hoy = fecha_base
+        self.dias_historial = dias_historial
+        self.ahora = datetime.combine(fecha_base, datetime.min.time()).replace(hour=12)
+        self.cantidades = cantidades
+        self.popularidad_productos = Zipf(cantidades["productos"])
+        self.popularidad_bodegas = Zipf(cantidades["bodegas"], 0.9)
+        self.popularidad_proveedores = Zipf(cantidades["proveedores"], 1.05)
+
+    def azar(self, entidad: str) -> random.Random:
+        return random.Random(f"{self.semilla}:{entidad}")
+
+    @lru_cache(maxsize=1 << 16)
+    def producto(self, indice: int) -> dict:
+        u = uniformes(self.semilla, "producto", indice)
+        categoria = elegir(NOMBRES_CATEGORIA, PESOS_CATEGORIA, u[0])
+        nombres, unidades, precio, vida_util, refrigerada = CATEGORIAS[categoria]
+        nombre = nombres[int(u[1] * len(nombres))]
+        variante = VARIANTES[int(u[2] * len(VARIANTES))]
+        return {
+            "id": identificador(self.semilla, "producto", indice),
+            "nombre": f"{nombre} {variante} {indice + 1}",
+            "descripcion": f"{nombre} {variante.lower()} ({categoria})",
+            "categoria": categoria,
+            "unidad_medida": unidades[int(u[3] * len(unidades))],
+            "precio_unitario": round(lognormal(precio, 0.6, u[1] * 7 % 1), 2),
+            "codigo_barras": codigo_ean13(indice),
+            "peso_unitario": round(lognormal(0.5, 0.8, u[2] * 11 % 1), 3),
+            "requiere_refrigeracion": u[3] * 13 % 1 < refrigerada,
+            "vida_util_dias": max(3, int(lognormal(vida_util, 0.3, u[0] * 17 % 1))),
+        }
+
+    def productos(self) -> Iterator[dict]:
+        for indice in range(self.cantidades["productos"]):
+            yield self.producto(indice)
+
+    @lru_cache(maxsize=1 << 16)
+    def bodega(self, indice: int) -> dict:
+        u = uniformes(self.semilla, "bodega", indice)
+        ciudad, pais, latitud, longitud, _ = elegir(CIUDADES, PESOS_CIUDAD, u[0])
+        id_producto = self.producto(self._indice_producto_bodega(indice))["id"]
+        capacidad = int(lognormal(2000, 0.7, u[2]))
+        reservada = int(capacidad * u[3] * 0.2)
+        return {
+            "id": identificador(self.semilla, "bodega", indice),
+            "nombre": f"Bodega {ciudad} {indice + 1}",
+            "capacidad": capacidad,
+            "ubicacion_geografica": {
+                "latitud": round(latitud + (u[1] - 0.5) * 0.2, 4),
+                "longitud": round(longitud + (u[2] - 0.5) * 0.2, 4),
+                "direccion": f"Calle {int(u[3] * 150) + 1} #{int(u[0] * 90) + 1}-{int(u[1] * 99) + 1}",
+                "ciudad": ciudad,
+                "pais": pais,
+            },
+            "cantidad_disponible": capacidad - reservada,
+            "cantidad_reservada": reservada,
+            "cantidad_vendida": 0,
+            "id_producto": id_producto,
+        }
+
+    def bodegas(self) -> Iterator[dict]:
+        for indice in range(self.cantidades["bodegas"]):
+            yield self.bodega(indice)
+
+    def lotes(self) -> Iterator[dict]:
+        azar = self.azar("lotes")
+        for indice in range(self.cantidades["lotes"]):
+            indice_bodega = self.popularidad_bodegas.indice(azar.random())
+            bodega = self.bodega(indice_bodega)
+            # Cada lote es del producto que guarda su bodega
+            producto = self.producto(self._indice_producto_bodega(indice_bodega))
+            vida_util = producto["vida_util_dias"]
+            # Más lotes frescos que viejos; ~7% ya pasó su vida útil
+            antiguedad = int(vida_util * 1.15 * azar.random() ** 1.8)
+            inicial = max(1, int(lognormal(200, 0.9, azar.random())))
+            consumido = min(1.0, antiguedad / vida_util) * azar.random()
+            if producto["requiere_refrigeracion"]:
+                tipo = "congelado" if producto["categoria"] == "congelados" else "refrigerado"
+                temperatura = -18.0 if tipo == "congelado" else round(azar.uniform(2, 6), 1)
+            else:
+                tipo = "seco" if producto["categoria"] in ("secos", "alimentos") else "ambiente"
+                temperatura = round(azar.uniform(15, 25), 1)
+            yield {
+                "id": identificador(self.semilla, "lote", indice),
+                "fecha_vencimiento": (self.hoy - timedelta(days=antiguedad) + timedelta(days=vida_util)).isoformat(),
+                "tipo_almacenamiento": tipo,
+                "cantidad_inicial": inicial,
+                "cantidad_disponible": inicial - int(inicial * consumido),
+                "cantidad_reservada": 0,
+                "cantidad_vendida": int(inicial * consumido),
+                "id_producto": producto["id"],
+                "id_bodega": bodega["id"],
+                "temperatura_optima": temperatura,
+                "humedad_optima": round(azar.uniform(40, 70), 1),
+            }
+
+    @lru_cache(maxsize=1 << 16)
+    def _indice_producto_bodega(self, indice_bodega: int) -> int:
+        u = uniformes(self.semilla, "bodega", indice_bodega)
+        return self.popularidad_productos.indice(u[1])
+
+    @lru_cache(maxsize=1 << 16)
+    def proveedor(self, indice: int) -> dict:
+        u = uniformes(self.semilla, "proveedor", indice)
+        ciudad, pais, _, _, _ = elegir(CIUDADES, PESOS_CIUDAD, u[0])
+        categorias = sorted({elegir(NOMBRES_CATEGORIA, PESOS_CATEGORIA, (u[1] * k) % 1) for k in (1, 3, 7)})
+        especialidades = sorted({ESPECIALIDADES[c] for c in categorias[:1 + int(u[2] * len(categorias))]})
+        return {
+            "id": identificador(self.semilla, "proveedor", indice),
+            "nombre": f"Distribuidora {ciudad} {indice + 1} S.A.S.",
+            "email": f"contacto{indice + 1}@proveedor{indice + 1}.example.com",
+            "telefono": f"+57 {int(u[3] * 9) + 1} {int(u[1] * 9_000_000) + 1_000_000}",
+            "direccion": f"Carrera {int(u[2] * 100) + 1} #{int(u[3] * 80) + 1}-{int(u[0] * 99) + 1}",
+            "ciudad": ciudad,
+            "pais": pais,
+            "nit_rut": f"9{indice:08d}-{indice % 10}",
+            "persona_contacto": f"Contacto {indice + 1}",
+            "especialidades": especialidades,
+            "condiciones_entrega": {
+                "tiempo_entrega": max(1, int(lognormal(4, 0.6, u[3]))),
+                "cantidad_minima": int(lognormal(50, 0.8, u[2] * 5 % 1)),
+                "costo_envio": round(lognormal(80, 0.5, u[1] * 3 % 1), 2),
+                "area_cobertura": "Nacional" if u[0] * 7 % 1 < 0.6 else "Regional",
+                "restricciones": [],
+            },
+            "estado": elegir(("activo", "pendiente", "inactivo", "suspendido"), (85, 8, 5, 2), u[2] * 13 % 1),
+        }
+
+    def proveedores(self) -> Iterator[dict]:
+        for indice in range(self.cantidades["proveedores"]):
+            yield self.proveedor(indice)
+
+    def ordenes(self) -> Iterator[dict]:
+        azar = self.azar("ordenes")
+        for indice in range(self.cantidades["ordenes"]):
+            proveedor = self.proveedor(self.popularidad_proveedores.indice(azar.random()))
+            plazo = proveedor["condiciones_entrega"]["tiempo_entrega"]
+            antiguedad = min(730, int(azar.expovariate(1 / 90)))
+            fecha_orden = self.hoy - timedelta(days=antiguedad)
+            estado = elegir(*zip(*next(e for hasta, e in ESTADOS_POR_ANTIGUEDAD if antiguedad <= hasta)), azar.random())
+            orden = {
+                "id": identificador(self.semilla, "orden", indice),
+                "numero_orden": f"OC{indice + 1:06d}",
+                "id_proveedor": proveedor["id"],
+                "tipo_orden": "urgente" if azar.random() < 0.15 else "regular",
+                "estado": estado,
+                "fecha_orden": fecha_orden.isoformat(),
+                "fecha_requerida": (fecha_orden + timedelta(days=plazo + azar.randint(0, 10))).isoformat(),
+                "observaciones": None,
+                "direccion_entrega": proveedor["direccion"],
+                "fecha_aprobacion": None,
+                "fecha_envio": None,
+                "fecha_recepcion": None,
+            }
+            if estado in ("aprobada", "enviada", "recibida"):
+                aprobacion = self.ahora - timedelta(days=antiguedad) + timedelta(hours=azar.randint(1, 48))
+                orden["fecha_aprobacion"] = aprobacion.isoformat()
+                if estado in ("enviada", "recibida"):
+                    envio = aprobacion + timedelta(hours=azar.randint(12, 96))
+                    orden["fecha_envio"] = envio.isoformat()
+                    if estado == "recibida":
+                        # Entrega alrededor del plazo del proveedor, con atrasos ocasionales
+                        recepcion = envio + timedelta(days=max(0, round(plazo * lognormal(1, 0.35, azar.random()))))
+                        orden["fecha_recepcion"] = min(recepcion, self.ahora).isoformat()
+            items = []
+            for _ in range(min(20, 1 + int(azar.expovariate(1 / 2)))):
+                producto = self.producto(self.popularidad_productos.indice(azar.random()))
+                cantidad = max(1, int(lognormal(40, 1.0, azar.random())))
+                precio = round(producto["precio_unitario"] * azar.uniform(0.85, 1.0), 2)
+                descuento = elegir((0, 5, 10), (70, 20, 10), azar.random())
+                subtotal = round(precio * cantidad, 2)
+                items.append({
+                    "id": identificador(self.semilla, f"item:{indice}", len(items)),
+                    "id_producto": producto["id"],
+                    "cantidad": cantidad,
+                    "precio_unitario": precio,
+                    "descuento_porcentaje": descuento,
+                    "subtotal": subtotal,
+                    "total_item": round(subtotal * (1 - descuento / 100), 2),
+                })
+            subtotal = round(sum(item["total_item"] for item in items), 2)
+            orden.update({
+                "subtotal": subtotal,
+                "descuento_total": round(sum(item["subtotal"] - item["total_item"] for item in items), 2),
+                "impuestos": round(subtotal * 0.19, 2),
+                "total": round(subtotal * 1.19, 2),
+                "items": items,
+            })
+            yield orden
+
+    def proyecciones(self) -> Iterator[dict]:
+        azar = self.azar("proyecciones")
+        inicio_mes = self.hoy.replace(day=1)
+        productos = self.cantidades["productos"]
+        for indice in range(self.cantidades["proyecciones"]):
+            indice_producto = indice % productos
+            producto = self.producto(indice_producto)
+            tipo = elegir(("semanal", "mensual", "trimestral", "anual"), (15, 55, 20, 10), azar.random())
+            dias = {"semanal": 7, "mensual": 30, "trimestral": 91, "anual": 365}[tipo]
+            inicio = inicio_mes + timedelta(days=30 * azar.randint(-3, 3))
+            # Demanda diaria proporcional a la popularidad del producto
+            diaria = 500 * self.popularidad_productos.peso(indice_producto) * lognormal(1, 0.4, azar.random())
+            yield {
+                "id": identificador(self.semilla, "proyeccion", indice),
+                "id_producto": producto["id"],
+                "fecha_inicio": inicio.isoformat(),
+                "fecha_fin": (inicio + timedelta(days=dias - 1)).isoformat(),
+                "tipo_proyeccion": tipo,
+                "demanda_estimada": max(1, round(diaria * dias)),
+                "unidades": producto["unidad_medida"],
+                "metodologia": elegir(("historico", "media_movil", "holt_winters", "croston"), (40, 25, 25, 10), azar.random()),
+                "factores_considerados": ["tendencia", "estacionalidad"] if azar.random() < 0.6 else ["tendencia"],
+                "confianza_porcentaje": round(azar.uniform(60, 98), 1),
+                "estado": elegir(("activa", "borrador", "archivada"), (60, 25, 15), azar.random()),
+            }
+
+    def demanda(self) -> Iterator[dict]:
+        """Demanda real diaria de cada producto, producto por producto; se omiten los días sin demanda"""
+        desde = self.hoy - timedelta(days=self.dias_historial - 1)
+        for indice in range(self.cantidades["productos"]):
+            producto = self.producto(indice)
+            # Cada producto tiene su propio generador: la serie no depende de los demás
+            azar = random.Random(f"{self.semilla}:demanda:{indice}")
+            media = 500 * self.popularidad_productos.peso(indice) * lognormal(1, 0.4, azar.random())
+            # Por debajo de ~2 unidades diarias la demanda es intermitente: pocos días con pedidos más grandes
+            probabilidad = min(1.0, media / 2)
+            tendencia = azar.uniform(-0.3, 0.5) / self.dias_historial
+            amplitud = azar.uniform(0.2, 1.0)
+            for dia in range(self.dias_historial):
+                if azar.random() >= probabilidad:
+                    continue
+                fecha = desde + timedelta(days=dia)
+                nivel = media / probabilidad * (1 + tendencia * dia) * (1 + amplitud * (SEMANA[fecha.weekday()] - 1))
+                # Picos ocasionales (promociones, pedidos grandes)
+                if azar.random() < 0.02:
+                    nivel *= azar.uniform(2, 5)
+                cantidad = poisson(azar, nivel)
+                if cantidad:
+                    yield {"id_producto": producto["id"], "fecha": fecha.isoformat(), "cantidad": cantidad}
+
+
+def poisson(azar: random.Random, media: float) -> int:
+    """Cantidad con distribución de Poisson; aproximación normal para medias grandes"""
+    if media > 30:
+        return max(0, round(azar.gauss(media, math.sqrt(media))))
+    limite, k, producto = math.exp(-media), 0, azar.random()
+    while producto > limite:
+        k += 1
+        producto *= azar.random()
+    return k
+
+
+# --- Salidas ---
+
+def escribir_json(ruta: str, registros: Iterable[dict]) -> int:
+    """Arreglo JSON con un registro por línea, escrito a medida que se generan"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    cantidad = 0
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write("[")
+        for registro in registros:
+            f.write(",\n" if cantidad else "\n")
+            f.write(json.dumps(registro, ensure_ascii=False))
+            cantidad += 1
+        f.write("\n]\n")
+    return cantidad
+
+
+def importar(url: str, registros: Iterable[dict], tamano_lote: int, timeout: float) -> dict:
+    """Enviar los registros como NDJSON en streaming al endpoint de importación"""
+    import httpx
+
+    def cuerpo() -> Iterator[bytes]:
+        bloque = []
+        for registro in registros:
+            bloque.append(json.dumps(registro, ensure_ascii=False))
+            if len(bloque) == 1000:
+                yield ("\n".join(bloque) + "\n").encode()
+                bloque = []
+        if bloque:
+            yield ("\n".join(bloque) + "\n").encode()
+
+    respuesta = httpx.post(
+        url, content=cuerpo(), params={"tamano_lote": tamano_lote, "max_errores": 10},
+        headers={"Content-Type": "application/x-ndjson"}, timeout=timeout
+    )
+    respuesta.raise_for_status()
+    return respuesta.json()
+
+
+def enviar_demanda(url: str, registros: Iterable[dict], tamano_bloque: int, timeout: float) -> dict:
+    """Enviar la demanda a POST /historial/demanda en bloques de tamano_bloque registros"""
+    import httpx
+
+    resumen = {"registros": 0, "bloques": 0, "proyecciones_conciliadas": 0}
+    with httpx.Client(timeout=timeout) as cliente:
+        bloque = []
+        for registro in itertools.chain(registros, [None]):
+            if registro is not None:
+                bloque.append(registro)
+                if len(bloque) < tamano_bloque:
+                    continue
+            if not bloque:
+                break
+            # acumular=False reemplaza el valor del día: volver a enviar no duplica la demanda
+            respuesta = cliente.post(url, json={"registros": bloque, "acumular": False})
+            respuesta.raise_for_status()
+            resumen["registros"] += len(bloque)
+            resumen["bloques"] += 1
+            resumen["proyecciones_conciliadas"] += respuesta.json()["proyecciones_conciliadas"]
+            bloque = []
+    return resumen
+
+
+def cantidades_desde(productos: int, ajustes: str) -> Dict[str, int]:
+    cantidades = {
+        entidad: max(minimo, round(productos * proporcion))
+        for entidad, (proporcion, minimo) in PROPORCIONES.items()
+    }
+    for ajuste in filter(None, ajustes.split(",")):
+        entidad, valor = ajuste.split("=")
+        if entidad not in cantidades:
+            raise SystemExit(f"Entidad desconocida: {entidad}")
+        cantidades[entidad] = int(valor)
+    return cantidades
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--productos", type=int, default=1000, help="Cantidad de productos; las demás entidades son proporcionales")
+    parser.add_argument("--cantidades", default="", help="Cantidades explícitas por entidad (lotes=1000000,ordenes=...)")
+    parser.add_argument("--semilla", type=int, default=1, help="Semilla del generador")
+    parser.add_argument("--fecha-base", type=date.fromisoformat, default=date.today(), help="Fecha de referencia (hoy por defecto)")
+    parser.add_argument("--entidades", default=",".join(DESTINOS), help="Entidades a generar, separadas por coma")
+    parser.add_argument("--dias-historial", type=int, default=365, help="Días de demanda diaria que terminan en --fecha-base")
+    parser.add_argument("--salida", help="Directorio donde escribir <servicio>/test_data.json")
+    parser.add_argument("--importar", action="store_true", help="Enviar a los endpoints de importación de los servicios")
+    parser.add_argument("--host", default="127.0.0.1", help="Host de los servicios para --importar")
+    parser.add_argument("--tamano-lote", type=int, default=5000, help="Filas por lote confirmado al importar (registros por bloque de demanda)")
+    parser.add_argument("--timeout", type=float, default=3600, help="Timeout de cada importación en segundos")
+    args = parser.parse_args()
+    if not args.salida and not args.importar:
+        parser.error("Indicar --salida, --importar o ambos")
+
+    cantidades = cantidades_desde(args.productos, args.cantidades)
+    generador = Generador(args.semilla, args.fecha_base, cantidades, args.dias_historial)
+    for entidad in args.entidades.split(","):
+        if entidad not in DESTINOS:
+            raise SystemExit(f"Entidad desconocida: {entidad}")
+        servicio, ruta_importacion = DESTINOS[entidad]
+        registros: Callable[[], Iterator[dict]] = getattr(generador, entidad)
+        if args.salida:
+            inicio = time.perf_counter()
+            ruta = os.path.join(args.salida, servicio, ARCHIVO_DEMANDA if entidad == "demanda" else "test_data.json")
+            total = escribir_json(ruta, registros())
+            print(f"{entidad}: {total} registros en {ruta} ({time.perf_counter() - inicio:.1f} s)")
+        if args.importar:
+            if ruta_importacion is None:
+                print(f"{entidad}: {servicio} no tiene importación masiva; usar --salida", file=sys.stderr)
+                continue
+            inicio = time.perf_counter()
+            url = f"http://{args.host}:{SERVICIOS[servicio]}{ruta_importacion}"
+            enviar = enviar_demanda if entidad == "demanda" else importar
+            resultado = enviar(url, registros(), args.tamano_lote, args.timeout)
+            print(f"{entidad}: {resultado} ({time.perf_counter() - inicio:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Memoria por registro: dict contra registro compacto (comun.registros).
+
+Construye N lotes y N órdenes con la forma que tienen en ms-lote y
+ms-orden-compra, primero como dicts y después como registros compactos, y
+mide con tracemalloc los bytes que quedan asignados por registro. Los textos
+se crean uno por registro, como al leer JSON o una importación, así que se ve
+también el efecto de internar los campos repetidos.
+
+Uso (desde la raíz del repositorio):
+    PYTHONPATH=. python benchmarks/memoria_registros.py --cantidad 1000000
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from comun import esquema_registro
+
+# Mismos campos que los esquemas de ms-lote y ms-orden-compra
+Lote = esquema_registro("Lote", (
+    "id", "fecha_vencimiento", "tipo_almacenamiento", "cantidad_inicial", "cantidad_disponible",
+    "cantidad_reservada", "cantidad_vendida", "id_producto", "id_bodega", "temperatura_optima",
+    "humedad_optima", "fecha_creacion", "fecha_actualizacion", "esta_vencido"
+), internar=("tipo_almacenamiento", "id_producto", "id_bodega"))
+
+Orden = esquema_registro("Orden", (
+    "id", "numero_orden", "id_proveedor", "tipo_orden", "estado", "fecha_orden", "fecha_requerida",
+    "observaciones", "direccion_entrega", "fecha_creacion", "fecha_actualizacion", "subtotal",
+    "descuento_total", "impuestos", "total", "fecha_aprobacion", "fecha_envio", "fecha_recepcion"
+), internar=("id_proveedor", "tipo_orden", "estado"))
+
+TIPOS_ALMACENAMIENTO = ("ambiente", "refrigerado", "congelado", "controlado")
+ESTADOS_ORDEN = ("borrador", "pendiente", "aprobada", "enviada", "recibida", "cancelada")
+
+
+def copia(texto: str) -> str:
+    """Un objeto str nuevo con el mismo texto, como los que deja json.loads"""
+    return texto.encode().decode()
+
+
+def lote(azar: random.Random, indice: int) -> dict:
+    vencimiento = date(2025, 1, 1) + timedelta(days=azar.randrange(720))
+    ahora = datetime.now()
+    cantidad = azar.randrange(1, 5000)
+    return {
+        "id": str(uuid.UUID(int=azar.getrandbits(128))),
+        "fecha_vencimiento": vencimiento,
+        "tipo_almacenamiento": copia(azar.choice(TIPOS_ALMACENAMIENTO)),
+        "cantidad_inicial": cantidad,
+        "cantidad_disponible": cantidad,
+        "cantidad_reservada": 0,
+        "cantidad_vendida": 0,
+        "id_producto": f"prod-{azar.randrange(50000):06d}",
+        "id_bodega": f"bod-{azar.randrange(200):04d}",
+        "temperatura_optima": round(azar.uniform(-20, 25), 1),
+        "humedad_optima": round(azar.uniform(30, 80), 1),
+        "fecha_creacion": ahora,
+        "fecha_actualizacion": ahora,
+        "esta_vencido": vencimiento < date.today(),
+        "version": 1,
+    }
+
+
+def orden(azar: random.Random, indice: int) -> dict:
+    ahora = datetime.now()
+    subtotal = Decimal(azar.randrange(100, 10_000_000)) / 100
+    impuestos = subtotal * Decimal("0.19")
+    return {
+        "id": str(uuid.UUID(int=azar.getrandbits(128))),
+        "numero_orden": f"OC{indice:06d}",
+        "id_proveedor": f"prov-{azar.randrange(5000):05d}",
+        "tipo_orden": copia(azar.choice(("regular", "urgente"))),
+        "estado": copia(azar.choice(ESTADOS_ORDEN)),
+        "fecha_orden": date(2025, 1, 1) + timedelta(days=azar.randrange(365)),
+        "fecha_requerida": date(2025, 2, 1) + timedelta(days=azar.randrange(365)),
+        "observaciones": None,
+        "direccion_entrega": None,
+        "fecha_creacion": ahora,
+        "fecha_actualizacion": ahora,
+        "subtotal": subtotal,
+        "descuento_total": Decimal(0),
+        "impuestos": impuestos,
+        "total": subtotal + impuestos,
+        "fecha_aprobacion": None,
+        "fecha_envio": None,
+        "fecha_recepcion": None,
+        "version": 1,
+    }
+
+
+def medir(construir, cantidad: int, compacto=None):
+    """Bytes asignados por registro al construir la colección"""
+    azar = random.Random(42)
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    if compacto is None:
+        registros = [construir(azar, i) for i in range(cantidad)]
+    else:
+        registros = [compacto.desde(construir(azar, i)) for i in range(cantidad)]
+    gc.collect()
+    usados = tracemalloc.get_traced_memory()[0] - antes
+    tracemalloc.stop()
+    del registros
+    return usados / cantidad
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cantidad", type=int, default=1_000_000, help="Registros por colección")
+    args = parser.parse_args()
+
+    print(f"{'colección':<10} {'dict B/reg':>11} {'compacto B/reg':>15} {'ahorro':>7}")
+    for nombre, construir, compacto in (("lotes", lote, Lote), ("ordenes", orden, Orden)):
+        bytes_dict = medir(construir, args.cantidad)
+        bytes_compacto = medir(construir, args.cantidad, compacto)
+        print(f"{nombre:<10} {bytes_dict:>11.0f} {bytes_compacto:>15.0f} {1 - bytes_compacto / bytes_dict:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""Código compartido por los microservicios.
+
+Se instala junto a cada servicio (ver Dockerfile) y se importa como paquete:
+from comun import Repositorio, IndiceHash, Igual
+"""
+from .condiciones import Condicion, Contiene, EnConjunto, Igual, Predicado, Rango
+from .indices import IndiceHash, IndiceOrdenado, IndiceTexto, fusionar_ordenado
+from .persistencia import Persistencia, PersistenciaArchivo, PersistenciaMemoria, persistencia_desde_entorno
+from .registros import RegistroCompacto, esquema_registro
+from .repositorio import Pagina, Repositorio
+from .texto import normalizar, valor_enum
+
+__all__ = [
+    "Condicion", "Contiene", "EnConjunto", "Igual", "Predicado", "Rango",
+    "IndiceHash", "IndiceOrdenado", "IndiceTexto", "fusionar_ordenado",
+    "Persistencia", "PersistenciaArchivo", "PersistenciaMemoria", "persistencia_desde_entorno",
+    "RegistroCompacto", "esquema_registro",
+    "Pagina", "Repositorio",
+    "normalizar", "valor_enum",
+]
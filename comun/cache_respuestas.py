@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from enum import Enum
+from typing import Optional, Tuple
+
+
+def clave_cache(endpoint: str, **parametros) -> Tuple:
+    """Normalizar parámetros de consulta en una clave de caché estable"""
+    normalizados = []
+    for nombre, valor in sorted(parametros.items()):
+        if valor is None:
+            continue
+        if isinstance(valor, Enum):
+            valor = valor.value
+        normalizados.append((nombre, valor))
+    return (endpoint, tuple(normalizados))
+
+
+class CacheRespuestas:
+    """Caché LRU de respuestas JSON ya serializadas, acotada por tamaño en bytes.
+
+    Cada entrada guarda la versión de la colección con la que se generó; una
+    entrada de una versión anterior se descarta al consultarla (invalidación perezosa).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entradas: "OrderedDict[Tuple, Tuple[int, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave: Tuple, version: int) -> Optional[bytes]:
+        """Obtener el cuerpo cacheado si corresponde a la versión actual"""
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            self.fallos += 1
+            return None
+        if entrada[0] != version:
+            self._descartar(clave)
+            self.fallos += 1
+            return None
+        self._entradas.move_to_end(clave)
+        self.aciertos += 1
+        return entrada[1]
+
+    def guardar(self, clave: Tuple, version: int, cuerpo: bytes):
+        """Guardar un cuerpo serializado, expulsando las entradas menos usadas"""
+        # Respuestas muy grandes desplazarían todo el contenido útil de la caché
+        if len(cuerpo) > self.max_bytes // 4:
+            return
+        if clave in self._entradas:
+            self._descartar(clave)
+        self._entradas[clave] = (version, cuerpo)
+        self._bytes += len(cuerpo)
+        while self._bytes > self.max_bytes:
+            clave_antigua = next(iter(self._entradas))
+            self._descartar(clave_antigua)
+
+    def _descartar(self, clave: Tuple):
+        _, cuerpo = self._entradas.pop(clave)
+        self._bytes -= len(cuerpo)
+
+    def estadisticas(self) -> dict:
+        """Resumen de uso de la caché"""
+        total = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._entradas),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0
+        }
@@ -0,0 +1,128 @@
+"""Condiciones de filtrado para las consultas del repositorio.
+
+Cada condición sabe evaluarse sobre un registro; el repositorio además le
+pide a sus índices que la resuelvan sin recorrer la colección. Una condición
+sin valor (None, texto vacío, rango abierto por ambos lados) no filtra, así
+que los parámetros opcionales de un endpoint se pasan tal cual.
+
+Los campos anidados se indican con punto ("ubicacion_geografica.ciudad"). Si
+el campo es una lista, Igual, EnConjunto y Contiene se cumplen cuando algún
+elemento cumple.
+"""
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+from .texto import normalizar, valor_enum
+
+_COLECCIONES = (list, tuple, set, frozenset)
+
+
+def extractor(campo: str) -> Callable[[Any], Any]:
+    """Función que lee el campo (con puntos para anidar) de un registro"""
+    if "." not in campo:
+        return lambda registro: registro.get(campo)
+    ruta = tuple(campo.split("."))
+
+    def obtener(registro):
+        valor = registro
+        for parte in ruta:
+            if valor is None:
+                return None
+            valor = valor.get(parte)
+        return valor
+    return obtener
+
+
+def valores_de(valor) -> Tuple:
+    """Los elementos de un campo lista, o el valor solo; vacío si es None"""
+    if valor is None:
+        return ()
+    if isinstance(valor, _COLECCIONES):
+        return tuple(valor)
+    return (valor,)
+
+
+def clave(valor, normalizado: bool = False):
+    """Valor con el que se compara por igualdad y se indexa en un índice hash"""
+    valor = valor_enum(valor)
+    if normalizado and isinstance(valor, str):
+        return normalizar(valor)
+    return valor
+
+
+class Condicion:
+    """Filtro sobre un campo de los registros"""
+
+    campo: Optional[str] = None
+    activa = True
+
+    def coincide(self, registro) -> bool:
+        raise NotImplementedError
+
+
+class Igual(Condicion):
+    """Campo igual al valor; con normalizado, sin distinguir mayúsculas ni tildes"""
+
+    def __init__(self, campo: str, valor, normalizado: bool = False):
+        self.campo = campo
+        self.normalizado = normalizado
+        self.activa = valor is not None
+        self.clave = clave(valor, normalizado) if self.activa else None
+        self._obtener = extractor(campo)
+
+    def coincide(self, registro) -> bool:
+        return any(clave(v, self.normalizado) == self.clave for v in valores_de(self._obtener(registro)))
+
+
+class EnConjunto(Condicion):
+    """Campo igual a alguno de los valores"""
+
+    def __init__(self, campo: str, valores: Optional[Iterable], normalizado: bool = False):
+        self.campo = campo
+        self.normalizado = normalizado
+        self.activa = valores is not None
+        self.claves = frozenset(clave(v, normalizado) for v in valores) if self.activa else frozenset()
+        self._obtener = extractor(campo)
+
+    def coincide(self, registro) -> bool:
+        return any(clave(v, self.normalizado) in self.claves for v in valores_de(self._obtener(registro)))
+
+
+class Rango(Condicion):
+    """Campo entre minimo y maximo, ambos inclusive; un extremo None queda abierto"""
+
+    def __init__(self, campo: str, minimo=None, maximo=None):
+        self.campo = campo
+        self.minimo = minimo
+        self.maximo = maximo
+        self.activa = minimo is not None or maximo is not None
+        self._obtener = extractor(campo)
+
+    def coincide(self, registro) -> bool:
+        valor = self._obtener(registro)
+        if valor is None:
+            return False
+        return (self.minimo is None or valor >= self.minimo) and (self.maximo is None or valor <= self.maximo)
+
+
+class Contiene(Condicion):
+    """Campo que contiene el texto, sin distinguir mayúsculas ni tildes"""
+
+    def __init__(self, campo: str, texto: Optional[str]):
+        self.campo = campo
+        self.texto = normalizar(texto) if texto else ""
+        self.activa = bool(self.texto)
+        self._obtener = extractor(campo)
+
+    def coincide(self, registro) -> bool:
+        return any(self.texto in normalizar(str(valor_enum(v))) for v in valores_de(self._obtener(registro)))
+
+
+class Predicado(Condicion):
+    """Condición arbitraria; ningún índice la resuelve, se evalúa sobre los candidatos"""
+
+    def __init__(self, funcion: Callable[[Any], bool], activa: bool = True):
+        self.funcion = funcion
+        self.activa = activa
+
+    def coincide(self, registro) -> bool:
+        return self.funcion(registro)
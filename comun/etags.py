@@ -0,0 +1,36 @@
+"""ETags fuertes y respuestas 304 para GET condicionales.
+
+Los ETags se derivan de versiones (del registro o de la colección), no del
+cuerpo serializado, así que validarlos no cuesta serializar la respuesta.
+
+    etag = etag_fuerte(producto["id"], producto["version"])
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
+"""
+import uuid
+from typing import Optional
+
+from fastapi import Response
+
+# Cambia en cada reinicio: las versiones en memoria vuelven a empezar y no deben
+# coincidir con ETags emitidos por una instancia anterior
+INSTANCIA = uuid.uuid4().hex[:8]
+
+
+def etag_fuerte(*partes) -> str:
+    """Construir un ETag fuerte a partir de sus partes"""
+    return '"' + "-".join(str(parte) for parte in (INSTANCIA, *partes)) + '"'
+
+
+def etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """Verificar si el encabezado If-None-Match contiene el ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidato.strip().removeprefix("W/") == etag for candidato in if_none_match.split(","))
+
+
+def no_modificado(etag: str) -> Response:
+    """Respuesta 304 sin cuerpo"""
+    return Response(status_code=304, headers={"ETag": etag})
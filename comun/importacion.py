@@ -0,0 +1,221 @@
+"""Importación masiva en streaming desde NDJSON o CSV.
+
+El cuerpo de la solicitud se lee por fragmentos y se procesa fila por fila:
+cada fila se valida con el modelo de creación del servicio, las válidas se
+acumulan en un lote de tamaño fijo y cada lote se confirma de una vez (alta
+en la colección e índices en bloque). Solo se conservan el lote en curso y
+los primeros errores, así que la memoria usada por la importación no
+depende del tamaño del archivo.
+
+En CSV la primera fila es el encabezado. Las columnas con punto se anidan
+("condiciones_entrega.tiempo_entrega") y los valores que empiezan con "[" o
+"{" se leen como JSON ('["Antibióticos", "Vacunas"]'). Las celdas vacías se
+omiten para que apliquen los valores por defecto del modelo.
+"""
+import asyncio
+import codecs
+import csv
+import json
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+FORMATO_NDJSON = "ndjson"
+FORMATO_CSV = "csv"
+
+# Una línea más larga que esto se considera un archivo mal formado
+LONGITUD_MAXIMA_LINEA = 1024 * 1024
+
+
+class ErrorFila(ValueError):
+    """Fila que no se puede interpretar"""
+
+
+def formato_desde_content_type(content_type: Optional[str]) -> str:
+    """CSV si el Content-Type lo indica; NDJSON en cualquier otro caso"""
+    return FORMATO_CSV if content_type and "csv" in content_type.lower() else FORMATO_NDJSON
+
+
+async def leer_lineas(fragmentos: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Líneas de texto UTF-8 a medida que llegan los fragmentos, sin el salto de línea"""
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+    pendiente = ""
+    async for fragmento in fragmentos:
+        texto = decodificador.decode(fragmento)
+        if "\n" not in texto:
+            pendiente += texto
+            if len(pendiente) > LONGITUD_MAXIMA_LINEA:
+                raise ValueError(f"Línea de más de {LONGITUD_MAXIMA_LINEA} caracteres")
+            continue
+        lineas = (pendiente + texto).split("\n")
+        pendiente = lineas.pop()
+        for linea in lineas:
+            yield linea.removesuffix("\r")
+    pendiente += decodificador.decode(b"", final=True)
+    if pendiente:
+        yield pendiente.removesuffix("\r")
+
+
+def _valor_csv(valor: str):
+    if valor[:1] in ("[", "{"):
+        try:
+            return json.loads(valor)
+        except json.JSONDecodeError:
+            raise ErrorFila(f"JSON inválido: {valor[:50]}")
+    return valor
+
+
+def _fila_csv(encabezado: List[str], valores: List[str]) -> dict:
+    if len(valores) != len(encabezado):
+        raise ErrorFila(f"Se esperaban {len(encabezado)} columnas y hay {len(valores)}")
+    fila: dict = {}
+    for columna, valor in zip(encabezado, valores):
+        if valor == "":
+            continue
+        *padres, campo = columna.split(".")
+        destino = fila
+        for padre in padres:
+            destino = destino.setdefault(padre, {})
+        destino[campo] = _valor_csv(valor)
+    return fila
+
+
+async def leer_filas(fragmentos: AsyncIterator[bytes], formato: str) -> AsyncIterator[Tuple[int, object]]:
+    """(número de línea, fila) por cada registro; la fila es un dict o el ErrorFila que impidió leerla"""
+    encabezado: Optional[List[str]] = None
+    registro: List[str] = []
+    comillas = 0
+    inicio = 0
+    numero = 0
+    async for linea in leer_lineas(fragmentos):
+        numero += 1
+        if formato == FORMATO_NDJSON:
+            if not linea.strip():
+                continue
+            try:
+                fila = json.loads(linea)
+            except json.JSONDecodeError as error:
+                yield numero, ErrorFila(f"JSON inválido: {error.msg}")
+                continue
+            yield numero, fila if isinstance(fila, dict) else ErrorFila("La fila debe ser un objeto JSON")
+            continue
+
+        # CSV: un campo entre comillas puede ocupar varias líneas; el registro
+        # termina cuando la cantidad de comillas acumuladas es par
+        if not registro:
+            if not linea.strip():
+                continue
+            inicio = numero
+        registro.append(linea)
+        comillas += linea.count('"')
+        if comillas % 2:
+            if sum(map(len, registro)) > LONGITUD_MAXIMA_LINEA:
+                raise ValueError(f"Registro de más de {LONGITUD_MAXIMA_LINEA} caracteres en la línea {inicio}")
+            continue
+        try:
+            valores = next(csv.reader(["\n".join(registro)]))
+        except csv.Error as error:
+            valores = ErrorFila(f"CSV inválido: {error}")
+        registro, comillas = [], 0
+        if encabezado is None:
+            if isinstance(valores, ErrorFila):
+                raise ValueError(f"Encabezado CSV inválido: {valores}")
+            encabezado = [columna.strip() for columna in valores]
+            continue
+        if isinstance(valores, ErrorFila):
+            yield inicio, valores
+            continue
+        try:
+            yield inicio, _fila_csv(encabezado, valores)
+        except ErrorFila as error:
+            yield inicio, error
+    if registro:
+        yield inicio, ErrorFila("Comillas sin cerrar al final del archivo")
+
+
+def _mensajes_validacion(error: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(parte) for parte in detalle['loc']) or 'fila'}: {detalle['msg']}"
+        for detalle in error.errors()
+    ]
+
+
+async def importar(
+    fragmentos: AsyncIterator[bytes],
+    formato: str,
+    modelo: Type[BaseModel],
+    confirmar: Callable[[List[Tuple[Optional[str], BaseModel]]], None],
+    existe: Callable[[str], bool],
+    tamano_lote: int = 1000,
+    max_errores: int = 100
+) -> Dict:
+    """Validar y confirmar por lotes las filas del cuerpo.
+
+    confirmar recibe una lista de (id, modelo validado); el id es None si la
+    fila no trae uno. Un id que ya existe se reporta como error de la fila.
+    Si el archivo queda ilegible a mitad de camino, los lotes ya confirmados
+    se conservan y el resultado indica dónde se interrumpió.
+    """
+    resultado = {
+        "formato": formato,
+        "filas_leidas": 0,
+        "importadas": 0,
+        "con_error": 0,
+        "lotes_confirmados": 0,
+        "interrumpida": False,
+        "motivo_interrupcion": None,
+        "errores": [],
+    }
+    lote: List[Tuple[Optional[str], BaseModel]] = []
+    ids_lote = set()
+
+    def registrar_error(numero: int, mensajes: List[str]):
+        resultado["con_error"] += 1
+        if len(resultado["errores"]) < max_errores:
+            resultado["errores"].append({"linea": numero, "errores": mensajes})
+
+    async def confirmar_lote():
+        # El lote se vacía antes de confirmarlo: si confirmar falla no se vuelve a intentar
+        pendientes = lote[:]
+        lote.clear()
+        ids_lote.clear()
+        confirmar(pendientes)
+        resultado["importadas"] += len(pendientes)
+        resultado["lotes_confirmados"] += 1
+        # Ceder el event loop entre lotes para no bloquear otras solicitudes
+        await asyncio.sleep(0)
+
+    filas = leer_filas(fragmentos, formato)
+    while True:
+        # Solo la lectura interrumpe la importación; los errores de confirmar se propagan
+        try:
+            numero, fila = await filas.__anext__()
+        except StopAsyncIteration:
+            break
+        except ValueError as error:
+            resultado["interrumpida"] = True
+            resultado["motivo_interrupcion"] = str(error)
+            break
+        resultado["filas_leidas"] += 1
+        if isinstance(fila, ErrorFila):
+            registrar_error(numero, [str(fila)])
+            continue
+        identificador = fila.pop("id", None)
+        if identificador is not None:
+            identificador = str(identificador)
+            if identificador in ids_lote or existe(identificador):
+                registrar_error(numero, [f"id: ya existe un registro con id {identificador}"])
+                continue
+        try:
+            registro = modelo(**fila)
+        except ValidationError as error:
+            registrar_error(numero, _mensajes_validacion(error))
+            continue
+        lote.append((identificador, registro))
+        if identificador is not None:
+            ids_lote.add(identificador)
+        if len(lote) >= tamano_lote:
+            await confirmar_lote()
+    if lote:
+        await confirmar_lote()
+    return resultado
@@ -0,0 +1,305 @@
+"""Índices secundarios del repositorio.
+
+Cada índice se declara sobre un campo y se mantiene en cada escritura:
+guarda por registro las claves con que lo indexó, de modo que se puede
+reindexar un registro ya modificado en sitio sin conocer sus valores
+anteriores. Para una condición que sabe resolver, un índice devuelve un
+Plan con la cantidad estimada de candidatos; el repositorio elige el plan
+más selectivo y evalúa las demás condiciones solo sobre esos candidatos.
+"""
+from bisect import bisect_left, bisect_right, insort
+from heapq import merge
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from .condiciones import Condicion, Contiene, EnConjunto, Igual, Rango, clave, extractor, valores_de
+from .texto import normalizar, trigramas, valor_enum
+
+
+class Plan(NamedTuple):
+    """Forma de obtener candidatos para una condición"""
+    estimado: int  # Cota superior de candidatos
+    ids: Callable[[bool], Iterable[str]]  # Recibe descendente; devuelve los IDs candidatos
+    orden: Optional[str] = None  # Campo por el que salen ordenados los IDs, si lo hay
+
+
+def fusionar_ordenado(lista: list, nuevos: list):
+    """Incorporar nuevos elementos a una lista ordenada.
+
+    Ordena solo los nuevos y busca su posición por bisección; la lista se
+    reconstruye copiando tramos, sin volver a comparar sus elementos.
+    """
+    nuevos.sort()
+    if not lista or not nuevos or nuevos[0] >= lista[-1]:
+        lista.extend(nuevos)
+        return
+    resultado = []
+    anterior = 0
+    for elemento in nuevos:
+        posicion = bisect_right(lista, elemento, anterior)
+        resultado += lista[anterior:posicion]
+        resultado.append(elemento)
+        anterior = posicion
+    resultado += lista[anterior:]
+    lista[:] = resultado
+
+
+class Indice:
+    """Índice sobre un campo de los registros"""
+
+    def __init__(self, campo: str):
+        self.campo = campo
+        self._obtener = extractor(campo)
+
+    def agregar(self, identificador: str, registro, secuencia: int):
+        raise NotImplementedError
+
+    def agregar_varios(self, entradas: Sequence[Tuple[str, Any, int]]):
+        """Agregar (id, registro, secuencia) en bloque"""
+        for identificador, registro, secuencia in entradas:
+            self.agregar(identificador, registro, secuencia)
+
+    def quitar(self, identificador: str):
+        raise NotImplementedError
+
+    def planificar(self, condicion: Condicion, condiciones: Sequence[Condicion]) -> Optional[Plan]:
+        """Plan para resolver la condición, o None si este índice no la resuelve"""
+        return None
+
+    def conteos(self, ids: Iterable[str]) -> Dict[Any, int]:
+        """Cantidad de registros por valor del campo entre los IDs dados"""
+        raise NotImplementedError
+
+
+class IndiceHash(Indice):
+    """Conjunto de IDs por valor; resuelve Igual y EnConjunto.
+
+    Un campo lista aporta cada elemento como valor. Con normalizado las
+    claves se guardan sin mayúsculas ni tildes (y las consultas deben ser
+    normalizadas). Con parcial además resuelve Contiene: busca por trigramas
+    entre los valores distintos, que suelen ser muchos menos que los
+    registros, y junta los IDs de los valores que coinciden.
+    """
+
+    def __init__(self, campo: str, normalizado: bool = False, parcial: bool = False):
+        if parcial and not normalizado:
+            raise ValueError("Un índice parcial debe ser normalizado")
+        super().__init__(campo)
+        self.normalizado = normalizado
+        self.parcial = parcial
+        self._ids: Dict[Any, Set[str]] = {}
+        self._claves: Dict[str, Tuple] = {}
+        self._nombres: Dict[Any, Any] = {}  # Clave -> primer valor original, para los conteos
+        self._trigramas: Dict[str, Set[str]] = {}  # Trigrama -> claves que lo contienen
+
+    def agregar(self, identificador: str, registro, secuencia: int = 0):
+        if identificador in self._claves:
+            self.quitar(identificador)
+        claves = []
+        for valor in valores_de(self._obtener(registro)):
+            k = clave(valor, self.normalizado)
+            if k in claves:
+                continue
+            claves.append(k)
+            ids = self._ids.get(k)
+            if ids is None:
+                ids = self._ids[k] = set()
+                self._nombres[k] = valor_enum(valor)
+                if self.parcial and isinstance(k, str):
+                    for trigrama in trigramas(k):
+                        self._trigramas.setdefault(trigrama, set()).add(k)
+            ids.add(identificador)
+        self._claves[identificador] = tuple(claves)
+
+    def quitar(self, identificador: str):
+        for k in self._claves.pop(identificador, ()):
+            ids = self._ids[k]
+            ids.discard(identificador)
+            if ids:
+                continue
+            del self._ids[k]
+            del self._nombres[k]
+            if self.parcial and isinstance(k, str):
+                for trigrama in trigramas(k):
+                    self._trigramas[trigrama].discard(k)
+                    if not self._trigramas[trigrama]:
+                        del self._trigramas[trigrama]
+
+    def claves_que_contienen(self, texto: str) -> List:
+        """Valores indexados (normalizados) que contienen el texto normalizado"""
+        if len(texto) < 3:
+            candidatas = self._ids.keys()
+        else:
+            conjuntos = sorted((self._trigramas.get(t, set()) for t in trigramas(texto)), key=len)
+            candidatas = set.intersection(*conjuntos) if conjuntos[0] else ()
+        return [k for k in candidatas if isinstance(k, str) and texto in k]
+
+    def planificar(self, condicion: Condicion, condiciones: Sequence[Condicion]) -> Optional[Plan]:
+        if condicion.campo != self.campo:
+            return None
+        if isinstance(condicion, Igual) and condicion.normalizado == self.normalizado:
+            ids = self._ids.get(condicion.clave, ())
+            return Plan(len(ids), lambda descendente: ids)
+        if isinstance(condicion, EnConjunto) and condicion.normalizado == self.normalizado:
+            conjuntos = [self._ids[k] for k in condicion.claves if k in self._ids]
+        elif isinstance(condicion, Contiene) and self.parcial:
+            conjuntos = [self._ids[k] for k in self.claves_que_contienen(condicion.texto)]
+        else:
+            return None
+        return Plan(sum(map(len, conjuntos)), lambda descendente: set().union(*conjuntos))
+
+    def conteos(self, ids: Iterable[str]) -> Dict[Any, int]:
+        conteo: Dict[Any, int] = {}
+        for identificador in ids:
+            for k in self._claves.get(identificador, ()):
+                conteo[k] = conteo.get(k, 0) + 1
+        return {self._nombres[k]: n for k, n in conteo.items()}
+
+    def distribucion(self) -> Dict[Any, int]:
+        """Cantidad de registros por valor en toda la colección, en O(valores distintos)"""
+        return {self._nombres[k]: len(ids) for k, ids in self._ids.items()}
+
+
+class IndiceOrdenado(Indice):
+    """Listas ordenadas de (valor, secuencia, id); resuelve Rango e Igual en O(log N + k).
+
+    Con particion se mantiene una lista por combinación de valores de esos
+    campos (por ejemplo categoría y estado): si la consulta fija esos campos
+    con Igual, el rango se busca solo en su lista; si no, se combinan las
+    listas compatibles conservando el orden. Los registros sin valor en el
+    campo no se indexan.
+    """
+
+    def __init__(self, campo: str, particion: Sequence[str] = ()):
+        super().__init__(campo)
+        self.particion = tuple(particion)
+        self._obtener_particion = [extractor(p) for p in self.particion]
+        self._listas: Dict[Tuple, List[Tuple[Any, int, str]]] = {}
+        self._claves: Dict[str, Tuple[Tuple, Tuple[Any, int, str]]] = {}  # ID -> (partición, entrada)
+
+    def _entrada(self, identificador: str, registro, secuencia: int):
+        valor = self._obtener(registro)
+        if valor is None:
+            return None
+        particion = tuple(valor_enum(obtener(registro)) for obtener in self._obtener_particion)
+        return particion, (valor, secuencia, identificador)
+
+    def agregar(self, identificador: str, registro, secuencia: int):
+        if identificador in self._claves:
+            self.quitar(identificador)
+        indexado = self._entrada(identificador, registro, secuencia)
+        if indexado is None:
+            return
+        particion, entrada = indexado
+        insort(self._listas.setdefault(particion, []), entrada)
+        self._claves[identificador] = indexado
+
+    def agregar_varios(self, entradas: Sequence[Tuple[str, Any, int]]):
+        """Agregar en bloque: una fusión por lista en lugar de una inserción por registro"""
+        nuevas: Dict[Tuple, list] = {}
+        for identificador, registro, secuencia in entradas:
+            if identificador in self._claves:
+                self.quitar(identificador)
+            indexado = self._entrada(identificador, registro, secuencia)
+            if indexado is None:
+                continue
+            nuevas.setdefault(indexado[0], []).append(indexado[1])
+            self._claves[identificador] = indexado
+        for particion, lista in nuevas.items():
+            fusionar_ordenado(self._listas.setdefault(particion, []), lista)
+
+    def quitar(self, identificador: str):
+        indexado = self._claves.pop(identificador, None)
+        if indexado is None:
+            return
+        particion, entrada = indexado
+        lista = self._listas[particion]
+        del lista[bisect_left(lista, entrada)]
+        if not lista:
+            del self._listas[particion]
+
+    def planificar(self, condicion: Condicion, condiciones: Sequence[Condicion]) -> Optional[Plan]:
+        if condicion.campo != self.campo:
+            return None
+        if isinstance(condicion, Rango):
+            minimo, maximo = condicion.minimo, condicion.maximo
+        elif isinstance(condicion, Igual) and not condicion.normalizado:
+            minimo = maximo = condicion.clave
+        else:
+            return None
+        return self.tramo(minimo, maximo, condiciones)
+
+    def tramo(self, minimo=None, maximo=None, condiciones: Sequence[Condicion] = ()) -> Plan:
+        """Plan para los valores en [minimo, maximo] en las particiones compatibles con las condiciones"""
+        fijos = {}
+        for c in condiciones:
+            if isinstance(c, Igual) and c.activa and not c.normalizado and c.campo in self.particion:
+                fijos[self.particion.index(c.campo)] = c.clave
+        valor = itemgetter(0)
+        tramos = []
+        for particion, lista in self._listas.items():
+            if any(particion[i] != v for i, v in fijos.items()):
+                continue
+            inicio = 0 if minimo is None else bisect_left(lista, minimo, key=valor)
+            fin = len(lista) if maximo is None else bisect_right(lista, maximo, key=valor)
+            if fin > inicio:
+                tramos.append(lista[inicio:fin])
+
+        def ids(descendente: bool) -> Iterable[str]:
+            secuencias = [reversed(t) if descendente else t for t in tramos]
+            entradas = secuencias[0] if len(secuencias) == 1 else merge(*secuencias, reverse=descendente)
+            return (entrada[2] for entrada in entradas)
+        return Plan(sum(map(len, tramos)), ids, self.campo)
+
+    def cantidad(self) -> int:
+        """Registros indexados (los que tienen valor en el campo)"""
+        return len(self._claves)
+
+    def conteos(self, ids: Iterable[str]) -> Dict[Any, int]:
+        conteo: Dict[Any, int] = {}
+        for identificador in ids:
+            indexado = self._claves.get(identificador)
+            if indexado is not None:
+                valor = indexado[1][0]
+                conteo[valor] = conteo.get(valor, 0) + 1
+        return conteo
+
+
+class IndiceTexto(Indice):
+    """Trigramas del texto de cada registro; resuelve Contiene sin recorrer la colección.
+
+    Los candidatos son los registros que tienen todos los trigramas de la
+    consulta, un superconjunto que luego se verifica. Ocupa memoria
+    proporcional al largo del texto, así que conviene para campos cortos.
+    Consultas de menos de tres caracteres no usan el índice.
+    """
+
+    def __init__(self, campo: str):
+        super().__init__(campo)
+        self._ids: Dict[str, Set[str]] = {}  # Trigrama -> IDs
+        self._claves: Dict[str, Tuple[str, ...]] = {}
+
+    def agregar(self, identificador: str, registro, secuencia: int = 0):
+        if identificador in self._claves:
+            self.quitar(identificador)
+        claves = set()
+        for valor in valores_de(self._obtener(registro)):
+            claves |= trigramas(normalizar(str(valor_enum(valor))))
+        for trigrama in claves:
+            self._ids.setdefault(trigrama, set()).add(identificador)
+        self._claves[identificador] = tuple(claves)
+
+    def quitar(self, identificador: str):
+        for trigrama in self._claves.pop(identificador, ()):
+            ids = self._ids[trigrama]
+            ids.discard(identificador)
+            if not ids:
+                del self._ids[trigrama]
+
+    def planificar(self, condicion: Condicion, condiciones: Sequence[Condicion]) -> Optional[Plan]:
+        if condicion.campo != self.campo or not isinstance(condicion, Contiene) or len(condicion.texto) < 3:
+            return None
+        conjuntos = sorted((self._ids.get(t, set()) for t in trigramas(condicion.texto)), key=len)
+        if not conjuntos[0]:
+            return Plan(0, lambda descendente: ())
+        return Plan(len(conjuntos[0]), lambda descendente: set.intersection(*conjuntos))
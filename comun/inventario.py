@@ -0,0 +1,191 @@
+"""Consultas a otros servicios con caché TTL y respaldo obsoleto.
+
+Las consultas usan un único cliente HTTP con conexiones reutilizables, tiempos
+límite cortos y una caché con TTL breve. Varias peticiones concurrentes por el
+mismo dato comparten un único llamado. Si un servicio no responde a tiempo se
+devuelve el último dato conocido (obsoleto) en lugar de fallar.
+
+La usan MS-Producto (stock por producto) y MS-ProyeccionDemanda (stock,
+proveedores y compras para alertas y reposición).
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from .metricas import Metricas, medir_llamadas
+from .trazas import TransporteTrazado
+
+MS_BODEGA_URL = os.getenv("MS_BODEGA_URL", "http://ms-bodega:8001")
+MS_LOTE_URL = os.getenv("MS_LOTE_URL", "http://ms-lote:8002")
+MS_ORDEN_COMPRA_URL = os.getenv("MS_ORDEN_COMPRA_URL", "http://ms-orden-compra:8005")
+MS_PROVEEDOR_URL = os.getenv("MS_PROVEEDOR_URL", "http://ms-proveedor:8006")
+
+TIMEOUT = httpx.Timeout(float(os.getenv("INVENTARIO_TIMEOUT", "1.0")), connect=0.5)
+LIMITES = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+# Orígenes posibles de un dato
+ORIGEN_TIEMPO_REAL = "tiempo_real"
+ORIGEN_CACHE = "cache"
+ORIGEN_OBSOLETO = "obsoleto"
+ORIGEN_SIN_DATOS = "sin_datos"
+
+
+class CacheTTL:
+    """Caché con vencimiento corto que conserva entradas obsoletas como respaldo"""
+
+    def __init__(self, ttl: float, ttl_obsoleto: float, max_entradas: int = 50000):
+        self.ttl = ttl
+        self.ttl_obsoleto = ttl_obsoleto
+        self.max_entradas = max_entradas
+        self._entradas: Dict[Any, Tuple[float, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def obtener(self, clave) -> Tuple[Optional[Any], bool]:
+        """Devolver (valor, es_fresco); valor es None si no hay dato utilizable"""
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None, False
+        edad = time.monotonic() - entrada[0]
+        if edad > self.ttl_obsoleto:
+            del self._entradas[clave]
+            return None, False
+        return entrada[1], edad <= self.ttl
+
+    def guardar(self, clave, valor):
+        if len(self._entradas) >= self.max_entradas and clave not in self._entradas:
+            self._purgar()
+        self._entradas[clave] = (time.monotonic(), valor)
+
+    def _purgar(self):
+        limite = time.monotonic() - self.ttl_obsoleto
+        for clave in [c for c, (instante, _) in self._entradas.items() if instante < limite]:
+            del self._entradas[clave]
+        # Si todo sigue vigente, se descarta la mitad más antigua
+        if len(self._entradas) >= self.max_entradas:
+            ordenadas = sorted(self._entradas, key=lambda c: self._entradas[c][0])
+            for clave in ordenadas[:len(ordenadas) // 2]:
+                del self._entradas[clave]
+
+
+cache_inventario = CacheTTL(
+    ttl=float(os.getenv("STOCK_CACHE_TTL", "5")),
+    ttl_obsoleto=float(os.getenv("STOCK_CACHE_TTL_OBSOLETO", "300")),
+    max_entradas=int(os.getenv("STOCK_CACHE_MAX_ENTRADAS", "100000"))
+)
+
+_cliente: Optional[httpx.AsyncClient] = None
+_en_vuelo: Dict[Any, asyncio.Future] = {}
+_ganchos: Dict[str, list] = {}
+
+
+def medir_consultas(metricas: Metricas):
+    """Medir las llamadas del cliente compartido en las métricas del servicio; antes de la primera consulta"""
+    global _ganchos
+    _ganchos = medir_llamadas(metricas)
+
+
+def obtener_cliente() -> httpx.AsyncClient:
+    """Cliente HTTP compartido (pool de conexiones)"""
+    global _cliente
+    if _cliente is None or _cliente.is_closed:
+        _cliente = httpx.AsyncClient(
+            timeout=TIMEOUT, event_hooks=_ganchos,
+            transport=TransporteTrazado(httpx.AsyncHTTPTransport(limits=LIMITES))
+        )
+    return _cliente
+
+
+async def cerrar_cliente():
+    global _cliente
+    if _cliente is not None:
+        await _cliente.aclose()
+        _cliente = None
+
+
+async def consultar(clave, metodo: str, url: str, **kwargs) -> Tuple[Optional[Any], str]:
+    """Consultar un servicio con caché TTL, deduplicación de llamados y respaldo obsoleto.
+
+    Devuelve (datos, origen); datos es None con ORIGEN_SIN_DATOS si el servicio
+    no respondió y no hay nada en caché.
+    """
+    valor, es_fresco = cache_inventario.obtener(clave)
+    if es_fresco:
+        return valor, ORIGEN_CACHE
+
+    # Varias peticiones concurrentes por el mismo dato comparten un único llamado
+    pendiente = _en_vuelo.get(clave)
+    if pendiente is None:
+        pendiente = asyncio.ensure_future(obtener_cliente().request(metodo, url, **kwargs))
+        _en_vuelo[clave] = pendiente
+        pendiente.add_done_callback(lambda _: _en_vuelo.pop(clave, None))
+
+    try:
+        respuesta = await asyncio.shield(pendiente)
+        respuesta.raise_for_status()
+        datos = respuesta.json()
+    except (httpx.HTTPError, ValueError):
+        if valor is not None:
+            return valor, ORIGEN_OBSOLETO
+        return None, ORIGEN_SIN_DATOS
+
+    cache_inventario.guardar(clave, datos)
+    return datos, ORIGEN_TIEMPO_REAL
+
+
+async def consultar_por_producto(
+    servicio: str, url: str, ids_producto: List[str]
+) -> Tuple[Optional[Dict[str, Optional[dict]]], str]:
+    """POST {"ids_producto": [...]} a un servicio que responde un registro por producto, con caché por producto.
+
+    Solo se piden los productos sin dato fresco en caché, y el dato de cada uno
+    se guarda por separado: que cambie el conjunto pedido no invalida lo ya
+    conocido. Devuelve {id_producto: registro} con None para los productos que
+    el servicio no registra; si el servicio falla se usan los datos obsoletos y
+    los productos sin ninguno quedan fuera. datos es None si no se conoce nada.
+    """
+    datos: Dict[str, Optional[dict]] = {}
+    faltantes: List[str] = []
+    for id_producto in sorted(set(ids_producto)):
+        valor, es_fresco = cache_inventario.obtener((servicio, id_producto))
+        if valor is not None:
+            # Un dict vacío en caché significa que el servicio no tiene registros del producto
+            datos[id_producto] = valor or None
+        if not es_fresco:
+            faltantes.append(id_producto)
+    if not faltantes:
+        return datos, ORIGEN_CACHE
+
+    clave = (servicio, tuple(faltantes))
+    pendiente = _en_vuelo.get(clave)
+    if pendiente is None:
+        pendiente = asyncio.ensure_future(obtener_cliente().post(url, json={"ids_producto": faltantes}))
+        _en_vuelo[clave] = pendiente
+        pendiente.add_done_callback(lambda _: _en_vuelo.pop(clave, None))
+
+    try:
+        respuesta = await asyncio.shield(pendiente)
+        respuesta.raise_for_status()
+        recibidos = {registro["id_producto"]: registro for registro in respuesta.json()}
+    except (httpx.HTTPError, ValueError, KeyError):
+        if datos:
+            return datos, ORIGEN_OBSOLETO
+        return None, ORIGEN_SIN_DATOS
+
+    for id_producto in faltantes:
+        registro = recibidos.get(id_producto)
+        cache_inventario.guardar((servicio, id_producto), registro or {})
+        datos[id_producto] = registro
+    return datos, ORIGEN_TIEMPO_REAL if len(faltantes) == len(datos) else ORIGEN_CACHE
+
+
+def origen_combinado(*origenes: str) -> str:
+    """El origen menos confiable determina el origen de la respuesta"""
+    for origen in (ORIGEN_SIN_DATOS, ORIGEN_OBSOLETO, ORIGEN_CACHE):
+        if origen in origenes:
+            return origen
+    return ORIGEN_TIEMPO_REAL
@@ -0,0 +1,387 @@
+"""Métricas en formato de texto de Prometheus, sin dependencias externas.
+
+Las métricas de Istio miden el salto de red entre sidecars; estas miden lo que
+pasa dentro del servicio: latencia por ruta (handler, serialización y llamadas
+a otros servicios), solicitudes en curso, tamaño de las respuestas y retraso
+del lazo de eventos, más los contadores de negocio que registre cada servicio.
+
+    metricas = instrumentar(app)
+    reservas = metricas.contador("lote_reservas_total", "Reservas de lotes", ("resultado",))
+    reservas.incrementar("ok")
+
+Las métricas no usan locks: se actualizan desde el lazo de eventos, igual que
+los repositorios. Las calculadas (métricas.calculada) se evalúan solo al
+exponer /metrics, así que no cuestan nada por solicitud.
+"""
+import asyncio
+import math
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .texto import valor_enum
+
+# Límites en segundos pensados para latencias de unos pocos milisegundos
+LIMITES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LIMITES_BYTES = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+LIMITES_RETRASO = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Ruta de las solicitudes que no coinciden con ninguna (404): no se usa la URL para no multiplicar series
+SIN_RUTA = "<sin_ruta>"
+
+
+def _numero(valor: float) -> str:
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    if math.isnan(valor):
+        return "NaN"
+    return repr(float(valor))
+
+
+def _escapar(valor) -> str:
+    return str(valor_enum(valor)).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._textos: Dict[Tuple, str] = {}
+
+    def _texto_etiquetas(self, valores: Tuple, extra: str = "") -> str:
+        """{a="x",b="y"} de una combinación de valores, cacheado por combinación"""
+        texto = self._textos.get(valores)
+        if texto is None:
+            texto = ",".join(f'{n}="{_escapar(v)}"' for n, v in zip(self.etiquetas, valores))
+            self._textos[valores] = texto
+        if extra:
+            texto = f"{texto},{extra}" if texto else extra
+        return f"{{{texto}}}" if texto else ""
+
+    def muestras(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def exponer(self) -> Iterator[str]:
+        yield f"# HELP {self.nombre} {self.ayuda}"
+        yield f"# TYPE {self.nombre} {self.tipo}"
+        yield from self.muestras()
+
+
+class Contador(Metrica):
+    """Valor que solo crece, por combinación de etiquetas"""
+
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Tuple, float] = {}
+
+    def incrementar(self, *etiquetas, cantidad: float = 1):
+        self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def valor(self, *etiquetas) -> float:
+        return self._valores.get(etiquetas, 0)
+
+    def muestras(self) -> Iterator[str]:
+        for etiquetas, valor in list(self._valores.items()):
+            yield f"{self.nombre}{self._texto_etiquetas(etiquetas)} {_numero(valor)}"
+
+
+class Medidor(Contador):
+    """Valor que sube y baja (solicitudes en curso, último retraso medido)"""
+
+    tipo = "gauge"
+
+    def fijar(self, valor: float, *etiquetas):
+        self._valores[etiquetas] = valor
+
+    def sumar(self, cantidad: float, *etiquetas):
+        self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+
+class Histograma(Metrica):
+    """Cantidad de observaciones por intervalo, más su suma y su cantidad.
+
+    Por combinación de etiquetas se guarda una lista de conteos no acumulados
+    (observar es un bisect y dos sumas); los acumulados se calculan al exponer.
+    """
+
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, limites: Sequence[float], etiquetas: Sequence[str] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(sorted(limites))
+        self._textos_limites = tuple(f'le="{_numero(limite)}"' for limite in self.limites) + ('le="+Inf"',)
+        self._series: Dict[Tuple, List] = {}  # etiquetas -> [conteos..., suma]
+
+    def observar(self, valor: float, *etiquetas):
+        serie = self._series.get(etiquetas)
+        if serie is None:
+            serie = self._series[etiquetas] = [0] * (len(self.limites) + 1) + [0.0]
+        serie[bisect_left(self.limites, valor)] += 1
+        serie[-1] += valor
+
+    def instantanea(self) -> Dict[Tuple, Tuple[int, ...]]:
+        """Conteos no acumulados por intervalo de cada combinación de etiquetas"""
+        return {etiquetas: tuple(serie[:-1]) for etiquetas, serie in list(self._series.items())}
+
+    def muestras(self) -> Iterator[str]:
+        for etiquetas, serie in list(self._series.items()):
+            acumulado = 0
+            for conteo, limite in zip(serie, self._textos_limites):
+                acumulado += conteo
+                yield f"{self.nombre}_bucket{self._texto_etiquetas(etiquetas, limite)} {acumulado}"
+            yield f"{self.nombre}_sum{self._texto_etiquetas(etiquetas)} {_numero(serie[-1])}"
+            yield f"{self.nombre}_count{self._texto_etiquetas(etiquetas)} {acumulado}"
+
+
+def cuantil(limites: Sequence[float], conteos: Sequence[int], q: float) -> float:
+    """Cuantil estimado de un histograma, interpolando dentro del intervalo como histogram_quantile.
+
+    conteos son no acumulados, con uno más que limites (el de +Inf). Si el
+    cuantil cae en el último intervalo se devuelve infinito.
+    """
+    total = sum(conteos)
+    if not total:
+        return 0.0
+    objetivo = q * total
+    acumulado = 0
+    for i, conteo in enumerate(conteos):
+        if acumulado + conteo >= objetivo and conteo:
+            if i == len(limites):
+                return math.inf
+            inferior = limites[i - 1] if i else 0.0
+            return inferior + (limites[i] - inferior) * (objetivo - acumulado) / conteo
+        acumulado += conteo
+    return math.inf
+
+
+class Calculada(Metrica):
+    """Métrica cuyo valor se obtiene al exponer, de un número o de {valor_etiqueta: número}"""
+
+    def __init__(self, nombre: str, ayuda: str, funcion: Callable[[], Union[float, Dict]], tipo: str, etiqueta: Optional[str]):
+        super().__init__(nombre, ayuda, (etiqueta,) if etiqueta else ())
+        self.funcion = funcion
+        self.tipo = tipo
+
+    def muestras(self) -> Iterator[str]:
+        resultado = self.funcion()
+        if not self.etiquetas:
+            yield f"{self.nombre} {_numero(resultado)}"
+            return
+        for valor_etiqueta, valor in resultado.items():
+            yield f"{self.nombre}{self._texto_etiquetas((valor_etiqueta,))} {_numero(valor)}"
+
+
+class Metricas:
+    """Métricas de un servicio, expuestas juntas en /metrics"""
+
+    def __init__(self, servicio: str):
+        self.servicio = servicio
+        self._metricas: Dict[str, Metrica] = {}
+
+    def _registrar(self, metrica: Metrica) -> Metrica:
+        if metrica.nombre in self._metricas:
+            raise ValueError(f"Métrica duplicada: {metrica.nombre}")
+        self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Contador:
+        return self._registrar(Contador(nombre, ayuda, etiquetas))
+
+    def medidor(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Medidor:
+        return self._registrar(Medidor(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre: str, ayuda: str, limites: Sequence[float], etiquetas: Sequence[str] = ()) -> Histograma:
+        return self._registrar(Histograma(nombre, ayuda, limites, etiquetas))
+
+    def calculada(self, nombre: str, ayuda: str, funcion: Callable, tipo: str = "gauge", etiqueta: Optional[str] = None) -> Calculada:
+        """Métrica evaluada al exponer; con etiqueta, funcion devuelve {valor_etiqueta: número}"""
+        return self._registrar(Calculada(nombre, ayuda, funcion, tipo, etiqueta))
+
+    def obtener(self, nombre: str) -> Optional[Metrica]:
+        return self._metricas.get(nombre)
+
+    def exponer(self) -> str:
+        lineas = []
+        for metrica in self._metricas.values():
+            lineas.extend(metrica.exponer())
+        lineas.append("")
+        return "\n".join(lineas)
+
+
+def registrar_repositorio(metricas: Metricas, repositorio, *campos: str):
+    """Cantidad de registros del repositorio y, por cada campo, su distribución según el índice hash.
+
+    registrar_repositorio(metricas, ordenes_db, "estado") expone ordenes_registros y
+    ordenes_por_estado{estado="..."}; los conteos salen del índice, en O(valores distintos).
+    """
+    nombre = repositorio.nombre
+    metricas.calculada(f"{nombre}_registros", f"Registros en la colección {nombre}", lambda: len(repositorio))
+    for campo in campos:
+        indice = repositorio.indice(campo)
+        if indice is None or not hasattr(indice, "distribucion"):
+            raise ValueError(f"{nombre} no tiene índice hash sobre {campo}")
+        metricas.calculada(
+            f"{nombre}_por_{campo}", f"Registros de {nombre} por {campo}",
+            lambda indice=indice: {valor_enum(valor): n for valor, n in indice.distribucion().items()},
+            etiqueta=campo
+        )
+
+
+def registrar_cache(metricas: Metricas, cache):
+    """Aciertos, fallos, tasa de aciertos y bytes de una CacheRespuestas"""
+    metricas.calculada("cache_respuestas_aciertos_total", "Consultas resueltas desde la caché", lambda: cache.aciertos, "counter")
+    metricas.calculada("cache_respuestas_fallos_total", "Consultas que no estaban en la caché", lambda: cache.fallos, "counter")
+    metricas.calculada(
+        "cache_respuestas_tasa_aciertos", "Aciertos sobre consultas desde el arranque",
+        lambda: cache.estadisticas()["tasa_aciertos"]
+    )
+    metricas.calculada("cache_respuestas_bytes", "Bytes ocupados por la caché", lambda: cache.estadisticas()["bytes"])
+
+
+def medir_llamadas(metricas: Metricas) -> Dict[str, list]:
+    """event_hooks de httpx que miden las llamadas a otros servicios por host y estado.
+
+    httpx.AsyncClient(event_hooks=medir_llamadas(metricas)). Se mide hasta
+    recibir los encabezados; las llamadas que fallan sin respuesta no se cuentan.
+    """
+    duracion = metricas.histograma(
+        "http_client_request_duration_seconds", "Duración de las llamadas a otros servicios",
+        LIMITES_LATENCIA, ("host", "status")
+    )
+
+    async def al_enviar(solicitud):
+        solicitud.extensions["inicio_metricas"] = time.perf_counter()
+
+    async def al_recibir(respuesta):
+        inicio = respuesta.request.extensions.get("inicio_metricas")
+        if inicio is not None:
+            duracion.observar(time.perf_counter() - inicio, respuesta.request.url.host, respuesta.status_code)
+
+    return {"request": [al_enviar], "response": [al_recibir]}
+
+
+class PlantillasRuta:
+    """Plantilla de ruta (/lotes/{lote_id}) de una solicitud ya enrutada.
+
+    Se obtiene del endpoint que el router deja en el scope, así que las
+    etiquetas y los nombres de tramos no dependen de los IDs de la URL.
+    """
+
+    def __init__(self, router):
+        self.router = router
+        self._rutas: Dict[Callable, str] = {}
+
+    def plantilla(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return SIN_RUTA
+        ruta = self._rutas.get(endpoint)
+        if ruta is None:
+            # Se reconstruye solo al ver un endpoint nuevo (rutas agregadas después del arranque)
+            self._rutas = {r.endpoint: r.path for r in self.router.routes if hasattr(r, "endpoint")}
+            ruta = self._rutas.setdefault(endpoint, SIN_RUTA)
+        return ruta
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI que mide cada solicitud HTTP.
+
+    La ruta se etiqueta con la plantilla y no con la URL. Es middleware ASGI
+    puro: BaseHTTPMiddleware agregaría una tarea y una cola por solicitud.
+    """
+
+    def __init__(self, app, metricas: Metricas, router, intervalo_lazo: float = 0.5):
+        self.app = app
+        self.rutas = PlantillasRuta(router)
+        self.intervalo_lazo = intervalo_lazo
+        self._monitor: Optional[asyncio.Task] = None
+        self.duracion = metricas.histograma(
+            "http_request_duration_seconds", "Duración de las solicitudes dentro del servicio",
+            LIMITES_LATENCIA, ("method", "route", "status")
+        )
+        self.tamano = metricas.histograma(
+            "http_response_size_bytes", "Tamaño del cuerpo de las respuestas", LIMITES_BYTES, ("method", "route")
+        )
+        self.en_curso = metricas.medidor("http_requests_in_flight", "Solicitudes en curso")
+        self.en_curso.fijar(0)
+        self.retraso = metricas.histograma(
+            "event_loop_lag_seconds", "Retraso del lazo de eventos respecto de lo programado", LIMITES_RETRASO
+        )
+        self.retraso_ultimo = metricas.medidor("event_loop_lag_last_seconds", "Último retraso medido del lazo de eventos")
+
+    def _al_apagar(self, receive):
+        """receive de lifespan que detiene la medición del lazo al apagar el servicio"""
+        async def recibir():
+            mensaje = await receive()
+            if mensaje["type"] == "lifespan.shutdown" and self._monitor is not None:
+                self._monitor.cancel()
+                self._monitor = None
+            return mensaje
+        return recibir
+
+    async def _medir_lazo(self):
+        lazo = asyncio.get_running_loop()
+        while True:
+            inicio = lazo.time()
+            await asyncio.sleep(self.intervalo_lazo)
+            retraso = max(0.0, lazo.time() - inicio - self.intervalo_lazo)
+            self.retraso.observar(retraso)
+            self.retraso_ultimo.fijar(retraso)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.app(scope, self._al_apagar(receive), send)
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self._monitor is None:
+            self._monitor = asyncio.get_running_loop().create_task(self._medir_lazo())
+
+        respuesta = [500, 0]  # estado, bytes del cuerpo
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.body":
+                respuesta[1] += len(mensaje.get("body", b""))
+            elif mensaje["type"] == "http.response.start":
+                respuesta[0] = mensaje["status"]
+            await send(mensaje)
+
+        inicio = time.perf_counter()
+        self.en_curso.sumar(1)
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.en_curso.sumar(-1)
+            metodo = scope["method"]
+            ruta = self.rutas.plantilla(scope)
+            self.duracion.observar(duracion, metodo, ruta, respuesta[0])
+            self.tamano.observar(respuesta[1], metodo, ruta)
+
+
+def instrumentar(app, servicio: Optional[str] = None) -> Metricas:
+    """Agregar el middleware de métricas y GET /metrics a la aplicación FastAPI.
+
+    Con METRICAS_HABILITADAS=0 no se agrega nada; las métricas de negocio
+    se siguen pudiendo registrar y actualizar, pero no se exponen.
+    """
+    from fastapi.responses import PlainTextResponse
+
+    metricas = Metricas(servicio or app.title)
+    if os.getenv("METRICAS_HABILITADAS", "1") == "0":
+        return metricas
+    app.add_middleware(MiddlewareMetricas, metricas=metricas, router=app.router)
+
+    async def exponer_metricas():
+        """Métricas del servicio en formato de texto de Prometheus"""
+        return PlainTextResponse(metricas.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    app.add_api_route("/metrics", exponer_metricas, methods=["GET"], tags=["Monitoreo"], include_in_schema=False)
+    return metricas
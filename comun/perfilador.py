@@ -0,0 +1,313 @@
+"""Perfilador por muestreo para servicios en ejecución, sin dependencias externas.
+
+Un hilo toma cada intervalo_ms las pilas de todos los hilos del proceso
+(sys._current_frames) durante N segundos y las cuenta. El resultado está en
+formato de pilas colapsadas ("hilo;raíz;...;hoja cantidad"), el que leen
+flamegraph.pl, speedscope e inferno. Mientras no se captura no cuesta nada;
+durante la captura el costo es proporcional a la frecuencia de muestreo.
+
+    perfilar(app, metricas)
+
+Rutas (protegidas con el encabezado X-Token-Admin = PERFIL_TOKEN; sin
+PERFIL_TOKEN responden 404):
+- GET /admin/perfil?segundos=10: captura y devuelve el perfil.
+- GET /admin/perfiles y /admin/perfiles/{nombre}: últimos perfiles guardados.
+
+Con PERFIL_P99_UMBRAL_MS se revisa cada PERFIL_REVISION_S el histograma de
+latencia de MiddlewareMetricas; si el p99 de una ruta en ese periodo supera el
+umbral se captura un perfil automáticamente (como mucho uno cada
+PERFIL_ESPERA_S) y queda en /admin/perfiles.
+"""
+import asyncio
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from .metricas import Histograma, Metricas, cuantil
+
+logger = logging.getLogger(__name__)
+
+# Marcos superiores de hilos esperando (lazo de eventos en select, pools sin trabajo)
+_ARCHIVOS_INACTIVOS = ("selectors.py",)
+_ESPERAS_INACTIVAS = {("threading.py", "wait"), ("queue.py", "get"), ("thread.py", "_worker")}
+
+# Rutas que no se consideran para el disparo automático
+_RUTAS_EXCLUIDAS = ("/admin", "/metrics")
+
+
+def _inactivo(codigo) -> bool:
+    archivo = os.path.basename(codigo.co_filename)
+    return archivo in _ARCHIVOS_INACTIVOS or (archivo, codigo.co_name) in _ESPERAS_INACTIVAS
+
+
+def _marco(codigo) -> str:
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+
+
+class CapturaEnCurso(RuntimeError):
+    pass
+
+
+class Perfil:
+    """Pilas colapsadas de una captura"""
+
+    __slots__ = ("nombre", "motivo", "inicio", "segundos", "muestras", "pilas")
+
+    def __init__(self, nombre: str, motivo: str, inicio: datetime, segundos: float, muestras: int, pilas: Counter):
+        self.nombre = nombre
+        self.motivo = motivo
+        self.inicio = inicio
+        self.segundos = segundos
+        self.muestras = muestras
+        self.pilas = pilas
+
+    def colapsado(self) -> str:
+        return "".join(f"{pila} {cantidad}\n" for pila, cantidad in sorted(self.pilas.items()))
+
+    def resumen(self) -> dict:
+        return {
+            "nombre": self.nombre,
+            "motivo": self.motivo,
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "segundos": round(self.segundos, 3),
+            "muestras": self.muestras,
+            "pilas": len(self.pilas),
+        }
+
+
+class Perfilador:
+    """Captura perfiles de a uno por vez y guarda los últimos max_perfiles"""
+
+    def __init__(self, max_perfiles: int = 10):
+        self.max_perfiles = max_perfiles
+        self.perfiles: "OrderedDict[str, Perfil]" = OrderedDict()
+        self._ocupado = threading.Lock()
+
+    @property
+    def capturando(self) -> bool:
+        return self._ocupado.locked()
+
+    def capturar(self, segundos: float, intervalo: float = 0.01, motivo: str = "manual", incluir_inactivo: bool = False) -> Perfil:
+        """Muestrear las pilas de todos los hilos; bloquea durante la captura"""
+        if not self._ocupado.acquire(blocking=False):
+            raise CapturaEnCurso()
+        try:
+            return self._guardar(self._muestrear(segundos, intervalo, motivo, incluir_inactivo))
+        finally:
+            self._ocupado.release()
+
+    async def capturar_async(self, segundos: float, intervalo: float = 0.01, motivo: str = "manual", incluir_inactivo: bool = False) -> Perfil:
+        """capturar en un hilo aparte, para no bloquear el lazo de eventos que se quiere medir"""
+        if self.capturando:
+            raise CapturaEnCurso()
+        return await asyncio.to_thread(self.capturar, segundos, intervalo, motivo, incluir_inactivo)
+
+    def _muestrear(self, segundos: float, intervalo: float, motivo: str, incluir_inactivo: bool) -> Perfil:
+        propio = threading.get_ident()
+        # Las pilas se cuentan como tuplas de objetos de código y se formatean al final
+        conteos: Counter = Counter()
+        muestras = 0
+        inicio = datetime.now()
+        comienzo = time.perf_counter()
+        fin = comienzo + segundos
+        siguiente = comienzo
+        while True:
+            ahora = time.perf_counter()
+            if ahora >= fin:
+                break
+            for ident, marco in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                if not incluir_inactivo and _inactivo(marco.f_code):
+                    continue
+                pila = []
+                while marco is not None:
+                    pila.append(marco.f_code)
+                    marco = marco.f_back
+                conteos[(ident, tuple(pila))] += 1
+            muestras += 1
+            siguiente += intervalo
+            espera = siguiente - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            else:
+                siguiente = time.perf_counter()
+
+        nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+        pilas: Counter = Counter()
+        for (ident, pila), cantidad in conteos.items():
+            hilo = nombres.get(ident, f"hilo-{ident}").replace(" ", "_").replace(";", ":")
+            pilas[";".join([hilo, *(_marco(codigo) for codigo in reversed(pila))])] += cantidad
+        nombre = f"{inicio:%Y%m%dT%H%M%S}-{motivo}"
+        return Perfil(nombre, motivo, inicio, time.perf_counter() - comienzo, muestras, pilas)
+
+    def _guardar(self, perfil: Perfil) -> Perfil:
+        # Dos capturas en el mismo segundo con el mismo motivo no se pisan
+        nombre, n = perfil.nombre, 1
+        while nombre in self.perfiles:
+            n += 1
+            nombre = f"{perfil.nombre}-{n}"
+        perfil.nombre = nombre
+        self.perfiles[nombre] = perfil
+        while len(self.perfiles) > self.max_perfiles:
+            self.perfiles.popitem(last=False)
+        return perfil
+
+
+class DisparadorLentas:
+    """Captura un perfil cuando el p99 reciente de alguna ruta supera el umbral.
+
+    Cada `revision` segundos compara el histograma de latencia con el de la
+    revisión anterior; con al menos `minimo` solicitudes de una ruta en ese
+    periodo estima su p99 como histogram_quantile. Tras una captura espera
+    `espera` segundos antes de poder disparar otra.
+    """
+
+    def __init__(self, perfilador: Perfilador, histograma: Histograma, umbral_s: float, duracion: float,
+                 revision: float = 15.0, espera: float = 300.0, minimo: int = 20, capturados=None):
+        self.perfilador = perfilador
+        self.histograma = histograma
+        self.umbral_s = umbral_s
+        self.duracion = duracion
+        self.revision = revision
+        self.espera = espera
+        self.minimo = minimo
+        self.capturados = capturados
+        self._anterior: Dict[Tuple, Tuple[int, ...]] = {}
+        self._ultima = -espera
+
+    def _p99_por_ruta(self) -> Dict[Tuple[str, str], float]:
+        actual = self.histograma.instantanea()
+        por_ruta: Dict[Tuple[str, str], list] = defaultdict(lambda: [0] * (len(self.histograma.limites) + 1))
+        for etiquetas, conteos in actual.items():
+            metodo, ruta = etiquetas[0], etiquetas[1]
+            if ruta.startswith(_RUTAS_EXCLUIDAS):
+                continue
+            anteriores = self._anterior.get(etiquetas)
+            acumulados = por_ruta[(metodo, ruta)]
+            for i, conteo in enumerate(conteos):
+                acumulados[i] += conteo - (anteriores[i] if anteriores else 0)
+        self._anterior = actual
+        return {
+            ruta: cuantil(self.histograma.limites, conteos, 0.99)
+            for ruta, conteos in por_ruta.items() if sum(conteos) >= self.minimo
+        }
+
+    async def revisar(self) -> Optional[Perfil]:
+        lentas = {ruta: p99 for ruta, p99 in self._p99_por_ruta().items() if p99 > self.umbral_s}
+        if not lentas or time.monotonic() - self._ultima < self.espera or self.perfilador.capturando:
+            return None
+        (metodo, ruta), p99 = max(lentas.items(), key=lambda item: item[1])
+        logger.warning("p99 de %s %s en %.0f ms; capturando perfil de %ss", metodo, ruta, p99 * 1000, self.duracion)
+        self._ultima = time.monotonic()
+        try:
+            perfil = await self.perfilador.capturar_async(self.duracion, motivo="p99")
+        except CapturaEnCurso:
+            return None
+        perfil.motivo = f"p99 {metodo} {ruta} {p99 * 1000:.0f}ms"
+        if self.capturados is not None:
+            self.capturados.incrementar("p99")
+        return perfil
+
+    async def ejecutar(self):
+        while True:
+            await asyncio.sleep(self.revision)
+            try:
+                await self.revisar()
+            except Exception:
+                logger.exception("Error revisando latencias para el perfilador")
+
+
+def perfilar(app, metricas: Optional[Metricas] = None, perfilador: Optional[Perfilador] = None) -> Optional[Perfilador]:
+    """Agregar las rutas /admin/perfil* y, con PERFIL_P99_UMBRAL_MS, el disparo automático.
+
+    Sin PERFIL_TOKEN no se agrega nada: las rutas responderían 404 de todas formas.
+    """
+    from fastapi import Header, HTTPException, Path, Query
+    from fastapi.responses import PlainTextResponse
+
+    token = os.getenv("PERFIL_TOKEN", "")
+    if not token:
+        return None
+    perfilador = perfilador or Perfilador(int(os.getenv("PERFIL_MAX_GUARDADOS", "10")))
+    capturados = metricas.contador("perfiles_capturados_total", "Perfiles capturados", ("motivo",)) if metricas else None
+
+    def verificar(x_token_admin: Optional[str]):
+        if not x_token_admin or not hmac.compare_digest(x_token_admin.encode(), token.encode()):
+            raise HTTPException(status_code=403, detail="Token de administración inválido")
+
+    async def capturar_perfil(
+        segundos: float = Query(10, ge=0.1, le=60, description="Duración de la captura en segundos"),
+        intervalo_ms: float = Query(10, ge=1, le=1000, description="Milisegundos entre muestras"),
+        incluir_inactivo: bool = Query(False, description="Incluir hilos esperando (lazo de eventos en select, pools sin trabajo)"),
+        x_token_admin: Optional[str] = Header(None),
+    ):
+        """Muestrear las pilas del proceso y devolverlas en formato colapsado (flamegraph.pl, speedscope)"""
+        verificar(x_token_admin)
+        try:
+            perfil = await perfilador.capturar_async(segundos, intervalo_ms / 1000, incluir_inactivo=incluir_inactivo)
+        except CapturaEnCurso:
+            raise HTTPException(status_code=409, detail="Ya hay una captura de perfil en curso")
+        if capturados is not None:
+            capturados.incrementar("manual")
+        return PlainTextResponse(perfil.colapsado(), headers={
+            "X-Perfil-Nombre": perfil.nombre, "X-Perfil-Muestras": str(perfil.muestras),
+        })
+
+    async def listar_perfiles(x_token_admin: Optional[str] = Header(None)):
+        """Perfiles guardados, del más reciente al más antiguo"""
+        verificar(x_token_admin)
+        return [perfil.resumen() for perfil in reversed(perfilador.perfiles.values())]
+
+    async def obtener_perfil(
+        nombre: str = Path(..., description="Nombre del perfil en /admin/perfiles"),
+        x_token_admin: Optional[str] = Header(None),
+    ):
+        """Perfil guardado en formato colapsado"""
+        verificar(x_token_admin)
+        perfil = perfilador.perfiles.get(nombre)
+        if perfil is None:
+            raise HTTPException(status_code=404, detail="Perfil no encontrado")
+        return PlainTextResponse(perfil.colapsado())
+
+    for ruta, funcion in (
+        ("/admin/perfil", capturar_perfil),
+        ("/admin/perfiles", listar_perfiles),
+        ("/admin/perfiles/{nombre}", obtener_perfil),
+    ):
+        app.add_api_route(ruta, funcion, methods=["GET"], tags=["Administración"])
+
+    umbral_ms = os.getenv("PERFIL_P99_UMBRAL_MS")
+    if umbral_ms and metricas is not None:
+        tareas = []
+
+        async def iniciar_disparador():
+            # MiddlewareMetricas crea el histograma al armarse la pila de middlewares, antes del startup
+            histograma = metricas.obtener("http_request_duration_seconds")
+            if histograma is None:
+                logger.warning("PERFIL_P99_UMBRAL_MS sin métricas de latencia (METRICAS_HABILITADAS=0); no hay disparo automático")
+                return
+            disparador = DisparadorLentas(
+                perfilador, histograma,
+                umbral_s=float(umbral_ms) / 1000,
+                duracion=float(os.getenv("PERFIL_DURACION_S", "10")),
+                revision=float(os.getenv("PERFIL_REVISION_S", "15")),
+                espera=float(os.getenv("PERFIL_ESPERA_S", "300")),
+                minimo=int(os.getenv("PERFIL_MIN_SOLICITUDES", "20")),
+                capturados=capturados,
+            )
+            tareas.append(asyncio.create_task(disparador.ejecutar()))
+
+        async def detener_disparador():
+            for tarea in tareas:
+                tarea.cancel()
+
+        app.add_event_handler("startup", iniciar_disparador)
+        app.add_event_handler("shutdown", detener_disparador)
+    return perfilador
@@ -0,0 +1,105 @@
+"""Persistencia opcional de los repositorios.
+
+Por defecto los datos viven solo en memoria, como hasta ahora. Si se define
+REPOSITORIO_DIRECTORIO, cada repositorio escribe sus cambios en un registro
+de solo-agregado (un archivo por colección) y lo relee al iniciar; al
+cargar, el registro se compacta para que no crezca sin límite.
+"""
+import os
+import pickle
+from typing import BinaryIO, Dict, Iterable, Optional, Tuple
+
+
+class Persistencia:
+    """Destino de los cambios de un repositorio"""
+
+    def cargar(self) -> Dict[str, dict]:
+        """Registros guardados, por ID"""
+        return {}
+
+    def guardar(self, identificador: str, registro: dict):
+        pass
+
+    def guardar_varios(self, registros: Iterable[Tuple[str, dict]]):
+        for identificador, registro in registros:
+            self.guardar(identificador, registro)
+
+    def eliminar(self, identificador: str):
+        pass
+
+    def cerrar(self):
+        pass
+
+
+class PersistenciaMemoria(Persistencia):
+    """Sin persistencia: los datos se pierden al reiniciar"""
+
+
+class PersistenciaArchivo(Persistencia):
+    """Registro de solo-agregado de (id, registro); un registro None indica eliminación.
+
+    El archivo queda abierto para agregar: cada escritura serializa las
+    entradas en el búfer y lo vacía al sistema operativo con un solo write,
+    sin abrir ni cerrar el archivo por cambio.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._archivo: Optional[BinaryIO] = None
+
+    def _escribir(self, entradas: Iterable[Tuple[str, Optional[dict]]]):
+        if self._archivo is None:
+            self._archivo = open(self.ruta, "ab")
+        for entrada in entradas:
+            pickle.dump(entrada, self._archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        self._archivo.flush()
+
+    def cerrar(self):
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+
+    def cargar(self) -> Dict[str, dict]:
+        # La compactación reemplaza el archivo: el abierto para agregar quedaría apuntando al anterior
+        self.cerrar()
+        registros: Dict[str, dict] = {}
+        if not os.path.exists(self.ruta):
+            return registros
+        with open(self.ruta, "rb") as archivo:
+            while True:
+                try:
+                    identificador, registro = pickle.load(archivo)
+                except EOFError:
+                    break
+                except (pickle.UnpicklingError, ValueError):
+                    # Última escritura incompleta (el proceso terminó a mitad); se descarta
+                    break
+                if registro is None:
+                    registros.pop(identificador, None)
+                else:
+                    registros[identificador] = registro
+        # Compactar: reescribir solo el estado vigente y reemplazar el archivo de una vez
+        temporal = f"{self.ruta}.tmp"
+        with open(temporal, "wb") as archivo:
+            for entrada in registros.items():
+                pickle.dump(entrada, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, self.ruta)
+        return registros
+
+    def guardar(self, identificador: str, registro: dict):
+        self._escribir([(identificador, registro)])
+
+    def guardar_varios(self, registros: Iterable[Tuple[str, dict]]):
+        self._escribir(registros)
+
+    def eliminar(self, identificador: str):
+        self._escribir([(identificador, None)])
+
+
+def persistencia_desde_entorno(nombre: str) -> Persistencia:
+    """Persistencia en archivo si REPOSITORIO_DIRECTORIO está definido; en memoria si no"""
+    directorio = os.getenv("REPOSITORIO_DIRECTORIO")
+    if not directorio:
+        return PersistenciaMemoria()
+    os.makedirs(directorio, exist_ok=True)
+    return PersistenciaArchivo(os.path.join(directorio, f"{nombre}.log"))
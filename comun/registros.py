@@ -0,0 +1,125 @@
+"""Registros compactos para colecciones grandes.
+
+Un dict por registro cuesta varios cientos de bytes solo en su tabla de
+claves, además de una copia de cada texto repetido (IDs de producto, estados)
+leído de JSON o de una importación. Las clases creadas con esquema_registro
+guardan los campos en __slots__ y comparten los textos repetidos de los campos
+que se internan, pero se usan igual que un dict: registro["campo"], get,
+update, pop, "campo" in registro, **registro y dict(registro).
+
+Un Repositorio creado con registro=Clase convierte cada registro al
+guardarlo y devuelve el convertido. Los campos fuera del esquema se aceptan y
+van a un dict aparte que solo se crea si hace falta.
+"""
+import sys
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, Optional, Sequence, Tuple
+
+_FALTA = object()
+
+
+class RegistroCompacto(MutableMapping):
+    """Base de los registros con campos fijos en __slots__"""
+
+    __slots__ = ("_extra",)
+    _campos: Tuple[str, ...] = ()
+    _nombres: FrozenSet[str] = frozenset()
+    _internar: FrozenSet[str] = frozenset()
+
+    def __init__(self, valores: Mapping = (), **otros):
+        self._extra: Optional[Dict[str, Any]] = None
+        for clave, valor in dict(valores, **otros).items():
+            self[clave] = valor
+
+    @classmethod
+    def desde(cls, registro: Mapping) -> "RegistroCompacto":
+        """El registro convertido a esta clase (el mismo si ya lo es)"""
+        if type(registro) is cls:
+            return registro
+        compacto = cls.__new__(cls)
+        compacto._extra = None
+        for clave, valor in registro.items():
+            compacto[clave] = valor
+        return compacto
+
+    def __getitem__(self, clave: str):
+        if clave in self._nombres:
+            valor = getattr(self, clave, _FALTA)
+            if valor is not _FALTA:
+                return valor
+        elif self._extra is not None and clave in self._extra:
+            return self._extra[clave]
+        raise KeyError(clave)
+
+    def get(self, clave: str, defecto=None):
+        if clave in self._nombres:
+            return getattr(self, clave, defecto)
+        if self._extra is not None:
+            return self._extra.get(clave, defecto)
+        return defecto
+
+    def __setitem__(self, clave: str, valor):
+        if clave in self._nombres:
+            if clave in self._internar and type(valor) is str:
+                valor = sys.intern(valor)
+            setattr(self, clave, valor)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[clave] = valor
+
+    def __delitem__(self, clave: str):
+        if clave in self._nombres:
+            if getattr(self, clave, _FALTA) is _FALTA:
+                raise KeyError(clave)
+            delattr(self, clave)
+        elif self._extra is not None and clave in self._extra:
+            del self._extra[clave]
+        else:
+            raise KeyError(clave)
+
+    def __contains__(self, clave) -> bool:
+        if clave in self._nombres:
+            return getattr(self, clave, _FALTA) is not _FALTA
+        return self._extra is not None and clave in self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        for campo in self._campos:
+            if getattr(self, campo, _FALTA) is not _FALTA:
+                yield campo
+        if self._extra:
+            yield from list(self._extra)
+
+    def __len__(self) -> int:
+        presentes = sum(1 for campo in self._campos if getattr(self, campo, _FALTA) is not _FALTA)
+        return presentes + (len(self._extra) if self._extra else 0)
+
+    def copy(self) -> dict:
+        """Copia como dict, igual que dict.copy"""
+        return dict(self.items())
+
+    def __reduce__(self):
+        # Se serializa como dict: la clase se crea en tiempo de ejecución y el
+        # repositorio vuelve a compactar los registros al cargarlos
+        return dict, (list(self.items()),)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+
+def esquema_registro(nombre: str, campos: Sequence[str], internar: Iterable[str] = ()) -> type:
+    """Clase de registro compacto con los campos dados (se agrega "version").
+
+    internar: campos de texto con pocos valores distintos (IDs referenciados,
+    estados) cuyos valores se comparten entre registros.
+    """
+    campos = tuple(dict.fromkeys((*campos, "version")))
+    choques = [campo for campo in campos if hasattr(RegistroCompacto, campo)]
+    if choques:
+        raise ValueError(f"Campos que chocan con métodos del registro: {', '.join(choques)}")
+    return type(nombre, (RegistroCompacto,), {
+        "__slots__": campos,
+        "_campos": campos,
+        "_nombres": frozenset(campos),
+        "_internar": frozenset(internar),
+    })
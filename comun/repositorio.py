@@ -0,0 +1,283 @@
+"""Repositorio en memoria con índices secundarios.
+
+Reemplaza el dict de nivel de módulo de cada servicio. Se sigue usando como
+un dict de ID -> registro para leer (repo[id], repo.values()), pero las
+escrituras pasan por guardar/eliminar, que mantienen los índices declarados,
+la versión del registro y la de la colección (usadas por ETags y cachés) y
+la persistencia configurada.
+
+Las consultas reciben condiciones (ver condiciones.py). Cada índice estima
+cuántos candidatos le deja cada condición que sabe resolver y se usa el plan
+más chico; las demás condiciones se evalúan solo sobre esos candidatos. Sin
+orden pedido, los resultados salen en orden de inserción, igual que al
+recorrer el dict.
+
+Con registro=Clase (ver registros.py) los registros se guardan compactos;
+guardar devuelve el registro guardado, que es el que hay que seguir usando.
+"""
+from collections.abc import MutableMapping
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Type
+
+from .condiciones import Condicion, EnConjunto, Igual, extractor
+from .indices import Indice, IndiceOrdenado, Plan
+from .persistencia import Persistencia, persistencia_desde_entorno
+from .registros import RegistroCompacto
+
+# Con un índice ordenado disponible para el orden pedido, se prefiere un plan
+# de filtro (que obliga a ordenar los resultados) solo si deja al menos este
+# factor menos de candidatos; si no, se recorre el índice ordenado, que además
+# permite cortar apenas se completa la página.
+FACTOR_ORDENAR = 4
+
+
+class Pagina(NamedTuple):
+    total: int
+    registros: List[dict]
+
+
+class Repositorio(MutableMapping):
+    """Colección de registros (dicts con "id") con índices, versiones y persistencia"""
+
+    def __init__(
+        self,
+        nombre: str,
+        indices: Sequence[Indice] = (),
+        persistencia: Optional[Persistencia] = None,
+        registro: Optional[Type[RegistroCompacto]] = None
+    ):
+        self.nombre = nombre
+        self.indices: List[Indice] = list(indices)
+        self.registro = registro
+        self.persistencia = persistencia if persistencia is not None else persistencia_desde_entorno(nombre)
+        self.version = 0
+        self._datos: Dict[str, dict] = {}
+        self._secuencias: Dict[str, int] = {}  # ID -> orden de inserción
+        self._siguiente = 0
+        guardados = self.persistencia.cargar()
+        if guardados:
+            self._indexar_varios([(identificador, self._compactar(r)) for identificador, r in guardados.items()])
+
+    # --- Lectura como dict ---
+
+    def __getitem__(self, identificador: str) -> dict:
+        return self._datos[identificador]
+
+    def __contains__(self, identificador) -> bool:
+        return identificador in self._datos
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._datos)
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+    def get(self, identificador: str, defecto=None):
+        return self._datos.get(identificador, defecto)
+
+    def keys(self):
+        return self._datos.keys()
+
+    def values(self):
+        return self._datos.values()
+
+    def items(self):
+        return self._datos.items()
+
+    def __setitem__(self, identificador: str, registro: dict):
+        self.guardar(registro, identificador)
+
+    def __delitem__(self, identificador: str):
+        if identificador not in self._datos:
+            raise KeyError(identificador)
+        self.eliminar(identificador)
+
+    # --- Escritura ---
+
+    def _compactar(self, registro):
+        return registro if self.registro is None else self.registro.desde(registro)
+
+    def _indexar(self, identificador: str, registro: dict):
+        secuencia = self._secuencias.get(identificador)
+        if secuencia is None:
+            secuencia = self._secuencias[identificador] = self._siguiente
+            self._siguiente += 1
+        self._datos[identificador] = registro
+        for indice in self.indices:
+            indice.agregar(identificador, registro, secuencia)
+
+    def _indexar_varios(self, entradas: List[Tuple[str, dict]]):
+        indexadas = []
+        for identificador, registro in entradas:
+            secuencia = self._secuencias.get(identificador)
+            if secuencia is None:
+                secuencia = self._secuencias[identificador] = self._siguiente
+                self._siguiente += 1
+            self._datos[identificador] = registro
+            indexadas.append((identificador, registro, secuencia))
+        for indice in self.indices:
+            indice.agregar_varios(indexadas)
+
+    def guardar(self, registro: dict, identificador: Optional[str] = None) -> dict:
+        """Dar de alta o registrar la modificación de un registro (también si se modificó en sitio)"""
+        registro = self._compactar(registro)
+        identificador = identificador if identificador is not None else registro["id"]
+        registro["version"] = registro.get("version", 0) + 1
+        self._indexar(identificador, registro)
+        self.version += 1
+        self.persistencia.guardar(identificador, registro)
+        return registro
+
+    def guardar_varios(self, registros: Iterable[dict]):
+        """Guardar un lote con una sola actualización de índices y de la versión de la colección"""
+        entradas = []
+        for registro in map(self._compactar, registros):
+            registro["version"] = registro.get("version", 0) + 1
+            entradas.append((registro["id"], registro))
+        if not entradas:
+            return
+        self._indexar_varios(entradas)
+        self.version += 1
+        self.persistencia.guardar_varios(entradas)
+
+    def inicializar(self, registros: Iterable[dict]) -> bool:
+        """Cargar datos iniciales (de prueba) si el repositorio está vacío; no cambian la versión"""
+        if self._datos:
+            return False
+        self._indexar_varios([(registro["id"], registro) for registro in map(self._compactar, registros)])
+        self.persistencia.guardar_varios(self._datos.items())
+        return True
+
+    def eliminar(self, identificador: str) -> Optional[dict]:
+        """Quitar un registro; devuelve el registro eliminado o None si no existía"""
+        registro = self._datos.pop(identificador, None)
+        if registro is None:
+            return None
+        del self._secuencias[identificador]
+        for indice in self.indices:
+            indice.quitar(identificador)
+        self.version += 1
+        self.persistencia.eliminar(identificador)
+        return registro
+
+    def cerrar(self):
+        """Cerrar la persistencia (el archivo del registro de cambios, si hay)"""
+        self.persistencia.cerrar()
+
+    def tocar(self):
+        """Incrementar la versión de la colección sin modificar registros"""
+        self.version += 1
+
+    # --- Consultas ---
+
+    def indice(self, campo: str, tipo: type = Indice) -> Optional[Indice]:
+        """Primer índice declarado sobre el campo (del tipo dado)"""
+        for indice in self.indices:
+            if indice.campo == campo and isinstance(indice, tipo):
+                return indice
+        return None
+
+    def _plan_clave(self, condicion: Condicion) -> Optional[Plan]:
+        """Plan por ID, sin índice secundario"""
+        if isinstance(condicion, Igual) and not condicion.normalizado:
+            ids = (condicion.clave,) if condicion.clave in self._datos else ()
+        elif isinstance(condicion, EnConjunto) and not condicion.normalizado:
+            ids = [i for i in condicion.claves if i in self._datos]
+        else:
+            return None
+        return Plan(len(ids), lambda descendente: ids)
+
+    def _planificar(self, condiciones: Sequence[Condicion], ordenar_por: Optional[str]) -> Tuple[Optional[Plan], str]:
+        mejor, descripcion = None, "recorrido completo"
+        for condicion in condiciones:
+            if condicion.campo == "id":
+                candidatos = [(self._plan_clave(condicion), "id")]
+            else:
+                candidatos = [
+                    (indice.planificar(condicion, condiciones), f"{type(indice).__name__}({indice.campo})")
+                    for indice in self.indices if indice.campo == condicion.campo
+                ]
+            for plan, nombre in candidatos:
+                if plan is not None and (mejor is None or plan.estimado < mejor.estimado):
+                    mejor, descripcion = plan, nombre
+        if ordenar_por is None or (mejor is not None and mejor.orden == ordenar_por):
+            return mejor, descripcion
+        ordenado = self.indice(ordenar_por, IndiceOrdenado)
+        if ordenado is None:
+            return mejor, descripcion
+        plan_orden = ordenado.tramo(condiciones=condiciones)
+        # Los registros sin valor en el campo no están en el índice ordenado
+        completo = ordenado.cantidad() == len(self._datos) or any(c.campo == ordenar_por for c in condiciones)
+        if completo and (mejor is None or mejor.estimado * FACTOR_ORDENAR > plan_orden.estimado):
+            return plan_orden, f"IndiceOrdenado({ordenar_por})"
+        return mejor, descripcion
+
+    def consultar(
+        self,
+        *condiciones: Condicion,
+        ordenar_por: Optional[str] = None,
+        descendente: bool = False
+    ) -> Iterator[dict]:
+        """Registros que cumplen todas las condiciones, a medida que se recorren.
+
+        Con ordenar_por los registros sin valor en ese campo van al final.
+        """
+        activas = [c for c in condiciones if c.activa]
+        plan, _ = self._planificar(activas, ordenar_por)
+        if plan is None:
+            registros: Iterable[dict] = self._datos.values()
+        else:
+            ids = plan.ids(descendente)
+            if plan.orden is None or plan.orden != ordenar_por:
+                ids = sorted(ids, key=self._secuencias.__getitem__)
+            registros = (r for r in map(self._datos.get, ids) if r is not None)
+        resultado = (r for r in registros if all(c.coincide(r) for c in activas))
+        if ordenar_por is None or (plan is not None and plan.orden == ordenar_por):
+            return resultado
+        return iter(_ordenar(resultado, ordenar_por, descendente))
+
+    def ids(self, *condiciones: Condicion) -> List[str]:
+        return [registro["id"] for registro in self.consultar(*condiciones)]
+
+    def contar(self, *condiciones: Condicion) -> int:
+        if not any(c.activa for c in condiciones):
+            return len(self._datos)
+        return sum(1 for _ in self.consultar(*condiciones))
+
+    def paginar(
+        self,
+        *condiciones: Condicion,
+        offset: int = 0,
+        limite: Optional[int] = None,
+        ordenar_por: Optional[str] = None,
+        descendente: bool = False
+    ) -> Pagina:
+        """Total de coincidencias y los registros de la página pedida"""
+        resultado = self.consultar(*condiciones, ordenar_por=ordenar_por, descendente=descendente)
+        fin = None if limite is None else offset + limite
+        registros = list(islice(resultado, offset, fin))
+        total = offset + len(registros) if fin is None or len(registros) < limite else fin + sum(1 for _ in resultado)
+        if not registros and offset:
+            # Página fuera de rango: el recorrido ya se consumió hasta el final
+            total = self.contar(*condiciones)
+        return Pagina(total, registros)
+
+    def explicar(self, *condiciones: Condicion, ordenar_por: Optional[str] = None) -> Dict[str, Any]:
+        """Plan elegido para una consulta, para diagnóstico"""
+        activas = [c for c in condiciones if c.activa]
+        plan, descripcion = self._planificar(activas, ordenar_por)
+        return {
+            "plan": descripcion,
+            "candidatos_estimados": len(self._datos) if plan is None else plan.estimado,
+            "ordena_despues": ordenar_por is not None and (plan is None or plan.orden != ordenar_por),
+            "total_registros": len(self._datos),
+        }
+
+
+def _ordenar(registros: Iterable[dict], campo: str, descendente: bool) -> List[dict]:
+    obtener = extractor(campo)
+    con_valor, sin_valor = [], []
+    for registro in registros:
+        (sin_valor if obtener(registro) is None else con_valor).append(registro)
+    con_valor.sort(key=obtener, reverse=descendente)
+    return con_valor + sin_valor
@@ -0,0 +1,68 @@
+"""Importación por lotes: confirmación, errores de fila e interrupciones"""
+import asyncio
+import json
+
+import pytest
+from pydantic import BaseModel
+
+from comun.importacion import FORMATO_NDJSON, LONGITUD_MAXIMA_LINEA, importar
+
+
+class Item(BaseModel):
+    nombre: str
+    cantidad: int
+
+
+async def fragmentos(*partes: bytes):
+    for parte in partes:
+        yield parte
+
+
+def ndjson(filas) -> bytes:
+    return "".join(json.dumps(fila) + "\n" for fila in filas).encode()
+
+
+def ejecutar(partes, confirmar, tamano_lote=2, existe=lambda _: False):
+    return asyncio.run(importar(fragmentos(*partes), FORMATO_NDJSON, Item, confirmar, existe, tamano_lote))
+
+
+def test_confirma_por_lotes_y_reporta_filas_invalidas():
+    lotes = []
+    filas = [{"nombre": "a", "cantidad": 1}, {"nombre": "b"}, {"id": "x", "nombre": "c", "cantidad": 3},
+             {"id": "x", "nombre": "d", "cantidad": 4}, {"nombre": "e", "cantidad": 5}]
+    confirmados = set()
+
+    def confirmar(lote):
+        lotes.append([(i, r.nombre) for i, r in lote])
+        confirmados.update(i for i, _ in lote)
+
+    resultado = ejecutar([ndjson(filas)], confirmar, existe=confirmados.__contains__)
+
+    assert lotes == [[(None, "a"), ("x", "c")], [(None, "e")]]
+    assert resultado["importadas"] == 3
+    assert resultado["lotes_confirmados"] == 2
+    assert [error["linea"] for error in resultado["errores"]] == [2, 4]
+    assert not resultado["interrumpida"]
+
+
+def test_interrupcion_de_lectura_conserva_los_lotes_confirmados():
+    lotes = []
+    partes = [ndjson([{"nombre": "a", "cantidad": 1}] * 3), b"x" * (LONGITUD_MAXIMA_LINEA + 1)]
+    resultado = ejecutar(partes, lambda lote: lotes.append(len(lote)))
+
+    assert lotes == [2, 1]
+    assert resultado["interrumpida"]
+    assert resultado["importadas"] == 3
+
+
+@pytest.mark.parametrize("filas", [3, 4])
+def test_error_al_confirmar_se_propaga_sin_reintentar_el_lote(filas):
+    llamadas = []
+
+    def confirmar(lote):
+        llamadas.append(len(lote))
+        raise ValueError("confirmación rechazada")
+
+    with pytest.raises(ValueError, match="confirmación rechazada"):
+        ejecutar([ndjson([{"nombre": "a", "cantidad": 1}] * filas)], confirmar)
+    assert llamadas == [2]
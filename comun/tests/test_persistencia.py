@@ -0,0 +1,97 @@
+"""Registro de cambios en archivo: recarga, compactación y escrituras interrumpidas"""
+import os
+import pickle
+
+from comun import IndiceHash, PersistenciaArchivo, Repositorio, esquema_registro
+
+Orden = esquema_registro("Orden", ("id", "estado", "total"), internar=("estado",))
+
+
+def abrir(ruta, registro=None) -> Repositorio:
+    return Repositorio("ordenes", indices=(IndiceHash("estado"),), persistencia=PersistenciaArchivo(ruta), registro=registro)
+
+
+def entradas(ruta):
+    resultado = []
+    with open(ruta, "rb") as archivo:
+        while True:
+            try:
+                resultado.append(pickle.load(archivo))
+            except EOFError:
+                return resultado
+
+
+def test_recarga_el_estado_vigente(tmp_path):
+    ruta = str(tmp_path / "ordenes.log")
+    repo = abrir(ruta, Orden)
+    repo.guardar_varios({"id": f"o{i}", "estado": "borrador", "total": i} for i in range(5))
+    orden = repo["o1"]
+    orden["estado"] = "enviada"
+    repo.guardar(orden)
+    repo.eliminar("o2")
+    repo.cerrar()
+
+    recargado = abrir(ruta, Orden)
+
+    assert sorted(recargado) == ["o0", "o1", "o3", "o4"]
+    assert recargado["o1"]["estado"] == "enviada"
+    assert recargado["o1"]["version"] == 2
+    assert recargado.ids(*()) and recargado.indice("estado").distribucion() == {"borrador": 3, "enviada": 1}
+    assert isinstance(recargado["o0"], Orden)
+
+
+def test_compacta_al_cargar(tmp_path):
+    ruta = str(tmp_path / "ordenes.log")
+    repo = abrir(ruta)
+    repo.guardar({"id": "o1", "estado": "borrador", "total": 1})
+    for total in range(2, 50):
+        repo.guardar({**repo["o1"], "total": total})
+    repo.guardar({"id": "o2", "estado": "borrador", "total": 1})
+    repo.eliminar("o2")
+    repo.cerrar()
+    assert len(entradas(ruta)) == 51
+
+    recargado = abrir(ruta)
+
+    assert [identificador for identificador, _ in entradas(ruta)] == ["o1"]
+    assert recargado["o1"]["total"] == 49
+    assert not os.path.exists(f"{ruta}.tmp")
+
+
+def test_escribe_sobre_el_archivo_compactado(tmp_path):
+    ruta = str(tmp_path / "ordenes.log")
+    repo = abrir(ruta)
+    repo.guardar({"id": "o1", "estado": "borrador", "total": 1})
+    repo.guardar({**repo["o1"], "total": 2})
+
+    # La carga compacta y reemplaza el archivo mientras el repositorio anterior lo tenía abierto
+    recargado = abrir(ruta)
+    recargado.guardar({"id": "o2", "estado": "borrador", "total": 3})
+
+    assert [identificador for identificador, _ in entradas(ruta)] == ["o1", "o2"]
+    assert sorted(abrir(ruta)) == ["o1", "o2"]
+
+
+def test_cada_escritura_llega_al_archivo_sin_cerrar(tmp_path):
+    ruta = str(tmp_path / "ordenes.log")
+    repo = abrir(ruta)
+    repo.guardar({"id": "o1", "estado": "borrador", "total": 1})
+
+    assert entradas(ruta)[-1][0] == "o1"
+    repo.eliminar("o1")
+    assert entradas(ruta)[-1] == ("o1", None)
+
+
+def test_descarta_la_ultima_escritura_incompleta(tmp_path):
+    ruta = str(tmp_path / "ordenes.log")
+    repo = abrir(ruta)
+    repo.guardar_varios({"id": f"o{i}", "estado": "borrador", "total": i} for i in range(3))
+    repo.cerrar()
+    with open(ruta, "r+b") as archivo:
+        archivo.truncate(os.path.getsize(ruta) - 5)
+
+    recargado = abrir(ruta)
+
+    assert sorted(recargado) == ["o0", "o1"]
+    recargado.guardar({"id": "o3", "estado": "borrador", "total": 3})
+    assert sorted(abrir(ruta)) == ["o0", "o1", "o3"]
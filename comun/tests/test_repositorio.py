@@ -0,0 +1,164 @@
+"""Repositorio: índices tras modificar en sitio, elección de plan y paginación"""
+import pytest
+
+from comun import (
+    Contiene, EnConjunto, Igual, IndiceHash, IndiceOrdenado, IndiceTexto, PersistenciaMemoria, Predicado, Rango,
+    Repositorio, esquema_registro
+)
+
+Lote = esquema_registro("Lote", ("id", "id_producto", "estado", "cantidad", "codigo"), internar=("id_producto", "estado"))
+
+
+def crear_repositorio(registro=None, cantidad=100) -> Repositorio:
+    repo = Repositorio(
+        "lotes",
+        indices=(
+            IndiceHash("id_producto"),
+            IndiceHash("estado", normalizado=True, parcial=True),
+            IndiceOrdenado("cantidad", particion=("id_producto",)),
+            IndiceTexto("codigo"),
+        ),
+        persistencia=PersistenciaMemoria(),
+        registro=registro,
+    )
+    repo.guardar_varios(
+        {
+            "id": f"l{i:03d}",
+            "id_producto": f"p{i % 10}",
+            "estado": "Disponible" if i % 4 else "Agotado",
+            "cantidad": i,
+            "codigo": f"LOTE-{i:03d}",
+        }
+        for i in range(cantidad)
+    )
+    return repo
+
+
+@pytest.fixture(params=[None, Lote], ids=["dict", "compacto"])
+def repo(request) -> Repositorio:
+    return crear_repositorio(request.param)
+
+
+def test_modificacion_en_sitio_reindexa(repo):
+    registro = repo["l005"]
+    registro["id_producto"] = "p99"
+    registro["cantidad"] = 1000
+    registro["estado"] = "Agotado"
+    registro["codigo"] = "XYZ-1"
+    repo.guardar(registro)
+
+    assert repo.ids(Igual("id_producto", "p99")) == ["l005"]
+    assert "l005" not in repo.ids(Igual("id_producto", "p5"))
+    assert repo.ids(Rango("cantidad", 500)) == ["l005"]
+    assert "l005" in repo.ids(Igual("estado", "agotado", normalizado=True))
+    assert "l005" not in repo.ids(Igual("estado", "disponible", normalizado=True))
+    assert repo.ids(Contiene("codigo", "xyz")) == ["l005"]
+    assert repo.ids(Contiene("codigo", "LOTE-005")) == []
+    assert repo["l005"]["version"] == 2
+
+
+def test_guardar_varios_reindexa_los_existentes(repo):
+    repo.guardar_varios([{**repo["l001"], "cantidad": 500}, {**repo["l002"], "id_producto": "p1"}])
+
+    assert repo.ids(Rango("cantidad", 500, 500)) == ["l001"]
+    assert "l002" in repo.ids(Igual("id_producto", "p1"))
+    assert "l002" not in repo.ids(Igual("id_producto", "p2"))
+    # Cada registro queda una sola vez en el índice ordenado
+    assert len(repo.ids(Rango("cantidad", 0))) == len(repo)
+
+
+def test_eliminar_quita_de_todos_los_indices(repo):
+    repo.eliminar("l007")
+
+    assert "l007" not in repo
+    assert "l007" not in repo.ids(Igual("id_producto", "p7"))
+    assert repo.ids(Rango("cantidad", 7, 7)) == []
+    assert repo.ids(Contiene("codigo", "LOTE-007")) == []
+    assert repo.indice("id_producto").distribucion()["p7"] == 9
+
+
+def test_plan_elige_el_indice_mas_selectivo(repo):
+    # El rango sobre cantidad deja 3 candidatos; el estado agotado, 25
+    plan = repo.explicar(Igual("estado", "agotado", normalizado=True), Rango("cantidad", 10, 12))
+    assert plan["plan"] == "IndiceOrdenado(cantidad)"
+    assert plan["candidatos_estimados"] == 3
+    assert repo.ids(Igual("estado", "agotado", normalizado=True), Rango("cantidad", 10, 12)) == ["l012"]
+
+    plan = repo.explicar(Igual("estado", "agotado", normalizado=True), Rango("cantidad", 0, 90))
+    assert plan["plan"] == "IndiceHash(estado)"
+    assert plan["candidatos_estimados"] == 25
+
+
+def test_plan_usa_la_particion_del_indice_ordenado(repo):
+    # Con el producto fijo el rango se recorre solo dentro de su partición
+    plan = repo.explicar(Igual("id_producto", "p1"), Rango("cantidad", 0, 90))
+    assert plan["plan"] == "IndiceOrdenado(cantidad)"
+    assert plan["candidatos_estimados"] == 9
+    assert repo.contar(Igual("id_producto", "p1"), Rango("cantidad", 0, 90)) == 9
+
+
+def test_plan_por_id_texto_y_sin_indice(repo):
+    assert repo.explicar(EnConjunto("id", ["l001", "l002", "nada"]))["candidatos_estimados"] == 2
+    assert repo.explicar(Contiene("codigo", "LOTE-01"))["plan"] == "IndiceTexto(codigo)"
+    assert repo.explicar(Contiene("estado", "agot"))["plan"] == "IndiceHash(estado)"
+
+    sin_indice = repo.explicar(Predicado(lambda r: r["cantidad"] % 2 == 0))
+    assert sin_indice["plan"] == "recorrido completo"
+    assert sin_indice["candidatos_estimados"] == len(repo)
+
+
+def test_condiciones_sin_valor_no_filtran(repo):
+    assert repo.contar(Igual("id_producto", None), Rango("cantidad"), Contiene("codigo", "")) == len(repo)
+    assert repo.explicar(Igual("id_producto", None))["plan"] == "recorrido completo"
+
+
+def test_plan_ordenado_recorre_el_indice(repo):
+    plan = repo.explicar(Igual("estado", "disponible", normalizado=True), ordenar_por="cantidad")
+    assert plan["plan"] == "IndiceOrdenado(cantidad)"
+    assert not plan["ordena_despues"]
+
+    cantidades = [r["cantidad"] for r in repo.consultar(Igual("id_producto", "p3"), ordenar_por="cantidad", descendente=True)]
+    assert cantidades == sorted(cantidades, reverse=True) == list(range(93, -1, -10))
+
+
+def test_resultados_en_orden_de_insercion(repo):
+    # Un plan por índice hash devuelve los IDs del conjunto; deben salir en orden de inserción
+    assert repo.ids(Igual("id_producto", "p4")) == [f"l{i:03d}" for i in range(4, 100, 10)]
+    repo.guardar({"id": "l000", "id_producto": "p4", "estado": "Agotado", "cantidad": 0, "codigo": "X"})
+    assert repo.ids(Igual("id_producto", "p4"))[0] == "l000"
+
+
+def test_ordenar_sin_valor_al_final():
+    repo = crear_repositorio(cantidad=5)
+    repo.guardar({"id": "sin", "id_producto": "p0", "estado": "Disponible", "codigo": "S"})
+
+    assert repo.explicar(ordenar_por="cantidad")["ordena_despues"]
+    assert [r["id"] for r in repo.consultar(ordenar_por="cantidad", descendente=True)][-1] == "sin"
+
+
+@pytest.mark.parametrize("offset,limite,esperados", [
+    (0, 3, ["l001", "l011", "l021"]),
+    (8, 3, ["l081", "l091"]),
+    (0, None, [f"l{i:03d}" for i in range(1, 100, 10)]),
+    (20, 5, []),
+])
+def test_paginar(repo, offset, limite, esperados):
+    pagina = repo.paginar(Igual("id_producto", "p1"), offset=offset, limite=limite)
+
+    assert pagina.total == 10
+    assert [r["id"] for r in pagina.registros] == esperados
+
+
+def test_paginar_ordenado(repo):
+    pagina = repo.paginar(Rango("cantidad", 10, 49), offset=5, limite=10, ordenar_por="cantidad", descendente=True)
+
+    assert pagina.total == 40
+    assert [r["cantidad"] for r in pagina.registros] == list(range(44, 34, -1))
+
+
+def test_version_de_la_coleccion(repo):
+    version = repo.version
+    repo.guardar({**repo["l001"], "cantidad": 2})
+    repo.eliminar("l002")
+    repo.eliminar("no-existe")
+    assert repo.version == version + 2
@@ -0,0 +1,18 @@
+"""Normalización de valores para comparar e indexar."""
+import unicodedata
+from typing import Set
+
+
+def valor_enum(valor):
+    """Normalizar un valor que puede venir como Enum o como str"""
+    return getattr(valor, "value", valor)
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes y con espacios simples ("Antibióticos " -> "antibioticos")"""
+    descompuesto = unicodedata.normalize("NFKD", texto.casefold())
+    return " ".join("".join(c for c in descompuesto if not unicodedata.combining(c)).split())
+
+
+def trigramas(texto: str) -> Set[str]:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
@@ -0,0 +1,283 @@
+"""Trazas dentro de los servicios con OpenTelemetry (opcional).
+
+Istio crea un tramo por salto entre sidecars; sin más, una traza de
+obtener_orden muestra un tramo opaco por servicio. Con trazar(app):
+
+- Se reenvían a las llamadas salientes los encabezados de traza de la
+  solicitud entrante (traceparent, x-b3-*, x-request-id...), que es lo que
+  Istio necesita para unir los tramos de los sidecars en una sola traza. Esto
+  funciona aunque OpenTelemetry no esté instalado.
+- Con TRAZAS_HABILITADAS=1 y OpenTelemetry instalado (comun/requirements-trazas.txt)
+  cada solicitud tiene un tramo de servidor hijo del tramo de Istio, con
+  tramos internos (tramo("filtrar"), tramo("construir_respuesta")) y uno por
+  cada llamada con httpx hecha a través de TransporteTrazado. Se propagan
+  W3C traceparent y B3 multi-encabezado.
+
+Muestreo:
+- Inicial (TRAZAS_MUESTREO, proporción 0-1): decide por traza con el
+  identificador de traza, así que todos los servicios deciden lo mismo.
+  Por defecto se respeta la decisión del padre (los encabezados de Istio);
+  con TRAZAS_RESPETAR_PADRE=0 se aplica la proporción igual.
+- De cola (TRAZAS_COLA=1): los tramos de cada traza se retienen hasta que
+  termina el tramo raíz local y se exportan solo si hubo un error, si
+  duró al menos TRAZAS_COLA_LENTAS_MS, o para TRAZAS_COLA_PROPORCION de las
+  demás. La decisión es local al servicio; el muestreo de cola entre
+  servicios corresponde al colector.
+
+El exportador es OTLP por gRPC (OTEL_EXPORTER_OTLP_ENDPOINT, por defecto el
+colector de Jaeger de tracing.yaml), o la consola con TRAZAS_EXPORTADOR=consola.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from .metricas import PlantillasRuta
+from .texto import valor_enum
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:  # OpenTelemetry (API y SDK) es opcional
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+COLECTOR_JAEGER = "http://jaeger-collector.istio-system.svc.cluster.local:4317"
+
+# Encabezados que Istio pide reenviar para unir las trazas de los sidecars
+ENCABEZADOS_TRAZA = frozenset((
+    "x-request-id", "traceparent", "tracestate", "baggage", "b3",
+    "x-b3-traceid", "x-b3-spanid", "x-b3-parentspanid", "x-b3-sampled", "x-b3-flags", "x-ot-span-context",
+))
+
+_ENCABEZADOS_TRAZA_BYTES = frozenset(nombre.encode() for nombre in ENCABEZADOS_TRAZA)
+
+_entrantes: ContextVar[Dict[str, str]] = ContextVar("encabezados_traza", default={})
+_tracer = None
+_NULO = nullcontext()
+
+
+def habilitadas() -> bool:
+    return _tracer is not None
+
+
+def tramo(nombre: str, **atributos):
+    """Tramo interno como context manager; sin trazas habilitadas no hace nada"""
+    if _tracer is None:
+        return _NULO
+    return _tracer.start_as_current_span(
+        nombre, attributes={clave: valor_enum(valor) for clave, valor in atributos.items() if valor is not None}
+    )
+
+
+class TransporteTrazado:
+    """Transporte de httpx que propaga la traza y crea un tramo por llamada.
+
+    httpx.AsyncClient(transport=TransporteTrazado()). Sin trazas habilitadas
+    solo reenvía los encabezados de traza de la solicitud entrante.
+    """
+
+    def __init__(self, interno=None):
+        if interno is None:
+            import httpx
+            interno = httpx.AsyncHTTPTransport()
+        self._interno = interno
+
+    async def handle_async_request(self, solicitud):
+        entrantes = _entrantes.get()
+        if _tracer is None:
+            for nombre, valor in entrantes.items():
+                if nombre not in solicitud.headers:
+                    solicitud.headers[nombre] = valor
+            return await self._interno.handle_async_request(solicitud)
+
+        # El contexto lo inyecta el propagador; del resto solo se reenvía x-request-id
+        if "x-request-id" in entrantes and "x-request-id" not in solicitud.headers:
+            solicitud.headers["x-request-id"] = entrantes["x-request-id"]
+        with _tracer.start_as_current_span(
+            f"{solicitud.method} {solicitud.url.host}", kind=SpanKind.CLIENT,
+            attributes={
+                "http.request.method": solicitud.method, "server.address": solicitud.url.host,
+                "url.full": str(solicitud.url),
+            },
+        ) as span:
+            propagate.inject(solicitud.headers)
+            respuesta = await self._interno.handle_async_request(solicitud)
+            span.set_attribute("http.response.status_code", respuesta.status_code)
+            if respuesta.status_code >= 500:
+                span.set_status(Status(StatusCode.ERROR))
+            return respuesta
+
+    # Mismo protocolo que httpx.AsyncBaseTransport, sin importar httpx en los servicios que no lo usan
+    async def __aenter__(self):
+        await self._interno.__aenter__()
+        return self
+
+    async def __aexit__(self, *excepcion):
+        await self._interno.__aexit__(*excepcion)
+
+    async def aclose(self):
+        await self._interno.aclose()
+
+
+class MiddlewareTrazas:
+    """Middleware ASGI que guarda los encabezados de traza y, si hay trazas, abre el tramo de servidor"""
+
+    def __init__(self, app, router):
+        self.app = app
+        self.rutas = PlantillasRuta(router)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encabezados = {
+            nombre.decode("latin-1"): valor.decode("latin-1")
+            for nombre, valor in scope["headers"] if nombre in _ENCABEZADOS_TRAZA_BYTES
+        }
+        if _tracer is None and not encabezados:
+            await self.app(scope, receive, send)
+            return
+        token = _entrantes.set(encabezados)
+        try:
+            if _tracer is None:
+                await self.app(scope, receive, send)
+            else:
+                await self._trazar(scope, receive, send, encabezados)
+        finally:
+            _entrantes.reset(token)
+
+    async def _trazar(self, scope, receive, send, encabezados):
+        estado = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+            await send(mensaje)
+
+        metodo = scope["method"]
+        with _tracer.start_as_current_span(
+            metodo, context=propagate.extract(encabezados), kind=SpanKind.SERVER,
+            attributes={"http.request.method": metodo, "url.path": scope["path"]},
+        ) as span:
+            try:
+                await self.app(scope, receive, enviar)
+            finally:
+                ruta = self.rutas.plantilla(scope)
+                span.update_name(f"{metodo} {ruta}")
+                span.set_attribute("http.route", ruta)
+                span.set_attribute("http.response.status_code", estado[0])
+                if estado[0] >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
+
+
+if trace is not None:
+    class MuestreoCola(SpanProcessor):
+        """Retiene los tramos de cada traza hasta que termina su raíz local y decide si exportarlos.
+
+        Se conservan las trazas con algún tramo en error, las que duraron al
+        menos lentas_s y una proporción de las demás (por identificador de
+        traza). Los tramos que terminan después de la raíz siguen la decisión
+        ya tomada. Como mucho se retienen max_trazas trazas sin decidir; si
+        se supera, se descartan las más antiguas.
+        """
+
+        def __init__(self, destino: SpanProcessor, lentas_s: float, proporcion: float, max_trazas: int = 10000):
+            self.destino = destino
+            self.lentas_s = lentas_s
+            self.limite_proporcion = int(proporcion * (1 << 64))
+            self.max_trazas = max_trazas
+            self._pendientes: "OrderedDict[int, List[ReadableSpan]]" = OrderedDict()
+            self._decididas: "OrderedDict[int, bool]" = OrderedDict()
+            self._lock = threading.Lock()
+
+        def on_start(self, span, parent_context=None):
+            pass
+
+        def on_end(self, span: ReadableSpan):
+            traza_id = span.context.trace_id
+            with self._lock:
+                conservar = self._decididas.get(traza_id)
+                if conservar is not None:
+                    tramos = [span]
+                elif span.parent is not None and not span.parent.is_remote:
+                    self._pendientes.setdefault(traza_id, []).append(span)
+                    if len(self._pendientes) > self.max_trazas:
+                        self._pendientes.popitem(last=False)
+                    return
+                else:
+                    tramos = self._pendientes.pop(traza_id, [])
+                    tramos.append(span)
+                    conservar = self._decidir(span, tramos)
+                    self._decididas[traza_id] = conservar
+                    if len(self._decididas) > self.max_trazas:
+                        self._decididas.popitem(last=False)
+            if conservar:
+                for tramo_terminado in tramos:
+                    self.destino.on_end(tramo_terminado)
+
+        def _decidir(self, raiz: ReadableSpan, tramos: List[ReadableSpan]) -> bool:
+            if any(t.status.status_code is StatusCode.ERROR for t in tramos):
+                return True
+            if (raiz.end_time - raiz.start_time) / 1e9 >= self.lentas_s:
+                return True
+            return (raiz.context.trace_id & 0xFFFFFFFFFFFFFFFF) < self.limite_proporcion
+
+        def shutdown(self):
+            self.destino.shutdown()
+
+        def force_flush(self, timeout_millis: int = 30000) -> bool:
+            return self.destino.force_flush(timeout_millis)
+
+
+def _configurar(servicio: str):
+    """Proveedor de trazas, propagadores, muestreo y exportador según el entorno"""
+    global _tracer
+    from opentelemetry.baggage.propagation import W3CBaggagePropagator
+    from opentelemetry.propagators.b3 import B3MultiFormat
+    from opentelemetry.propagators.composite import CompositePropagator
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+    propagate.set_global_textmap(CompositePropagator([
+        TraceContextTextMapPropagator(), W3CBaggagePropagator(), B3MultiFormat()
+    ]))
+
+    muestreo = TraceIdRatioBased(float(os.getenv("TRAZAS_MUESTREO", "1.0")))
+    if os.getenv("TRAZAS_RESPETAR_PADRE", "1") == "1":
+        muestreo = ParentBased(muestreo)
+    proveedor = TracerProvider(resource=Resource.create({"service.name": servicio}), sampler=muestreo)
+
+    if os.getenv("TRAZAS_EXPORTADOR", "otlp") == "consola":
+        exportador = ConsoleSpanExporter()
+    else:
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        exportador = OTLPSpanExporter(endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", COLECTOR_JAEGER), insecure=True)
+    procesador = BatchSpanProcessor(exportador)
+    if os.getenv("TRAZAS_COLA", "0") == "1":
+        procesador = MuestreoCola(
+            procesador,
+            lentas_s=float(os.getenv("TRAZAS_COLA_LENTAS_MS", "250")) / 1000,
+            proporcion=float(os.getenv("TRAZAS_COLA_PROPORCION", "0.1")),
+        )
+    proveedor.add_span_processor(procesador)
+    trace.set_tracer_provider(proveedor)
+    _tracer = trace.get_tracer("comun.trazas")
+
+
+def trazar(app, servicio: Optional[str] = None):
+    """Agregar el middleware de trazas y, si corresponde, configurar OpenTelemetry"""
+    if os.getenv("TRAZAS_HABILITADAS", "0") == "1":
+        if trace is None:
+            logger.warning("TRAZAS_HABILITADAS=1 pero OpenTelemetry no está instalado; solo se propagan encabezados")
+        else:
+            _configurar(servicio or os.getenv("OTEL_SERVICE_NAME") or app.title)
+    app.add_middleware(MiddlewareTrazas, router=app.router)
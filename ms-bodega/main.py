@@ -1,20 +1,58 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, Response, Request
 from fastapi.responses import JSONResponse
 from typing import List, Optional
 from datetime import datetime
+from itertools import islice
+from pydantic import TypeAdapter
 import uuid
 import os
 import json
-from models import BodegaCreate, BodegaUpdate, BodegaResponse, BodegaFilter
+from models import (
+    BodegaCreate, BodegaUpdate, BodegaResponse, BodegaFilter,
+    ConsultaStock, StockProductoBodegas, FormatoImportacion, ResultadoImportacion
+)
+from comun import Repositorio, esquema_registro, IndiceHash, IndiceOrdenado, IndiceTexto, Igual, EnConjunto, Contiene, Rango
+from comun.cache_respuestas import CacheRespuestas, clave_cache
+from comun.etags import etag_coincide, etag_fuerte, no_modificado
+from comun.importacion import importar, formato_desde_content_type
+from comun.metricas import instrumentar, registrar_cache, registrar_repositorio
+from comun.perfilador import perfilar
+from comun.trazas import tramo, trazar
 
 app = FastAPI(
     title="MS-Bodega API",
     description="Microservicio para gestión de bodegas y ubicaciones geográficas",
     version="1.0.0"
 )
+metricas = instrumentar(app)
+trazar(app, "ms-bodega")
+perfilar(app, metricas)
+
+# Registro compacto de una bodega; el producto se comparte entre bodegas
+Bodega = esquema_registro("Bodega", (
+    "id", "nombre", "capacidad", "ubicacion_geografica", "cantidad_disponible", "cantidad_reservada",
+    "cantidad_vendida", "id_producto", "fecha_creacion", "fecha_actualizacion"
+), internar=("id_producto",))
+
+# Base de datos en memoria con índices por los filtros del listado.
+# Cada escritura (bodegas_db.guardar/eliminar) incrementa la versión de la bodega y la de
+# la colección (bodegas_db.version), usadas en los ETags.
+bodegas_db = Repositorio("bodegas", [
+    IndiceHash("id_producto"),
+    IndiceTexto("nombre"),
+    IndiceHash("ubicacion_geografica.ciudad", normalizado=True, parcial=True),
+    IndiceOrdenado("capacidad"),
+], registro=Bodega)
 
-# Simulación de base de datos en memoria
-bodegas_db = {}
+# Caché de listas ya serializadas a JSON, validada contra bodegas_db.version
+cache_respuestas = CacheRespuestas(max_bytes=int(os.getenv("CACHE_RESPUESTAS_MAX_BYTES", 32 * 1024 * 1024)))
+lista_bodegas_json = TypeAdapter(List[BodegaResponse])
+
+registrar_repositorio(metricas, bodegas_db)
+registrar_cache(metricas, cache_respuestas)
+reservas = metricas.contador("bodega_reservas_total", "Reservas de stock en bodegas", ("resultado",))
+unidades_reservadas = metricas.contador("bodega_unidades_reservadas_total", "Unidades reservadas en bodegas")
+unidades_vendidas = metricas.contador("bodega_unidades_vendidas_total", "Unidades vendidas desde bodegas")
 
 def cargar_bodegas_desde_json():
     ruta = os.path.join(os.path.dirname(__file__), "test_data.json")
@@ -36,24 +74,17 @@ def cargar_bodegas_desde_json():
             "cantidad_vendida": bodega.get("cantidad_vendida", 0),
             "id_producto": bodega["id_producto"],
             "fecha_creacion": datetime.now(),
-            "fecha_actualizacion": datetime.now()
+            "fecha_actualizacion": datetime.now(),
+            "version": 1
         }
     return bodegas
 
-bodegas_db = cargar_bodegas_desde_json()
+# Los datos de prueba solo se cargan si no hay datos persistidos
+bodegas_db.inicializar(cargar_bodegas_desde_json().values())
 
-@app.get("/", tags=["Health"])
-async def root():
-    """Endpoint de salud del servicio"""
-    return {"message": "MS-Bodega API activa", "timestamp": datetime.now()}
-
-@app.post("/bodegas", response_model=BodegaResponse, tags=["Bodegas"])
-async def crear_bodega(bodega: BodegaCreate):
-    """Crear una nueva bodega"""
-    bodega_id = str(uuid.uuid4())
-    now = datetime.now()
-    
-    nueva_bodega = {
+def construir_bodega(bodega: BodegaCreate, bodega_id: str, now: datetime) -> dict:
+    """Registro en memoria de una bodega nueva"""
+    return {
         "id": bodega_id,
         "nombre": bodega.nombre,
         "capacidad": bodega.capacidad,
@@ -63,44 +94,99 @@ async def crear_bodega(bodega: BodegaCreate):
         "cantidad_vendida": 0,
         "id_producto": bodega.id_producto,
         "fecha_creacion": now,
-        "fecha_actualizacion": now
+        "fecha_actualizacion": now,
+        "version": 0
     }
+
+def confirmar_bodegas(lote):
+    """Dar de alta un lote importado con un solo cambio de versión de la colección"""
+    now = datetime.now()
+    bodegas_db.guardar_varios(
+        construir_bodega(bodega, bodega_id or str(uuid.uuid4()), now) for bodega_id, bodega in lote
+    )
+
+@app.get("/", tags=["Health"])
+async def root():
+    """Endpoint de salud del servicio"""
+    return {"message": "MS-Bodega API activa", "timestamp": datetime.now()}
+
+@app.post("/bodegas", response_model=BodegaResponse, tags=["Bodegas"])
+async def crear_bodega(bodega: BodegaCreate):
+    """Crear una nueva bodega"""
+    bodega_id = str(uuid.uuid4())
+    nueva_bodega = construir_bodega(bodega, bodega_id, datetime.now())
     
-    bodegas_db[bodega_id] = nueva_bodega
+    nueva_bodega = bodegas_db.guardar(nueva_bodega)
     return BodegaResponse(**nueva_bodega)
 
+@app.post("/bodegas/importar", response_model=ResultadoImportacion, tags=["Importación"])
+async def importar_bodegas(
+    request: Request,
+    formato: Optional[FormatoImportacion] = Query(None, description="Formato del cuerpo; por defecto según el Content-Type"),
+    tamano_lote: int = Query(1000, ge=1, le=50000, description="Filas confirmadas por lote"),
+    max_errores: int = Query(100, ge=0, le=10000, description="Máximo de errores detallados en la respuesta")
+):
+    """Importar bodegas desde NDJSON o CSV, leyendo el cuerpo en streaming"""
+    resultado = await importar(
+        request.stream(),
+        formato or formato_desde_content_type(request.headers.get("content-type")),
+        BodegaCreate, confirmar_bodegas, bodegas_db.__contains__,
+        tamano_lote, max_errores
+    )
+    return ResultadoImportacion(**resultado)
+
 @app.get("/bodegas", response_model=List[BodegaResponse], tags=["Bodegas"])
 async def listar_bodegas(
     nombre: Optional[str] = Query(None, description="Filtrar por nombre"),
     id_producto: Optional[str] = Query(None, description="Filtrar por ID de producto"),
     ciudad: Optional[str] = Query(None, description="Filtrar por ciudad"),
     capacidad_min: Optional[int] = Query(None, description="Capacidad mínima"),
-    capacidad_max: Optional[int] = Query(None, description="Capacidad máxima")
+    capacidad_max: Optional[int] = Query(None, description="Capacidad máxima"),
+    offset: int = Query(0, ge=0, description="Número de bodegas a omitir"),
+    limit: Optional[int] = Query(None, ge=1, description="Número máximo de bodegas a devolver"),
+    if_none_match: Optional[str] = Header(None)
 ):
     """Listar todas las bodegas con filtros opcionales"""
-    bodegas = list(bodegas_db.values())
-    
-    # Aplicar filtros
-    if nombre:
-        bodegas = [b for b in bodegas if nombre.lower() in b["nombre"].lower()]
-    if id_producto:
-        bodegas = [b for b in bodegas if b["id_producto"] == id_producto]
-    if ciudad:
-        bodegas = [b for b in bodegas if ciudad.lower() in b["ubicacion_geografica"]["ciudad"].lower()]
-    if capacidad_min:
-        bodegas = [b for b in bodegas if b["capacidad"] >= capacidad_min]
-    if capacidad_max:
-        bodegas = [b for b in bodegas if b["capacidad"] <= capacidad_max]
-    
-    return [BodegaResponse(**bodega) for bodega in bodegas]
+    etag = etag_fuerte("bodegas", bodegas_db.version)
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
+    
+    clave = clave_cache(
+        "bodegas", nombre=nombre, id_producto=id_producto, ciudad=ciudad,
+        capacidad_min=capacidad_min, capacidad_max=capacidad_max, offset=offset, limit=limit
+    )
+    cuerpo = cache_respuestas.obtener(clave, bodegas_db.version)
+    if cuerpo is not None:
+        return Response(content=cuerpo, media_type="application/json", headers={"ETag": etag})
+    
+    # El repositorio resuelve los filtros con el índice más selectivo
+    with tramo("filtrar", coleccion="bodegas"):
+        bodegas = bodegas_db.consultar(
+            Contiene("nombre", nombre),
+            Igual("id_producto", id_producto),
+            Contiene("ubicacion_geografica.ciudad", ciudad),
+            Rango("capacidad", capacidad_min, capacidad_max)
+        )
+        bodegas = list(islice(bodegas, offset, offset + limit if limit else None))
+    
+    with tramo("construir_respuesta", cantidad=len(bodegas)):
+        cuerpo = lista_bodegas_json.dump_json([BodegaResponse(**bodega) for bodega in bodegas])
+    cache_respuestas.guardar(clave, bodegas_db.version, cuerpo)
+    return Response(content=cuerpo, media_type="application/json", headers={"ETag": etag})
 
 @app.get("/bodegas/{bodega_id}", response_model=BodegaResponse, tags=["Bodegas"])
-async def obtener_bodega(bodega_id: str):
+async def obtener_bodega(bodega_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
     """Obtener una bodega específica por ID"""
     if bodega_id not in bodegas_db:
         raise HTTPException(status_code=404, detail="Bodega no encontrada")
     
-    return BodegaResponse(**bodegas_db[bodega_id])
+    bodega = bodegas_db[bodega_id]
+    etag = etag_fuerte(bodega_id, bodega.get("version", 0))
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
+    response.headers["ETag"] = etag
+    
+    return BodegaResponse(**bodega)
 
 @app.put("/bodegas/{bodega_id}", response_model=BodegaResponse, tags=["Bodegas"])
 async def actualizar_bodega(bodega_id: str, bodega_update: BodegaUpdate):
@@ -118,7 +204,7 @@ async def actualizar_bodega(bodega_id: str, bodega_update: BodegaUpdate):
             bodega[field] = value
     
     bodega["fecha_actualizacion"] = datetime.now()
-    bodegas_db[bodega_id] = bodega
+    bodegas_db.guardar(bodega)
     
     return BodegaResponse(**bodega)
 
@@ -128,7 +214,7 @@ async def eliminar_bodega(bodega_id: str):
     if bodega_id not in bodegas_db:
         raise HTTPException(status_code=404, detail="Bodega no encontrada")
     
-    del bodegas_db[bodega_id]
+    bodegas_db.eliminar(bodega_id)
     return {"message": f"Bodega {bodega_id} eliminada exitosamente"}
 
 @app.get("/bodegas/{bodega_id}/disponibilidad", tags=["Disponibilidad"])
@@ -157,6 +243,7 @@ async def reservar_cantidad(bodega_id: str, cantidad: int):
     bodega = bodegas_db[bodega_id]
     
     if bodega["cantidad_disponible"] < cantidad:
+        reservas.incrementar("sin_stock")
         raise HTTPException(
             status_code=400, 
             detail=f"Cantidad no disponible. Disponible: {bodega['cantidad_disponible']}"
@@ -165,6 +252,9 @@ async def reservar_cantidad(bodega_id: str, cantidad: int):
     bodega["cantidad_disponible"] -= cantidad
     bodega["cantidad_reservada"] += cantidad
     bodega["fecha_actualizacion"] = datetime.now()
+    bodegas_db.guardar(bodega)
+    reservas.incrementar("ok")
+    unidades_reservadas.incrementar(cantidad=cantidad)
     
     return {
         "message": f"Se reservaron {cantidad} unidades",
@@ -189,6 +279,8 @@ async def vender_cantidad(bodega_id: str, cantidad: int):
     bodega["cantidad_reservada"] -= cantidad
     bodega["cantidad_vendida"] += cantidad
     bodega["fecha_actualizacion"] = datetime.now()
+    bodegas_db.guardar(bodega)
+    unidades_vendidas.incrementar(cantidad=cantidad)
     
     return {
         "message": f"Se vendieron {cantidad} unidades",
@@ -196,6 +288,30 @@ async def vender_cantidad(bodega_id: str, cantidad: int):
         "cantidad_vendida": bodega["cantidad_vendida"]
     }
 
+@app.post("/stock/productos", response_model=List[StockProductoBodegas], tags=["Disponibilidad"])
+async def consultar_stock_productos(consulta: ConsultaStock):
+    """Consultar en un solo llamado el stock agregado por producto en todas las bodegas"""
+    stock = {}
+    
+    # Con ids_producto se recorren solo las bodegas de esos productos, vía el índice
+    for bodega in bodegas_db.consultar(EnConjunto("id_producto", consulta.ids_producto)):
+        id_producto = bodega["id_producto"]
+        acumulado = stock.get(id_producto)
+        if acumulado is None:
+            acumulado = stock[id_producto] = {
+                "id_producto": id_producto, "cantidad_disponible": 0, "cantidad_reservada": 0, "bodegas": 0
+            }
+        acumulado["cantidad_disponible"] += bodega["cantidad_disponible"]
+        acumulado["cantidad_reservada"] += bodega["cantidad_reservada"]
+        acumulado["bodegas"] += 1
+    
+    return [StockProductoBodegas(**acumulado) for acumulado in stock.values()]
+
+@app.get("/cache/estadisticas", tags=["Caché"])
+async def obtener_estadisticas_cache():
+    """Obtener estadísticas de la caché de respuestas"""
+    return cache_respuestas.estadisticas()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
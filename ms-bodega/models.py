@@ -55,3 +55,40 @@ class BodegaFilter(BaseModel):
     ciudad: Optional[str] = None
     capacidad_min: Optional[int] = None
     capacidad_max: Optional[int] = None
+
+
+class ConsultaStock(BaseModel):
+    """Consulta de stock para varios productos a la vez"""
+    ids_producto: Optional[List[str]] = None  # None = todos los productos
+
+
+class StockProductoBodegas(BaseModel):
+    """Stock agregado de un producto en todas sus bodegas"""
+    id_producto: str
+    cantidad_disponible: int
+    cantidad_reservada: int
+    bodegas: int
+
+
+class FormatoImportacion(str, Enum):
+    """Formatos aceptados por la importación masiva"""
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class ErrorFilaImportacion(BaseModel):
+    """Errores de una fila rechazada en una importación"""
+    linea: int
+    errores: List[str]
+
+
+class ResultadoImportacion(BaseModel):
+    """Resumen de una importación masiva"""
+    formato: FormatoImportacion
+    filas_leidas: int
+    importadas: int
+    con_error: int
+    lotes_confirmados: int
+    interrumpida: bool
+    motivo_interrupcion: Optional[str] = None
+    errores: List[ErrorFilaImportacion]  # Solo los primeros max_errores
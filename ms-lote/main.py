@@ -1,22 +1,48 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from typing import List, Optional
 from datetime import datetime, date, timedelta
+from itertools import islice
 import uuid
 import os
 import json
 from models import (
     LoteCreate, LoteUpdate, LoteResponse, LoteFilter, 
-    AlertaVencimiento, TipoAlmacenamiento
+    AlertaVencimiento, TipoAlmacenamiento, ConsultaStock, StockProductoLotes,
+    FormatoImportacion, ResultadoImportacion
 )
+from comun import Repositorio, esquema_registro, IndiceHash, IndiceOrdenado, Igual, EnConjunto, Rango, Predicado
+from comun.importacion import importar, formato_desde_content_type
+from comun.metricas import instrumentar, registrar_repositorio
+from comun.perfilador import perfilar
+from comun.trazas import tramo, trazar
 
 app = FastAPI(
     title="MS-Lote API",
     description="Microservicio para gestión de lotes y almacenamiento",
     version="1.0.0"
 )
+metricas = instrumentar(app)
+trazar(app, "ms-lote")
+perfilar(app, metricas)
 
-# Simulación de base de datos en memoria
-lotes_db = {}
+# Registro compacto de un lote; los IDs referenciados y el tipo se comparten entre lotes
+Lote = esquema_registro("Lote", (
+    "id", "fecha_vencimiento", "tipo_almacenamiento", "cantidad_inicial", "cantidad_disponible",
+    "cantidad_reservada", "cantidad_vendida", "id_producto", "id_bodega", "temperatura_optima",
+    "humedad_optima", "fecha_creacion", "fecha_actualizacion", "esta_vencido"
+), internar=("tipo_almacenamiento", "id_producto", "id_bodega"))
+
+# Base de datos en memoria con índices por producto, bodega, tipo y fecha de vencimiento
+lotes_db = Repositorio("lotes", [
+    IndiceHash("id_producto"),
+    IndiceHash("id_bodega"),
+    IndiceHash("tipo_almacenamiento"),
+    IndiceOrdenado("fecha_vencimiento"),
+], registro=Lote)
+
+registrar_repositorio(metricas, lotes_db, "tipo_almacenamiento")
+reservas = metricas.contador("lote_reservas_total", "Reservas de lotes", ("resultado",))
+unidades_reservadas = metricas.contador("lote_unidades_reservadas_total", "Unidades reservadas de lotes")
 
 def esta_vencido(fecha_vencimiento: date) -> bool:
     """Verificar si un lote está vencido"""
@@ -49,26 +75,16 @@ def cargar_lotes_desde_json():
         }
     return lotes
 
-lotes_db = cargar_lotes_desde_json()
+# Los datos de prueba solo se cargan si no hay datos persistidos
+lotes_db.inicializar(cargar_lotes_desde_json().values())
 
 def calcular_dias_vencimiento(fecha_vencimiento: date) -> int:
     """Calcular días para el vencimiento"""
     return (fecha_vencimiento - date.today()).days
 
-
-
-@app.get("/", tags=["Health"])
-async def root():
-    """Endpoint de salud del servicio"""
-    return {"message": "MS-Lote API activa", "timestamp": datetime.now()}
-
-@app.post("/lotes", response_model=LoteResponse, tags=["Lotes"])
-async def crear_lote(lote: LoteCreate):
-    """Crear un nuevo lote"""
-    lote_id = str(uuid.uuid4())
-    now = datetime.now()
-    
-    nuevo_lote = {
+def construir_lote(lote: LoteCreate, lote_id: str, now: datetime) -> dict:
+    """Registro en memoria de un lote nuevo"""
+    return {
         "id": lote_id,
         "fecha_vencimiento": lote.fecha_vencimiento,
         "tipo_almacenamiento": lote.tipo_almacenamiento,
@@ -84,10 +100,46 @@ async def crear_lote(lote: LoteCreate):
         "fecha_actualizacion": now,
         "esta_vencido": esta_vencido(lote.fecha_vencimiento)
     }
+
+def confirmar_lotes(lote_importado):
+    """Dar de alta un lote de registros importados"""
+    now = datetime.now()
+    lotes_db.guardar_varios(
+        construir_lote(lote, lote_id or str(uuid.uuid4()), now) for lote_id, lote in lote_importado
+    )
+
+
+
+@app.get("/", tags=["Health"])
+async def root():
+    """Endpoint de salud del servicio"""
+    return {"message": "MS-Lote API activa", "timestamp": datetime.now()}
+
+@app.post("/lotes", response_model=LoteResponse, tags=["Lotes"])
+async def crear_lote(lote: LoteCreate):
+    """Crear un nuevo lote"""
+    lote_id = str(uuid.uuid4())
+    nuevo_lote = construir_lote(lote, lote_id, datetime.now())
     
-    lotes_db[lote_id] = nuevo_lote
+    nuevo_lote = lotes_db.guardar(nuevo_lote)
     return LoteResponse(**nuevo_lote)
 
+@app.post("/lotes/importar", response_model=ResultadoImportacion, tags=["Importación"])
+async def importar_lotes(
+    request: Request,
+    formato: Optional[FormatoImportacion] = Query(None, description="Formato del cuerpo; por defecto según el Content-Type"),
+    tamano_lote: int = Query(1000, ge=1, le=50000, description="Filas confirmadas por lote"),
+    max_errores: int = Query(100, ge=0, le=10000, description="Máximo de errores detallados en la respuesta")
+):
+    """Importar lotes desde NDJSON o CSV, leyendo el cuerpo en streaming"""
+    resultado = await importar(
+        request.stream(),
+        formato or formato_desde_content_type(request.headers.get("content-type")),
+        LoteCreate, confirmar_lotes, lotes_db.__contains__,
+        tamano_lote, max_errores
+    )
+    return ResultadoImportacion(**resultado)
+
 @app.get("/lotes", response_model=List[LoteResponse], tags=["Lotes"])
 async def listar_lotes(
     id_producto: Optional[str] = Query(None, description="Filtrar por ID de producto"),
@@ -96,32 +148,32 @@ async def listar_lotes(
     vencimiento_desde: Optional[date] = Query(None, description="Fecha de vencimiento desde"),
     vencimiento_hasta: Optional[date] = Query(None, description="Fecha de vencimiento hasta"),
     solo_disponibles: Optional[bool] = Query(None, description="Solo lotes con cantidad disponible > 0"),
-    solo_vencidos: Optional[bool] = Query(None, description="Solo lotes vencidos")
+    solo_vencidos: Optional[bool] = Query(None, description="Solo lotes vencidos"),
+    offset: int = Query(0, ge=0, description="Número de lotes a omitir"),
+    limit: Optional[int] = Query(None, ge=1, description="Número máximo de lotes a devolver")
 ):
     """Listar todos los lotes con filtros opcionales"""
-    lotes = list(lotes_db.values())
+    # Vencido: vence antes de hoy; se combina con el rango pedido en una sola condición
+    if solo_vencidos:
+        ayer = date.today() - timedelta(days=1)
+        vencimiento_hasta = min(vencimiento_hasta, ayer) if vencimiento_hasta else ayer
+    
+    with tramo("filtrar", coleccion="lotes"):
+        lotes = lotes_db.consultar(
+            Igual("id_producto", id_producto or None),
+            Igual("id_bodega", id_bodega or None),
+            Igual("tipo_almacenamiento", tipo_almacenamiento),
+            Rango("fecha_vencimiento", vencimiento_desde, vencimiento_hasta),
+            Predicado(lambda l: l["cantidad_disponible"] > 0, activa=bool(solo_disponibles))
+        )
+        lotes = list(islice(lotes, offset, offset + limit if limit else None))
     
     # Actualizar estado de vencimiento
     for lote in lotes:
         lote["esta_vencido"] = esta_vencido(lote["fecha_vencimiento"])
     
-    # Aplicar filtros
-    if id_producto:
-        lotes = [l for l in lotes if l["id_producto"] == id_producto]
-    if id_bodega:
-        lotes = [l for l in lotes if l["id_bodega"] == id_bodega]
-    if tipo_almacenamiento:
-        lotes = [l for l in lotes if l["tipo_almacenamiento"] == tipo_almacenamiento]
-    if vencimiento_desde:
-        lotes = [l for l in lotes if l["fecha_vencimiento"] >= vencimiento_desde]
-    if vencimiento_hasta:
-        lotes = [l for l in lotes if l["fecha_vencimiento"] <= vencimiento_hasta]
-    if solo_disponibles:
-        lotes = [l for l in lotes if l["cantidad_disponible"] > 0]
-    if solo_vencidos:
-        lotes = [l for l in lotes if l["esta_vencido"]]
-    
-    return [LoteResponse(**lote) for lote in lotes]
+    with tramo("construir_respuesta", cantidad=len(lotes)):
+        return [LoteResponse(**lote) for lote in lotes]
 
 @app.get("/lotes/{lote_id}", response_model=LoteResponse, tags=["Lotes"])
 async def obtener_lote(lote_id: str):
@@ -147,7 +199,7 @@ async def actualizar_lote(lote_id: str, lote_update: LoteUpdate):
     
     lote["fecha_actualizacion"] = datetime.now()
     lote["esta_vencido"] = esta_vencido(lote["fecha_vencimiento"])
-    lotes_db[lote_id] = lote
+    lotes_db.guardar(lote)
     
     return LoteResponse(**lote)
 
@@ -157,7 +209,7 @@ async def eliminar_lote(lote_id: str):
     if lote_id not in lotes_db:
         raise HTTPException(status_code=404, detail="Lote no encontrado")
     
-    del lotes_db[lote_id]
+    lotes_db.eliminar(lote_id)
     return {"message": f"Lote {lote_id} eliminado exitosamente"}
 
 @app.get("/lotes/{lote_id}/disponibilidad", tags=["Disponibilidad"])
@@ -189,9 +241,11 @@ async def reservar_cantidad_lote(lote_id: str, cantidad: int):
     lote = lotes_db[lote_id]
     
     if esta_vencido(lote["fecha_vencimiento"]):
+        reservas.incrementar("vencido")
         raise HTTPException(status_code=400, detail="No se puede reservar de un lote vencido")
     
     if lote["cantidad_disponible"] < cantidad:
+        reservas.incrementar("sin_stock")
         raise HTTPException(
             status_code=400, 
             detail=f"Cantidad no disponible. Disponible: {lote['cantidad_disponible']}"
@@ -200,6 +254,9 @@ async def reservar_cantidad_lote(lote_id: str, cantidad: int):
     lote["cantidad_disponible"] -= cantidad
     lote["cantidad_reservada"] += cantidad
     lote["fecha_actualizacion"] = datetime.now()
+    lotes_db.guardar(lote)
+    reservas.incrementar("ok")
+    unidades_reservadas.incrementar(cantidad=cantidad)
     
     return {
         "message": f"Se reservaron {cantidad} unidades del lote",
@@ -207,6 +264,30 @@ async def reservar_cantidad_lote(lote_id: str, cantidad: int):
         "cantidad_reservada": lote["cantidad_reservada"]
     }
 
+@app.post("/stock/productos", response_model=List[StockProductoLotes], tags=["Disponibilidad"])
+async def consultar_stock_productos(consulta: ConsultaStock):
+    """Consultar en un solo llamado el stock agregado por producto; los lotes vencidos no suman disponible"""
+    hoy = date.today()
+    stock = {}
+    
+    # Con ids_producto se recorren solo los lotes de esos productos, vía el índice
+    for lote in lotes_db.consultar(EnConjunto("id_producto", consulta.ids_producto)):
+        id_producto = lote["id_producto"]
+        acumulado = stock.get(id_producto)
+        if acumulado is None:
+            acumulado = stock[id_producto] = {
+                "id_producto": id_producto, "cantidad_disponible": 0, "cantidad_reservada": 0,
+                "lotes": 0, "lotes_vencidos": 0
+            }
+        if lote["fecha_vencimiento"] < hoy:
+            acumulado["lotes_vencidos"] += 1
+        else:
+            acumulado["cantidad_disponible"] += lote["cantidad_disponible"]
+        acumulado["cantidad_reservada"] += lote["cantidad_reservada"]
+        acumulado["lotes"] += 1
+    
+    return [StockProductoLotes(**acumulado) for acumulado in stock.values()]
+
 @app.get("/alertas/vencimiento", response_model=List[AlertaVencimiento], tags=["Alertas"])
 async def obtener_alertas_vencimiento(
     dias_anticipacion: int = Query(30, description="Días de anticipación para alerta")
@@ -215,10 +296,10 @@ async def obtener_alertas_vencimiento(
     alertas = []
     fecha_limite = date.today() + timedelta(days=dias_anticipacion)
     
-    for lote_id, lote in lotes_db.items():
-        if (lote["fecha_vencimiento"] <= fecha_limite and 
-            lote["cantidad_disponible"] > 0 and 
-            not esta_vencido(lote["fecha_vencimiento"])):
+    # Solo los lotes que vencen entre hoy y la fecha límite, vía el índice de vencimiento
+    for lote in lotes_db.consultar(Rango("fecha_vencimiento", date.today(), fecha_limite)):
+        lote_id = lote["id"]
+        if lote["cantidad_disponible"] > 0:
             
             dias_vencimiento = calcular_dias_vencimiento(lote["fecha_vencimiento"])
             
@@ -248,10 +329,9 @@ async def obtener_lotes_vencidos():
     """Obtener todos los lotes vencidos"""
     lotes_vencidos = []
     
-    for lote_id, lote in lotes_db.items():
-        if esta_vencido(lote["fecha_vencimiento"]):
-            lote["esta_vencido"] = True
-            lotes_vencidos.append(LoteResponse(**lote))
+    for lote in lotes_db.consultar(Rango("fecha_vencimiento", maximo=date.today() - timedelta(days=1))):
+        lote["esta_vencido"] = True
+        lotes_vencidos.append(LoteResponse(**lote))
     
     return lotes_vencidos
 
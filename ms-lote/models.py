@@ -70,3 +70,41 @@ class AlertaVencimiento(BaseModel):
     dias_para_vencer: int
     cantidad_disponible: int
     prioridad: str  # "ALTA", "MEDIA", "BAJA"
+
+
+class ConsultaStock(BaseModel):
+    """Consulta de stock para varios productos a la vez"""
+    ids_producto: Optional[List[str]] = None  # None = todos los productos
+
+
+class StockProductoLotes(BaseModel):
+    """Stock agregado de un producto en todos sus lotes"""
+    id_producto: str
+    cantidad_disponible: int  # solo lotes no vencidos
+    cantidad_reservada: int
+    lotes: int
+    lotes_vencidos: int
+
+
+class FormatoImportacion(str, Enum):
+    """Formatos aceptados por la importación masiva"""
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class ErrorFilaImportacion(BaseModel):
+    """Errores de una fila rechazada en una importación"""
+    linea: int
+    errores: List[str]
+
+
+class ResultadoImportacion(BaseModel):
+    """Resumen de una importación masiva"""
+    formato: FormatoImportacion
+    filas_leidas: int
+    importadas: int
+    con_error: int
+    lotes_confirmados: int
+    interrumpida: bool
+    motivo_interrupcion: Optional[str] = None
+    errores: List[ErrorFilaImportacion]  # Solo los primeros max_errores
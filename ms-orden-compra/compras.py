@@ -0,0 +1,75 @@
+"""Última compra y stock en tránsito por producto, mantenidos de forma incremental.
+
+Cada orden no cancelada aporta a sus productos una compra (fecha, proveedor y
+precio) y, si está aprobada o enviada, la cantidad en tránsito. Igual que el
+desempeño de proveedores, cada escritura quita el aporte de la orden con sus
+valores anteriores y lo vuelve a sumar con los nuevos, así que consultar un
+producto no recorre las órdenes.
+"""
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from desempeno import ESTADOS_COMPROMETIDOS
+from models import EstadoOrden
+
+
+class ComprasProductos:
+    """Compras de cada producto ordenadas por fecha, con la cantidad en tránsito"""
+
+    def __init__(self):
+        # id_producto -> claves (fecha_orden, fecha_creacion, id_orden) en orden creciente
+        self._compras: Dict[str, list] = {}
+        # (id_producto, id_orden) -> (id_proveedor, precio_unitario)
+        self._detalle: Dict[Tuple[str, str], Tuple[str, object]] = {}
+        self._en_transito: Dict[str, int] = {}
+
+    def agregar(self, orden: dict, items: List[dict]):
+        self._aplicar(orden, items, 1)
+
+    def quitar(self, orden: dict, items: List[dict]):
+        self._aplicar(orden, items, -1)
+
+    def _aplicar(self, orden: dict, items: List[dict], signo: int):
+        if orden["estado"] == EstadoOrden.CANCELLED or not items:
+            return
+        # Con varios items del mismo producto vale el precio del último y se suman las cantidades
+        por_producto: Dict[str, Tuple[object, int]] = {}
+        for item in items:
+            _, cantidad = por_producto.get(item["id_producto"], (None, 0))
+            por_producto[item["id_producto"]] = (item["precio_unitario"], cantidad + item["cantidad"])
+
+        clave = (orden["fecha_orden"], orden["fecha_creacion"], orden["id"])
+        en_transito = orden["estado"] in ESTADOS_COMPROMETIDOS
+        for id_producto, (precio, cantidad) in por_producto.items():
+            compras = self._compras.setdefault(id_producto, [])
+            if signo > 0:
+                insort(compras, clave)
+                self._detalle[(id_producto, orden["id"])] = (orden["id_proveedor"], precio)
+            else:
+                posicion = bisect_left(compras, clave)
+                if posicion < len(compras) and compras[posicion] == clave:
+                    del compras[posicion]
+                self._detalle.pop((id_producto, orden["id"]), None)
+                if not compras:
+                    del self._compras[id_producto]
+            if en_transito:
+                self._en_transito[id_producto] = self._en_transito.get(id_producto, 0) + signo * cantidad
+
+    def consultar(self, ids_producto: Optional[Iterable[str]] = None) -> List[dict]:
+        """Última compra y cantidad en tránsito de los productos indicados (None = todos) que tienen compras"""
+        ids = self._compras if ids_producto is None else dict.fromkeys(ids_producto)
+        resultado = []
+        for id_producto in ids:
+            compras = self._compras.get(id_producto)
+            if not compras:
+                continue
+            fecha_orden, _, id_orden = compras[-1]
+            id_proveedor, precio = self._detalle[(id_producto, id_orden)]
+            resultado.append({
+                "id_producto": id_producto,
+                "id_proveedor": id_proveedor,
+                "precio_unitario": precio,
+                "fecha_ultima_compra": fecha_orden,
+                "cantidad_en_transito": self._en_transito.get(id_producto, 0),
+            })
+        return resultado
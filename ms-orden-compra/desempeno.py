@@ -0,0 +1,113 @@
+"""Desempeño de proveedores mantenido de forma incremental.
+
+Cada orden aporta a los agregados de su proveedor según su estado actual:
+conteos, montos y, si ya se recibió, el tiempo de entrega (envío → recepción)
+y si llegó a tiempo. Cada escritura quita el aporte de la orden con sus
+valores anteriores y lo vuelve a sumar con los nuevos, así que consultar el
+desempeño cuesta O(1).
+
+Los proveedores modificados se publican como un registro de cambios
+versionado: quien consume pide los cambios desde la última versión que vio
+y recibe solo los proveedores que cambiaron, en orden de versión.
+"""
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+from models import EstadoOrden
+
+ESTADOS_PENDIENTES = (EstadoOrden.PENDING, EstadoOrden.APPROVED, EstadoOrden.SENT)
+ESTADOS_COMPROMETIDOS = (EstadoOrden.APPROVED, EstadoOrden.SENT)
+
+
+def _decimal(valor) -> Decimal:
+    return valor if isinstance(valor, Decimal) else Decimal(str(valor or 0))
+
+
+class DesempenoProveedores:
+    """Agregados de órdenes por proveedor con registro de cambios versionado"""
+
+    def __init__(self):
+        # Cambia en cada reinicio: los consumidores deben volver a sincronizar desde cero
+        self.instancia = uuid.uuid4().hex[:8]
+        self.version = 0
+        # Proveedores en orden de última modificación (versión creciente)
+        self._agregados: "OrderedDict[str, dict]" = OrderedDict()
+
+    def agregar(self, orden: dict):
+        self._aplicar(orden, 1)
+
+    def quitar(self, orden: dict):
+        self._aplicar(orden, -1)
+
+    def _aplicar(self, orden: dict, signo: int):
+        id_proveedor = orden["id_proveedor"]
+        agregado = self._agregados.get(id_proveedor)
+        if agregado is None:
+            agregado = self._agregados[id_proveedor] = {
+                "id_proveedor": id_proveedor,
+                "total_ordenes": 0,
+                "ordenes_pendientes": 0,
+                "ordenes_completadas": 0,
+                "ordenes_canceladas": 0,
+                "monto_total": Decimal(0),
+                "monto_comprometido": Decimal(0),
+                "monto_recibido": Decimal(0),
+                "entregas_medidas": 0,
+                "suma_dias_entrega": 0.0,
+                "entregas_a_tiempo": 0,
+            }
+        estado = orden["estado"]
+        total = _decimal(orden.get("total"))
+        agregado["total_ordenes"] += signo
+        agregado["monto_total"] += signo * total
+        if estado in ESTADOS_PENDIENTES:
+            agregado["ordenes_pendientes"] += signo
+        if estado in ESTADOS_COMPROMETIDOS:
+            agregado["monto_comprometido"] += signo * total
+        if estado == EstadoOrden.CANCELLED:
+            agregado["ordenes_canceladas"] += signo
+        if estado == EstadoOrden.RECEIVED:
+            agregado["ordenes_completadas"] += signo
+            agregado["monto_recibido"] += signo * total
+            envio, recepcion = orden.get("fecha_envio"), orden.get("fecha_recepcion")
+            if envio and recepcion:
+                agregado["entregas_medidas"] += signo
+                agregado["suma_dias_entrega"] += signo * (recepcion - envio).total_seconds() / 86400
+                if recepcion.date() <= orden["fecha_requerida"]:
+                    agregado["entregas_a_tiempo"] += signo
+
+        self.version += 1
+        agregado["version"] = self.version
+        agregado["fecha_actualizacion"] = datetime.now()
+        self._agregados.move_to_end(id_proveedor)
+
+    def resumen(self, id_proveedor: str) -> Optional[dict]:
+        """Agregados del proveedor con las métricas derivadas; None si no tiene órdenes"""
+        agregado = self._agregados.get(id_proveedor)
+        if agregado is None or not agregado["total_ordenes"]:
+            return None
+        return self._con_metricas(agregado)
+
+    def cambios(self, desde_version: int, limite: int) -> Tuple[List[dict], int, bool]:
+        """Proveedores modificados después de desde_version, la versión alcanzada y si quedan más"""
+        modificados = []
+        for agregado in reversed(self._agregados.values()):
+            if agregado["version"] <= desde_version:
+                break
+            modificados.append(agregado)
+        modificados.reverse()
+        pagina = modificados[:limite]
+        hasta = pagina[-1]["version"] if len(modificados) > limite else self.version
+        return [self._con_metricas(agregado) for agregado in pagina], hasta, len(modificados) > limite
+
+    @staticmethod
+    def _con_metricas(agregado: dict) -> dict:
+        medidas = agregado["entregas_medidas"]
+        return {
+            **agregado,
+            "promedio_dias_entrega": round(agregado["suma_dias_entrega"] / medidas, 2) if medidas else None,
+            "tasa_a_tiempo": round(agregado["entregas_a_tiempo"] / medidas, 4) if medidas else None,
+        }
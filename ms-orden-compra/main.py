@@ -1,7 +1,11 @@
-from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi import FastAPI, HTTPException, Query, Depends, Response
+from pydantic import TypeAdapter
 from typing import List, Optional
 from datetime import datetime, date, timedelta
 from decimal import Decimal
+from contextlib import contextmanager
+from itertools import islice
+import gc
 import uuid
 import os
 import json
@@ -9,19 +13,52 @@ import httpx
 from models import (
     OrdenCompraCreate, ItemOrdenCreate, OrdenCompraUpdate,
     OrdenCompraResponse, ItemOrdenResponse, OrdenCompraFilter,
-    ResumenOrdenesProveedor, AlertaOrden,
+    ResumenOrdenesProveedor, AlertaOrden, ConsultaCompras, CompraProducto,
+    DesempenoProveedor, CambiosDesempeno,
     EstadoOrden, TipoOrden
 )
+from desempeno import DesempenoProveedores
+from compras import ComprasProductos
+from comun import Repositorio, esquema_registro, IndiceHash, IndiceOrdenado, Igual, EnConjunto, Rango
+from comun.metricas import instrumentar, medir_llamadas, registrar_repositorio
+from comun.perfilador import perfilar
+from comun.trazas import TransporteTrazado, tramo, trazar
+
+# Servicios consultados al obtener una orden
+MS_PROVEEDOR_URL = os.getenv("MS_PROVEEDOR_URL", "http://ms-proveedor:8006")
+MS_PRODUCTO_URL = os.getenv("MS_PRODUCTO_URL", "http://ms-producto:8003")
 
 app = FastAPI(
     title="MS-OrdenCompra API",
     description="Microservicio para gestión de órdenes de compra",
     version="1.0.0"
 )
+metricas = instrumentar(app)
+trazar(app, "ms-orden-compra")
+perfilar(app, metricas)
+
+# Registro compacto de una orden; el proveedor, el tipo y el estado se comparten entre órdenes
+Orden = esquema_registro("Orden", (
+    "id", "numero_orden", "id_proveedor", "tipo_orden", "estado", "fecha_orden", "fecha_requerida",
+    "observaciones", "direccion_entrega", "fecha_creacion", "fecha_actualizacion", "subtotal",
+    "descuento_total", "impuestos", "total", "fecha_aprobacion", "fecha_envio", "fecha_recepcion"
+), internar=("id_proveedor", "tipo_orden", "estado"))
 
-# Simulación de base de datos en memoria
-ordenes_db = {}
-items_orden_db = {}
+# Base de datos en memoria con índices por los filtros del listado
+ordenes_db = Repositorio("ordenes", [
+    IndiceHash("id_proveedor"),
+    IndiceHash("estado"),
+    IndiceHash("tipo_orden"),
+    IndiceOrdenado("fecha_orden"),
+    IndiceOrdenado("total"),
+], registro=Orden)
+# Items de cada orden: {"id": orden_id, "items": [...]}
+items_orden_db = Repositorio("items_orden")
+
+registrar_repositorio(metricas, ordenes_db, "estado", "tipo_orden")
+transiciones = metricas.contador("ordenes_transiciones_total", "Cambios de estado de las órdenes", ("estado",))
+ganchos_llamadas = medir_llamadas(metricas)
+lista_compras_json = TypeAdapter(List[CompraProducto])
 contador_orden = 1
 
 def generar_numero_orden() -> str:
@@ -44,11 +81,11 @@ def cargar_ordenes_desde_json():
         orden_id = orden.get("id") or str(uuid.uuid4())
         ordenes[orden_id] = {
             "id": orden_id,
-            "numero_orden": generar_numero_orden(),
+            "numero_orden": orden.get("numero_orden") or generar_numero_orden(),
             "id_proveedor": orden["id_proveedor"],
             "tipo_orden": orden["tipo_orden"],
-            "estado": EstadoOrden.DRAFT,
-            "fecha_orden": date.today(),
+            "estado": EstadoOrden(orden.get("estado", EstadoOrden.DRAFT)),
+            "fecha_orden": date.fromisoformat(orden["fecha_orden"]) if orden.get("fecha_orden") else date.today(),
             "fecha_requerida": date.fromisoformat(orden["fecha_requerida"]) if isinstance(orden["fecha_requerida"], str) else orden["fecha_requerida"],
             "observaciones": orden.get("observaciones", None),
             "direccion_entrega": orden.get("direccion_entrega", None),
@@ -84,13 +121,52 @@ def cargar_ordenes_desde_json():
             pass
     return ordenes, items_por_orden, max_num + 1
 
-ordenes_db, items_orden_db, contador_orden = cargar_ordenes_desde_json()
+ordenes_iniciales, items_iniciales, _ = cargar_ordenes_desde_json()
+
+# Los datos de prueba solo se cargan si no hay datos persistidos
+if ordenes_db.inicializar(ordenes_iniciales.values()):
+    items_orden_db.inicializar({"id": orden_id, "items": items} for orden_id, items in items_iniciales.items())
+
+# La numeración continúa desde la última orden cargada
+contador_orden = max((int(o["numero_orden"].removeprefix("OC")) for o in ordenes_db.values()), default=0) + 1
+
+def items_de(orden_id: str) -> list:
+    """Items de una orden"""
+    registro = items_orden_db.get(orden_id)
+    return registro["items"] if registro else []
+
+# Agregados por proveedor (tiempos de entrega, cumplimiento, montos) publicados como registro de cambios
+desempeno_proveedores = DesempenoProveedores()
+# Última compra y cantidad en tránsito por producto
+compras_productos = ComprasProductos()
+for _orden in ordenes_db.values():
+    desempeno_proveedores.agregar(_orden)
+    compras_productos.agregar(_orden, items_de(_orden["id"]))
+
+# Los datos cargados al iniciar no forman ciclos: se excluyen del recolector para que
+# las recolecciones completas no recorran cientos de miles de órdenes en medio de una petición
+gc.freeze()
+
+@contextmanager
+def modificando_orden(orden: dict):
+    """Quitar el aporte de la orden (y sus items) a los agregados y, tras modificarla, guardarla y volver a sumarlo"""
+    desempeno_proveedores.quitar(orden)
+    compras_productos.quitar(orden, items_de(orden["id"]))
+    estado_anterior = orden["estado"]
+    try:
+        yield
+    finally:
+        ordenes_db.guardar(orden)
+        desempeno_proveedores.agregar(orden)
+        compras_productos.agregar(orden, items_de(orden["id"]))
+        if orden["estado"] != estado_anterior:
+            transiciones.incrementar(orden["estado"])
 
 
 
 def calcular_totales_orden(orden_id: str) -> dict:
     """Calcular totales de una orden"""
-    items = items_orden_db.get(orden_id, [])
+    items = items_de(orden_id)
     
     subtotal = sum(item["total_item"] for item in items)
     descuento_total = sum(item["precio_unitario"] * item["cantidad"] * item["descuento_porcentaje"] / 100 for item in items)
@@ -130,13 +206,15 @@ async def crear_orden(orden: OrdenCompraCreate):
     }
     
     # Inicializar items vacíos
-    items_orden_db[orden_id] = []
+    items_orden_db.guardar({"id": orden_id, "items": []})
     
     # Calcular totales iniciales (serán 0)
     totales = calcular_totales_orden(orden_id)
     nueva_orden.update(totales)
     
-    ordenes_db[orden_id] = nueva_orden
+    nueva_orden = ordenes_db.guardar(nueva_orden)
+    desempeno_proveedores.agregar(nueva_orden)
+    transiciones.incrementar(EstadoOrden.DRAFT)
     return OrdenCompraResponse(**nueva_orden, items=[])
 
 @app.post("/ordenes/{orden_id}/items", response_model=ItemOrdenResponse, tags=["Items"])
@@ -164,15 +242,15 @@ async def agregar_item_orden(orden_id: str, item: ItemOrdenCreate):
         "total_item": total_item
     }
     
-    # Agregar item a la orden
-    if orden_id not in items_orden_db:
-        items_orden_db[orden_id] = []
-    items_orden_db[orden_id].append(nuevo_item)
-    
-    # Actualizar totales de la orden
-    totales = calcular_totales_orden(orden_id)
-    orden.update(totales)
-    orden["fecha_actualizacion"] = datetime.now()
+    with modificando_orden(orden):
+        # Agregar item a la orden
+        registro_items = items_orden_db.get(orden_id) or {"id": orden_id, "items": []}
+        registro_items["items"].append(nuevo_item)
+        items_orden_db.guardar(registro_items)
+        
+        # Actualizar totales de la orden
+        orden.update(calcular_totales_orden(orden_id))
+        orden["fecha_actualizacion"] = datetime.now()
     
     return ItemOrdenResponse(**nuevo_item)
 
@@ -184,33 +262,29 @@ async def listar_ordenes(
     fecha_desde: Optional[date] = Query(None, description="Fecha de orden desde"),
     fecha_hasta: Optional[date] = Query(None, description="Fecha de orden hasta"),
     monto_min: Optional[Decimal] = Query(None, description="Monto mínimo"),
-    monto_max: Optional[Decimal] = Query(None, description="Monto máximo")
+    monto_max: Optional[Decimal] = Query(None, description="Monto máximo"),
+    offset: int = Query(0, ge=0, description="Número de órdenes a omitir"),
+    limit: Optional[int] = Query(None, ge=1, description="Número máximo de órdenes a devolver")
 ):
     """Listar todas las órdenes con filtros opcionales"""
-    ordenes = list(ordenes_db.values())
-    
-    # Aplicar filtros
-    if id_proveedor:
-        ordenes = [o for o in ordenes if o["id_proveedor"] == id_proveedor]
-    if estado:
-        ordenes = [o for o in ordenes if o["estado"] == estado]
-    if tipo_orden:
-        ordenes = [o for o in ordenes if o["tipo_orden"] == tipo_orden]
-    if fecha_desde:
-        ordenes = [o for o in ordenes if o["fecha_orden"] >= fecha_desde]
-    if fecha_hasta:
-        ordenes = [o for o in ordenes if o["fecha_orden"] <= fecha_hasta]
-    if monto_min:
-        ordenes = [o for o in ordenes if o["total"] >= monto_min]
-    if monto_max:
-        ordenes = [o for o in ordenes if o["total"] <= monto_max]
+    # El repositorio resuelve los filtros con el índice más selectivo
+    with tramo("filtrar", coleccion="ordenes"):
+        ordenes = ordenes_db.consultar(
+            Igual("id_proveedor", id_proveedor or None),
+            Igual("estado", estado),
+            Igual("tipo_orden", tipo_orden),
+            Rango("fecha_orden", fecha_desde, fecha_hasta),
+            Rango("total", monto_min or None, monto_max or None)
+        )
+        ordenes = list(islice(ordenes, offset, offset + limit if limit else None))
     
     # Agregar items a cada orden
-    ordenes_response = []
-    for orden in ordenes:
-        items = items_orden_db.get(orden["id"], [])
-        items_response = [ItemOrdenResponse(**item) for item in items]
-        ordenes_response.append(OrdenCompraResponse(**orden, items=items_response))
+    with tramo("construir_respuesta", cantidad=len(ordenes)):
+        ordenes_response = []
+        for orden in ordenes:
+            items = items_de(orden["id"])
+            items_response = [ItemOrdenResponse(**item) for item in items]
+            ordenes_response.append(OrdenCompraResponse(**orden, items=items_response))
     
     return ordenes_response
 
@@ -221,18 +295,20 @@ async def obtener_orden(orden_id: str):
         raise HTTPException(status_code=404, detail="Orden no encontrada")
     
     orden = ordenes_db[orden_id]
-    items = items_orden_db.get(orden_id, [])
-    items_response = [ItemOrdenResponse(**item) for item in items]
+    items = items_de(orden_id)
+    with tramo("construir_items", cantidad=len(items)):
+        items_response = [ItemOrdenResponse(**item) for item in items]
 
-    async with httpx.AsyncClient() as client:
-        proveedor_resp = await client.get(f"http://ms-proveedor:8006/proveedores/{orden['id_proveedor']}")
+    async with httpx.AsyncClient(event_hooks=ganchos_llamadas, transport=TransporteTrazado()) as client:
+        proveedor_resp = await client.get(f"{MS_PROVEEDOR_URL}/proveedores/{orden['id_proveedor']}")
         proveedor = proveedor_resp.json()
         print(proveedor)
-        producto_resp = await client.get(f"http://ms-producto:8003/productos/{items[0]['id_producto']}")
+        producto_resp = await client.get(f"{MS_PRODUCTO_URL}/productos/{items[0]['id_producto']}")
         producto = producto_resp.json()
         print(producto)
     
-    return OrdenCompraResponse(**orden, items=items_response)
+    with tramo("construir_respuesta"):
+        return OrdenCompraResponse(**orden, items=items_response)
 
 @app.put("/ordenes/{orden_id}", response_model=OrdenCompraResponse, tags=["Órdenes"])
 async def actualizar_orden(orden_id: str, orden_update: OrdenCompraUpdate):
@@ -243,12 +319,13 @@ async def actualizar_orden(orden_id: str, orden_update: OrdenCompraUpdate):
     orden = ordenes_db[orden_id]
     update_data = orden_update.dict(exclude_unset=True)
     
-    for field, value in update_data.items():
-        orden[field] = value
-    
-    orden["fecha_actualizacion"] = datetime.now()
+    with modificando_orden(orden):
+        for field, value in update_data.items():
+            orden[field] = value
+        
+        orden["fecha_actualizacion"] = datetime.now()
     
-    items = items_orden_db.get(orden_id, [])
+    items = items_de(orden_id)
     items_response = [ItemOrdenResponse(**item) for item in items]
     
     return OrdenCompraResponse(**orden, items=items_response)
@@ -263,9 +340,10 @@ async def eliminar_orden(orden_id: str):
     if orden["estado"] != EstadoOrden.DRAFT:
         raise HTTPException(status_code=400, detail="Solo se pueden eliminar órdenes en borrador")
     
-    del ordenes_db[orden_id]
-    if orden_id in items_orden_db:
-        del items_orden_db[orden_id]
+    ordenes_db.eliminar(orden_id)
+    desempeno_proveedores.quitar(orden)
+    compras_productos.quitar(orden, items_de(orden_id))
+    items_orden_db.eliminar(orden_id)
     
     return {"message": f"Orden {orden_id} eliminada exitosamente"}
 
@@ -279,9 +357,10 @@ async def aprobar_orden(orden_id: str):
     if orden["estado"] not in [EstadoOrden.DRAFT, EstadoOrden.PENDING]:
         raise HTTPException(status_code=400, detail="La orden no puede ser aprobada en su estado actual")
     
-    orden["estado"] = EstadoOrden.APPROVED
-    orden["fecha_aprobacion"] = datetime.now()
-    orden["fecha_actualizacion"] = datetime.now()
+    with modificando_orden(orden):
+        orden["estado"] = EstadoOrden.APPROVED
+        orden["fecha_aprobacion"] = datetime.now()
+        orden["fecha_actualizacion"] = datetime.now()
     
     return {"message": f"Orden {orden['numero_orden']} aprobada exitosamente"}
 
@@ -295,9 +374,10 @@ async def enviar_orden(orden_id: str):
     if orden["estado"] != EstadoOrden.APPROVED:
         raise HTTPException(status_code=400, detail="La orden debe estar aprobada para ser enviada")
     
-    orden["estado"] = EstadoOrden.SENT
-    orden["fecha_envio"] = datetime.now()
-    orden["fecha_actualizacion"] = datetime.now()
+    with modificando_orden(orden):
+        orden["estado"] = EstadoOrden.SENT
+        orden["fecha_envio"] = datetime.now()
+        orden["fecha_actualizacion"] = datetime.now()
     
     return {"message": f"Orden {orden['numero_orden']} enviada exitosamente"}
 
@@ -311,9 +391,10 @@ async def recibir_orden(orden_id: str):
     if orden["estado"] != EstadoOrden.SENT:
         raise HTTPException(status_code=400, detail="La orden debe estar enviada para ser recibida")
     
-    orden["estado"] = EstadoOrden.RECEIVED
-    orden["fecha_recepcion"] = datetime.now()
-    orden["fecha_actualizacion"] = datetime.now()
+    with modificando_orden(orden):
+        orden["estado"] = EstadoOrden.RECEIVED
+        orden["fecha_recepcion"] = datetime.now()
+        orden["fecha_actualizacion"] = datetime.now()
     
     return {"message": f"Orden {orden['numero_orden']} recibida exitosamente"}
 
@@ -327,41 +408,73 @@ async def cancelar_orden(orden_id: str, motivo: Optional[str] = None):
     if orden["estado"] == EstadoOrden.RECEIVED:
         raise HTTPException(status_code=400, detail="No se puede cancelar una orden ya recibida")
     
-    orden["estado"] = EstadoOrden.CANCELLED
-    if motivo:
-        orden["observaciones"] = f"{orden.get('observaciones', '')} - CANCELADA: {motivo}".strip(" -")
-    orden["fecha_actualizacion"] = datetime.now()
+    with modificando_orden(orden):
+        orden["estado"] = EstadoOrden.CANCELLED
+        if motivo:
+            orden["observaciones"] = f"{orden.get('observaciones', '')} - CANCELADA: {motivo}".strip(" -")
+        orden["fecha_actualizacion"] = datetime.now()
     
     return {"message": f"Orden {orden['numero_orden']} cancelada exitosamente"}
 
 @app.get("/proveedores/{id_proveedor}/ordenes/resumen", response_model=ResumenOrdenesProveedor, tags=["Reportes"])
 async def obtener_resumen_proveedor(id_proveedor: str):
     """Obtener resumen de órdenes de un proveedor específico"""
-    ordenes_proveedor = [o for o in ordenes_db.values() if o["id_proveedor"] == id_proveedor]
+    resumen = desempeno_proveedores.resumen(id_proveedor)
     
-    if not ordenes_proveedor:
+    if resumen is None:
         raise HTTPException(status_code=404, detail="No se encontraron órdenes para este proveedor")
     
-    total_ordenes = len(ordenes_proveedor)
-    ordenes_pendientes = len([o for o in ordenes_proveedor if o["estado"] in [EstadoOrden.PENDING, EstadoOrden.APPROVED, EstadoOrden.SENT]])
-    ordenes_completadas = len([o for o in ordenes_proveedor if o["estado"] == EstadoOrden.RECEIVED])
-    monto_total = sum(o["total"] for o in ordenes_proveedor)
-    
     return ResumenOrdenesProveedor(
         id_proveedor=id_proveedor,
-        total_ordenes=total_ordenes,
-        ordenes_pendientes=ordenes_pendientes,
-        ordenes_completadas=ordenes_completadas,
-        monto_total=monto_total
+        total_ordenes=resumen["total_ordenes"],
+        ordenes_pendientes=resumen["ordenes_pendientes"],
+        ordenes_completadas=resumen["ordenes_completadas"],
+        monto_total=resumen["monto_total"],
+        promedio_tiempo_entrega=round(resumen["promedio_dias_entrega"]) if resumen["promedio_dias_entrega"] is not None else None
+    )
+
+@app.get("/proveedores/desempeno", response_model=CambiosDesempeno, tags=["Reportes"])
+async def obtener_cambios_desempeno(
+    desde_version: int = Query(0, ge=0, description="Última versión recibida; 0 para obtener todos los proveedores"),
+    limite: int = Query(1000, ge=1, le=10000, description="Máximo de proveedores por página")
+):
+    """Registro de cambios del desempeño por proveedor, para sincronizar por lotes"""
+    proveedores, version, hay_mas = desempeno_proveedores.cambios(desde_version, limite)
+    return CambiosDesempeno(
+        instancia=desempeno_proveedores.instancia,
+        desde_version=desde_version,
+        version=version,
+        hay_mas=hay_mas,
+        proveedores=proveedores
     )
 
+@app.get("/proveedores/{id_proveedor}/desempeno", response_model=DesempenoProveedor, tags=["Reportes"])
+async def obtener_desempeno_proveedor(id_proveedor: str):
+    """Tiempo de entrega, cumplimiento y montos de un proveedor"""
+    resumen = desempeno_proveedores.resumen(id_proveedor)
+    if resumen is None:
+        raise HTTPException(status_code=404, detail="No se encontraron órdenes para este proveedor")
+    return DesempenoProveedor(**resumen)
+
+@app.post("/compras/productos", response_model=List[CompraProducto], tags=["Reportes"])
+async def consultar_compras_productos(consulta: ConsultaCompras):
+    """Consultar en un solo llamado la última compra y el stock en tránsito de cada producto.
+
+    Se leen los agregados por producto, así que el costo depende solo de los productos pedidos.
+    """
+    compras = compras_productos.consultar(consulta.ids_producto)
+    with tramo("construir_respuesta", cantidad=len(compras)):
+        cuerpo = lista_compras_json.dump_json([CompraProducto(**compra) for compra in compras])
+    return Response(content=cuerpo, media_type="application/json")
+
 @app.get("/alertas/ordenes", response_model=List[AlertaOrden], tags=["Alertas"])
 async def obtener_alertas_ordenes():
     """Obtener alertas de órdenes de compra"""
     alertas = []
     hoy = date.today()
     
-    for orden in ordenes_db.values():
+    # Solo las órdenes enviadas o pendientes pueden generar alertas
+    for orden in ordenes_db.consultar(EnConjunto("estado", [EstadoOrden.SENT, EstadoOrden.PENDING])):
         # Alerta por retraso en entrega
         if (orden["estado"] == EstadoOrden.SENT and 
             orden["fecha_requerida"] < hoy):
@@ -398,26 +511,16 @@ async def obtener_estadisticas_ordenes():
     if not ordenes_db:
         return {"message": "No hay órdenes registradas"}
     
-    ordenes = list(ordenes_db.values())
-    
-    # Estadísticas por estado
-    estados_count = {}
-    for orden in ordenes:
-        estado = orden["estado"]
-        estados_count[estado] = estados_count.get(estado, 0) + 1
-    
-    # Estadísticas por tipo
-    tipos_count = {}
-    for orden in ordenes:
-        tipo = orden["tipo_orden"]
-        tipos_count[tipo] = tipos_count.get(tipo, 0) + 1
+    # Conteos por estado y tipo leídos de los índices
+    estados_count = ordenes_db.indice("estado").distribucion()
+    tipos_count = ordenes_db.indice("tipo_orden").distribucion()
     
     # Montos
-    monto_total = sum(o["total"] for o in ordenes)
-    monto_promedio = monto_total / len(ordenes)
+    monto_total = sum(o["total"] for o in ordenes_db.values())
+    monto_promedio = monto_total / len(ordenes_db)
     
     return {
-        "total_ordenes": len(ordenes),
+        "total_ordenes": len(ordenes_db),
         "monto_total": monto_total,
         "monto_promedio": round(float(monto_promedio), 2),
         "ordenes_por_estado": estados_count,
@@ -36,7 +36,7 @@ class ItemOrdenCreate(BaseModel):
     id_producto: str
     cantidad: int
     precio_unitario: Decimal
-    descuento_porcentaje: Optional[Decimal] = 0
+    descuento_porcentaje: Optional[Decimal] = Decimal(0)
 
 
 class OrdenCompraUpdate(BaseModel):
@@ -122,3 +122,44 @@ class AlertaOrden(BaseModel):
     criticidad: str  # "ALTA", "MEDIA", "BAJA"
     descripcion: str
     fecha_alerta: datetime
+
+
+class ConsultaCompras(BaseModel):
+    """Consulta del historial de compras para varios productos a la vez"""
+    ids_producto: Optional[List[str]] = None  # None = todos los productos
+
+
+class CompraProducto(BaseModel):
+    """Última compra de un producto y cantidad pendiente de recibir"""
+    id_producto: str
+    id_proveedor: str  # proveedor de la última compra
+    precio_unitario: Decimal
+    fecha_ultima_compra: date
+    cantidad_en_transito: int  # órdenes aprobadas o enviadas, aún no recibidas
+
+
+class DesempenoProveedor(BaseModel):
+    """Agregados de órdenes de un proveedor, mantenidos de forma incremental"""
+    id_proveedor: str
+    version: int
+    total_ordenes: int
+    ordenes_pendientes: int
+    ordenes_completadas: int
+    ordenes_canceladas: int
+    monto_total: Decimal
+    monto_comprometido: Decimal  # órdenes aprobadas o enviadas
+    monto_recibido: Decimal
+    entregas_medidas: int  # órdenes recibidas con fecha de envío y de recepción
+    entregas_a_tiempo: int  # recibidas a más tardar en la fecha requerida
+    promedio_dias_entrega: Optional[float] = None  # envío → recepción
+    tasa_a_tiempo: Optional[float] = None  # 0 a 1
+    fecha_actualizacion: datetime
+
+
+class CambiosDesempeno(BaseModel):
+    """Página del registro de cambios de desempeño de proveedores"""
+    instancia: str  # cambia al reiniciar el servicio; al cambiar hay que sincronizar desde cero
+    desde_version: int
+    version: int  # pasar como desde_version en la siguiente consulta
+    hay_mas: bool
+    proveedores: List[DesempenoProveedor]
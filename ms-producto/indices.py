@@ -0,0 +1,77 @@
+"""Agregados en memoria del catálogo de productos.
+
+Se declaran como un índice más del repositorio de productos, así que se
+mantienen en cada escritura: el aporte de cada producto se recuerda para
+poder retirarlo aunque el registro ya se haya modificado.
+"""
+from bisect import bisect_left, insort
+from typing import Dict, List, Sequence, Tuple
+
+from comun.indices import Indice, fusionar_ordenado
+from comun.texto import valor_enum
+
+
+class EstadisticasCatalogo(Indice):
+    """Contadores y sumas de los productos activos, con precios ordenados para percentiles"""
+
+    def __init__(self):
+        super().__init__("precio_unitario")
+        self.total = 0
+        self.refrigerados = 0
+        self.suma_precios = 0.0
+        self.por_categoria: Dict[str, int] = {}
+        self.precios: List[float] = []
+        self._aportes: Dict[str, Tuple[str, bool, float]] = {}  # ID -> (categoría, refrigerado, precio)
+
+    def _sumar(self, identificador: str, producto: dict) -> bool:
+        if identificador in self._aportes:
+            self.quitar(identificador)
+        if not producto["activo"]:
+            return False
+        aporte = (valor_enum(producto["categoria"]), bool(producto["requiere_refrigeracion"]), producto["precio_unitario"])
+        categoria, refrigerado, precio = self._aportes[identificador] = aporte
+        self.total += 1
+        self.por_categoria[categoria] = self.por_categoria.get(categoria, 0) + 1
+        if refrigerado:
+            self.refrigerados += 1
+        self.suma_precios += precio
+        return True
+
+    def agregar(self, identificador: str, producto: dict, secuencia: int = 0):
+        if self._sumar(identificador, producto):
+            insort(self.precios, producto["precio_unitario"])
+
+    def agregar_varios(self, entradas: Sequence[Tuple[str, dict, int]]):
+        """Agregar un lote de productos fusionando sus precios con la lista ordenada"""
+        nuevos = [producto["precio_unitario"] for identificador, producto, _ in entradas if self._sumar(identificador, producto)]
+        fusionar_ordenado(self.precios, nuevos)
+
+    def quitar(self, identificador: str):
+        aporte = self._aportes.pop(identificador, None)
+        if aporte is None:
+            return
+        categoria, refrigerado, precio = aporte
+        self.total -= 1
+        self.por_categoria[categoria] -= 1
+        if not self.por_categoria[categoria]:
+            del self.por_categoria[categoria]
+        if refrigerado:
+            self.refrigerados -= 1
+        self.suma_precios -= precio
+        del self.precios[bisect_left(self.precios, precio)]
+        if not self.total:
+            # Evita arrastrar error de redondeo cuando el catálogo queda vacío
+            self.suma_precios = 0.0
+
+    def precio_promedio(self) -> float:
+        return self.suma_precios / self.total if self.total else 0
+
+    def percentil(self, p: float) -> float:
+        """Percentil de precio con interpolación lineal entre rangos"""
+        if not self.precios:
+            return 0
+        posicion = (len(self.precios) - 1) * p / 100
+        inferior = int(posicion)
+        superior = min(inferior + 1, len(self.precios) - 1)
+        fraccion = posicion - inferior
+        return self.precios[inferior] + (self.precios[superior] - self.precios[inferior]) * fraccion
@@ -0,0 +1,127 @@
+"""Stock real de los productos desde MS-Bodega y MS-Lote.
+
+Las consultas pasan por comun.inventario (cliente compartido, caché TTL y
+respaldo obsoleto). Sin datos de ningún servicio se usa el stock_total local
+del producto y el origen de la respuesta es "local".
+"""
+import asyncio
+from typing import Dict, List, Optional
+
+from comun.inventario import (
+    MS_BODEGA_URL, MS_LOTE_URL, ORIGEN_SIN_DATOS, consultar, consultar_por_producto, origen_combinado
+)
+
+# Sin datos de los servicios el stock sale del propio producto
+ORIGEN_LOCAL = "local"
+
+
+async def consultar_detalle_producto(id_producto: str):
+    """Obtener en paralelo las bodegas y los lotes de un producto"""
+    (bodegas, origen_bodegas), (lotes, origen_lotes) = await asyncio.gather(
+        consultar(("bodegas", id_producto), "GET", f"{MS_BODEGA_URL}/bodegas", params={"id_producto": id_producto}),
+        consultar(("lotes", id_producto), "GET", f"{MS_LOTE_URL}/lotes", params={"id_producto": id_producto})
+    )
+    return bodegas, lotes, _origen_combinado(origen_bodegas, origen_lotes)
+
+
+async def consultar_stock_productos(ids_producto: Optional[List[str]] = None):
+    """Obtener en paralelo el stock agregado de varios productos (None = todos).
+
+    Con ids el stock se guarda en caché por servicio y producto; sin ids se
+    consulta y guarda el catálogo completo.
+    """
+    if ids_producto is None:
+        cuerpo = {"ids_producto": None}
+        (bodegas, origen_bodegas), (lotes, origen_lotes) = await asyncio.gather(
+            consultar(("stock-bodegas", None), "POST", f"{MS_BODEGA_URL}/stock/productos", json=cuerpo),
+            consultar(("stock-lotes", None), "POST", f"{MS_LOTE_URL}/stock/productos", json=cuerpo)
+        )
+        por_bodegas = {s["id_producto"]: s for s in bodegas or []}
+        por_lotes = {s["id_producto"]: s for s in lotes or []}
+    else:
+        (por_bodegas, origen_bodegas), (por_lotes, origen_lotes) = await asyncio.gather(
+            consultar_por_producto("stock-bodegas", f"{MS_BODEGA_URL}/stock/productos", ids_producto),
+            consultar_por_producto("stock-lotes", f"{MS_LOTE_URL}/stock/productos", ids_producto)
+        )
+        por_bodegas = por_bodegas or {}
+        por_lotes = por_lotes or {}
+    return por_bodegas, por_lotes, _origen_combinado(origen_bodegas, origen_lotes)
+
+
+def _origen_combinado(*origenes: str) -> str:
+    origen = origen_combinado(*origenes)
+    return ORIGEN_LOCAL if origen == ORIGEN_SIN_DATOS else origen
+
+
+def calcular_stock(producto: dict, bodegas: Optional[List[dict]], lotes: Optional[List[dict]]) -> dict:
+    """Combinar bodegas y lotes en la información de stock de un producto.
+
+    Si el producto tiene lotes, el stock disponible es la suma de sus lotes no
+    vencidos; si no, se usa lo reportado por las bodegas. Sin datos de ningún
+    servicio se conserva el stock_total local del producto.
+    """
+    por_bodega: Dict[str, dict] = {}
+    for bodega in bodegas or []:
+        por_bodega[bodega["id"]] = {
+            "id_bodega": bodega["id"],
+            "nombre": bodega["nombre"],
+            "ciudad": bodega["ubicacion_geografica"]["ciudad"],
+            "cantidad_disponible": bodega["cantidad_disponible"],
+            "cantidad_reservada": bodega["cantidad_reservada"],
+            "lotes": []
+        }
+
+    disponible_lotes = reservado_lotes = 0
+    for lote in lotes or []:
+        detalle = por_bodega.setdefault(lote["id_bodega"], {
+            "id_bodega": lote["id_bodega"],
+            "nombre": None,
+            "ciudad": None,
+            "cantidad_disponible": 0,
+            "cantidad_reservada": 0,
+            "lotes": []
+        })
+        detalle["lotes"].append({
+            "id_lote": lote["id"],
+            "cantidad_disponible": lote["cantidad_disponible"],
+            "cantidad_reservada": lote["cantidad_reservada"],
+            "fecha_vencimiento": lote["fecha_vencimiento"],
+            "esta_vencido": lote["esta_vencido"]
+        })
+        if not lote["esta_vencido"]:
+            disponible_lotes += lote["cantidad_disponible"]
+        reservado_lotes += lote["cantidad_reservada"]
+
+    if lotes:
+        disponible, reservado = disponible_lotes, reservado_lotes
+    elif bodegas:
+        disponible = sum(b["cantidad_disponible"] for b in bodegas)
+        reservado = sum(b["cantidad_reservada"] for b in bodegas)
+    else:
+        disponible, reservado = producto.get("stock_total", 0), 0
+
+    return _stock(producto, disponible, reservado, list(por_bodega.values()))
+
+
+def calcular_stock_agregado(producto: dict, stock_bodegas: Optional[dict], stock_lotes: Optional[dict]) -> dict:
+    """Versión por lotes de calcular_stock a partir de los totales por producto"""
+    if stock_lotes and stock_lotes["lotes"]:
+        disponible, reservado = stock_lotes["cantidad_disponible"], stock_lotes["cantidad_reservada"]
+    elif stock_bodegas:
+        disponible, reservado = stock_bodegas["cantidad_disponible"], stock_bodegas["cantidad_reservada"]
+    else:
+        disponible, reservado = producto.get("stock_total", 0), 0
+    return _stock(producto, disponible, reservado, [])
+
+
+def _stock(producto: dict, disponible: int, reservado: int, bodegas_con_stock: List[dict]) -> dict:
+    stock_total = disponible + reservado
+    return {
+        "id_producto": producto["id"],
+        "nombre_producto": producto["nombre"],
+        "stock_total": stock_total,
+        "stock_disponible": disponible,
+        "stock_reservado": reservado,
+        "valor_inventario": round(stock_total * producto["precio_unitario"], 2),
+        "bodegas_con_stock": bodegas_con_stock
+    }
@@ -1,22 +1,64 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Header, Response, Request
 from typing import List, Optional
 from datetime import datetime
+from itertools import islice
+from pydantic import TypeAdapter
 import uuid
 import os
 import json
 from models import (
     ProductoCreate, ProductoUpdate, ProductoResponse, ProductoFilter,
-    ProductoStock, CategoriaProducto, UnidadMedida
+    ProductoStock, ValorizacionInventario, CategoriaProducto, UnidadMedida,
+    FormatoImportacion, ResultadoImportacion
 )
+from comun import Repositorio, esquema_registro, IndiceHash, IndiceOrdenado, Igual, EnConjunto, Contiene, Rango
+from comun.cache_respuestas import CacheRespuestas, clave_cache
+from comun.etags import etag_coincide, etag_fuerte, no_modificado
+from comun.importacion import importar, formato_desde_content_type
+from comun.inventario import cerrar_cliente, medir_consultas
+from comun.metricas import instrumentar, registrar_cache, registrar_repositorio
+from comun.perfilador import perfilar
+from comun.trazas import tramo, trazar
+from indices import EstadisticasCatalogo
+import inventario
 
 app = FastAPI(
     title="MS-Producto API",
     description="Microservicio para gestión de productos",
     version="1.0.0"
 )
+metricas = instrumentar(app)
+trazar(app, "ms-producto")
+perfilar(app, metricas)
+medir_consultas(metricas)
 
-# Simulación de base de datos en memoria
-productos_db = {}
+# Agregados del catálogo, mantenidos por el repositorio en cada escritura
+estadisticas_catalogo = EstadisticasCatalogo()
+
+# Registro compacto de un producto; categoría y unidad se comparten entre productos
+Producto = esquema_registro("Producto", (
+    "id", "nombre", "descripcion", "categoria", "unidad_medida", "precio_unitario", "codigo_barras",
+    "peso_unitario", "requiere_refrigeracion", "vida_util_dias", "activo", "fecha_creacion",
+    "fecha_actualizacion", "stock_total", "bodegas_disponibles"
+), internar=("categoria", "unidad_medida"))
+
+# Base de datos en memoria. Precios ordenados por (categoría, activo): un rango de precios
+# se resuelve con búsqueda binaria y recorre solo los productos que cumplen, ya en orden.
+# Cada escritura (productos_db.guardar) incrementa la versión del producto y la de la
+# colección (productos_db.version), usadas en los ETags.
+productos_db = Repositorio("productos", [
+    IndiceOrdenado("precio_unitario", particion=("categoria", "activo")),
+    IndiceHash("codigo_barras"),
+    IndiceHash("requiere_refrigeracion"),
+    estadisticas_catalogo,
+], registro=Producto)
+
+# Caché de listas ya serializadas a JSON, validada contra productos_db.version
+cache_respuestas = CacheRespuestas(max_bytes=int(os.getenv("CACHE_RESPUESTAS_MAX_BYTES", 32 * 1024 * 1024)))
+lista_productos_json = TypeAdapter(List[ProductoResponse])
+
+registrar_repositorio(metricas, productos_db, "requiere_refrigeracion")
+registrar_cache(metricas, cache_respuestas)
 
 def cargar_productos_desde_json():
     ruta = os.path.join(os.path.dirname(__file__), "test_data.json")
@@ -42,24 +84,33 @@ def cargar_productos_desde_json():
             "fecha_creacion": datetime.now(),
             "fecha_actualizacion": datetime.now(),
             "stock_total": producto.get("stock_total", 0),
-            "bodegas_disponibles": producto.get("bodegas_disponibles", 0)
+            "bodegas_disponibles": producto.get("bodegas_disponibles", 0),
+            "version": 1
         }
     return productos
 
-productos_db = cargar_productos_desde_json()
+# Los datos de prueba solo se cargan si no hay datos persistidos
+productos_db.inicializar(cargar_productos_desde_json().values())
 
-@app.get("/", tags=["Health"])
-async def root():
-    """Endpoint de salud del servicio"""
-    return {"message": "MS-Producto API activa", "timestamp": datetime.now()}
+def etag_producto(producto: dict) -> str:
+    """ETag de un producto individual"""
+    return etag_fuerte(producto["id"], producto.get("version", 0))
 
-@app.post("/productos", response_model=ProductoResponse, tags=["Productos"])
-async def crear_producto(producto: ProductoCreate):
-    """Crear un nuevo producto"""
-    producto_id = str(uuid.uuid4())
-    now = datetime.now()
-    
-    nuevo_producto = {
+def etag_coleccion(recurso: str) -> str:
+    """ETag de una lista, derivado de la versión de la colección sin serializarla"""
+    return etag_fuerte(recurso, productos_db.version)
+
+def respuesta_json(cuerpo: bytes, etag: str) -> Response:
+    """Respuesta con un cuerpo JSON ya serializado"""
+    return Response(content=cuerpo, media_type="application/json", headers={"ETag": etag})
+
+def serializar_productos(productos: List[dict]) -> bytes:
+    """Serializar una lista de productos con el mismo esquema que ProductoResponse"""
+    return lista_productos_json.dump_json([ProductoResponse(**producto) for producto in productos])
+
+def construir_producto(producto: ProductoCreate, producto_id: str, now: datetime) -> dict:
+    """Registro en memoria de un producto nuevo"""
+    return {
         "id": producto_id,
         "nombre": producto.nombre,
         "descripcion": producto.descripcion,
@@ -74,13 +125,53 @@ async def crear_producto(producto: ProductoCreate):
         "fecha_creacion": now,
         "fecha_actualizacion": now,
         "stock_total": 0,
-        "bodegas_disponibles": 0
+        "bodegas_disponibles": 0,
+        "version": 0
     }
+
+def confirmar_productos(lote):
+    """Dar de alta un lote importado e indexarlo en bloque, con un solo cambio de versión"""
+    now = datetime.now()
+    productos_db.guardar_varios(
+        construir_producto(producto, producto_id or str(uuid.uuid4()), now) for producto_id, producto in lote
+    )
+
+@app.on_event("shutdown")
+async def cerrar_conexiones():
+    """Cerrar el pool de conexiones hacia otros microservicios"""
+    await cerrar_cliente()
+
+@app.get("/", tags=["Health"])
+async def root():
+    """Endpoint de salud del servicio"""
+    return {"message": "MS-Producto API activa", "timestamp": datetime.now()}
+
+@app.post("/productos", response_model=ProductoResponse, tags=["Productos"])
+async def crear_producto(producto: ProductoCreate):
+    """Crear un nuevo producto"""
+    producto_id = str(uuid.uuid4())
+    nuevo_producto = construir_producto(producto, producto_id, datetime.now())
     
-    productos_db[producto_id] = nuevo_producto
+    nuevo_producto = productos_db.guardar(nuevo_producto)
     print(f"Producto creado: {nuevo_producto}")
     return ProductoResponse(**nuevo_producto)
 
+@app.post("/productos/importar", response_model=ResultadoImportacion, tags=["Importación"])
+async def importar_productos(
+    request: Request,
+    formato: Optional[FormatoImportacion] = Query(None, description="Formato del cuerpo; por defecto según el Content-Type"),
+    tamano_lote: int = Query(1000, ge=1, le=50000, description="Filas confirmadas por lote"),
+    max_errores: int = Query(100, ge=0, le=10000, description="Máximo de errores detallados en la respuesta")
+):
+    """Importar productos desde NDJSON o CSV, leyendo el cuerpo en streaming"""
+    resultado = await importar(
+        request.stream(),
+        formato or formato_desde_content_type(request.headers.get("content-type")),
+        ProductoCreate, confirmar_productos, productos_db.__contains__,
+        tamano_lote, max_errores
+    )
+    return ResultadoImportacion(**resultado)
+
 @app.get("/productos", response_model=List[ProductoResponse], tags=["Productos"])
 async def listar_productos(
     nombre: Optional[str] = Query(None, description="Filtrar por nombre (búsqueda parcial)"),
@@ -89,36 +180,61 @@ async def listar_productos(
     requiere_refrigeracion: Optional[bool] = Query(None, description="Filtrar productos que requieren refrigeración"),
     precio_min: Optional[float] = Query(None, description="Precio mínimo"),
     precio_max: Optional[float] = Query(None, description="Precio máximo"),
-    activo: Optional[bool] = Query(True, description="Filtrar por estado activo")
+    activo: Optional[bool] = Query(True, description="Filtrar por estado activo"),
+    sort: Optional[str] = Query(None, pattern="^-?precio$", description="Ordenar por precio (precio, -precio)"),
+    offset: int = Query(0, ge=0, description="Número de productos a omitir"),
+    limit: Optional[int] = Query(None, ge=1, description="Número máximo de productos"),
+    if_none_match: Optional[str] = Header(None)
 ):
     """Listar todos los productos con filtros opcionales"""
-    productos = list(productos_db.values())
-    
-    # Aplicar filtros
-    if nombre:
-        productos = [p for p in productos if nombre.lower() in p["nombre"].lower()]
-    if categoria:
-        productos = [p for p in productos if p["categoria"] == categoria]
-    if unidad_medida:
-        productos = [p for p in productos if p["unidad_medida"] == unidad_medida]
-    if requiere_refrigeracion is not None:
-        productos = [p for p in productos if p["requiere_refrigeracion"] == requiere_refrigeracion]
-    if precio_min:
-        productos = [p for p in productos if p["precio_unitario"] >= precio_min]
-    if precio_max:
-        productos = [p for p in productos if p["precio_unitario"] <= precio_max]
-    if activo is not None:
-        productos = [p for p in productos if p["activo"] == activo]
-    
-    return [ProductoResponse(**producto) for producto in productos]
+    etag = etag_coleccion("productos")
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
+    
+    clave = clave_cache(
+        "productos", nombre=nombre, categoria=categoria, unidad_medida=unidad_medida,
+        requiere_refrigeracion=requiere_refrigeracion, precio_min=precio_min,
+        precio_max=precio_max, activo=activo, sort=sort, offset=offset, limit=limit
+    )
+    cuerpo = cache_respuestas.obtener(clave, productos_db.version)
+    if cuerpo is not None:
+        return respuesta_json(cuerpo, etag)
+    
+    # Con categoría o rango de precio los resultados salen en orden de precio, desde el índice
+    # ordenado; sin ellos, en orden de inserción. La consulta es perezosa, así que la
+    # paginación corta apenas completa la página.
+    por_precio = categoria is not None or precio_min is not None or precio_max is not None or sort is not None
+    with tramo("filtrar", coleccion="productos"):
+        productos = productos_db.consultar(
+            Igual("categoria", categoria),
+            Igual("activo", activo),
+            Rango("precio_unitario", precio_min, precio_max),
+            Contiene("nombre", nombre),
+            Igual("unidad_medida", unidad_medida),
+            Igual("requiere_refrigeracion", requiere_refrigeracion),
+            ordenar_por="precio_unitario" if por_precio else None,
+            descendente=sort == "-precio"
+        )
+        productos = list(islice(productos, offset, offset + limit if limit else None))
+    
+    with tramo("construir_respuesta", cantidad=len(productos)):
+        cuerpo = serializar_productos(productos)
+    cache_respuestas.guardar(clave, productos_db.version, cuerpo)
+    return respuesta_json(cuerpo, etag)
 
 @app.get("/productos/{producto_id}", response_model=ProductoResponse, tags=["Productos"])
-async def obtener_producto(producto_id: str):
+async def obtener_producto(producto_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
     """Obtener un producto específico por ID"""
     if producto_id not in productos_db:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
-    return ProductoResponse(**productos_db[producto_id])
+    producto = productos_db[producto_id]
+    etag = etag_producto(producto)
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
+    response.headers["ETag"] = etag
+    
+    return ProductoResponse(**producto)
 
 @app.put("/productos/{producto_id}", response_model=ProductoResponse, tags=["Productos"])
 async def actualizar_producto(producto_id: str, producto_update: ProductoUpdate):
@@ -133,7 +249,7 @@ async def actualizar_producto(producto_id: str, producto_update: ProductoUpdate)
         producto[field] = value
     
     producto["fecha_actualizacion"] = datetime.now()
-    productos_db[producto_id] = producto
+    productos_db.guardar(producto)
     
     return ProductoResponse(**producto)
 
@@ -146,61 +262,98 @@ async def eliminar_producto(producto_id: str):
     producto = productos_db[producto_id]
     producto["activo"] = False
     producto["fecha_actualizacion"] = datetime.now()
+    productos_db.guardar(producto)
     
     return {"message": f"Producto {producto_id} desactivado exitosamente"}
 
 @app.get("/productos/buscar/codigo-barras/{codigo_barras}", response_model=ProductoResponse, tags=["Búsqueda"])
-async def buscar_por_codigo_barras(codigo_barras: str):
+async def buscar_por_codigo_barras(codigo_barras: str, response: Response, if_none_match: Optional[str] = Header(None)):
     """Buscar producto por código de barras"""
-    for producto in productos_db.values():
-        if producto.get("codigo_barras") == codigo_barras:
-            return ProductoResponse(**producto)
+    for producto in productos_db.consultar(Igual("codigo_barras", codigo_barras)):
+        etag = etag_producto(producto)
+        if etag_coincide(if_none_match, etag):
+            return no_modificado(etag)
+        response.headers["ETag"] = etag
+        return ProductoResponse(**producto)
     
     raise HTTPException(status_code=404, detail="Producto no encontrado con el código de barras especificado")
 
 @app.get("/productos/categoria/{categoria}", response_model=List[ProductoResponse], tags=["Búsqueda"])
-async def obtener_productos_por_categoria(categoria: CategoriaProducto):
+async def obtener_productos_por_categoria(categoria: CategoriaProducto, if_none_match: Optional[str] = Header(None)):
     """Obtener todos los productos de una categoría específica"""
-    productos = [
-        ProductoResponse(**producto) 
-        for producto in productos_db.values() 
-        if producto["categoria"] == categoria and producto["activo"]
-    ]
+    etag = etag_coleccion(f"categoria-{categoria.value}")
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
     
-    return productos
+    clave = clave_cache("categoria", categoria=categoria)
+    cuerpo = cache_respuestas.obtener(clave, productos_db.version)
+    if cuerpo is None:
+        productos = productos_db.consultar(
+            Igual("categoria", categoria), Igual("activo", True), ordenar_por="precio_unitario"
+        )
+        cuerpo = serializar_productos(list(productos))
+        cache_respuestas.guardar(clave, productos_db.version, cuerpo)
+    
+    return respuesta_json(cuerpo, etag)
 
 @app.get("/productos/{producto_id}/stock", response_model=ProductoStock, tags=["Stock"])
 async def obtener_stock_producto(producto_id: str):
-    """Obtener información de stock de un producto específico"""
+    """Obtener información de stock de un producto específico desde MS-Bodega y MS-Lote"""
     if producto_id not in productos_db:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
     producto = productos_db[producto_id]
+    bodegas, lotes, origen = await inventario.consultar_detalle_producto(producto_id)
     
-    # Aquí se integraría con MS-Bodega y MS-Lote para obtener stock real
-    # Por ahora simulamos la respuesta
-    stock_info = ProductoStock(
-        id_producto=producto_id,
-        nombre_producto=producto["nombre"],
-        stock_total=producto.get("stock_total", 0),
-        stock_disponible=producto.get("stock_total", 0),
-        stock_reservado=0,
-        valor_inventario=producto.get("stock_total", 0) * producto["precio_unitario"],
-        bodegas_con_stock=[]  # Se obtendría de MS-Bodega
-    )
+    return ProductoStock(**inventario.calcular_stock(producto, bodegas, lotes), origen=origen)
+
+@app.get("/inventario/valorizacion", response_model=ValorizacionInventario, tags=["Stock"])
+async def valorizar_inventario(
+    ids: Optional[List[str]] = Query(None, description="IDs de producto; por defecto todos los activos"),
+    categoria: Optional[CategoriaProducto] = Query(None, description="Filtrar por categoría")
+):
+    """Calcular stock y valor de inventario de muchos productos con un solo llamado por servicio"""
+    # Con ids se incluyen también los productos inactivos pedidos explícitamente
+    productos = list(productos_db.consultar(
+        EnConjunto("id", ids or None),
+        Igual("activo", None if ids else True),
+        Igual("categoria", categoria)
+    ))
+    
+    ids_consulta = [p["id"] for p in productos] if ids or categoria else None
+    por_bodegas, por_lotes, origen = await inventario.consultar_stock_productos(ids_consulta)
     
-    return stock_info
+    stocks = [
+        ProductoStock(**inventario.calcular_stock_agregado(
+            producto, por_bodegas.get(producto["id"]), por_lotes.get(producto["id"])
+        ), origen=origen)
+        for producto in productos
+    ]
+    
+    return ValorizacionInventario(
+        productos=stocks,
+        total_productos=len(stocks),
+        unidades_totales=sum(s.stock_total for s in stocks),
+        valor_total=round(sum(s.valor_inventario for s in stocks), 2),
+        origen=origen,
+        fecha_consulta=datetime.now()
+    )
 
 @app.get("/productos/refrigeracion/requeridos", response_model=List[ProductoResponse], tags=["Consultas"])
-async def obtener_productos_refrigeracion():
+async def obtener_productos_refrigeracion(if_none_match: Optional[str] = Header(None)):
     """Obtener todos los productos que requieren refrigeración"""
-    productos = [
-        ProductoResponse(**producto) 
-        for producto in productos_db.values() 
-        if producto["requiere_refrigeracion"] and producto["activo"]
-    ]
+    etag = etag_coleccion("refrigeracion")
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
     
-    return productos
+    clave = clave_cache("refrigeracion")
+    cuerpo = cache_respuestas.obtener(clave, productos_db.version)
+    if cuerpo is None:
+        productos = productos_db.consultar(Igual("requiere_refrigeracion", True), Igual("activo", True))
+        cuerpo = serializar_productos(list(productos))
+        cache_respuestas.guardar(clave, productos_db.version, cuerpo)
+    
+    return respuesta_json(cuerpo, etag)
 
 @app.get("/categorias", tags=["Categorías"])
 async def listar_categorias():
@@ -220,30 +373,23 @@ async def listar_unidades_medida():
 
 @app.get("/estadisticas/productos", tags=["Estadísticas"])
 async def obtener_estadisticas():
-    """Obtener estadísticas generales de productos"""
-    productos_activos = [p for p in productos_db.values() if p["activo"]]
-    
-    # Estadísticas por categoría
-    categoria_count = {}
-    for producto in productos_activos:
-        categoria = producto["categoria"]
-        categoria_count[categoria] = categoria_count.get(categoria, 0) + 1
-    
-    # Productos que requieren refrigeración
-    productos_refrigerados = len([p for p in productos_activos if p["requiere_refrigeracion"]])
-    
-    # Precio promedio
-    precios = [p["precio_unitario"] for p in productos_activos]
-    precio_promedio = sum(precios) / len(precios) if precios else 0
-    
+    """Obtener estadísticas generales de productos (agregados mantenidos en cada escritura)"""
     return {
-        "total_productos": len(productos_activos),
-        "productos_refrigerados": productos_refrigerados,
-        "precio_promedio": round(precio_promedio, 2),
-        "productos_por_categoria": categoria_count,
+        "total_productos": estadisticas_catalogo.total,
+        "productos_refrigerados": estadisticas_catalogo.refrigerados,
+        "precio_promedio": round(estadisticas_catalogo.precio_promedio(), 2),
+        "percentiles_precio": {
+            f"p{p}": round(estadisticas_catalogo.percentil(p), 2) for p in (25, 50, 75, 90)
+        },
+        "productos_por_categoria": dict(estadisticas_catalogo.por_categoria),
         "fecha_consulta": datetime.now()
     }
 
+@app.get("/cache/estadisticas", tags=["Caché"])
+async def obtener_estadisticas_cache():
+    """Obtener estadísticas de la caché de respuestas"""
+    return cache_respuestas.estadisticas()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8003)
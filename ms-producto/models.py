@@ -98,3 +98,38 @@ class ProductoStock(BaseModel):
     stock_reservado: int
     valor_inventario: float
     bodegas_con_stock: List[dict]
+    origen: Optional[str] = None  # "tiempo_real", "cache", "obsoleto" o "local"
+
+
+class ValorizacionInventario(BaseModel):
+    """Valorización de inventario para un conjunto de productos"""
+    productos: List[ProductoStock]
+    total_productos: int
+    unidades_totales: int
+    valor_total: float
+    origen: str
+    fecha_consulta: datetime
+
+
+class FormatoImportacion(str, Enum):
+    """Formatos aceptados por la importación masiva"""
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class ErrorFilaImportacion(BaseModel):
+    """Errores de una fila rechazada en una importación"""
+    linea: int
+    errores: List[str]
+
+
+class ResultadoImportacion(BaseModel):
+    """Resumen de una importación masiva"""
+    formato: FormatoImportacion
+    filas_leidas: int
+    importadas: int
+    con_error: int
+    lotes_confirmados: int
+    interrumpida: bool
+    motivo_interrupcion: Optional[str] = None
+    errores: List[ErrorFilaImportacion]  # Solo los primeros max_errores
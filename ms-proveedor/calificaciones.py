@@ -0,0 +1,92 @@
+"""Calificación de proveedores con acumuladores incrementales.
+
+Cada evaluación suma sus puntajes a acumuladores por proveedor y criterio, de
+modo que registrar una evaluación y leer la calificación cuestan O(1) sin
+importar cuántas evaluaciones tenga el proveedor.
+
+La calificación ponderada por recencia da a cada evaluación un peso
+exp(-λ·edad), con λ = ln 2 / vida media. Como todas las evaluaciones de un
+proveedor envejecen al mismo ritmo, el promedio ponderado no cambia con el
+paso del tiempo: basta acumular puntaje·e^(λ·t) y e^(λ·t), con t medido desde
+una fecha de referencia que se adelanta cuando los exponentes crecen.
+"""
+import math
+from datetime import datetime
+from typing import Dict, Optional
+
+CRITERIOS = ("calidad", "puntualidad", "servicio", "precio")
+
+# Exponente a partir del cual se adelanta la referencia para evitar desbordes
+EXPONENTE_MAXIMO = 500.0
+
+
+class _Acumulador:
+    __slots__ = ("total", "sumas", "peso", "sumas_ponderadas", "referencia")
+
+    def __init__(self, referencia: datetime):
+        self.total = 0
+        self.sumas = [0.0] * len(CRITERIOS)
+        self.peso = 0.0
+        self.sumas_ponderadas = [0.0] * len(CRITERIOS)
+        self.referencia = referencia
+
+
+class CalificacionesProveedores:
+    """Promedios simples y ponderados por recencia de las evaluaciones de cada proveedor"""
+
+    def __init__(self, vida_media_dias: float):
+        self.vida_media_dias = vida_media_dias
+        self._lambda = math.log(2) / vida_media_dias
+        self._acumuladores: Dict[str, _Acumulador] = {}
+
+    def registrar(self, id_proveedor: str, evaluacion: dict):
+        """Sumar una evaluación a los acumuladores del proveedor"""
+        fecha = evaluacion["fecha_evaluacion"]
+        if fecha.tzinfo is not None:
+            fecha = fecha.astimezone().replace(tzinfo=None)
+        acumulador = self._acumuladores.get(id_proveedor)
+        if acumulador is None:
+            acumulador = self._acumuladores[id_proveedor] = _Acumulador(fecha)
+
+        exponente = self._lambda * self._dias(fecha, acumulador.referencia)
+        if exponente > EXPONENTE_MAXIMO:
+            # Adelantar la referencia a esta evaluación reescalando lo acumulado
+            factor = math.exp(-exponente)
+            acumulador.peso *= factor
+            acumulador.sumas_ponderadas = [suma * factor for suma in acumulador.sumas_ponderadas]
+            acumulador.referencia = fecha
+            exponente = 0.0
+        peso = math.exp(exponente)
+
+        acumulador.total += 1
+        acumulador.peso += peso
+        for i, criterio in enumerate(CRITERIOS):
+            acumulador.sumas[i] += evaluacion[criterio]
+            acumulador.sumas_ponderadas[i] += peso * evaluacion[criterio]
+
+    def total(self, id_proveedor: str) -> int:
+        acumulador = self._acumuladores.get(id_proveedor)
+        return acumulador.total if acumulador else 0
+
+    def por_criterio(self, id_proveedor: str, reciente: bool = False) -> Optional[Dict[str, float]]:
+        """Promedio de cada criterio; None si el proveedor no tiene evaluaciones"""
+        acumulador = self._acumuladores.get(id_proveedor)
+        if acumulador is None:
+            return None
+        if reciente and acumulador.peso > 0:
+            sumas, divisor = acumulador.sumas_ponderadas, acumulador.peso
+        else:
+            # Evaluaciones tan antiguas que su peso se anula: se usa el promedio simple
+            sumas, divisor = acumulador.sumas, acumulador.total
+        return {criterio: suma / divisor for criterio, suma in zip(CRITERIOS, sumas)}
+
+    def promedio(self, id_proveedor: str, reciente: bool = False) -> float:
+        """Promedio de los cuatro criterios, redondeado a un decimal; 0.0 sin evaluaciones"""
+        criterios = self.por_criterio(id_proveedor, reciente)
+        if criterios is None:
+            return 0.0
+        return round(sum(criterios.values()) / len(CRITERIOS), 1)
+
+    @staticmethod
+    def _dias(fecha: datetime, referencia: datetime) -> float:
+        return (fecha - referencia).total_seconds() / 86400
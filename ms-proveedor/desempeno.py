@@ -0,0 +1,117 @@
+"""Desempeño de proveedores sincronizado desde MS-OrdenCompra.
+
+Una tarea en segundo plano consulta periódicamente el registro de cambios de
+MS-OrdenCompra (GET /proveedores/desempeno) y guarda localmente los agregados
+de cada proveedor: solo llegan los proveedores modificados desde la última
+versión vista. Los puntajes y rankings leen este estado local, sin llamados
+entre servicios por solicitud.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+import httpx
+
+from comun.trazas import TransporteTrazado
+
+MS_ORDEN_COMPRA_URL = os.getenv("MS_ORDEN_COMPRA_URL", "http://ms-orden-compra:8005")
+INTERVALO_SEGUNDOS = float(os.getenv("DESEMPENO_INTERVALO_SEGUNDOS", "30"))
+TAMANO_LOTE = int(os.getenv("DESEMPENO_TAMANO_LOTE", "1000"))
+
+# Pesos del puntaje compuesto; si falta un componente se reparten entre los demás
+PESOS = {"cumplimiento": 0.4, "plazo": 0.3, "calificacion": 0.3}
+
+
+class DesempenoSincronizado:
+    """Copia local de los agregados de desempeño publicados por MS-OrdenCompra"""
+
+    def __init__(self, ganchos: Optional[Dict[str, list]] = None):
+        self.ganchos = ganchos or {}  # event_hooks de httpx, p. ej. medir_llamadas(metricas)
+        self.datos: Dict[str, dict] = {}
+        self.instancia: Optional[str] = None
+        self.version = 0
+        self.revision = 0  # cambia cada vez que se aplican datos nuevos
+        self.ultima_sincronizacion: Optional[datetime] = None
+        self.ultimo_error: Optional[str] = None
+
+    def aplicar(self, pagina: dict) -> Optional[int]:
+        """Aplicar una página del registro de cambios y devolver los proveedores actualizados.
+
+        Devuelve None si MS-OrdenCompra se reinició (sus versiones empiezan de
+        nuevo) y hay que volver a pedir desde la versión 0.
+        """
+        if pagina["instancia"] != self.instancia:
+            self.datos.clear()
+            self.instancia = pagina["instancia"]
+            self.revision += 1
+            if pagina["desde_version"]:
+                self.version = 0
+                return None
+        for desempeno in pagina["proveedores"]:
+            self.datos[desempeno["id_proveedor"]] = desempeno
+        self.version = pagina["version"]
+        if pagina["proveedores"]:
+            self.revision += 1
+        return len(pagina["proveedores"])
+
+    async def sincronizar(self, cliente: httpx.AsyncClient) -> int:
+        """Traer todos los cambios pendientes, por lotes"""
+        actualizados = 0
+        while True:
+            respuesta = await cliente.get(
+                f"{MS_ORDEN_COMPRA_URL}/proveedores/desempeno",
+                params={"desde_version": self.version, "limite": TAMANO_LOTE}
+            )
+            respuesta.raise_for_status()
+            pagina = respuesta.json()
+            aplicados = self.aplicar(pagina)
+            if aplicados is None:
+                continue
+            actualizados += aplicados
+            if not pagina["hay_mas"]:
+                break
+        self.ultima_sincronizacion = datetime.now()
+        self.ultimo_error = None
+        return actualizados
+
+    async def ejecutar(self):
+        """Sincronizar periódicamente hasta que se cancele la tarea"""
+        async with httpx.AsyncClient(
+            timeout=httpx.Timeout(5.0, connect=1.0), event_hooks=self.ganchos, transport=TransporteTrazado()
+        ) as cliente:
+            while True:
+                try:
+                    await self.sincronizar(cliente)
+                except (httpx.HTTPError, ValueError, KeyError) as error:
+                    # Se conserva el último estado conocido y se reintenta en el siguiente ciclo
+                    self.ultimo_error = f"{type(error).__name__}: {error}"
+                await asyncio.sleep(INTERVALO_SEGUNDOS)
+
+
+def puntaje_compuesto(
+    desempeno: Optional[dict],
+    tiempo_prometido: int,
+    calificacion: float,
+    evaluaciones: int
+) -> dict:
+    """Componentes entre 0 y 1 y puntaje compuesto entre 0 y 100 (None sin ningún dato).
+
+    - cumplimiento: fracción de entregas recibidas a más tardar en la fecha requerida
+    - plazo: tiempo de entrega prometido / tiempo real promedio, acotado a 1
+    - calificacion: promedio de evaluaciones / 5
+    """
+    componentes: Dict[str, Optional[float]] = {"cumplimiento": None, "plazo": None, "calificacion": None}
+    if desempeno and desempeno.get("entregas_medidas"):
+        componentes["cumplimiento"] = desempeno["tasa_a_tiempo"]
+        dias = desempeno["promedio_dias_entrega"]
+        componentes["plazo"] = 1.0 if dias <= 0 else min(1.0, tiempo_prometido / dias)
+    if evaluaciones:
+        componentes["calificacion"] = calificacion / 5
+
+    disponibles = {nombre: valor for nombre, valor in componentes.items() if valor is not None}
+    puntaje = None
+    if disponibles:
+        peso_total = sum(PESOS[nombre] for nombre in disponibles)
+        puntaje = round(100 * sum(PESOS[nombre] * valor for nombre, valor in disponibles.items()) / peso_total, 2)
+    return {**{nombre: round(valor, 4) if valor is not None else None for nombre, valor in componentes.items()}, "puntaje": puntaje}
@@ -0,0 +1,67 @@
+"""Índice en memoria de las certificaciones de los proveedores.
+
+Se mantiene de forma incremental en cada alta, de modo que las consultas
+recorren solo los resultados y no todas las certificaciones. Los índices de
+los proveedores mismos se declaran en su repositorio (ver main.py).
+"""
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from comun.texto import valor_enum
+
+
+class IndiceCertificaciones:
+    """Certificaciones ordenadas por fecha de vencimiento, globales y por tipo.
+
+    La vigencia no se guarda: una certificación es vigente si vence en la fecha
+    de corte o después. Así "vigentes", "por vencer en N días" y "proveedores
+    con certificación vigente de un tipo" son tramos de listas ordenadas,
+    O(log N + k).
+    """
+
+    TODAS = "*"
+
+    def __init__(self):
+        self._listas: Dict[str, List[Tuple[date, int]]] = {}
+        self._certificaciones: Dict[int, Tuple[str, dict]] = {}  # secuencia -> (proveedor, certificación)
+        self._secuencia = 0
+        # Por tipo, el vencimiento más lejano de cada proveedor: vigente mientras no haya pasado
+        self._vencimiento_proveedor: Dict[Tuple[str, str], date] = {}
+        self._proveedores_por_tipo: Dict[str, List[Tuple[date, str]]] = {}
+
+    def agregar(self, proveedor_id: str, certificacion: dict):
+        tipo = valor_enum(certificacion["tipo"])
+        vencimiento = certificacion["fecha_vencimiento"]
+        self._secuencia += 1
+        self._certificaciones[self._secuencia] = (proveedor_id, certificacion)
+        for clave in (self.TODAS, tipo):
+            insort(self._listas.setdefault(clave, []), (vencimiento, self._secuencia))
+
+        anterior = self._vencimiento_proveedor.get((tipo, proveedor_id))
+        if anterior is None or vencimiento > anterior:
+            proveedores = self._proveedores_por_tipo.setdefault(tipo, [])
+            if anterior is not None:
+                del proveedores[bisect_left(proveedores, (anterior, proveedor_id))]
+            insort(proveedores, (vencimiento, proveedor_id))
+            self._vencimiento_proveedor[(tipo, proveedor_id)] = vencimiento
+
+    def por_vencer(self, desde: date, hasta: date, tipo=None) -> Iterator[Tuple[str, dict]]:
+        """(proveedor, certificación) con vencimiento en [desde, hasta], por fecha de vencimiento"""
+        lista = self._listas.get(self.TODAS if tipo is None else valor_enum(tipo), [])
+        inicio = bisect_left(lista, (desde,))
+        fin = bisect_right(lista, (hasta, self._secuencia))
+        return (self._certificaciones[secuencia] for _, secuencia in lista[inicio:fin])
+
+    def total_vigentes(self, corte: date, tipo=None) -> int:
+        lista = self._listas.get(self.TODAS if tipo is None else valor_enum(tipo), [])
+        return len(lista) - bisect_left(lista, (corte,))
+
+    def proveedores_vigentes(self, tipo, corte: date) -> Iterator[str]:
+        """Proveedores con al menos una certificación del tipo vigente en la fecha de corte"""
+        proveedores = self._proveedores_por_tipo.get(valor_enum(tipo), [])
+        return (proveedor_id for _, proveedor_id in proveedores[bisect_left(proveedores, (corte,)):])
+
+
+def es_vigente(certificacion: dict, corte: Optional[date] = None) -> bool:
+    return certificacion["fecha_vencimiento"] >= (corte or date.today())
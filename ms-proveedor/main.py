@@ -1,4 +1,5 @@
-from fastapi import FastAPI, HTTPException, Query
+import asyncio
+from fastapi import FastAPI, HTTPException, Query, Header, Response, Request
 from typing import List, Optional
 from datetime import datetime, date, timedelta
 import uuid
@@ -7,17 +8,43 @@ import json
 from models import (
     ProveedorCreate, ProveedorUpdate, ProveedorResponse, ProveedorFilter,
     CertificacionSanitaria, ProveedorEvaluacion, ProveedorEstadisticas,
-    CondicionesEntrega, TipoCertificacion, EstadoProveedor
+    TipoCertificacion, EstadoProveedor,
+    CalificacionProveedor, TipoPonderacion, BusquedaProveedores, PuntajeProveedor,
+    FormatoImportacion, ResultadoImportacion
 )
+from calificaciones import CalificacionesProveedores, CRITERIOS
+from indices import IndiceCertificaciones, es_vigente
+from desempeno import DesempenoSincronizado, puntaje_compuesto
+from comun import Repositorio, IndiceHash, IndiceOrdenado, Igual, EnConjunto, Contiene, Rango
+from comun.etags import etag_coincide, etag_fuerte, no_modificado
+from comun.importacion import importar, formato_desde_content_type
+from comun.metricas import instrumentar, medir_llamadas, registrar_repositorio
+from comun.perfilador import perfilar
+from comun.trazas import tramo, trazar
 
 app = FastAPI(
     title="MS-Proveedor API",
     description="Microservicio para gestión de proveedores",
     version="1.0.0"
 )
+metricas = instrumentar(app)
+trazar(app, "ms-proveedor")
+perfilar(app, metricas)
 
-# Simulación de base de datos en memoria
-proveedores_db = {}
+# Índices de los filtros y facetas. Las especialidades y el país se comparan sin mayúsculas
+# ni tildes; la búsqueda parcial de especialidad usa trigramas sobre el vocabulario de
+# especialidades, mucho menor que proveedores × especialidades.
+indice_especialidades = IndiceHash("especialidades", normalizado=True, parcial=True)
+indice_estado = IndiceHash("estado")
+indice_pais = IndiceHash("pais", normalizado=True)
+indice_tiempo_entrega = IndiceOrdenado("condiciones_entrega.tiempo_entrega")
+
+# Base de datos en memoria. Cada escritura (proveedores_db.guardar) reindexa el proveedor e
+# incrementa su versión y la de la colección (proveedores_db.version), usadas en los ETags.
+proveedores_db = Repositorio(
+    "proveedores", [indice_especialidades, indice_estado, indice_pais, indice_tiempo_entrega]
+)
+registrar_repositorio(metricas, proveedores_db, "estado")
 
 def cargar_proveedores_desde_json():
     ruta = os.path.join(os.path.dirname(__file__), "test_data.json")
@@ -45,49 +72,87 @@ def cargar_proveedores_desde_json():
             "total_ordenes": prov.get("total_ordenes", 0),
             "fecha_ultimo_pedido": datetime.now(),
             "fecha_creacion": datetime.now(),
-            "fecha_actualizacion": datetime.now()
+            "fecha_actualizacion": datetime.now(),
+            "version": 1
         }
     return proveedores
 
-proveedores_db = cargar_proveedores_desde_json()
+# Los datos de prueba solo se cargan si no hay datos persistidos
+proveedores_db.inicializar(cargar_proveedores_desde_json().values())
 
-certificaciones_db = {}  # {proveedor_id: [certificaciones]}
-evaluaciones_db = {}  # {proveedor_id: [evaluaciones]}
+# Una certificación o evaluación por registro, indexadas por proveedor. Se persisten igual
+# que los proveedores; el índice de vencimientos y las calificaciones se reconstruyen de ellas.
+certificaciones_db = Repositorio("certificaciones", [IndiceHash("id_proveedor")])
+evaluaciones_db = Repositorio("evaluaciones", [IndiceHash("id_proveedor")])
 
-def calcular_calificacion_promedio(proveedor_id: str) -> float:
-    """Calcular calificación promedio de un proveedor"""
-    evaluaciones = evaluaciones_db.get(proveedor_id, [])
-    if not evaluaciones:
-        return 0.0
-    
-    total_puntos = sum(
-        (eval["calidad"] + eval["puntualidad"] + eval["servicio"] + eval["precio"]) / 4
-        for eval in evaluaciones
-    )
-    return round(total_puntos / len(evaluaciones), 1)
+indice_certificaciones = IndiceCertificaciones()
+for _certificacion in certificaciones_db.values():
+    indice_certificaciones.agregar(_certificacion["id_proveedor"], _certificacion)
+
+# Sumas por proveedor y criterio, actualizadas al agregar cada evaluación
+calificaciones_proveedores = CalificacionesProveedores(float(os.getenv("CALIFICACION_VIDA_MEDIA_DIAS", "180")))
+for _evaluacion in evaluaciones_db.values():
+    calificaciones_proveedores.registrar(_evaluacion["id_proveedor"], _evaluacion)
+
+# Agregados de órdenes por proveedor, sincronizados por lotes desde MS-OrdenCompra
+desempeno_sincronizado = DesempenoSincronizado(ganchos=medir_llamadas(metricas))
+tarea_desempeno: Optional[asyncio.Task] = None
+
+def calcular_calificacion_promedio(proveedor_id: str, ponderacion: TipoPonderacion = TipoPonderacion.SIMPLE) -> float:
+    """Calificación promedio de un proveedor, leída de los acumuladores en O(1)"""
+    return calificaciones_proveedores.promedio(proveedor_id, reciente=ponderacion == TipoPonderacion.RECIENTE)
 
 def verificar_certificaciones_vigentes(proveedor_id: str) -> List[CertificacionSanitaria]:
-    """Verificar y actualizar estado de certificaciones"""
-    certificaciones = certificaciones_db.get(proveedor_id, [])
+    """Certificaciones de un proveedor con la vigencia calculada al día de hoy"""
     hoy = date.today()
-    
-    for cert in certificaciones:
-        cert["vigente"] = cert["fecha_vencimiento"] >= hoy
-    
-    return [CertificacionSanitaria(**cert) for cert in certificaciones]
+    return [
+        CertificacionSanitaria(**cert, vigente=es_vigente(cert, hoy))
+        for cert in certificaciones_db.consultar(Igual("id_proveedor", proveedor_id))
+    ]
 
-@app.get("/", tags=["Health"])
-async def root():
-    """Endpoint de salud del servicio"""
-    return {"message": "MS-Proveedor API activa", "timestamp": datetime.now()}
+def respuesta_proveedor(proveedor: dict, ponderacion: TipoPonderacion = TipoPonderacion.SIMPLE) -> ProveedorResponse:
+    """Proveedor con su calificación y sus certificaciones"""
+    return ProveedorResponse(
+        **{**proveedor, "calificacion": calcular_calificacion_promedio(proveedor["id"], ponderacion)},
+        certificaciones=verificar_certificaciones_vigentes(proveedor["id"])
+    )
 
-@app.post("/proveedores", response_model=ProveedorResponse, tags=["Proveedores"])
-async def crear_proveedor(proveedor: ProveedorCreate):
-    """Crear un nuevo proveedor"""
-    proveedor_id = str(uuid.uuid4())
-    now = datetime.now()
-    
-    nuevo_proveedor = {
+def condiciones_indexadas(
+    estado: Optional[EstadoProveedor] = None,
+    especialidad: Optional[str] = None,
+    especialidad_parcial: bool = False,
+    pais: Optional[str] = None,
+    tiempo_entrega_max: Optional[int] = None
+) -> tuple:
+    """Condiciones de los filtros que resuelven los índices; las vacías no filtran"""
+    return (
+        Igual("estado", estado),
+        Contiene("especialidades", especialidad) if especialidad_parcial
+            else Igual("especialidades", especialidad or None, normalizado=True),
+        Igual("pais", pais or None, normalizado=True),
+        Rango("condiciones_entrega.tiempo_entrega", maximo=tiempo_entrega_max),
+    )
+
+def facetas_proveedores(ids: List[str]) -> dict:
+    """Conteo por valor de especialidad, estado, país y tiempo de entrega dentro de un resultado"""
+    conteos = {
+        "especialidad": indice_especialidades.conteos(ids),
+        "estado": indice_estado.conteos(ids),
+        "pais": indice_pais.conteos(ids),
+        "tiempo_entrega": indice_tiempo_entrega.conteos(ids),
+    }
+    return {
+        faceta: {str(valor): n for valor, n in sorted(conteo.items(), key=lambda item: (-item[1], item[0]))}
+        for faceta, conteo in conteos.items()
+    }
+
+def etag_proveedores(*partes) -> str:
+    """ETag fuerte que incluye el día, porque la vigencia de certificaciones depende de la fecha"""
+    return etag_fuerte(date.today().toordinal(), *partes)
+
+def construir_proveedor(proveedor: ProveedorCreate, proveedor_id: str, now: datetime) -> dict:
+    """Registro en memoria de un proveedor nuevo"""
+    return {
         "id": proveedor_id,
         "nombre": proveedor.nombre,
         "email": str(proveedor.email),
@@ -104,14 +169,57 @@ async def crear_proveedor(proveedor: ProveedorCreate):
         "total_ordenes": 0,
         "fecha_ultimo_pedido": None,
         "fecha_creacion": now,
-        "fecha_actualizacion": now
+        "fecha_actualizacion": now,
+        "version": 0
     }
+
+def confirmar_proveedores(lote):
+    """Dar de alta un lote importado e indexarlo en bloque, con un solo cambio de versión"""
+    now = datetime.now()
+    nuevos = [construir_proveedor(proveedor, proveedor_id or str(uuid.uuid4()), now) for proveedor_id, proveedor in lote]
+    proveedores_db.guardar_varios(nuevos)
+
+def puntaje_proveedor(proveedor: dict) -> PuntajeProveedor:
+    """Puntaje compuesto a partir del desempeño sincronizado y las evaluaciones"""
+    proveedor_id = proveedor["id"]
+    desempeno = desempeno_sincronizado.datos.get(proveedor_id)
+    return PuntajeProveedor(
+        id_proveedor=proveedor_id,
+        nombre=proveedor["nombre"],
+        **puntaje_compuesto(
+            desempeno,
+            proveedor["condiciones_entrega"]["tiempo_entrega"],
+            calcular_calificacion_promedio(proveedor_id),
+            calificaciones_proveedores.total(proveedor_id)
+        ),
+        ordenes_completadas=desempeno["ordenes_completadas"] if desempeno else 0,
+        promedio_dias_entrega=desempeno["promedio_dias_entrega"] if desempeno else None,
+        monto_recibido=desempeno["monto_recibido"] if desempeno else 0
+    )
+
+@app.on_event("startup")
+async def iniciar_sincronizacion():
+    """Sincronizar en segundo plano el desempeño publicado por MS-OrdenCompra"""
+    global tarea_desempeno
+    tarea_desempeno = asyncio.create_task(desempeno_sincronizado.ejecutar())
+
+@app.on_event("shutdown")
+async def detener_sincronizacion():
+    if tarea_desempeno is not None:
+        tarea_desempeno.cancel()
+
+@app.get("/", tags=["Health"])
+async def root():
+    """Endpoint de salud del servicio"""
+    return {"message": "MS-Proveedor API activa", "timestamp": datetime.now()}
+
+@app.post("/proveedores", response_model=ProveedorResponse, tags=["Proveedores"])
+async def crear_proveedor(proveedor: ProveedorCreate):
+    """Crear un nuevo proveedor"""
+    proveedor_id = str(uuid.uuid4())
+    nuevo_proveedor = construir_proveedor(proveedor, proveedor_id, datetime.now())
     
-    # Inicializar certificaciones y evaluaciones vacías
-    certificaciones_db[proveedor_id] = []
-    evaluaciones_db[proveedor_id] = []
-    
-    proveedores_db[proveedor_id] = nuevo_proveedor
+    proveedores_db.guardar(nuevo_proveedor)
     
     return ProveedorResponse(
         **nuevo_proveedor,
@@ -119,75 +227,139 @@ async def crear_proveedor(proveedor: ProveedorCreate):
         certificaciones=[]
     )
 
+@app.post("/proveedores/importar", response_model=ResultadoImportacion, tags=["Importación"])
+async def importar_proveedores(
+    request: Request,
+    formato: Optional[FormatoImportacion] = Query(None, description="Formato del cuerpo; por defecto según el Content-Type"),
+    tamano_lote: int = Query(1000, ge=1, le=50000, description="Filas confirmadas por lote"),
+    max_errores: int = Query(100, ge=0, le=10000, description="Máximo de errores detallados en la respuesta")
+):
+    """Importar proveedores desde NDJSON o CSV, leyendo el cuerpo en streaming"""
+    resultado = await importar(
+        request.stream(),
+        formato or formato_desde_content_type(request.headers.get("content-type")),
+        ProveedorCreate, confirmar_proveedores, proveedores_db.__contains__,
+        tamano_lote, max_errores
+    )
+    return ResultadoImportacion(**resultado)
+
 @app.get("/proveedores", response_model=List[ProveedorResponse], tags=["Proveedores"])
 async def listar_proveedores(
+    response: Response,
     nombre: Optional[str] = Query(None, description="Filtrar por nombre (búsqueda parcial)"),
     ciudad: Optional[str] = Query(None, description="Filtrar por ciudad"),
     pais: Optional[str] = Query(None, description="Filtrar por país"),
     estado: Optional[EstadoProveedor] = Query(None, description="Filtrar por estado"),
     especialidad: Optional[str] = Query(None, description="Filtrar por especialidad"),
     certificacion: Optional[TipoCertificacion] = Query(None, description="Filtrar por tipo de certificación"),
-    tiempo_entrega_max: Optional[int] = Query(None, description="Tiempo máximo de entrega en días")
+    tiempo_entrega_max: Optional[int] = Query(None, description="Tiempo máximo de entrega en días"),
+    ponderacion: TipoPonderacion = Query(TipoPonderacion.SIMPLE, description="Ponderación de las evaluaciones en la calificación"),
+    if_none_match: Optional[str] = Header(None)
 ):
     """Listar todos los proveedores con filtros opcionales"""
-    proveedores = list(proveedores_db.values())
-    
-    # Aplicar filtros
-    if nombre:
-        proveedores = [p for p in proveedores if nombre.lower() in p["nombre"].lower()]
-    if ciudad:
-        proveedores = [p for p in proveedores if ciudad.lower() in p["ciudad"].lower()]
-    if pais:
-        proveedores = [p for p in proveedores if pais.lower() in p["pais"].lower()]
-    if estado:
-        proveedores = [p for p in proveedores if p["estado"] == estado]
-    if especialidad:
-        proveedores = [p for p in proveedores if especialidad.lower() in [e.lower() for e in p["especialidades"]]]
-    if tiempo_entrega_max:
-        proveedores = [p for p in proveedores if p["condiciones_entrega"]["tiempo_entrega"] <= tiempo_entrega_max]
-    
-    # Filtrar por certificación si se especifica
-    if certificacion:
-        proveedores_con_cert = []
-        for proveedor in proveedores:
-            certificaciones = certificaciones_db.get(proveedor["id"], [])
-            tiene_certificacion = any(
-                cert["tipo"] == certificacion and cert["vigente"]
-                for cert in certificaciones
-            )
-            if tiene_certificacion:
-                proveedores_con_cert.append(proveedor)
-        proveedores = proveedores_con_cert
-    
-    # Preparar respuesta con certificaciones
-    proveedores_response = []
-    for proveedor in proveedores:
-        # Actualizar calificación
-        proveedor["calificacion"] = calcular_calificacion_promedio(proveedor["id"])
-        
-        # Obtener certificaciones vigentes
-        certificaciones = verificar_certificaciones_vigentes(proveedor["id"])
-        
-        proveedores_response.append(ProveedorResponse(
-            **proveedor,
-            #condiciones_entrega=CondicionesEntrega(**proveedor["condiciones_entrega"]),
-            certificaciones=certificaciones
+    etag = etag_proveedores("proveedores", ponderacion.value, proveedores_db.version)
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
+    response.headers["ETag"] = etag
+    
+    # Con certificación, los candidatos son los proveedores con una vigente de ese tipo
+    con_certificacion = (
+        set(indice_certificaciones.proveedores_vigentes(certificacion, date.today())) if certificacion else None
+    )
+    with tramo("filtrar", coleccion="proveedores"):
+        proveedores = list(proveedores_db.consultar(
+            *condiciones_indexadas(estado, especialidad, tiempo_entrega_max=tiempo_entrega_max or None),
+            Contiene("nombre", nombre),
+            Contiene("ciudad", ciudad),
+            Contiene("pais", pais),
+            EnConjunto("id", con_certificacion)
         ))
     
-    return proveedores_response
+    # Preparar respuesta con calificación y certificaciones
+    with tramo("construir_respuesta", cantidad=len(proveedores)):
+        return [respuesta_proveedor(proveedor, ponderacion) for proveedor in proveedores]
+
+@app.get("/proveedores/busqueda", response_model=BusquedaProveedores, tags=["Búsqueda"])
+async def buscar_proveedores(
+    response: Response,
+    especialidad: Optional[str] = Query(None, description="Especialidad o parte de ella, sin distinguir mayúsculas ni tildes"),
+    estado: Optional[EstadoProveedor] = Query(None, description="Filtrar por estado"),
+    pais: Optional[str] = Query(None, description="Filtrar por país, sin distinguir mayúsculas ni tildes"),
+    tiempo_entrega_max: Optional[int] = Query(None, description="Tiempo máximo de entrega en días"),
+    ponderacion: TipoPonderacion = Query(TipoPonderacion.SIMPLE, description="Ponderación de las evaluaciones en la calificación"),
+    offset: int = Query(0, ge=0, description="Proveedores a omitir"),
+    limit: int = Query(50, ge=1, le=500, description="Máximo de proveedores a devolver"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Búsqueda por facetas: proveedores que cumplen los filtros y conteos por valor de cada faceta"""
+    etag = etag_proveedores("busqueda", ponderacion.value, proveedores_db.version)
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
+    response.headers["ETag"] = etag
+    
+    ids = proveedores_db.ids(*condiciones_indexadas(estado, especialidad, True, pais, tiempo_entrega_max))
+    
+    return BusquedaProveedores(
+        total=len(ids),
+        facetas=facetas_proveedores(ids),
+        proveedores=[respuesta_proveedor(proveedores_db[i], ponderacion) for i in ids[offset:offset + limit]]
+    )
+
+@app.get("/proveedores/ranking", response_model=List[PuntajeProveedor], tags=["Desempeño"])
+async def ranking_proveedores(
+    response: Response,
+    especialidad: Optional[str] = Query(None, description="Filtrar por especialidad (coincidencia parcial)"),
+    estado: Optional[EstadoProveedor] = Query(None, description="Filtrar por estado"),
+    limit: int = Query(20, ge=1, le=500, description="Número máximo de proveedores"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Proveedores ordenados por puntaje compuesto (cumplimiento, plazo y calificación)"""
+    etag = etag_proveedores(
+        "ranking", proveedores_db.version, desempeno_sincronizado.instancia, desempeno_sincronizado.revision,
+        especialidad, estado, limit
+    )
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
+    response.headers["ETag"] = etag
+    
+    proveedores = proveedores_db.consultar(*condiciones_indexadas(estado, especialidad, especialidad_parcial=True))
+    puntajes = [puntaje_proveedor(proveedor) for proveedor in proveedores]
+    # Los proveedores sin datos quedan al final
+    puntajes.sort(key=lambda p: (p.puntaje is None, -(p.puntaje or 0)))
+    return puntajes[:limit]
+
+@app.get("/proveedores/desempeno/estado", tags=["Desempeño"])
+async def estado_sincronizacion_desempeno():
+    """Estado de la sincronización con MS-OrdenCompra"""
+    return {
+        "instancia_origen": desempeno_sincronizado.instancia,
+        "version": desempeno_sincronizado.version,
+        "proveedores_con_datos": len(desempeno_sincronizado.datos),
+        "ultima_sincronizacion": desempeno_sincronizado.ultima_sincronizacion,
+        "ultimo_error": desempeno_sincronizado.ultimo_error
+    }
 
 @app.get("/proveedores/{proveedor_id}", response_model=ProveedorResponse, tags=["Proveedores"])
-async def obtener_proveedor(proveedor_id: str):
+async def obtener_proveedor(
+    proveedor_id: str,
+    response: Response,
+    ponderacion: TipoPonderacion = Query(TipoPonderacion.SIMPLE, description="Ponderación de las evaluaciones en la calificación"),
+    if_none_match: Optional[str] = Header(None)
+):
     """Obtener un proveedor específico por ID"""
     if proveedor_id not in proveedores_db:
         raise HTTPException(status_code=404, detail="Proveedor no encontrado")
     
     proveedor = proveedores_db[proveedor_id]
-    proveedor["calificacion"] = calcular_calificacion_promedio(proveedor_id)
+    etag = etag_proveedores(proveedor_id, ponderacion.value, proveedor.get("version", 0))
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
+    response.headers["ETag"] = etag
+    
     certificaciones = verificar_certificaciones_vigentes(proveedor_id)
     
     return ProveedorResponse(
-        **proveedor,
+        **{**proveedor, "calificacion": calcular_calificacion_promedio(proveedor_id, ponderacion)},
         #condiciones_entrega=CondicionesEntrega(**proveedor["condiciones_entrega"]),
         certificaciones=certificaciones
     )
@@ -203,7 +375,7 @@ async def actualizar_proveedor(proveedor_id: str, proveedor_update: ProveedorUpd
     
     for field, value in update_data.items():
         if field == "condiciones_entrega" and value:
-            proveedor[field] = value.dict()
+            proveedor[field] = dict(value)
         elif field == "email" and value:
             proveedor[field] = str(value)
         else:
@@ -211,11 +383,11 @@ async def actualizar_proveedor(proveedor_id: str, proveedor_update: ProveedorUpd
     
     proveedor["fecha_actualizacion"] = datetime.now()
     proveedor["calificacion"] = calcular_calificacion_promedio(proveedor_id)
+    proveedores_db.guardar(proveedor)
     certificaciones = verificar_certificaciones_vigentes(proveedor_id)
     
     return ProveedorResponse(
         **proveedor,
-        condiciones_entrega=CondicionesEntrega(**proveedor["condiciones_entrega"]),
         certificaciones=certificaciones
     )
 
@@ -228,6 +400,7 @@ async def eliminar_proveedor(proveedor_id: str):
     proveedor = proveedores_db[proveedor_id]
     proveedor["estado"] = EstadoProveedor.INACTIVE
     proveedor["fecha_actualizacion"] = datetime.now()
+    proveedores_db.guardar(proveedor)
     
     return {"message": f"Proveedor {proveedor_id} desactivado exitosamente"}
 
@@ -237,15 +410,17 @@ async def agregar_certificacion(proveedor_id: str, certificacion: CertificacionS
     if proveedor_id not in proveedores_db:
         raise HTTPException(status_code=404, detail="Proveedor no encontrado")
     
-    if proveedor_id not in certificaciones_db:
-        certificaciones_db[proveedor_id] = []
-    
-    nueva_certificacion = certificacion.dict()
-    nueva_certificacion["vigente"] = certificacion.fecha_vencimiento >= date.today()
+    # La vigencia no se almacena: se deriva de la fecha de vencimiento al consultar
+    nueva_certificacion = certificacion.dict(exclude={"vigente"})
     
-    certificaciones_db[proveedor_id].append(nueva_certificacion)
+    registro = certificaciones_db.guardar({**nueva_certificacion, "id": str(uuid.uuid4()), "id_proveedor": proveedor_id})
+    indice_certificaciones.agregar(proveedor_id, registro)
+    proveedores_db.guardar(proveedores_db[proveedor_id])
     
-    return {"message": "Certificación agregada exitosamente", "certificacion": nueva_certificacion}
+    return {
+        "message": "Certificación agregada exitosamente",
+        "certificacion": {**nueva_certificacion, "vigente": es_vigente(nueva_certificacion)}
+    }
 
 @app.get("/proveedores/{proveedor_id}/certificaciones", response_model=List[CertificacionSanitaria], tags=["Certificaciones"])
 async def listar_certificaciones_proveedor(proveedor_id: str, solo_vigentes: bool = Query(True, description="Solo certificaciones vigentes")):
@@ -266,21 +441,40 @@ async def agregar_evaluacion(proveedor_id: str, evaluacion: ProveedorEvaluacion)
     if proveedor_id not in proveedores_db:
         raise HTTPException(status_code=404, detail="Proveedor no encontrado")
     
-    if proveedor_id not in evaluaciones_db:
-        evaluaciones_db[proveedor_id] = []
-    
     nueva_evaluacion = evaluacion.dict()
+    nueva_evaluacion["id"] = str(uuid.uuid4())
     nueva_evaluacion["id_proveedor"] = proveedor_id
     
-    evaluaciones_db[proveedor_id].append(nueva_evaluacion)
+    calificaciones_proveedores.registrar(proveedor_id, evaluaciones_db.guardar(nueva_evaluacion))
     
     # Actualizar calificación del proveedor
     proveedor = proveedores_db[proveedor_id]
     proveedor["calificacion"] = calcular_calificacion_promedio(proveedor_id)
     proveedor["fecha_actualizacion"] = datetime.now()
+    proveedores_db.guardar(proveedor)
     
     return {"message": "Evaluación agregada exitosamente", "nueva_calificacion": proveedor["calificacion"]}
 
+@app.get("/proveedores/{proveedor_id}/calificacion", response_model=CalificacionProveedor, tags=["Evaluaciones"])
+async def obtener_calificacion_proveedor(
+    proveedor_id: str,
+    ponderacion: TipoPonderacion = Query(TipoPonderacion.SIMPLE, description="Ponderación de las evaluaciones")
+):
+    """Obtener la calificación general y por criterio de un proveedor"""
+    if proveedor_id not in proveedores_db:
+        raise HTTPException(status_code=404, detail="Proveedor no encontrado")
+    
+    reciente = ponderacion == TipoPonderacion.RECIENTE
+    criterios = calificaciones_proveedores.por_criterio(proveedor_id, reciente) or {}
+    
+    return CalificacionProveedor(
+        id_proveedor=proveedor_id,
+        ponderacion=ponderacion,
+        total_evaluaciones=calificaciones_proveedores.total(proveedor_id),
+        calificacion=calificaciones_proveedores.promedio(proveedor_id, reciente),
+        **{criterio: round(criterios.get(criterio, 0.0), 2) for criterio in CRITERIOS}
+    )
+
 @app.get("/proveedores/{proveedor_id}/estadisticas", response_model=ProveedorEstadisticas, tags=["Estadísticas"])
 async def obtener_estadisticas_proveedor(proveedor_id: str):
     """Obtener estadísticas detalladas de un proveedor"""
@@ -288,21 +482,37 @@ async def obtener_estadisticas_proveedor(proveedor_id: str):
         raise HTTPException(status_code=404, detail="Proveedor no encontrado")
     
     proveedor = proveedores_db[proveedor_id]
-    certificaciones_vigentes = len([
-        cert for cert in certificaciones_db.get(proveedor_id, [])
-        if cert["vigente"]
-    ])
+    hoy = date.today()
+    certificaciones_vigentes = sum(
+        1 for cert in certificaciones_db.consultar(Igual("id_proveedor", proveedor_id)) if es_vigente(cert, hoy)
+    )
+    
+    # Datos de órdenes sincronizados desde MS-OrdenCompra; sin ellos se usa lo registrado localmente
+    desempeno = desempeno_sincronizado.datos.get(proveedor_id)
+    if desempeno:
+        promedio_dias = desempeno["promedio_dias_entrega"]
+        estadisticas_ordenes = {
+            "total_ordenes": desempeno["total_ordenes"],
+            "ordenes_completadas": desempeno["ordenes_completadas"],
+            "ordenes_pendientes": desempeno["ordenes_pendientes"],
+            "monto_total_compras": float(desempeno["monto_recibido"]),
+            "tiempo_entrega_promedio": round(promedio_dias) if promedio_dias is not None
+                else proveedor["condiciones_entrega"]["tiempo_entrega"]
+        }
+    else:
+        estadisticas_ordenes = {
+            "total_ordenes": proveedor["total_ordenes"],
+            "ordenes_completadas": 0,
+            "ordenes_pendientes": 0,
+            "monto_total_compras": 0.0,
+            "tiempo_entrega_promedio": proveedor["condiciones_entrega"]["tiempo_entrega"]
+        }
     
-    # En un escenario real, estos datos vendrían de MS-OrdenCompra
     estadisticas = ProveedorEstadisticas(
         id_proveedor=proveedor_id,
         nombre_proveedor=proveedor["nombre"],
-        total_ordenes=proveedor["total_ordenes"],
-        ordenes_completadas=proveedor["total_ordenes"] - 2,  # Simulado
-        ordenes_pendientes=2,  # Simulado
-        monto_total_compras=50000.0,  # Simulado
-        calificacion_promedio=proveedor.get("calificacion", 0.0),
-        tiempo_entrega_promedio=proveedor["condiciones_entrega"]["tiempo_entrega"],
+        **estadisticas_ordenes,
+        calificacion_promedio=calcular_calificacion_promedio(proveedor_id),
         certificaciones_vigentes=certificaciones_vigentes,
         ultima_actividad=proveedor.get("fecha_ultimo_pedido", proveedor["fecha_actualizacion"])
     )
@@ -318,6 +528,7 @@ async def activar_proveedor(proveedor_id: str):
     proveedor = proveedores_db[proveedor_id]
     proveedor["estado"] = EstadoProveedor.ACTIVE
     proveedor["fecha_actualizacion"] = datetime.now()
+    proveedores_db.guardar(proveedor)
     
     return {"message": f"Proveedor {proveedor['nombre']} activado exitosamente"}
 
@@ -330,56 +541,48 @@ async def suspender_proveedor(proveedor_id: str, motivo: Optional[str] = None):
     proveedor = proveedores_db[proveedor_id]
     proveedor["estado"] = EstadoProveedor.SUSPENDED
     proveedor["fecha_actualizacion"] = datetime.now()
+    proveedores_db.guardar(proveedor)
     
     # En un caso real, se podría guardar el motivo en un campo específico
     return {"message": f"Proveedor {proveedor['nombre']} suspendido", "motivo": motivo}
 
 @app.get("/proveedores/buscar/especialidad/{especialidad}", response_model=List[ProveedorResponse], tags=["Búsqueda"])
-async def buscar_por_especialidad(especialidad: str):
+async def buscar_por_especialidad(especialidad: str, response: Response, if_none_match: Optional[str] = Header(None)):
     """Buscar proveedores por especialidad"""
-    proveedores_especialidad = []
-    
-    for proveedor in proveedores_db.values():
-        if proveedor["estado"] == EstadoProveedor.ACTIVE:
-            if any(especialidad.lower() in esp.lower() for esp in proveedor["especialidades"]):
-                proveedor["calificacion"] = calcular_calificacion_promedio(proveedor["id"])
-                certificaciones = verificar_certificaciones_vigentes(proveedor["id"])
-                
-                proveedores_especialidad.append(ProveedorResponse(
-                    **proveedor,
-                    condiciones_entrega=CondicionesEntrega(**proveedor["condiciones_entrega"]),
-                    certificaciones=certificaciones
-                ))
-    
-    return proveedores_especialidad
+    etag = etag_proveedores("especialidad", proveedores_db.version)
+    if etag_coincide(if_none_match, etag):
+        return no_modificado(etag)
+    response.headers["ETag"] = etag
+    
+    proveedores = proveedores_db.consultar(*condiciones_indexadas(EstadoProveedor.ACTIVE, especialidad, especialidad_parcial=True))
+    return [respuesta_proveedor(proveedor) for proveedor in proveedores]
 
 @app.get("/alertas/certificaciones", tags=["Alertas"])
-async def obtener_alertas_certificaciones(dias_anticipacion: int = Query(30, description="Días de anticipación para alerta")):
-    """Obtener alertas de certificaciones próximas a vencer"""
+async def obtener_alertas_certificaciones(
+    dias_anticipacion: int = Query(30, description="Días de anticipación para alerta"),
+    tipo: Optional[TipoCertificacion] = Query(None, description="Filtrar por tipo de certificación")
+):
+    """Obtener alertas de certificaciones vigentes próximas a vencer"""
     alertas = []
-    fecha_limite = date.today() + timedelta(days=dias_anticipacion)
+    hoy = date.today()
+    fecha_limite = hoy + timedelta(days=dias_anticipacion)
     
-    for proveedor_id, certificaciones in certificaciones_db.items():
+    # El índice devuelve solo las certificaciones que vencen en [hoy, fecha_limite], ya ordenadas
+    for proveedor_id, cert in indice_certificaciones.por_vencer(hoy, fecha_limite, tipo):
         proveedor = proveedores_db.get(proveedor_id)
         if not proveedor or proveedor["estado"] != EstadoProveedor.ACTIVE:
             continue
         
-        for cert in certificaciones:
-            if cert["fecha_vencimiento"] <= fecha_limite and cert["vigente"]:
-                dias_vencimiento = (cert["fecha_vencimiento"] - date.today()).days
-                
-                alertas.append({
-                    "proveedor_id": proveedor_id,
-                    "nombre_proveedor": proveedor["nombre"],
-                    "tipo_certificacion": cert["tipo"],
-                    "numero_certificado": cert["numero_certificado"],
-                    "fecha_vencimiento": cert["fecha_vencimiento"],
-                    "dias_para_vencer": dias_vencimiento,
-                    "criticidad": "ALTA" if dias_vencimiento <= 7 else "MEDIA"
-                })
-    
-    # Ordenar por días de vencimiento
-    alertas.sort(key=lambda x: x["dias_para_vencer"])
+        dias_vencimiento = (cert["fecha_vencimiento"] - hoy).days
+        alertas.append({
+            "proveedor_id": proveedor_id,
+            "nombre_proveedor": proveedor["nombre"],
+            "tipo_certificacion": cert["tipo"],
+            "numero_certificado": cert["numero_certificado"],
+            "fecha_vencimiento": cert["fecha_vencimiento"],
+            "dias_para_vencer": dias_vencimiento,
+            "criticidad": "ALTA" if dias_vencimiento <= 7 else "MEDIA"
+        })
     
     return alertas
 
@@ -389,33 +592,20 @@ async def obtener_estadisticas_generales():
     if not proveedores_db:
         return {"message": "No hay proveedores registrados"}
     
-    proveedores = list(proveedores_db.values())
-    
-    # Estadísticas por estado
-    estados_count = {}
-    for proveedor in proveedores:
-        estado = proveedor["estado"]
-        estados_count[estado] = estados_count.get(estado, 0) + 1
-    
-    # Estadísticas por país
-    paises_count = {}
-    for proveedor in proveedores:
-        pais = proveedor["pais"]
-        paises_count[pais] = paises_count.get(pais, 0) + 1
+    # Conteos por estado y país leídos de los índices, sin recorrer la colección
+    estados_count = indice_estado.distribucion()
+    paises_count = indice_pais.distribucion()
     
     # Calificación promedio general
-    calificaciones = [p.get("calificacion", 0) for p in proveedores if p.get("calificacion")]
+    calificaciones = [p.get("calificacion", 0) for p in proveedores_db.values() if p.get("calificacion")]
     calificacion_promedio = sum(calificaciones) / len(calificaciones) if calificaciones else 0
     
     # Certificaciones totales vigentes
-    total_certificaciones = sum(
-        len([cert for cert in certificaciones_db.get(p["id"], []) if cert["vigente"]])
-        for p in proveedores
-    )
+    total_certificaciones = indice_certificaciones.total_vigentes(date.today())
     
     return {
-        "total_proveedores": len(proveedores),
-        "proveedores_activos": estados_count.get(EstadoProveedor.ACTIVE, 0),
+        "total_proveedores": len(proveedores_db),
+        "proveedores_activos": estados_count.get(EstadoProveedor.ACTIVE.value, 0),
         "calificacion_promedio_general": round(calificacion_promedio, 1),
         "total_certificaciones_vigentes": total_certificaciones,
         "proveedores_por_estado": estados_count,
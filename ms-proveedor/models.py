@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, List, Dict
 from datetime import datetime, date
 from enum import Enum
 
@@ -24,6 +24,12 @@ class EstadoProveedor(str, Enum):
     PENDING = "pendiente"
 
 
+class TipoPonderacion(str, Enum):
+    """Ponderación de las evaluaciones al calcular la calificación"""
+    SIMPLE = "simple"
+    RECIENTE = "reciente"  # las evaluaciones recientes pesan más
+
+
 class CondicionesEntrega(BaseModel):
     """Condiciones de entrega del proveedor"""
     tiempo_entrega: int  # días
@@ -115,7 +121,19 @@ class ProveedorEvaluacion(BaseModel):
     servicio: int  # 1-5
     precio: int  # 1-5
     comentarios: Optional[str] = None
-    fecha_evaluacion: datetime = datetime.now()
+    fecha_evaluacion: datetime = Field(default_factory=datetime.now)
+
+
+class CalificacionProveedor(BaseModel):
+    """Calificación de un proveedor, general y por criterio"""
+    id_proveedor: str
+    ponderacion: TipoPonderacion
+    total_evaluaciones: int
+    calificacion: float
+    calidad: float
+    puntualidad: float
+    servicio: float
+    precio: float
 
 
 class ProveedorEstadisticas(BaseModel):
@@ -130,3 +148,47 @@ class ProveedorEstadisticas(BaseModel):
     tiempo_entrega_promedio: int
     certificaciones_vigentes: int
     ultima_actividad: datetime
+
+
+class PuntajeProveedor(BaseModel):
+    """Puntaje compuesto de un proveedor; los componentes van de 0 a 1 y el puntaje de 0 a 100"""
+    id_proveedor: str
+    nombre: str
+    puntaje: Optional[float] = None
+    cumplimiento: Optional[float] = None  # Entregas a tiempo / entregas medidas
+    plazo: Optional[float] = None  # Tiempo prometido / tiempo real promedio
+    calificacion: Optional[float] = None  # Calificación promedio / 5
+    ordenes_completadas: int = 0
+    promedio_dias_entrega: Optional[float] = None
+    monto_recibido: float = 0
+
+
+class BusquedaProveedores(BaseModel):
+    """Resultado de una búsqueda por facetas"""
+    total: int
+    facetas: Dict[str, Dict[str, int]]  # faceta -> valor -> proveedores en el resultado
+    proveedores: List[ProveedorResponse]
+
+
+class FormatoImportacion(str, Enum):
+    """Formatos aceptados por la importación masiva"""
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class ErrorFilaImportacion(BaseModel):
+    """Errores de una fila rechazada en una importación"""
+    linea: int
+    errores: List[str]
+
+
+class ResultadoImportacion(BaseModel):
+    """Resumen de una importación masiva"""
+    formato: FormatoImportacion
+    filas_leidas: int
+    importadas: int
+    con_error: int
+    lotes_confirmados: int
+    interrumpida: bool
+    motivo_interrupcion: Optional[str] = None
+    errores: List[ErrorFilaImportacion]  # Solo los primeros max_errores
@@ -0,0 +1,151 @@
+"""Evaluación de la precisión de los pronósticos contra la demanda real.
+
+El backtesting repite el pronóstico desde varios orígenes del pasado
+(validación con origen móvil) y compara cada horizonte con lo ocurrido.
+Todo se calcula por columnas sobre la matriz productos × días, por lo que
+evaluar el catálogo completo cuesta lo mismo que unas pocas series por
+número de pasos.
+
+La precisión móvil se mantiene de forma incremental: cada periodo
+conciliado suma su error a acumuladores por producto y método, y los
+periodos que salen de la ventana se restan.
+"""
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+import pronostico
+
+# Acumuladores: error absoluto, demanda real, error con signo, suma de APE, periodos con APE, periodos
+ERROR_ABSOLUTO, REAL, ERROR, SUMA_APE, CON_APE, OBSERVACIONES = range(6)
+
+
+def evaluar(
+    historial: np.ndarray,
+    metodologias: List[str],
+    horizonte: int,
+    origenes: int,
+    paso: int,
+    dias_entrenamiento: int
+) -> np.ndarray:
+    """Acumuladores de error por método y producto (métodos × productos × columnas según las constantes del módulo).
+
+    El origen j deja fuera de entrenamiento los últimos horizonte + j * paso días;
+    todos los métodos se evalúan sobre los mismos cortes de la matriz.
+    """
+    n, dias = historial.shape
+    historial = np.asarray(historial, dtype=np.float64)
+    sumas = np.zeros((len(metodologias), n, 6))
+    for j in range(origenes):
+        origen = dias - horizonte - j * paso
+        inicio = max(0, origen - dias_entrenamiento)
+        if origen - inicio < 2:
+            break
+        entrenamiento = historial[:, inicio:origen]
+        real = historial[:, origen:origen + horizonte]
+        con_demanda = real > 0
+        for k, metodologia in enumerate(metodologias):
+            estimado, _ = pronostico.METODOS[metodologia](entrenamiento, horizonte)
+            error = estimado - real
+            sumas[k, :, ERROR_ABSOLUTO] += np.abs(error).sum(axis=1)
+            sumas[k, :, REAL] += real.sum(axis=1)
+            sumas[k, :, ERROR] += error.sum(axis=1)
+            sumas[k, :, SUMA_APE] += np.divide(np.abs(error), real, out=np.zeros_like(real), where=con_demanda).sum(axis=1)
+            sumas[k, :, CON_APE] += con_demanda.sum(axis=1)
+            sumas[k, :, OBSERVACIONES] += horizonte
+    return sumas
+
+
+def metricas(sumas: np.ndarray) -> Dict[str, np.ndarray]:
+    """MAPE, WAPE y sesgo (%) a partir de acumuladores; acepta una fila o una matriz de filas"""
+    sumas = np.atleast_2d(sumas)
+    real = sumas[:, REAL]
+    return {
+        "mape": _porcentaje(sumas[:, SUMA_APE], sumas[:, CON_APE]),
+        "wape": _porcentaje(sumas[:, ERROR_ABSOLUTO], real),
+        "sesgo_porcentaje": _porcentaje(sumas[:, ERROR], real),
+        "observaciones": sumas[:, OBSERVACIONES].astype(np.int64),
+    }
+
+
+def _porcentaje(numerador: np.ndarray, denominador: np.ndarray) -> np.ndarray:
+    valores = np.divide(numerador, denominador, out=np.zeros_like(numerador, dtype=np.float64), where=denominador > 0)
+    return np.round(100 * valores, 2)
+
+
+def precision_periodo(estimada: float, real: float) -> float:
+    """Precisión (%) de un periodo: 100 - error porcentual, acotada a [0, 100]"""
+    if real <= 0:
+        return 100.0 if estimada <= 0 else 0.0
+    return round(max(0.0, 100 * (1 - abs(estimada - real) / real)), 2)
+
+
+class PrecisionMovil:
+    """Precisión de los últimos `ventana` periodos conciliados por (producto, método).
+
+    Mantiene sumas corrientes por clave y por método, de modo que registrar un
+    periodo y consultar la precisión cuestan O(1).
+    """
+
+    def __init__(self, ventana: int):
+        self.ventana = ventana
+        self._periodos: Dict[Tuple[str, str], "OrderedDict[Hashable, Tuple[float, float]]"] = {}
+        self._sumas: Dict[str, Dict[str, np.ndarray]] = {}  # id_producto -> método -> acumuladores
+        self._por_metodo: Dict[str, np.ndarray] = {}
+
+    def registrar(self, id_producto: str, metodologia: str, id_periodo: Hashable, estimada: float, real: float):
+        """Registrar (o corregir) la demanda real de un periodo"""
+        clave = (id_producto, metodologia)
+        periodos = self._periodos.setdefault(clave, OrderedDict())
+        anterior = periodos.get(id_periodo)
+        if anterior is not None:
+            self._acumular(clave, *anterior, signo=-1)
+        periodos[id_periodo] = (estimada, real)
+        self._acumular(clave, estimada, real, signo=1)
+        while len(periodos) > self.ventana:
+            _, antiguo = periodos.popitem(last=False)
+            self._acumular(clave, *antiguo, signo=-1)
+
+    def _acumular(self, clave: Tuple[str, str], estimada: float, real: float, signo: int):
+        error = estimada - real
+        fila = np.array([
+            abs(error), real, error,
+            abs(error) / real if real > 0 else 0.0,
+            1.0 if real > 0 else 0.0,
+            1.0
+        ])
+        id_producto, metodologia = clave
+        for sumas in (
+            self._sumas.setdefault(id_producto, {}).setdefault(metodologia, np.zeros(6)),
+            self._por_metodo.setdefault(metodologia, np.zeros(6))
+        ):
+            sumas += signo * fila
+
+    def consultar(self, id_producto: Optional[str] = None, metodologia: Optional[str] = None) -> List[dict]:
+        """Métricas por producto y método, o por método si no se indica producto"""
+        if id_producto is None:
+            filas = [
+                (None, metodo, sumas) for metodo, sumas in self._por_metodo.items()
+                if metodologia is None or metodo == metodologia
+            ]
+        else:
+            filas = [
+                (id_producto, metodo, sumas) for metodo, sumas in self._sumas.get(id_producto, {}).items()
+                if metodologia is None or metodo == metodologia
+            ]
+        filas = [fila for fila in filas if round(fila[2][OBSERVACIONES]) > 0]
+        if not filas:
+            return []
+        calculadas = metricas(np.array([sumas for _, _, sumas in filas]))
+        return [
+            {
+                "id_producto": producto,
+                "metodologia": metodo,
+                "mape": float(calculadas["mape"][i]),
+                "wape": float(calculadas["wape"][i]),
+                "sesgo_porcentaje": float(calculadas["sesgo_porcentaje"][i]),
+                "observaciones": int(round(sumas[OBSERVACIONES]))
+            }
+            for i, (producto, metodo, sumas) in enumerate(filas)
+        ]
@@ -0,0 +1,197 @@
+"""Almacén de historial de demanda diaria por producto.
+
+Los datos viven en una única matriz contigua float32 (productos × días), en
+memoria o respaldada por un archivo con memoria mapeada. Cada producto ocupa
+una fila, de modo que el rango de fechas de un producto es un tramo contiguo.
+Con 100k productos y 3 años de días ocupa ~440 MB en disco y, con
+persistencia, el sistema operativo solo mantiene en RAM las páginas usadas.
+"""
+import json
+import os
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from models import TipoProyeccion
+from pronostico import limites_periodos
+
+TIPO_DATO = np.float32
+
+# Crecimiento de la matriz: los días se reservan por bloques de un año
+BLOQUE_DIAS = 366
+BLOQUE_FILAS = 1024
+
+
+class HistorialDemanda:
+    """Matriz de demanda diaria con alta masiva, cortes por rango y remuestreo por periodo"""
+
+    def __init__(self, ruta: Optional[str] = None):
+        self.ruta = ruta
+        self.fecha_base: Optional[date] = None
+        self.dias = 0
+        self._filas: Dict[str, int] = {}
+        self._productos: List[str] = []
+        self._datos = np.zeros((0, 0), dtype=TIPO_DATO)
+        if ruta:
+            os.makedirs(ruta, exist_ok=True)
+            self._cargar()
+
+    # -- Consultas -----------------------------------------------------------
+
+    @property
+    def productos(self) -> List[str]:
+        return list(self._productos)
+
+    @property
+    def fecha_fin(self) -> Optional[date]:
+        if self.fecha_base is None or not self.dias:
+            return None
+        return date.fromordinal(self.fecha_base.toordinal() + self.dias - 1)
+
+    def __contains__(self, id_producto: str) -> bool:
+        return id_producto in self._filas
+
+    def __len__(self) -> int:
+        return len(self._productos)
+
+    def matriz(self, ids_producto: List[str], desde: date, hasta: date) -> np.ndarray:
+        """Demanda diaria de [desde, hasta] para varios productos; días o productos sin datos valen 0"""
+        dias = (hasta - desde).days + 1
+        resultado = np.zeros((len(ids_producto), max(dias, 0)), dtype=TIPO_DATO)
+        if self.fecha_base is None or dias <= 0:
+            return resultado
+
+        inicio = desde.toordinal() - self.fecha_base.toordinal()
+        fin = inicio + dias
+        # Intersección del rango pedido con los días almacenados
+        origen_inicio, origen_fin = max(inicio, 0), min(fin, self.dias)
+        if origen_inicio >= origen_fin:
+            return resultado
+
+        posiciones = [(i, self._filas[p]) for i, p in enumerate(ids_producto) if p in self._filas]
+        if posiciones:
+            destino, filas = (np.array(v, dtype=np.intp) for v in zip(*posiciones))
+            resultado[destino, origen_inicio - inicio:origen_fin - inicio] = self._datos[filas, origen_inicio:origen_fin]
+        return resultado
+
+    def serie(self, id_producto: str, desde: date, hasta: date) -> np.ndarray:
+        return self.matriz([id_producto], desde, hasta)[0]
+
+    @staticmethod
+    def remuestrear(matriz: np.ndarray, desde: date, tipo_proyeccion: TipoProyeccion) -> Tuple[List[str], np.ndarray]:
+        """Agregar columnas diarias por periodo calendario (semana ISO, mes, trimestre o año)"""
+        if matriz.shape[1] == 0:
+            return [], np.zeros((matriz.shape[0], 0))
+        etiquetas, inicios = limites_periodos(desde, matriz.shape[1], tipo_proyeccion)
+        return etiquetas, np.add.reduceat(matriz.astype(np.float64), inicios, axis=1)
+
+    # -- Escritura -----------------------------------------------------------
+
+    def registrar(
+        self,
+        ids_producto: List[str],
+        fechas: Iterable[date],
+        cantidades: Iterable[float],
+        acumular: bool = True
+    ) -> int:
+        """Registrar demanda en bloque; con acumular=False el valor reemplaza al existente"""
+        ordinales = np.fromiter((f.toordinal() for f in fechas), dtype=np.int64, count=len(ids_producto))
+        valores = np.fromiter(cantidades, dtype=np.float64, count=len(ids_producto))
+        if not len(ordinales):
+            return 0
+
+        productos_nuevos = False
+        for id_producto in ids_producto:
+            if id_producto not in self._filas:
+                self._filas[id_producto] = len(self._productos)
+                self._productos.append(id_producto)
+                productos_nuevos = True
+        filas = np.fromiter((self._filas[p] for p in ids_producto), dtype=np.intp, count=len(ids_producto))
+
+        dias_antes = self.dias
+        columnas = self._asegurar_capacidad(int(ordinales.min()), int(ordinales.max())) + ordinales
+        if acumular:
+            np.add.at(self._datos, (filas, columnas), valores)
+        else:
+            self._datos[filas, columnas] = valores
+
+        if self.ruta:
+            self._datos.flush()
+            if productos_nuevos or self.dias != dias_antes:
+                self._guardar_indice()
+        return len(ordinales)
+
+    def _asegurar_capacidad(self, ordinal_min: int, ordinal_max: int) -> int:
+        """Ampliar la matriz para cubrir las filas y fechas requeridas; devuelve -ordinal de la columna 0"""
+        if self.fecha_base is None:
+            self.fecha_base = date.fromordinal(ordinal_min)
+        base = self.fecha_base.toordinal()
+
+        desplazamiento = max(0, base - ordinal_min)  # días a anteponer si llegan fechas anteriores
+        dias_necesarios = max(self.dias + desplazamiento, ordinal_max - base + desplazamiento + 1)
+        filas_necesarias = len(self._productos)
+
+        cap_filas, cap_dias = self._datos.shape
+        if desplazamiento or filas_necesarias > cap_filas or dias_necesarios > cap_dias:
+            nuevas_filas = max(cap_filas, _redondear(filas_necesarias, BLOQUE_FILAS))
+            if filas_necesarias > cap_filas:
+                nuevas_filas = max(nuevas_filas, 2 * cap_filas)
+            nuevos_dias = max(cap_dias, _redondear(dias_necesarios, BLOQUE_DIAS))
+            self._redimensionar(nuevas_filas, nuevos_dias, desplazamiento)
+            if desplazamiento:
+                self.fecha_base = date.fromordinal(base - desplazamiento)
+                base = self.fecha_base.toordinal()
+
+        self.dias = max(self.dias + desplazamiento, ordinal_max - base + 1)
+        return -base
+
+    def _redimensionar(self, filas: int, dias: int, desplazamiento: int):
+        anterior = self._datos
+        usadas = len(anterior)
+        if self.ruta:
+            temporal = self._ruta_datos() + ".nuevo"
+            nuevo = np.lib.format.open_memmap(temporal, mode="w+", dtype=TIPO_DATO, shape=(filas, dias))
+        else:
+            nuevo = np.zeros((filas, dias), dtype=TIPO_DATO)
+        if usadas and self.dias:
+            nuevo[:usadas, desplazamiento:desplazamiento + self.dias] = anterior[:, :self.dias]
+        if self.ruta:
+            nuevo.flush()
+            del anterior
+            os.replace(temporal, self._ruta_datos())
+            nuevo = np.load(self._ruta_datos(), mmap_mode="r+")
+        self._datos = nuevo
+
+    # -- Persistencia --------------------------------------------------------
+
+    def _ruta_datos(self) -> str:
+        return os.path.join(self.ruta, "demanda.npy")
+
+    def _ruta_indice(self) -> str:
+        return os.path.join(self.ruta, "indice.json")
+
+    def _guardar_indice(self):
+        temporal = self._ruta_indice() + ".nuevo"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({
+                "fecha_base": self.fecha_base.isoformat() if self.fecha_base else None,
+                "dias": self.dias,
+                "productos": self._productos
+            }, f)
+        os.replace(temporal, self._ruta_indice())
+
+    def _cargar(self):
+        if not (os.path.exists(self._ruta_indice()) and os.path.exists(self._ruta_datos())):
+            return
+        with open(self._ruta_indice(), "r", encoding="utf-8") as f:
+            indice = json.load(f)
+        self.fecha_base = date.fromisoformat(indice["fecha_base"]) if indice["fecha_base"] else None
+        self.dias = indice["dias"]
+        self._productos = indice["productos"]
+        self._filas = {p: i for i, p in enumerate(self._productos)}
+        self._datos = np.load(self._ruta_datos(), mmap_mode="r+")
+
+
+def _redondear(valor: int, bloque: int) -> int:
+    return max(bloque, -(-valor // bloque) * bloque)
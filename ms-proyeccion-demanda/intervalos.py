@@ -0,0 +1,295 @@
+"""Índice de intervalos de fechas para las proyecciones.
+
+Cada árbol es un treap ordenado por (fecha_inicio, id) y aumentado con la
+fecha_fin máxima de cada subárbol. Eso permite descartar ramas enteras que
+terminan antes del rango consultado, de modo que "vigentes en D" y
+"solapadas con [a, b]" cuestan O(log N + k) en lugar de recorrer todo.
+"""
+import heapq
+import random
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+Intervalo = Tuple[date, date, str]  # (inicio, fin, id)
+
+
+class _Nodo:
+    __slots__ = ("clave", "fin", "max_fin", "prioridad", "izq", "der")
+
+    def __init__(self, inicio: date, fin: date, id_intervalo: str):
+        self.clave = (inicio, id_intervalo)
+        self.fin = fin
+        self.max_fin = fin
+        self.prioridad = random.random()
+        self.izq: Optional["_Nodo"] = None
+        self.der: Optional["_Nodo"] = None
+
+
+def _actualizar(nodo: "_Nodo") -> "_Nodo":
+    maximo = nodo.fin
+    if nodo.izq is not None and nodo.izq.max_fin > maximo:
+        maximo = nodo.izq.max_fin
+    if nodo.der is not None and nodo.der.max_fin > maximo:
+        maximo = nodo.der.max_fin
+    nodo.max_fin = maximo
+    return nodo
+
+
+def _dividir(nodo: Optional[_Nodo], clave) -> Tuple[Optional[_Nodo], Optional[_Nodo]]:
+    """Separar en (claves < clave, claves >= clave)"""
+    if nodo is None:
+        return None, None
+    if nodo.clave < clave:
+        nodo.der, derecha = _dividir(nodo.der, clave)
+        return _actualizar(nodo), derecha
+    izquierda, nodo.izq = _dividir(nodo.izq, clave)
+    return izquierda, _actualizar(nodo)
+
+
+def _unir(izquierda: Optional[_Nodo], derecha: Optional[_Nodo]) -> Optional[_Nodo]:
+    if izquierda is None:
+        return derecha
+    if derecha is None:
+        return izquierda
+    if izquierda.prioridad > derecha.prioridad:
+        izquierda.der = _unir(izquierda.der, derecha)
+        return _actualizar(izquierda)
+    derecha.izq = _unir(izquierda, derecha.izq)
+    return _actualizar(derecha)
+
+
+def _eliminar(nodo: Optional[_Nodo], clave) -> Optional[_Nodo]:
+    if nodo is None:
+        return None
+    if clave == nodo.clave:
+        return _unir(nodo.izq, nodo.der)
+    if clave < nodo.clave:
+        nodo.izq = _eliminar(nodo.izq, clave)
+    else:
+        nodo.der = _eliminar(nodo.der, clave)
+    return _actualizar(nodo)
+
+
+def _construir(nodos: List[_Nodo]) -> Optional[_Nodo]:
+    """Treap a partir de nodos ya ordenados por clave (árbol cartesiano con una pila)"""
+    pila: List[_Nodo] = []
+    for nodo in nodos:
+        ultimo = None
+        while pila and pila[-1].prioridad < nodo.prioridad:
+            ultimo = pila.pop()
+        nodo.izq = ultimo
+        if pila:
+            pila[-1].der = nodo
+        pila.append(nodo)
+    if not pila:
+        return None
+    # max_fin en postorden
+    raiz = pila[0]
+    por_visitar, orden = [raiz], []
+    while por_visitar:
+        nodo = por_visitar.pop()
+        orden.append(nodo)
+        por_visitar.extend(hijo for hijo in (nodo.izq, nodo.der) if hijo is not None)
+    for nodo in reversed(orden):
+        _actualizar(nodo)
+    return raiz
+
+
+class ArbolIntervalos:
+    """Intervalos cerrados [inicio, fin] identificados por id"""
+
+    def __init__(self):
+        self._raiz: Optional[_Nodo] = None
+        self._intervalos: Dict[str, Tuple[date, date]] = {}
+        # Aumenta al terminar cada modificación; permite saber si el árbol cambió mientras se copiaba
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._intervalos)
+
+    def __contains__(self, id_intervalo: str) -> bool:
+        return id_intervalo in self._intervalos
+
+    def insertar(self, id_intervalo: str, inicio: date, fin: date):
+        if id_intervalo in self._intervalos:
+            self.eliminar(id_intervalo)
+        nodo = _Nodo(inicio, fin, id_intervalo)
+        izquierda, derecha = _dividir(self._raiz, nodo.clave)
+        self._raiz = _unir(_unir(izquierda, nodo), derecha)
+        self._intervalos[id_intervalo] = (inicio, fin)
+        self.version += 1
+
+    def insertar_lote(self, intervalos: List[Intervalo]):
+        """Insertar muchos intervalos; si el lote es grande se reconstruye el árbol en O(n)"""
+        nuevos = [i for i in intervalos if i[2] not in self._intervalos] if len(intervalos) >= 64 else []
+        if len(nuevos) < max(len(intervalos), 64) or len(nuevos) * 8 < len(self._intervalos):
+            for inicio, fin, id_intervalo in intervalos:
+                self.insertar(id_intervalo, inicio, fin)
+            return
+        entradas = sorted(list(self.consultar()) + nuevos, key=lambda i: (i[0], i[2]))
+        self._raiz = _construir([_Nodo(*entrada) for entrada in entradas])
+        for inicio, fin, id_intervalo in nuevos:
+            self._intervalos[id_intervalo] = (inicio, fin)
+        self.version += 1
+
+    def con_lote(self, intervalos: List[Intervalo]) -> "ArbolIntervalos":
+        """Árbol nuevo con los intervalos actuales y los del lote, construido en O(n) sin modificar este"""
+        por_id = {entrada[2]: entrada for entrada in self.consultar()}
+        por_id.update((entrada[2], entrada) for entrada in intervalos)
+        entradas = sorted(por_id.values(), key=lambda i: (i[0], i[2]))
+        nuevo = ArbolIntervalos()
+        nuevo._raiz = _construir([_Nodo(*entrada) for entrada in entradas])
+        nuevo._intervalos = {id_intervalo: (inicio, fin) for inicio, fin, id_intervalo in entradas}
+        return nuevo
+
+    def eliminar(self, id_intervalo: str):
+        inicio, _ = self._intervalos.pop(id_intervalo)
+        self._raiz = _eliminar(self._raiz, (inicio, id_intervalo))
+        self.version += 1
+
+    def consultar(
+        self,
+        inicio_desde: date = date.min,
+        inicio_hasta: date = date.max,
+        fin_desde: date = date.min
+    ) -> Iterator[Intervalo]:
+        """Intervalos con inicio en [inicio_desde, inicio_hasta] y fin >= fin_desde, por inicio"""
+        pila: List[_Nodo] = []
+        nodo = self._raiz
+        while True:
+            while nodo is not None:
+                if nodo.max_fin < fin_desde:
+                    # Ningún intervalo de este subárbol llega al rango
+                    nodo = None
+                elif nodo.clave[0] < inicio_desde:
+                    # El nodo y su subárbol izquierdo empiezan antes del rango
+                    nodo = nodo.der
+                else:
+                    pila.append(nodo)
+                    nodo = nodo.izq
+            if not pila:
+                return
+            nodo = pila.pop()
+            inicio, id_intervalo = nodo.clave
+            if inicio > inicio_hasta:
+                return
+            if nodo.fin >= fin_desde:
+                yield inicio, nodo.fin, id_intervalo
+            nodo = nodo.der
+
+    def solapados(self, desde: date, hasta: date) -> Iterator[Intervalo]:
+        """Intervalos que se solapan con [desde, hasta]"""
+        return self.consultar(inicio_hasta=hasta, fin_desde=desde)
+
+    def vigentes(self, fecha: date) -> Iterator[Intervalo]:
+        """Intervalos que contienen la fecha"""
+        return self.solapados(fecha, fecha)
+
+
+def solapamientos(intervalos: Iterator[Intervalo]) -> Iterator[Tuple[Intervalo, Intervalo]]:
+    """Pares de intervalos solapados, recibiendo los intervalos ordenados por inicio.
+
+    Barrido con un montículo de intervalos abiertos: O(n log n + k).
+    """
+    abiertos: List[Tuple[date, date, str]] = []
+    for intervalo in intervalos:
+        inicio = intervalo[0]
+        while abiertos and abiertos[0][0] < inicio:
+            heapq.heappop(abiertos)
+        for fin, inicio_abierto, id_abierto in abiertos:
+            yield (inicio_abierto, fin, id_abierto), intervalo
+        heapq.heappush(abiertos, (intervalo[1], inicio, intervalo[2]))
+
+
+class IndiceProyecciones:
+    """Árboles de intervalos de las proyecciones, globales por estado y por producto"""
+
+    def __init__(self):
+        self.por_estado: Dict[str, ArbolIntervalos] = {}
+        self.por_producto: Dict[str, ArbolIntervalos] = {}
+
+    def agregar(self, proyeccion: dict):
+        for arbol in self._arboles(proyeccion, crear=True):
+            arbol.insertar(proyeccion["id"], proyeccion["fecha_inicio"], proyeccion["fecha_fin"])
+
+    def agregar_lote(self, proyecciones: List[dict]):
+        """Agregar muchas proyecciones agrupándolas por árbol"""
+        for arboles, clave, intervalos in self._agrupar(proyecciones):
+            arbol = arboles.get(clave)
+            if arbol is None:
+                arbol = arboles[clave] = ArbolIntervalos()
+            arbol.insertar_lote(intervalos)
+
+    def preparar_lote(self, proyecciones: List[dict]) -> list:
+        """Construir los árboles que resultan de agregar las proyecciones, sin modificar los actuales.
+
+        Pensado para ejecutarse fuera del event loop; aplicar_lote publica el resultado.
+        """
+        preparados = []
+        for arboles, clave, intervalos in self._agrupar(proyecciones):
+            actual = arboles.get(clave)
+            # La versión se lee antes de copiar: un cambio durante la copia la deja desactualizada
+            version = actual.version if actual is not None else None
+            nuevo = (actual or ArbolIntervalos()).con_lote(intervalos)
+            preparados.append((arboles, clave, actual, version, nuevo, intervalos))
+        return preparados
+
+    def aplicar_lote(self, preparados: list):
+        """Reemplazar los árboles por los preparados; los que cambiaron mientras se construían se actualizan en su lugar"""
+        for arboles, clave, actual, version, nuevo, intervalos in preparados:
+            vigente = arboles.get(clave)
+            if vigente is actual and (actual is None or actual.version == version):
+                arboles[clave] = nuevo
+                continue
+            if vigente is None:
+                vigente = arboles[clave] = ArbolIntervalos()
+            vigente.insertar_lote(intervalos)
+
+    def _agrupar(self, proyecciones: List[dict]) -> Iterator[Tuple[Dict[str, ArbolIntervalos], str, List[Intervalo]]]:
+        por_estado: Dict[str, List[Intervalo]] = {}
+        por_producto: Dict[str, List[Intervalo]] = {}
+        for proyeccion in proyecciones:
+            intervalo = (proyeccion["fecha_inicio"], proyeccion["fecha_fin"], proyeccion["id"])
+            estado = getattr(proyeccion["estado"], "value", proyeccion["estado"])
+            por_estado.setdefault(estado, []).append(intervalo)
+            por_producto.setdefault(proyeccion["id_producto"], []).append(intervalo)
+        for arboles, grupos in ((self.por_estado, por_estado), (self.por_producto, por_producto)):
+            for clave, intervalos in grupos.items():
+                yield arboles, clave, intervalos
+
+    def quitar(self, proyeccion: dict):
+        for arbol in self._arboles(proyeccion, crear=False):
+            arbol.eliminar(proyeccion["id"])
+        if not self.por_producto.get(proyeccion["id_producto"], True):
+            del self.por_producto[proyeccion["id_producto"]]
+
+    def _arboles(self, proyeccion: dict, crear: bool) -> List[ArbolIntervalos]:
+        claves = (
+            (self.por_estado, getattr(proyeccion["estado"], "value", proyeccion["estado"])),
+            (self.por_producto, proyeccion["id_producto"]),
+        )
+        if crear:
+            for arboles, clave in claves:
+                if clave not in arboles:
+                    arboles[clave] = ArbolIntervalos()
+        return [arboles[clave] for arboles, clave in claves]
+
+    def arbol_estado(self, estado) -> ArbolIntervalos:
+        return self.por_estado.get(getattr(estado, "value", estado)) or ArbolIntervalos()
+
+    def arbol_producto(self, id_producto: str) -> ArbolIntervalos:
+        return self.por_producto.get(id_producto) or ArbolIntervalos()
+
+    def consultar(
+        self,
+        estado=None,
+        inicio_desde: date = date.min,
+        inicio_hasta: date = date.max,
+        fin_desde: date = date.min
+    ) -> Iterator[Intervalo]:
+        """Consulta global; sin estado se combinan los árboles de todos los estados por inicio"""
+        if estado is not None:
+            return self.arbol_estado(estado).consultar(inicio_desde, inicio_hasta, fin_desde)
+        return heapq.merge(*(
+            arbol.consultar(inicio_desde, inicio_hasta, fin_desde) for arbol in self.por_estado.values()
+        ))
@@ -0,0 +1,61 @@
+"""Stock disponible real desde MS-Bodega y MS-Lote.
+
+Se consulta el stock agregado de los productos sin dato fresco en un solo
+llamado por servicio, ambos en paralelo, a través de comun.inventario
+(cliente compartido, caché TTL por producto y respaldo obsoleto).
+
+Con el mismo mecanismo se obtienen las condiciones de entrega de MS-Proveedor
+y el historial de compras de MS-OrdenCompra que usa la reposición.
+"""
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from comun.inventario import (
+    MS_BODEGA_URL, MS_LOTE_URL, MS_ORDEN_COMPRA_URL, MS_PROVEEDOR_URL, ORIGEN_SIN_DATOS,
+    consultar, consultar_por_producto, origen_combinado
+)
+
+
+async def consultar_stock_disponible(ids_producto: List[str]) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], str]:
+    """Stock disponible de cada producto (en el orden recibido), si se conoce, y el origen del dato.
+
+    Si el producto tiene lotes se usa la suma de sus lotes no vencidos; si no,
+    lo reportado por las bodegas; sin registros en ninguno el stock es 0.
+    El stock se guarda en caché por servicio y producto, así que con los
+    servicios caídos se sigue usando el último dato de cada producto; los que
+    no tienen ninguno quedan en False en la máscara de conocidos. Devuelve
+    None si ningún servicio respondió ni hay datos en caché.
+    """
+    (bodegas, origen_bodegas), (lotes, origen_lotes) = await asyncio.gather(
+        consultar_por_producto("stock-bodegas", f"{MS_BODEGA_URL}/stock/productos", ids_producto),
+        consultar_por_producto("stock-lotes", f"{MS_LOTE_URL}/stock/productos", ids_producto)
+    )
+    if bodegas is None and lotes is None:
+        return None, None, ORIGEN_SIN_DATOS
+    bodegas = bodegas or {}
+    lotes = lotes or {}
+
+    n = len(ids_producto)
+    valores = np.zeros(n, dtype=np.int64)
+    conocidos = np.zeros(n, dtype=bool)
+    for i, id_producto in enumerate(ids_producto):
+        stock_lotes = lotes.get(id_producto)
+        stock_bodegas = bodegas.get(id_producto)
+        if stock_lotes and stock_lotes["lotes"]:
+            valores[i] = stock_lotes["cantidad_disponible"]
+        elif stock_bodegas:
+            valores[i] = stock_bodegas["cantidad_disponible"]
+        conocidos[i] = id_producto in lotes or id_producto in bodegas
+    return valores, conocidos, origen_combinado(origen_bodegas, origen_lotes)
+
+
+async def consultar_proveedores() -> Tuple[Optional[List[dict]], str]:
+    """Proveedores registrados en MS-Proveedor, con sus condiciones de entrega"""
+    return await consultar(("proveedores",), "GET", f"{MS_PROVEEDOR_URL}/proveedores")
+
+
+async def consultar_compras(ids_producto: List[str]) -> Tuple[Optional[Dict[str, Optional[dict]]], str]:
+    """Última compra (proveedor y precio) y cantidad en tránsito de cada producto; None si no tiene compras"""
+    return await consultar_por_producto("compras", f"{MS_ORDEN_COMPRA_URL}/compras/productos", ids_producto)
@@ -1,23 +1,71 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Response
+from pydantic import TypeAdapter
 from typing import List, Optional
 from datetime import datetime, date, timedelta
+import asyncio
 import uuid
 import os
 import json
+import numpy as np
+from comun import IndiceHash, Igual, Predicado, Repositorio
+from comun.inventario import cerrar_cliente, medir_consultas
+from comun.metricas import instrumentar, registrar_repositorio
+from comun.perfilador import perfilar
+from comun.trazas import tramo, trazar
 from models import (
     ProyeccionDemandaCreate, ProyeccionDemandaUpdate, ProyeccionDemandaResponse,
     DetalleProyeccion, ProyeccionAgregada, AlertaDemanda,
-    TipoProyeccion, EstadoProyeccion
+    SolicitudPronostico, ResultadoPronostico,
+    SolicitudBacktesting, ResultadoBacktesting, MetricasPrecision,
+    RegistroDemandaLote, SerieDemanda, PuntoDemanda, ConflictoProyeccion,
+    SolicitudReposicion, ResultadoReposicion,
+    TrabajoPronostico, EstadoTrabajo, TipoProyeccion, EstadoProyeccion, MetodoPronostico
 )
+from historial import HistorialDemanda
+import inventario
+from intervalos import IndiceProyecciones, solapamientos
+import backtesting
+import pronostico
+import reposicion
+import trabajos
 
 app = FastAPI(
     title="MS-ProyeccionDemanda API",
     description="Microservicio para proyección de demanda de productos",
     version="1.0.0"
 )
+metricas = instrumentar(app)
+trazar(app, "ms-proyeccion-demanda")
+perfilar(app, metricas)
+medir_consultas(metricas)
 
-# Simulación de base de datos en memoria
-proyecciones_db = {}
+# Proyecciones en memoria, indexadas por producto, estado y tipo
+proyecciones_db = Repositorio("proyecciones", [
+    IndiceHash("id_producto"),
+    IndiceHash("estado"),
+    IndiceHash("tipo_proyeccion"),
+])
+registrar_repositorio(metricas, proyecciones_db, "estado", "tipo_proyeccion")
+
+def calcular_metricas_proyeccion(proyeccion: dict) -> dict:
+    """Calcular métricas derivadas de la proyección"""
+    fecha_inicio = proyeccion["fecha_inicio"]
+    fecha_fin = proyeccion["fecha_fin"]
+    demanda_estimada = proyeccion["demanda_estimada"]
+    
+    dias_vigencia = (fecha_fin - fecha_inicio).days + 1
+    demanda_diaria = demanda_estimada / dias_vigencia if dias_vigencia > 0 else 0
+    demanda_semanal = demanda_diaria * 7
+    demanda_mensual = demanda_diaria * 30
+    
+    proyeccion.update({
+        "dias_vigencia": dias_vigencia,
+        "demanda_diaria": round(demanda_diaria, 2),
+        "demanda_semanal": round(demanda_semanal, 2),
+        "demanda_mensual": round(demanda_mensual, 2)
+    })
+    
+    return proyeccion
 
 def cargar_proyecciones_desde_json():
     ruta = os.path.join(os.path.dirname(__file__), "test_data.json")
@@ -43,29 +91,103 @@ def cargar_proyecciones_desde_json():
             "fecha_creacion": datetime.now(),
             "fecha_actualizacion": datetime.now()
         }
+        calcular_metricas_proyeccion(proyecciones[proy_id])
     return proyecciones
 
-proyecciones_db = cargar_proyecciones_desde_json()
+proyecciones_db.inicializar(cargar_proyecciones_desde_json().values())
 
-def calcular_metricas_proyeccion(proyeccion: dict) -> dict:
-    """Calcular métricas derivadas de la proyección"""
-    fecha_inicio = proyeccion["fecha_inicio"]
-    fecha_fin = proyeccion["fecha_fin"]
-    demanda_estimada = proyeccion["demanda_estimada"]
+# Precisión móvil de los últimos periodos conciliados por producto y método
+precision_movil = backtesting.PrecisionMovil(int(os.getenv("PRECISION_VENTANA_PERIODOS", "12")))
+
+# Trabajos de pronóstico en segundo plano; los finalizados se conservan hasta vencer su TTL
+trabajos_db = {}
+resultados_trabajos = {}  # trabajo_id -> arreglos del cálculo; los resultados se arman por página
+tareas_trabajos = {}
+TRABAJOS_TTL = timedelta(seconds=float(os.getenv("TRABAJOS_TTL_SEGUNDOS", "3600")))
+TRABAJOS_MAX_FINALIZADOS = int(os.getenv("TRABAJOS_MAX_FINALIZADOS", "100"))
+# Las proyecciones de un trabajo se guardan en bloques; hasta terminar quedan fuera de los listados
+TRABAJOS_BLOQUE_PUBLICACION = int(os.getenv("TRABAJOS_BLOQUE_PUBLICACION", "2000"))
+proyecciones_ocultas = set()
+
+# Proyección agregada por producto; se descarta cuando cambia alguna proyección del producto
+agregadas_cache = {}
+
+def invalidar_producto(id_producto: str):
+    agregadas_cache.pop(id_producto, None)
+
+# Serializador de alertas: valida y serializa la lista completa en una sola llamada
+lista_alertas_json = TypeAdapter(List[AlertaDemanda])
+
+# Índice de intervalos de fechas (por estado y por producto), sincronizado en cada escritura
+indice_proyecciones = IndiceProyecciones()
+for _proyeccion in proyecciones_db.values():
+    indice_proyecciones.agregar(_proyeccion)
+
+# Historial de demanda real; con HISTORIAL_DEMANDA_RUTA se persiste en disco con memoria mapeada
+historial_demanda = HistorialDemanda(os.getenv("HISTORIAL_DEMANDA_RUTA") or None)
+
+def detalle_uniforme(proyeccion: dict) -> List[dict]:
+    """Repartir la demanda estimada por periodo en proporción a los días de cada periodo"""
+    dias = (proyeccion["fecha_fin"] - proyeccion["fecha_inicio"]).days + 1
+    etiquetas, inicios = pronostico.limites_periodos(proyeccion["fecha_inicio"], dias, proyeccion["tipo_proyeccion"])
+    acumulado = np.rint(proyeccion["demanda_estimada"] * np.append(inicios[1:], dias) / dias).astype(np.int64)
+    por_periodo = np.diff(acumulado, prepend=0).tolist()
+    return [
+        {"periodo": periodo, "demanda_estimada": demanda}
+        for periodo, demanda in zip(etiquetas, por_periodo)
+    ]
+
+def conciliar_proyecciones(ids_proyeccion) -> int:
+    """Completar la demanda real de los periodos ya cerrados según el historial almacenado.
+
+    Las proyecciones con el mismo rango y tipo se concilian juntas con una sola
+    lectura de la matriz de historial. Cada periodo conciliado actualiza la
+    precisión móvil de su producto y método.
+    """
+    corte = historial_demanda.fecha_fin
+    if corte is None:
+        return 0
     
-    dias_vigencia = (fecha_fin - fecha_inicio).days + 1
-    demanda_diaria = demanda_estimada / dias_vigencia if dias_vigencia > 0 else 0
-    demanda_semanal = demanda_diaria * 7
-    demanda_mensual = demanda_diaria * 30
+    grupos = {}
+    for proyeccion_id in ids_proyeccion:
+        proyeccion = proyecciones_db.get(proyeccion_id)
+        if (proyeccion is None or proyeccion["fecha_inicio"] > corte
+                or proyeccion["id_producto"] not in historial_demanda):
+            continue
+        tipo = getattr(proyeccion["tipo_proyeccion"], "value", proyeccion["tipo_proyeccion"])
+        grupos.setdefault((proyeccion["fecha_inicio"], proyeccion["fecha_fin"], tipo), []).append(proyeccion)
     
-    proyeccion.update({
-        "dias_vigencia": dias_vigencia,
-        "demanda_diaria": round(demanda_diaria, 2),
-        "demanda_semanal": round(demanda_semanal, 2),
-        "demanda_mensual": round(demanda_mensual, 2)
-    })
+    conciliadas = 0
+    for (fecha_inicio, fecha_fin, tipo), proyecciones in grupos.items():
+        dias = (fecha_fin - fecha_inicio).days + 1
+        _, inicios = pronostico.limites_periodos(fecha_inicio, dias, tipo)
+        ultimos_dias = np.append(inicios[1:], dias) - 1
+        completos = int(np.searchsorted(ultimos_dias, (corte - fecha_inicio).days, side="right"))
+        if not completos:
+            continue
+        
+        hasta = fecha_inicio + timedelta(days=int(ultimos_dias[completos - 1]))
+        matriz = historial_demanda.matriz([p["id_producto"] for p in proyecciones], fecha_inicio, hasta)
+        _, reales = HistorialDemanda.remuestrear(matriz, fecha_inicio, tipo)
+        reales = np.rint(reales).astype(np.int64).tolist()
+        
+        for proyeccion, fila in zip(proyecciones, reales):
+            if not proyeccion.get("detalle"):
+                proyeccion["detalle"] = detalle_uniforme(proyeccion)
+            for detalle, real in zip(proyeccion["detalle"], fila):
+                estimada = detalle["demanda_estimada"]
+                detalle["demanda_real"] = real
+                detalle["diferencia"] = real - estimada
+                detalle["precision_porcentaje"] = backtesting.precision_periodo(estimada, real)
+                precision_movil.registrar(
+                    proyeccion["id_producto"], proyeccion["metodologia"],
+                    (proyeccion["id"], detalle["periodo"]), estimada, real
+                )
+            invalidar_producto(proyeccion["id_producto"])
+            conciliadas += 1
+        proyecciones_db.guardar_varios(proyecciones)
     
-    return proyeccion
+    return conciliadas
 
 @app.get("/", tags=["Health"])
 async def root():
@@ -95,7 +217,9 @@ async def crear_proyeccion(proyeccion: ProyeccionDemandaCreate):
     }
     
     nueva_proyeccion = calcular_metricas_proyeccion(nueva_proyeccion)
-    proyecciones_db[proyeccion_id] = nueva_proyeccion
+    proyecciones_db.guardar(nueva_proyeccion)
+    indice_proyecciones.agregar(nueva_proyeccion)
+    invalidar_producto(proyeccion.id_producto)
     
     return ProyeccionDemandaResponse(**nueva_proyeccion)
 
@@ -108,28 +232,69 @@ async def listar_proyecciones(
     fecha_hasta: Optional[date] = Query(None, description="Fecha de inicio hasta"),
     activas_solamente: Optional[bool] = Query(None, description="Solo proyecciones activas")
 ):
-    """Listar todas las proyecciones con filtros opcionales"""
-    proyecciones = list(proyecciones_db.values())
-    
-    # Aplicar filtros
-    if id_producto:
-        proyecciones = [p for p in proyecciones if p["id_producto"] == id_producto]
-    if tipo_proyeccion:
-        proyecciones = [p for p in proyecciones if p["tipo_proyeccion"] == tipo_proyeccion]
-    if estado:
-        proyecciones = [p for p in proyecciones if p["estado"] == estado]
-    if fecha_desde:
-        proyecciones = [p for p in proyecciones if p["fecha_inicio"] >= fecha_desde]
-    if fecha_hasta:
-        proyecciones = [p for p in proyecciones if p["fecha_inicio"] <= fecha_hasta]
+    """Listar todas las proyecciones con filtros opcionales.
+
+    Con filtro de producto o de fechas se resuelve con el índice de intervalos
+    y el resultado queda ordenado por fecha de inicio.
+    """
     if activas_solamente:
-        proyecciones = [p for p in proyecciones if p["estado"] == EstadoProyeccion.ACTIVE]
+        if estado and estado != EstadoProyeccion.ACTIVE:
+            return []
+        estado = EstadoProyeccion.ACTIVE
     
-    # Recalcular métricas
-    for proyeccion in proyecciones:
-        calcular_metricas_proyeccion(proyeccion)
+    with tramo("filtrar", coleccion="proyecciones"):
+        if id_producto or fecha_desde or fecha_hasta:
+            rango = {"inicio_desde": fecha_desde or date.min, "inicio_hasta": fecha_hasta or date.max}
+            if id_producto:
+                intervalos = indice_proyecciones.arbol_producto(id_producto).consultar(**rango)
+            else:
+                intervalos = indice_proyecciones.consultar(estado, **rango)
+            proyecciones = (proyecciones_db[id_proyeccion] for _, _, id_proyeccion in intervalos)
+            # Aplicar filtros restantes
+            if tipo_proyeccion:
+                proyecciones = (p for p in proyecciones if p["tipo_proyeccion"] == tipo_proyeccion)
+            if estado:
+                proyecciones = (p for p in proyecciones if p["estado"] == estado)
+        else:
+            proyecciones = proyecciones_db.consultar(
+                Igual("estado", estado), Igual("tipo_proyeccion", tipo_proyeccion),
+                Predicado(lambda p: p["id"] not in proyecciones_ocultas, activa=bool(proyecciones_ocultas))
+            )
+        proyecciones = list(proyecciones)
+    
+    # Las métricas derivadas se calculan al escribir
+    with tramo("construir_respuesta", cantidad=len(proyecciones)):
+        return [ProyeccionDemandaResponse(**proyeccion) for proyeccion in proyecciones]
+
+@app.get("/proyecciones/vigentes", response_model=List[ProyeccionDemandaResponse], tags=["Consultas"])
+async def obtener_proyecciones_vigentes():
+    """Obtener proyecciones vigentes (activas y dentro del rango de fechas)"""
+    return [
+        ProyeccionDemandaResponse(**proyecciones_db[id_proyeccion])
+        for _, _, id_proyeccion in indice_proyecciones.arbol_estado(EstadoProyeccion.ACTIVE).vigentes(date.today())
+    ]
+
+@app.get("/proyecciones/solapadas", response_model=List[ProyeccionDemandaResponse], tags=["Consultas"])
+async def obtener_proyecciones_solapadas(
+    desde: date = Query(..., description="Inicio del rango"),
+    hasta: date = Query(..., description="Fin del rango"),
+    id_producto: Optional[str] = Query(None, description="Filtrar por ID de producto"),
+    estado: Optional[EstadoProyeccion] = Query(None, description="Filtrar por estado")
+):
+    """Obtener proyecciones cuyo periodo se solapa con [desde, hasta], ordenadas por fecha de inicio"""
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="hasta debe ser posterior a desde")
+    
+    rango = {"inicio_hasta": hasta, "fin_desde": desde}
+    if id_producto:
+        intervalos = indice_proyecciones.arbol_producto(id_producto).consultar(**rango)
+    else:
+        intervalos = indice_proyecciones.consultar(estado, **rango)
     
-    return [ProyeccionDemandaResponse(**proyeccion) for proyeccion in proyecciones]
+    proyecciones = (proyecciones_db[id_proyeccion] for _, _, id_proyeccion in intervalos)
+    if id_producto and estado:
+        proyecciones = (p for p in proyecciones if p["estado"] == estado)
+    return [ProyeccionDemandaResponse(**p) for p in proyecciones]
 
 @app.get("/proyecciones/{proyeccion_id}", response_model=ProyeccionDemandaResponse, tags=["Proyecciones"])
 async def obtener_proyeccion(proyeccion_id: str):
@@ -137,10 +302,7 @@ async def obtener_proyeccion(proyeccion_id: str):
     if proyeccion_id not in proyecciones_db:
         raise HTTPException(status_code=404, detail="Proyección no encontrada")
     
-    proyeccion = proyecciones_db[proyeccion_id]
-    proyeccion = calcular_metricas_proyeccion(proyeccion)
-    
-    return ProyeccionDemandaResponse(**proyeccion)
+    return ProyeccionDemandaResponse(**proyecciones_db[proyeccion_id])
 
 @app.put("/proyecciones/{proyeccion_id}", response_model=ProyeccionDemandaResponse, tags=["Proyecciones"])
 async def actualizar_proyeccion(proyeccion_id: str, proyeccion_update: ProyeccionDemandaUpdate):
@@ -151,12 +313,19 @@ async def actualizar_proyeccion(proyeccion_id: str, proyeccion_update: Proyeccio
     proyeccion = proyecciones_db[proyeccion_id]
     update_data = proyeccion_update.dict(exclude_unset=True)
     
+    indice_proyecciones.quitar(proyeccion)
     for field, value in update_data.items():
         proyeccion[field] = value
+    # El detalle por periodo deja de corresponder si cambia el rango, el tipo o la demanda
+    if update_data.keys() & {"fecha_inicio", "fecha_fin", "tipo_proyeccion", "demanda_estimada"}:
+        proyeccion.pop("detalle", None)
     
     proyeccion["fecha_actualizacion"] = datetime.now()
     proyeccion = calcular_metricas_proyeccion(proyeccion)
-    proyecciones_db[proyeccion_id] = proyeccion
+    proyecciones_db.guardar(proyeccion)
+    indice_proyecciones.agregar(proyeccion)
+    invalidar_producto(proyeccion["id_producto"])
+    conciliar_proyecciones([proyeccion_id])
     
     return ProyeccionDemandaResponse(**proyeccion)
 
@@ -166,7 +335,9 @@ async def eliminar_proyeccion(proyeccion_id: str):
     if proyeccion_id not in proyecciones_db:
         raise HTTPException(status_code=404, detail="Proyección no encontrada")
     
-    del proyecciones_db[proyeccion_id]
+    proyeccion = proyecciones_db.eliminar(proyeccion_id)
+    indice_proyecciones.quitar(proyeccion)
+    invalidar_producto(proyeccion["id_producto"])
     return {"message": f"Proyección {proyeccion_id} eliminada exitosamente"}
 
 @app.patch("/proyecciones/{proyeccion_id}/activar", tags=["Estados"])
@@ -176,8 +347,12 @@ async def activar_proyeccion(proyeccion_id: str):
         raise HTTPException(status_code=404, detail="Proyección no encontrada")
     
     proyeccion = proyecciones_db[proyeccion_id]
+    indice_proyecciones.quitar(proyeccion)
     proyeccion["estado"] = EstadoProyeccion.ACTIVE
     proyeccion["fecha_actualizacion"] = datetime.now()
+    proyecciones_db.guardar(proyeccion)
+    indice_proyecciones.agregar(proyeccion)
+    invalidar_producto(proyeccion["id_producto"])
     
     return {"message": f"Proyección {proyeccion_id} activada exitosamente"}
 
@@ -188,18 +363,25 @@ async def archivar_proyeccion(proyeccion_id: str):
         raise HTTPException(status_code=404, detail="Proyección no encontrada")
     
     proyeccion = proyecciones_db[proyeccion_id]
+    indice_proyecciones.quitar(proyeccion)
     proyeccion["estado"] = EstadoProyeccion.ARCHIVED
     proyeccion["fecha_actualizacion"] = datetime.now()
+    proyecciones_db.guardar(proyeccion)
+    indice_proyecciones.agregar(proyeccion)
+    invalidar_producto(proyeccion["id_producto"])
     
     return {"message": f"Proyección {proyeccion_id} archivada exitosamente"}
 
 @app.get("/productos/{id_producto}/proyecciones", response_model=ProyeccionAgregada, tags=["Consultas"])
 async def obtener_proyecciones_producto(id_producto: str):
-    """Obtener todas las proyecciones de un producto específico"""
+    """Obtener todas las proyecciones de un producto específico, ordenadas por fecha de inicio"""
+    agregada = agregadas_cache.get(id_producto)
+    if agregada is not None:
+        return agregada
+    
     proyecciones_producto = [
-        ProyeccionDemandaResponse(**calcular_metricas_proyeccion(p.copy()))
-        for p in proyecciones_db.values() 
-        if p["id_producto"] == id_producto
+        ProyeccionDemandaResponse(**proyecciones_db[id_proyeccion])
+        for _, _, id_proyeccion in indice_proyecciones.arbol_producto(id_producto).consultar()
     ]
     
     if not proyecciones_producto:
@@ -211,79 +393,701 @@ async def obtener_proyecciones_producto(id_producto: str):
     confianzas = [p.confianza_porcentaje for p in proyecciones_producto if p.confianza_porcentaje]
     promedio_confianza = sum(confianzas) / len(confianzas) if confianzas else 0
     
-    return ProyeccionAgregada(
+    agregada = ProyeccionAgregada(
         id_producto=id_producto,
         proyecciones=proyecciones_producto,
         demanda_total_estimada=demanda_total,
         periodo_total_dias=dias_total,
         promedio_confianza=round(promedio_confianza, 2)
     )
+    agregadas_cache[id_producto] = agregada
+    return agregada
 
-@app.get("/proyecciones/vigentes", response_model=List[ProyeccionDemandaResponse], tags=["Consultas"])
-async def obtener_proyecciones_vigentes():
-    """Obtener proyecciones vigentes (activas y dentro del rango de fechas)"""
-    hoy = date.today()
-    proyecciones_vigentes = []
+@app.get("/alertas/demanda", response_model=List[AlertaDemanda], tags=["Alertas"])
+async def obtener_alertas_demanda():
+    """Obtener alertas de demanda comparando proyecciones vigentes con el stock real"""
+    vigentes = [
+        proyecciones_db[id_proyeccion]
+        for _, _, id_proyeccion in indice_proyecciones.arbol_estado(EstadoProyeccion.ACTIVE).vigentes(date.today())
+    ]
+    if not vigentes:
+        return []
     
-    for proyeccion in proyecciones_db.values():
-        if (proyeccion["estado"] == EstadoProyeccion.ACTIVE and
-            proyeccion["fecha_inicio"] <= hoy <= proyeccion["fecha_fin"]):
-            proyeccion_calculada = calcular_metricas_proyeccion(proyeccion.copy())
-            proyecciones_vigentes.append(ProyeccionDemandaResponse(**proyeccion_calculada))
+    ids_producto = [p["id_producto"] for p in vigentes]
+    stock, conocidos, origen_stock = await inventario.consultar_stock_disponible(ids_producto)
+    if stock is None:
+        raise HTTPException(status_code=503, detail="No fue posible consultar el stock en MS-Bodega ni MS-Lote")
+    if not conocidos.all():
+        # Con los servicios caídos, los productos sin ningún dato en caché no se evalúan
+        seleccion = np.flatnonzero(conocidos)
+        vigentes = [vigentes[i] for i in seleccion.tolist()]
+        ids_producto = [ids_producto[i] for i in seleccion.tolist()]
+        stock = stock[seleccion]
     
-    return proyecciones_vigentes
+    # Evaluación vectorizada sobre todas las proyecciones vigentes
+    demanda = np.fromiter((p["demanda_estimada"] for p in vigentes), dtype=np.int64, count=len(vigentes))
+    diferencia = stock - demanda
+    condiciones = [diferencia < 0, demanda > stock * 1.5, demanda < stock * 0.2]
+    tipos = np.select(condiciones, [1, 2, 3], 0)  # 0 = no genera alerta
+    criticidades = np.select(
+        [(tipos == 1) & (np.abs(diferencia) > demanda * 0.5), tipos == 1, tipos == 2, tipos == 3],
+        [1, 2, 2, 3], 0
+    )
+    
+    # Ordenar por criticidad (ALTA, MEDIA, BAJA) conservando el orden original en empates
+    con_alerta = np.flatnonzero(tipos)
+    con_alerta = con_alerta[np.argsort(criticidades[con_alerta], kind="stable")]
+    
+    nombres_tipo = {1: "STOCK_INSUFICIENTE", 2: "DEMANDA_ALTA", 3: "DEMANDA_BAJA"}
+    nombres_criticidad = {1: "ALTA", 2: "MEDIA", 3: "BAJA"}
+    now = datetime.now()
+    alertas = [
+        {
+            "id_producto": ids_producto[i],
+            "tipo_alerta": nombres_tipo[t],
+            "demanda_proyectada": d,
+            "stock_actual": s,
+            "diferencia": dif,
+            "criticidad": nombres_criticidad[c],
+            "fecha_alerta": now,
+            "origen_stock": origen_stock
+        }
+        for i, t, c, d, s, dif in zip(
+            con_alerta.tolist(), tipos[con_alerta].tolist(), criticidades[con_alerta].tolist(),
+            demanda[con_alerta].tolist(), stock[con_alerta].tolist(), diferencia[con_alerta].tolist()
+        )
+    ]
+    cuerpo = lista_alertas_json.dump_json(lista_alertas_json.validate_python(alertas))
+    return Response(content=cuerpo, media_type="application/json")
 
-@app.get("/alertas/demanda", response_model=List[AlertaDemanda], tags=["Alertas"])
-async def obtener_alertas_demanda():
-    """Obtener alertas de demanda basadas en proyecciones vigentes"""
-    alertas = []
-    hoy = date.today()
+@app.get("/productos/{id_producto}/proyecciones/conflictos", response_model=List[ConflictoProyeccion], tags=["Consultas"])
+async def obtener_conflictos_producto(id_producto: str):
+    """Detectar proyecciones no archivadas del mismo producto y tipo con periodos solapados"""
+    por_tipo = {}
+    for intervalo in indice_proyecciones.arbol_producto(id_producto).consultar():
+        proyeccion = proyecciones_db[intervalo[2]]
+        if proyeccion["estado"] != EstadoProyeccion.ARCHIVED:
+            por_tipo.setdefault(proyeccion["tipo_proyeccion"], []).append(intervalo)
     
-    for proyeccion in proyecciones_db.values():
-        if (proyeccion["estado"] == EstadoProyeccion.ACTIVE and
-            proyeccion["fecha_inicio"] <= hoy <= proyeccion["fecha_fin"]):
-            
-            # Simular stock actual (en integración real vendría de MS-Bodega)
-            stock_simulado = 1000
-            demanda_proyectada = proyeccion["demanda_estimada"]
-            diferencia = stock_simulado - demanda_proyectada
-            
-            # Determinar tipo de alerta y criticidad
-            if diferencia < 0:
-                tipo_alerta = "STOCK_INSUFICIENTE"
-                criticidad = "ALTA" if abs(diferencia) > demanda_proyectada * 0.5 else "MEDIA"
-            elif demanda_proyectada > stock_simulado * 1.5:
-                tipo_alerta = "DEMANDA_ALTA"
-                criticidad = "MEDIA"
-            elif demanda_proyectada < stock_simulado * 0.2:
-                tipo_alerta = "DEMANDA_BAJA"
-                criticidad = "BAJA"
-            else:
-                continue  # No genera alerta
-            
-            alertas.append(AlertaDemanda(
-                id_producto=proyeccion["id_producto"],
-                tipo_alerta=tipo_alerta,
-                demanda_proyectada=demanda_proyectada,
-                stock_actual=stock_simulado,
-                diferencia=diferencia,
-                criticidad=criticidad,
-                fecha_alerta=datetime.now()
+    conflictos = []
+    for tipo, intervalos in por_tipo.items():
+        for (inicio_a, fin_a, id_a), (inicio_b, fin_b, id_b) in solapamientos(intervalos):
+            inicio_solape, fin_solape = max(inicio_a, inicio_b), min(fin_a, fin_b)
+            conflictos.append(ConflictoProyeccion(
+                id_producto=id_producto,
+                tipo_proyeccion=tipo,
+                id_proyeccion_a=id_a,
+                id_proyeccion_b=id_b,
+                fecha_inicio_solape=inicio_solape,
+                fecha_fin_solape=fin_solape,
+                dias_solapados=(fin_solape - inicio_solape).days + 1
             ))
     
-    # Ordenar por criticidad
-    criticidad_orden = {"ALTA": 1, "MEDIA": 2, "BAJA": 3}
-    alertas.sort(key=lambda x: criticidad_orden[x.criticidad])
+    return conflictos
+
+def rango_historial(solicitud: SolicitudPronostico):
+    """Fechas del historial almacenado que alimentan un pronóstico"""
+    hasta = solicitud.fecha_inicio - timedelta(days=1)
+    return hasta - timedelta(days=solicitud.dias_historial - 1), hasta
+
+def validar_solicitud_pronostico(solicitud: SolicitudPronostico) -> List[str]:
+    """Validar la solicitud y devolver los productos a pronosticar"""
+    if solicitud.fecha_fin < solicitud.fecha_inicio:
+        raise HTTPException(status_code=400, detail="fecha_fin debe ser posterior a fecha_inicio")
+    if solicitud.historial is not None:
+        if solicitud.historial and not any(solicitud.historial.values()):
+            raise HTTPException(status_code=400, detail="El historial de demanda está vacío")
+        return list(solicitud.historial)
+    if solicitud.dias_historial < 1:
+        raise HTTPException(status_code=400, detail="El historial de demanda está vacío")
+    return solicitud.ids_producto if solicitud.ids_producto is not None else historial_demanda.productos
+
+def construir_resultados(
+    metodologia: MetodoPronostico,
+    ids_producto: List[str],
+    calculo: dict,
+    ids_proyeccion: Optional[List[str]] = None,
+    inicio: int = 0,
+    fin: Optional[int] = None
+) -> List[ResultadoPronostico]:
+    """Resultados de las filas [inicio, fin) de un cálculo de pronóstico"""
+    fin = len(ids_producto) if fin is None else min(fin, len(ids_producto))
+    etiquetas = calculo["etiquetas"]
+    por_periodo = calculo["por_periodo"][inicio:fin].tolist()
+    totales = calculo["total"][inicio:fin].tolist()
+    confianzas = calculo["confianza"][inicio:fin].tolist()
+    return [
+        ResultadoPronostico(
+            id_producto=ids_producto[fila],
+            metodologia=metodologia,
+            demanda_estimada=totales[fila - inicio],
+            confianza_porcentaje=confianzas[fila - inicio],
+            detalle=[
+                {"periodo": periodo, "demanda_estimada": demanda}
+                for periodo, demanda in zip(etiquetas, por_periodo[fila - inicio])
+            ],
+            id_proyeccion=ids_proyeccion[fila] if ids_proyeccion is not None else None
+        )
+        for fila in range(inicio, fin)
+    ]
+
+def construir_proyecciones(solicitud: SolicitudPronostico, ids_producto: List[str], calculo: dict) -> dict:
+    """Proyecciones borrador de un cálculo de pronóstico, en el orden de ids_producto.
+
+    Se devuelven sin guardar para que el llamador las registre todas juntas con
+    guardar_proyecciones; no usa estado compartido, así que puede ejecutarse en otro hilo.
+    """
+    etiquetas = calculo["etiquetas"]
+    por_periodo = calculo["por_periodo"].tolist()
+    totales = calculo["total"].tolist()
+    confianzas = calculo["confianza"].tolist()
+    now = datetime.now()
+    
+    nuevas_proyecciones = {}
+    for fila, id_producto in enumerate(ids_producto):
+        proyeccion_id = str(uuid.uuid4())
+        nuevas_proyecciones[proyeccion_id] = calcular_metricas_proyeccion({
+            "id": proyeccion_id,
+            "id_producto": id_producto,
+            "fecha_inicio": solicitud.fecha_inicio,
+            "fecha_fin": solicitud.fecha_fin,
+            "tipo_proyeccion": solicitud.tipo_proyeccion,
+            "demanda_estimada": totales[fila],
+            "unidades": solicitud.unidades,
+            "metodologia": solicitud.metodologia.value,
+            "factores_considerados": ["historial_diario"],
+            "confianza_porcentaje": confianzas[fila],
+            "estado": EstadoProyeccion.DRAFT,
+            "detalle": [
+                {"periodo": periodo, "demanda_estimada": demanda}
+                for periodo, demanda in zip(etiquetas, por_periodo[fila])
+            ],
+            "fecha_creacion": now,
+            "fecha_actualizacion": now
+        })
+    
+    return nuevas_proyecciones
+
+def guardar_proyecciones(nuevas_proyecciones: dict):
+    """Registrar varias proyecciones de una vez.
+
+    No hay puntos de espera entre la primera y la última escritura, así que
+    ninguna petición observa un conjunto parcial.
+    """
+    proyecciones_db.guardar_varios(nuevas_proyecciones.values())
+    indice_proyecciones.agregar_lote(list(nuevas_proyecciones.values()))
+    for proyeccion in nuevas_proyecciones.values():
+        invalidar_producto(proyeccion["id_producto"])
+
+@app.post("/pronosticos", response_model=List[ResultadoPronostico], tags=["Pronósticos"])
+async def calcular_pronosticos(solicitud: SolicitudPronostico):
+    """Calcular pronósticos de demanda para todos los productos del historial en una sola pasada"""
+    ids_producto = validar_solicitud_pronostico(solicitud)
+    if not ids_producto:
+        return []
+    if solicitud.historial is not None:
+        _, historial = pronostico.matriz_historial(solicitud.historial)
+    else:
+        historial = historial_demanda.matriz(ids_producto, *rango_historial(solicitud))
+    
+    calculo = pronostico.pronosticar(
+        historial, solicitud.metodologia.value,
+        solicitud.fecha_inicio, solicitud.fecha_fin, solicitud.tipo_proyeccion
+    )
+    ids_proyeccion = None
+    if solicitud.crear_proyecciones:
+        nuevas_proyecciones = construir_proyecciones(solicitud, ids_producto, calculo)
+        guardar_proyecciones(nuevas_proyecciones)
+        ids_proyeccion = list(nuevas_proyecciones)
+    
+    return construir_resultados(solicitud.metodologia, ids_producto, calculo, ids_proyeccion)
+
+async def publicar_proyecciones(nuevas_proyecciones: dict, arboles_preparados: list):
+    """Registrar las proyecciones de un trabajo sin bloquear el event loop.
+
+    Se guardan en bloques cediendo el loop entre uno y otro, ocultas del listado
+    general; las demás consultas llegan a las proyecciones por los árboles de
+    intervalos, que se reemplazan en un solo paso al final. Si se cancela o
+    falla, se descartan las ya guardadas.
+    """
+    proyecciones = list(nuevas_proyecciones.values())
+    proyecciones_ocultas.update(nuevas_proyecciones)
+    try:
+        for inicio in range(0, len(proyecciones), TRABAJOS_BLOQUE_PUBLICACION):
+            proyecciones_db.guardar_varios(proyecciones[inicio:inicio + TRABAJOS_BLOQUE_PUBLICACION])
+            await asyncio.sleep(0)
+    except BaseException:
+        for proyeccion_id in nuevas_proyecciones:
+            proyecciones_db.eliminar(proyeccion_id)
+        raise
+    finally:
+        proyecciones_ocultas.difference_update(nuevas_proyecciones)
+    indice_proyecciones.aplicar_lote(arboles_preparados)
+    for proyeccion in proyecciones:
+        invalidar_producto(proyeccion["id_producto"])
+
+def purgar_trabajos():
+    """Olvidar los trabajos finalizados hace más de TRABAJOS_TTL y los más antiguos por encima del máximo"""
+    finalizados = sorted(
+        (trabajo for trabajo in trabajos_db.values() if trabajo["fecha_fin"] is not None),
+        key=lambda trabajo: trabajo["fecha_fin"]
+    )
+    sobrantes = len(finalizados) - TRABAJOS_MAX_FINALIZADOS
+    limite = datetime.now() - TRABAJOS_TTL
+    for posicion, trabajo in enumerate(finalizados):
+        if posicion < sobrantes or trabajo["fecha_fin"] < limite:
+            del trabajos_db[trabajo["id"]]
+            resultados_trabajos.pop(trabajo["id"], None)
+
+def respuesta_trabajo(trabajo: dict) -> TrabajoPronostico:
+    """Respuesta de un trabajo con su porcentaje de avance"""
+    total = trabajo["total_productos"]
+    progreso = 100 * trabajo["productos_procesados"] / total if total else 100.0
+    return TrabajoPronostico(**trabajo, progreso_porcentaje=round(progreso, 2))
+
+@app.post("/trabajos/pronostico", response_model=TrabajoPronostico, status_code=202, tags=["Trabajos"])
+async def enviar_trabajo_pronostico(solicitud: SolicitudPronostico):
+    """Encolar un pronóstico masivo que se calcula en segundo plano en un pool de procesos"""
+    ids_producto = validar_solicitud_pronostico(solicitud)
+    purgar_trabajos()
+    trabajo_id = str(uuid.uuid4())
+    fragmentos = trabajos.fragmentar(len(ids_producto))
+    
+    trabajos_db[trabajo_id] = {
+        "id": trabajo_id,
+        "estado": EstadoTrabajo.PENDIENTE,
+        "metodologia": solicitud.metodologia,
+        "total_productos": len(ids_producto),
+        "productos_procesados": 0,
+        "fragmentos_totales": len(fragmentos),
+        "fragmentos_completados": 0,
+        "proyecciones_creadas": 0,
+        "error": None,
+        "fecha_creacion": datetime.now(),
+        "fecha_inicio": None,
+        "fecha_fin": None
+    }
+    tareas_trabajos[trabajo_id] = asyncio.create_task(
+        ejecutar_trabajo_pronostico(trabajo_id, solicitud, ids_producto, fragmentos)
+    )
+    
+    return respuesta_trabajo(trabajos_db[trabajo_id])
+
+async def ejecutar_trabajo_pronostico(trabajo_id: str, solicitud: SolicitudPronostico, ids_producto: List[str], fragmentos):
+    """Calcular los fragmentos en el pool y publicar el resultado completo al terminar.
+
+    El event loop solo guarda los arreglos de cada fragmento; las proyecciones y
+    sus árboles de intervalos se construyen en otro hilo y se publican con
+    publicar_proyecciones. Los resultados se arman al pedir cada página.
+    """
+    trabajo = trabajos_db[trabajo_id]
+    trabajo["estado"] = EstadoTrabajo.EN_EJECUCION
+    trabajo["fecha_inicio"] = datetime.now()
+    calculos = {}
+    
+    if solicitud.historial is not None:
+        _, matriz = pronostico.matriz_historial(solicitud.historial)
+        preparar_historial = lambda inicio, fin: matriz[inicio:fin]
+    else:
+        desde, hasta = rango_historial(solicitud)
+        preparar_historial = lambda inicio, fin: historial_demanda.matriz(ids_producto[inicio:fin], desde, hasta)
+    
+    def preparar(inicio: int, fin: int):
+        return (
+            preparar_historial(inicio, fin), solicitud.metodologia.value,
+            solicitud.fecha_inicio, solicitud.fecha_fin, solicitud.tipo_proyeccion
+        )
+    
+    def al_completar(inicio: int, fin: int, calculo: dict):
+        calculos[inicio] = calculo
+        trabajo["productos_procesados"] += fin - inicio
+        trabajo["fragmentos_completados"] += 1
+    
+    try:
+        await trabajos.ejecutar_fragmentos(fragmentos, preparar, al_completar)
+        calculo = trabajos.unir_fragmentos([calculos[inicio] for inicio, _ in fragmentos])
+        nuevas_proyecciones = {}
+        if solicitud.crear_proyecciones and ids_producto:
+            nuevas_proyecciones = await asyncio.to_thread(construir_proyecciones, solicitud, ids_producto, calculo)
+            arboles = await asyncio.to_thread(indice_proyecciones.preparar_lote, list(nuevas_proyecciones.values()))
+            await publicar_proyecciones(nuevas_proyecciones, arboles)
+    except asyncio.CancelledError:
+        trabajo["estado"] = EstadoTrabajo.CANCELADO
+        trabajo["fecha_fin"] = datetime.now()
+        raise
+    except Exception as e:
+        trabajo["estado"] = EstadoTrabajo.FALLIDO
+        trabajo["error"] = str(e) or type(e).__name__
+        trabajo["fecha_fin"] = datetime.now()
+        return
+    finally:
+        tareas_trabajos.pop(trabajo_id, None)
+    
+    resultados_trabajos[trabajo_id] = {
+        **calculo,
+        "metodologia": solicitud.metodologia,
+        "ids_producto": ids_producto,
+        "ids_proyeccion": list(nuevas_proyecciones) if solicitud.crear_proyecciones else None
+    }
+    trabajo["proyecciones_creadas"] = len(nuevas_proyecciones)
+    trabajo["estado"] = EstadoTrabajo.COMPLETADO
+    trabajo["fecha_fin"] = datetime.now()
+
+@app.get("/trabajos/{trabajo_id}", response_model=TrabajoPronostico, tags=["Trabajos"])
+async def obtener_trabajo(trabajo_id: str):
+    """Consultar el estado y el progreso de un trabajo"""
+    purgar_trabajos()
+    if trabajo_id not in trabajos_db:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return respuesta_trabajo(trabajos_db[trabajo_id])
+
+@app.get("/trabajos/{trabajo_id}/resultado", response_model=List[ResultadoPronostico], tags=["Trabajos"])
+async def obtener_resultado_trabajo(
+    trabajo_id: str,
+    offset: int = Query(0, ge=0, description="Resultados a omitir"),
+    limit: int = Query(1000, ge=1, le=10000, description="Máximo de resultados")
+):
+    """Obtener los pronósticos de un trabajo completado, paginados; solo se arman los de la página pedida"""
+    purgar_trabajos()
+    if trabajo_id not in trabajos_db:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if trabajos_db[trabajo_id]["estado"] != EstadoTrabajo.COMPLETADO:
+        raise HTTPException(status_code=409, detail="El trabajo no ha finalizado correctamente")
+    resultado = resultados_trabajos[trabajo_id]
+    return construir_resultados(
+        resultado["metodologia"], resultado["ids_producto"], resultado,
+        resultado["ids_proyeccion"], offset, offset + limit
+    )
+
+@app.patch("/trabajos/{trabajo_id}/cancelar", response_model=TrabajoPronostico, tags=["Trabajos"])
+async def cancelar_trabajo(trabajo_id: str):
+    """Cancelar un trabajo pendiente o en ejecución; no se guarda ningún resultado parcial"""
+    if trabajo_id not in trabajos_db:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    tarea = tareas_trabajos.get(trabajo_id)
+    if tarea is None:
+        raise HTTPException(status_code=409, detail="El trabajo ya finalizó")
+    
+    tarea.cancel()
+    try:
+        await tarea
+    except asyncio.CancelledError:
+        pass
+    # Una tarea cancelada antes de empezar no llega a registrar su estado
+    trabajo = trabajos_db[trabajo_id]
+    if trabajo["estado"] == EstadoTrabajo.PENDIENTE:
+        trabajo["estado"] = EstadoTrabajo.CANCELADO
+        trabajo["fecha_fin"] = datetime.now()
+        tareas_trabajos.pop(trabajo_id, None)
+    resultados_trabajos.pop(trabajo_id, None)
+    return respuesta_trabajo(trabajos_db[trabajo_id])
+
+@app.post("/historial/demanda", tags=["Historial"])
+async def registrar_demanda(lote: RegistroDemandaLote):
+    """Registrar demanda real diaria en bloque"""
+    registros = lote.registros
+    if not registros:
+        return {"message": "Se registraron 0 valores de demanda", "productos": len(historial_demanda),
+                "fecha_fin": historial_demanda.fecha_fin, "proyecciones_conciliadas": 0}
+    corte_anterior = historial_demanda.fecha_fin
+    total = historial_demanda.registrar(
+        [r.id_producto for r in registros],
+        [r.fecha for r in registros],
+        [r.cantidad for r in registros],
+        acumular=lote.acumular
+    )
+    
+    # Proyecciones afectadas: las de los productos registrados que cubren las fechas recibidas
+    # y, si avanzó el último día con historial, todas las que cubren los días nuevos
+    desde = min(r.fecha for r in registros)
+    hasta = max(r.fecha for r in registros)
+    afectadas = set()
+    for id_producto in {r.id_producto for r in registros}:
+        afectadas.update(i for _, _, i in indice_proyecciones.arbol_producto(id_producto).solapados(desde, hasta))
+    corte = historial_demanda.fecha_fin
+    if corte_anterior is None or corte > corte_anterior:
+        inicio_nuevos = corte_anterior + timedelta(days=1) if corte_anterior else date.min
+        afectadas.update(i for _, _, i in indice_proyecciones.consultar(inicio_hasta=corte, fin_desde=inicio_nuevos))
+    conciliadas = conciliar_proyecciones(afectadas)
+    
+    return {
+        "message": f"Se registraron {total} valores de demanda",
+        "proyecciones_conciliadas": conciliadas,
+        "productos": len(historial_demanda),
+        "fecha_fin": historial_demanda.fecha_fin
+    }
+
+@app.get("/productos/{id_producto}/historial", response_model=SerieDemanda, tags=["Historial"])
+async def obtener_historial_producto(
+    id_producto: str,
+    desde: date = Query(..., description="Fecha inicial"),
+    hasta: date = Query(..., description="Fecha final"),
+    tipo_proyeccion: Optional[TipoProyeccion] = Query(None, description="Agregar por periodo (por defecto diario)")
+):
+    """Obtener la demanda real de un producto en un rango, diaria o agregada por periodo"""
+    if id_producto not in historial_demanda:
+        raise HTTPException(status_code=404, detail="No hay historial para este producto")
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="hasta debe ser posterior a desde")
+    
+    serie = historial_demanda.serie(id_producto, desde, hasta)
+    if tipo_proyeccion:
+        etiquetas, valores = HistorialDemanda.remuestrear(serie[None, :], desde, tipo_proyeccion)
+        valores = valores[0]
+    else:
+        etiquetas = [(desde + timedelta(days=i)).isoformat() for i in range(len(serie))]
+        valores = serie
     
-    return alertas
+    return SerieDemanda(
+        id_producto=id_producto,
+        desde=desde,
+        hasta=hasta,
+        tipo_proyeccion=tipo_proyeccion,
+        total=float(serie.sum()),
+        puntos=[PuntoDemanda(periodo=e, demanda=float(v)) for e, v in zip(etiquetas, valores)]
+    )
+
+@app.post("/proyecciones/conciliar", tags=["Precisión"])
+async def conciliar_todas_las_proyecciones():
+    """Conciliar todas las proyecciones con el historial almacenado (p. ej. tras cargarlo al iniciar)"""
+    return {"proyecciones_conciliadas": conciliar_proyecciones(list(proyecciones_db))}
+
+@app.get("/precision", response_model=List[MetricasPrecision], tags=["Precisión"])
+async def obtener_precision(
+    id_producto: Optional[str] = Query(None, description="Métricas de un producto; sin él, agregadas por método"),
+    metodologia: Optional[str] = Query(None, description="Filtrar por metodología")
+):
+    """Precisión móvil (MAPE, WAPE, sesgo) de los últimos periodos conciliados"""
+    return precision_movil.consultar(id_producto, metodologia)
+
+@app.post("/backtesting", response_model=ResultadoBacktesting, tags=["Precisión"])
+async def ejecutar_backtesting(solicitud: SolicitudBacktesting):
+    """Evaluar los métodos de pronóstico con origen móvil sobre el historial almacenado.
+
+    Los productos se reparten en fragmentos que se evalúan en el pool de procesos;
+    cada fragmento se arma una sola vez y evalúa todos los métodos en la misma tarea.
+    """
+    fecha_corte = solicitud.fecha_corte or historial_demanda.fecha_fin
+    if fecha_corte is None:
+        raise HTTPException(status_code=400, detail="No hay historial de demanda almacenado")
+    if min(solicitud.horizonte_dias, solicitud.origenes, solicitud.paso_dias, solicitud.dias_entrenamiento) < 1:
+        raise HTTPException(status_code=400, detail="Los parámetros del backtesting deben ser positivos")
+    
+    ids_producto = solicitud.ids_producto if solicitud.ids_producto is not None else historial_demanda.productos
+    metodologias = [m.value for m in (solicitud.metodologias or list(MetodoPronostico))]
+    dias = solicitud.dias_entrenamiento + solicitud.horizonte_dias + (solicitud.origenes - 1) * solicitud.paso_dias
+    desde = fecha_corte - timedelta(days=dias - 1)
+    
+    loop = asyncio.get_running_loop()
+    pool = trabajos.obtener_pool()
+    fragmentos = trabajos.fragmentar(len(ids_producto))
+    tareas = [
+        loop.run_in_executor(
+            pool, backtesting.evaluar,
+            historial_demanda.matriz(ids_producto[inicio:fin], desde, fecha_corte), metodologias,
+            solicitud.horizonte_dias, solicitud.origenes, solicitud.paso_dias, solicitud.dias_entrenamiento
+        )
+        for inicio, fin in fragmentos
+    ]
+    parciales = await asyncio.gather(*tareas)
+    
+    # Acumuladores por método: productos × columnas
+    por_fragmentos = np.concatenate(parciales, axis=1) if parciales else np.zeros((len(metodologias), 0, 6))
+    sumas = {metodologia: por_fragmentos[i] for i, metodologia in enumerate(metodologias)}
+    globales = {
+        clave: valores.tolist()
+        for clave, valores in backtesting.metricas(np.array([s.sum(axis=0) for s in sumas.values()])).items()
+    }
+    metodos = [
+        MetricasPrecision(
+            metodologia=metodologia,
+            mape=globales["mape"][i],
+            wape=globales["wape"][i],
+            sesgo_porcentaje=globales["sesgo_porcentaje"][i],
+            observaciones=globales["observaciones"][i]
+        )
+        for i, metodologia in enumerate(metodologias)
+    ]
+    
+    # Mejor método por producto según WAPE
+    por_metodo = {metodologia: backtesting.metricas(s) for metodologia, s in sumas.items()}
+    conteo = {}
+    if ids_producto:
+        wapes = np.vstack([por_metodo[m]["wape"] for m in metodologias])
+        mejores = np.bincount(wapes.argmin(axis=0), minlength=len(metodologias))
+        conteo = {m: int(c) for m, c in zip(metodologias, mejores) if c}
+    
+    productos = None
+    if solicitud.incluir_productos:
+        por_metodo = {m: {clave: v.tolist() for clave, v in metricas.items()} for m, metricas in por_metodo.items()}
+        productos = [
+            MetricasPrecision(
+                id_producto=id_producto,
+                metodologia=metodologia,
+                mape=por_metodo[metodologia]["mape"][fila],
+                wape=por_metodo[metodologia]["wape"][fila],
+                sesgo_porcentaje=por_metodo[metodologia]["sesgo_porcentaje"][fila],
+                observaciones=por_metodo[metodologia]["observaciones"][fila]
+            )
+            for fila, id_producto in enumerate(ids_producto)
+            for metodologia in metodologias
+        ]
+    
+    return ResultadoBacktesting(
+        fecha_corte=fecha_corte,
+        horizonte_dias=solicitud.horizonte_dias,
+        origenes=solicitud.origenes,
+        total_productos=len(ids_producto),
+        metodos=metodos,
+        mejor_metodologia=min(metodos, key=lambda m: m.wape).metodologia if ids_producto else None,
+        productos_por_mejor_metodologia=conteo,
+        productos=productos
+    )
+
+@app.post("/reposicion/sugerencias", response_model=ResultadoReposicion, tags=["Reposición"])
+async def sugerir_reposicion(solicitud: SolicitudReposicion):
+    """Calcular stock de seguridad, punto de reorden y lote económico, y sugerir órdenes de compra por proveedor.
+
+    La demanda diaria sale de la proyección activa vigente (la más reciente si hay
+    varias), la desviación del historial almacenado (Poisson si no hay historial),
+    el proveedor y el precio de la última compra y el tiempo de entrega de MS-Proveedor.
+    """
+    if not 0.5 <= solicitud.nivel_servicio < 1:
+        raise HTTPException(status_code=400, detail="nivel_servicio debe estar entre 0.5 y 1")
+    if solicitud.tasa_mantenimiento_anual < 0 or solicitud.dias_variabilidad < 2:
+        raise HTTPException(status_code=400, detail="tasa_mantenimiento_anual o dias_variabilidad fuera de rango")
+    
+    hoy = date.today()
+    filtro = set(solicitud.ids_producto) if solicitud.ids_producto is not None else None
+    vigente_por_producto = {}
+    for _, _, id_proyeccion in indice_proyecciones.arbol_estado(EstadoProyeccion.ACTIVE).vigentes(hoy):
+        proyeccion = proyecciones_db[id_proyeccion]
+        id_producto = proyeccion["id_producto"]
+        if filtro is not None and id_producto not in filtro:
+            continue
+        actual = vigente_por_producto.get(id_producto)
+        if actual is None or proyeccion["fecha_actualizacion"] > actual["fecha_actualizacion"]:
+            vigente_por_producto[id_producto] = proyeccion
+    
+    ids_producto = sorted(vigente_por_producto)
+    (stock, conocidos, origen_stock), (proveedores, _), (compras, _) = await asyncio.gather(
+        inventario.consultar_stock_disponible(ids_producto),
+        inventario.consultar_proveedores(),
+        inventario.consultar_compras(ids_producto)
+    )
+    if stock is None:
+        raise HTTPException(status_code=503, detail="No fue posible consultar el stock en MS-Bodega ni MS-Lote")
+    if proveedores is None:
+        raise HTTPException(status_code=503, detail="No fue posible consultar los proveedores en MS-Proveedor")
+    if compras is None:
+        raise HTTPException(status_code=503, detail="No fue posible consultar las compras en MS-OrdenCompra")
+    
+    # Solo se sugieren proveedores habilitados a los que ya se les compró el producto
+    habilitados = {p["id"]: p for p in proveedores if p["estado"] not in ("inactivo", "suspendido")}
+    compra_por_producto = {
+        id_producto: c for id_producto, c in compras.items() if c is not None and c["id_proveedor"] in habilitados
+    }
+    # Con los servicios caídos, los productos sin stock o compras en caché no se pueden calcular
+    sin_datos = [p for i, p in enumerate(ids_producto) if not conocidos[i] or p not in compras]
+    sin_proveedor = [
+        p for i, p in enumerate(ids_producto) if conocidos[i] and p in compras and p not in compra_por_producto
+    ]
+    seleccion = np.array(
+        [i for i, p in enumerate(ids_producto) if conocidos[i] and p in compra_por_producto], dtype=np.intp
+    )
+    ids_producto = [ids_producto[i] for i in seleccion.tolist()]
+    stock = stock[seleccion]
+    n = len(ids_producto)
+    
+    compras_sel = [compra_por_producto[p] for p in ids_producto]
+    condiciones = [habilitados[c["id_proveedor"]].get("condiciones_entrega") or {} for c in compras_sel]
+    demanda = np.fromiter((vigente_por_producto[p]["demanda_diaria"] for p in ids_producto), dtype=np.float64, count=n)
+    precio = np.fromiter((float(c["precio_unitario"]) for c in compras_sel), dtype=np.float64, count=n)
+    en_transito = np.fromiter((c["cantidad_en_transito"] for c in compras_sel), dtype=np.int64, count=n)
+    tiempo_entrega = np.fromiter((ce.get("tiempo_entrega") or 0 for ce in condiciones), dtype=np.int64, count=n)
+    cantidad_minima = np.fromiter((ce.get("cantidad_minima") or 0 for ce in condiciones), dtype=np.int64, count=n)
+    costo_pedido = np.fromiter((ce.get("costo_envio") or 0 for ce in condiciones), dtype=np.float64, count=n)
+    
+    # Desviación de la demanda diaria en los últimos días con historial; sin historial, Poisson (σ² = d)
+    desviacion = np.sqrt(demanda)
+    fin_historial = historial_demanda.fecha_fin
+    con_historial = np.array([p in historial_demanda for p in ids_producto], dtype=bool)
+    if fin_historial is not None and con_historial.any():
+        hasta = min(fin_historial, hoy - timedelta(days=1))
+        desde = max(hasta - timedelta(days=solicitud.dias_variabilidad - 1), historial_demanda.fecha_base)
+        filas = np.flatnonzero(con_historial)
+        matriz = historial_demanda.matriz([ids_producto[i] for i in filas.tolist()], desde, hasta)
+        desviacion[filas] = reposicion.desviacion_diaria(matriz)
+    
+    calculo = reposicion.calcular(
+        demanda, desviacion, tiempo_entrega, stock, en_transito, precio, costo_pedido, cantidad_minima,
+        solicitud.nivel_servicio, solicitud.tasa_mantenimiento_anual
+    )
+    cantidad = calculo["cantidad"]
+    
+    # Agrupar por proveedor los productos a reponer
+    ordenes = {}
+    for i in np.flatnonzero(cantidad).tolist():
+        compra = compras_sel[i]
+        orden = ordenes.get(compra["id_proveedor"])
+        if orden is None:
+            proveedor = habilitados[compra["id_proveedor"]]
+            orden = ordenes[compra["id_proveedor"]] = {
+                "id_proveedor": proveedor["id"],
+                "nombre_proveedor": proveedor.get("nombre"),
+                "tipo_orden": "regular",
+                "fecha_requerida": hoy + timedelta(days=int(tiempo_entrega[i])),
+                "items": [],
+                "total_estimado": 0.0
+            }
+        if calculo["urgente"][i]:
+            orden["tipo_orden"] = "urgente"
+        item_cantidad = int(cantidad[i])
+        orden["items"].append({
+            "id_producto": ids_producto[i],
+            "cantidad": item_cantidad,
+            "precio_unitario": float(precio[i])
+        })
+        orden["total_estimado"] += item_cantidad * float(precio[i])
+    for orden in ordenes.values():
+        orden["total_estimado"] = round(orden["total_estimado"], 2)
+        orden["observaciones"] = f"Reposición sugerida el {hoy.isoformat()}: {len(orden['items'])} productos en punto de reorden"
+    
+    detalle = None
+    if solicitud.incluir_detalle:
+        columnas = zip(
+            ids_producto, demanda.tolist(), desviacion.tolist(), tiempo_entrega.tolist(),
+            stock.tolist(), en_transito.tolist(), np.round(calculo["stock_seguridad"], 2).tolist(),
+            np.round(calculo["punto_reorden"], 2).tolist(), np.round(calculo["lote_economico"], 2).tolist(),
+            cantidad.tolist()
+        )
+        detalle = [
+            {
+                "id_producto": p, "id_proveedor": compra_por_producto[p]["id_proveedor"],
+                "demanda_diaria": d, "desviacion_diaria": round(s, 4), "tiempo_entrega_dias": l,
+                "stock_disponible": st, "cantidad_en_transito": t, "stock_seguridad": ss,
+                "punto_reorden": rop, "lote_economico": eoq, "cantidad_sugerida": q
+            }
+            for p, d, s, l, st, t, ss, rop, eoq, q in columnas
+        ]
+    
+    resultado = ResultadoReposicion(
+        fecha_calculo=datetime.now(),
+        nivel_servicio=solicitud.nivel_servicio,
+        productos_evaluados=n,
+        productos_a_reponer=int(np.count_nonzero(cantidad)),
+        origen_stock=origen_stock,
+        ordenes=sorted(ordenes.values(), key=lambda o: o["fecha_requerida"]),
+        sin_proveedor=sin_proveedor,
+        sin_datos=sin_datos,
+        detalle=detalle
+    )
+    return Response(content=resultado.model_dump_json(), media_type="application/json")
 
 @app.get("/estadisticas/demanda", tags=["Estadísticas"])
 async def obtener_estadisticas_demanda():
     """Obtener estadísticas generales de demanda"""
-    proyecciones_activas = [
-        p for p in proyecciones_db.values() 
-        if p["estado"] == EstadoProyeccion.ACTIVE
-    ]
+    proyecciones_activas = list(proyecciones_db.consultar(Igual("estado", EstadoProyeccion.ACTIVE)))
     
     if not proyecciones_activas:
         return {"message": "No hay proyecciones activas"}
@@ -315,6 +1119,11 @@ async def obtener_estadisticas_demanda():
         "fecha_consulta": datetime.now()
     }
 
+@app.on_event("shutdown")
+async def cerrar_conexiones():
+    await cerrar_cliente()
+    trabajos.cerrar_pool()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8004)
@@ -19,6 +19,22 @@ class EstadoProyeccion(str, Enum):
     ARCHIVED = "archivada"
 
 
+class EstadoTrabajo(str, Enum):
+    """Estados de un trabajo de pronóstico en segundo plano"""
+    PENDIENTE = "pendiente"
+    EN_EJECUCION = "en_ejecucion"
+    COMPLETADO = "completado"
+    CANCELADO = "cancelado"
+    FALLIDO = "fallido"
+
+
+class MetodoPronostico(str, Enum):
+    """Métodos estadísticos de pronóstico"""
+    MEDIA_MOVIL = "media_movil"
+    HOLT_WINTERS = "holt_winters"
+    CROSTON = "croston"  # demanda intermitente
+
+
 class ProyeccionDemandaCreate(BaseModel):
     """Modelo para crear una proyección de demanda"""
     id_producto: str
@@ -44,6 +60,15 @@ class ProyeccionDemandaUpdate(BaseModel):
     estado: Optional[EstadoProyeccion] = None
 
 
+class DetalleProyeccion(BaseModel):
+    """Detalle granular de proyección por periodo"""
+    periodo: str  # "2024-01", "2024-W1", etc.
+    demanda_estimada: int
+    demanda_real: Optional[int] = None
+    diferencia: Optional[int] = None
+    precision_porcentaje: Optional[float] = None
+
+
 class ProyeccionDemandaResponse(BaseModel):
     """Modelo de respuesta para proyección de demanda"""
     id: str
@@ -64,20 +89,13 @@ class ProyeccionDemandaResponse(BaseModel):
     demanda_diaria: float
     demanda_semanal: float
     demanda_mensual: float
+    # Detalle por periodo, con la demanda real de los periodos ya conciliados
+    detalle: Optional[List[DetalleProyeccion]] = None
 
     class Config:
         from_attributes = True
 
 
-class DetalleProyeccion(BaseModel):
-    """Detalle granular de proyección por periodo"""
-    periodo: str  # "2024-01", "2024-W1", etc.
-    demanda_estimada: int
-    demanda_real: Optional[int] = None
-    diferencia: Optional[int] = None
-    precision_porcentaje: Optional[float] = None
-
-
 class ProyeccionAgregada(BaseModel):
     """Proyección agregada por producto"""
     id_producto: str
@@ -97,3 +115,178 @@ class AlertaDemanda(BaseModel):
     diferencia: int
     criticidad: str  # "ALTA", "MEDIA", "BAJA"
     fecha_alerta: datetime
+    origen_stock: Optional[str] = None  # tiempo_real, cache, obsoleto o sin_datos
+
+
+class SolicitudPronostico(BaseModel):
+    """Solicitud de pronóstico para varios productos"""
+    # Demanda diaria por producto; el último valor es el día previo a fecha_inicio.
+    # Si se omite, se usa el historial almacenado de ids_producto (o de todos los productos).
+    historial: Optional[Dict[str, List[float]]] = None
+    ids_producto: Optional[List[str]] = None
+    dias_historial: int = 365
+    metodologia: MetodoPronostico = MetodoPronostico.HOLT_WINTERS
+    fecha_inicio: date
+    fecha_fin: date
+    tipo_proyeccion: TipoProyeccion
+    unidades: str = "unidades"
+    crear_proyecciones: bool = False
+
+
+class ResultadoPronostico(BaseModel):
+    """Pronóstico calculado para un producto"""
+    id_producto: str
+    metodologia: MetodoPronostico
+    demanda_estimada: int
+    confianza_porcentaje: float
+    detalle: List[DetalleProyeccion]
+    id_proyeccion: Optional[str] = None
+
+
+class TrabajoPronostico(BaseModel):
+    """Estado y progreso de un trabajo de pronóstico"""
+    id: str
+    estado: EstadoTrabajo
+    metodologia: MetodoPronostico
+    total_productos: int
+    productos_procesados: int
+    fragmentos_totales: int
+    fragmentos_completados: int
+    proyecciones_creadas: int
+    error: Optional[str] = None
+    fecha_creacion: datetime
+    fecha_inicio: Optional[datetime] = None
+    fecha_fin: Optional[datetime] = None
+    # Campo calculado
+    progreso_porcentaje: float
+
+
+class SolicitudBacktesting(BaseModel):
+    """Parámetros de una evaluación con origen móvil sobre el historial almacenado"""
+    ids_producto: Optional[List[str]] = None  # None = todos los productos con historial
+    metodologias: Optional[List[MetodoPronostico]] = None  # None = todos los métodos
+    fecha_corte: Optional[date] = None  # último día evaluado; por defecto el último con historial
+    horizonte_dias: int = 28
+    origenes: int = 4
+    paso_dias: int = 7
+    dias_entrenamiento: int = 365
+    incluir_productos: bool = False
+
+
+class MetricasPrecision(BaseModel):
+    """Métricas de error de un método, global o de un producto"""
+    id_producto: Optional[str] = None
+    metodologia: str
+    mape: float
+    wape: float
+    sesgo_porcentaje: float  # positivo = sobreestimación
+    observaciones: int
+
+
+class ResultadoBacktesting(BaseModel):
+    """Resultado de un backtesting"""
+    fecha_corte: date
+    horizonte_dias: int
+    origenes: int
+    total_productos: int
+    metodos: List[MetricasPrecision]
+    mejor_metodologia: Optional[str] = None  # menor WAPE global
+    productos_por_mejor_metodologia: Dict[str, int]
+    productos: Optional[List[MetricasPrecision]] = None
+
+
+class ConflictoProyeccion(BaseModel):
+    """Par de proyecciones vigentes del mismo producto y tipo con fechas solapadas"""
+    id_producto: str
+    tipo_proyeccion: TipoProyeccion
+    id_proyeccion_a: str
+    id_proyeccion_b: str
+    fecha_inicio_solape: date
+    fecha_fin_solape: date
+    dias_solapados: int
+
+
+class RegistroDemanda(BaseModel):
+    """Demanda real de un producto en un día"""
+    id_producto: str
+    fecha: date
+    cantidad: float
+
+
+class RegistroDemandaLote(BaseModel):
+    """Alta masiva de demanda real"""
+    registros: List[RegistroDemanda]
+    acumular: bool = True  # False: reemplaza el valor del día
+
+
+class PuntoDemanda(BaseModel):
+    """Demanda real de un periodo"""
+    periodo: str
+    demanda: float
+
+
+class SerieDemanda(BaseModel):
+    """Serie de demanda real de un producto"""
+    id_producto: str
+    desde: date
+    hasta: date
+    tipo_proyeccion: Optional[TipoProyeccion] = None  # None = diaria
+    total: float
+    puntos: List[PuntoDemanda]
+
+
+class SolicitudReposicion(BaseModel):
+    """Parámetros del cálculo de reposición"""
+    ids_producto: Optional[List[str]] = None  # None = todos los productos con proyección activa vigente
+    nivel_servicio: float = 0.95  # probabilidad de no quebrar stock durante el tiempo de entrega
+    tasa_mantenimiento_anual: float = 0.25  # costo anual de mantener una unidad, como fracción de su precio
+    dias_variabilidad: int = 90  # días de historial usados para la desviación de la demanda
+    incluir_detalle: bool = False
+
+
+class ReposicionProducto(BaseModel):
+    """Parámetros de reposición calculados para un producto"""
+    id_producto: str
+    id_proveedor: str
+    demanda_diaria: float
+    desviacion_diaria: float
+    tiempo_entrega_dias: int
+    stock_disponible: int
+    cantidad_en_transito: int
+    stock_seguridad: float
+    punto_reorden: float
+    lote_economico: float
+    cantidad_sugerida: int  # 0 = no requiere reposición
+
+
+class ItemOrdenSugerido(BaseModel):
+    """Item sugerido, con el formato de ItemOrdenCreate de MS-OrdenCompra"""
+    id_producto: str
+    cantidad: int
+    precio_unitario: float
+    descuento_porcentaje: float = 0
+
+
+class OrdenCompraSugerida(BaseModel):
+    """Borrador de orden para un proveedor, con los campos de OrdenCompraCreate de MS-OrdenCompra"""
+    id_proveedor: str
+    nombre_proveedor: Optional[str] = None
+    tipo_orden: str  # "regular" o "urgente"
+    fecha_requerida: date
+    observaciones: Optional[str] = None
+    direccion_entrega: Optional[str] = None
+    items: List[ItemOrdenSugerido]
+    total_estimado: float
+
+
+class ResultadoReposicion(BaseModel):
+    """Sugerencias de reposición agrupadas por proveedor"""
+    fecha_calculo: datetime
+    nivel_servicio: float
+    productos_evaluados: int
+    productos_a_reponer: int
+    origen_stock: str
+    ordenes: List[OrdenCompraSugerida]
+    sin_proveedor: List[str]  # productos sin compras previas a un proveedor habilitado
+    sin_datos: List[str] = []  # productos sin stock o compras conocidos (servicios caídos y sin caché)
+    detalle: Optional[List[ReposicionProducto]] = None
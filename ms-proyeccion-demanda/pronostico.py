@@ -0,0 +1,200 @@
+"""Motor de pronóstico de demanda vectorizado con NumPy.
+
+Todos los métodos reciben una matriz de historial (productos × días) y avanzan
+en el tiempo una sola vez, operando sobre todos los productos en cada paso.
+El costo es O(días) operaciones vectoriales, independiente del número de
+productos, lo que permite pronosticar decenas de miles de SKU en segundos.
+"""
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from models import TipoProyeccion
+
+MEDIA_MOVIL = "media_movil"
+HOLT_WINTERS = "holt_winters"
+CROSTON = "croston"
+
+# Ventana (días) usada para estimar la confianza a partir del error de ajuste
+VENTANA_CONFIANZA = 28
+
+
+def media_movil(historial: np.ndarray, horizonte: int, ventana: int = 28) -> Tuple[np.ndarray, np.ndarray]:
+    """Promedio de los últimos `ventana` días, proyectado plano"""
+    n, dias = historial.shape
+    ventana = max(1, min(ventana, dias))
+    acumulado = np.zeros((n, dias + 1))
+    np.cumsum(historial, axis=1, out=acumulado[:, 1:])
+
+    # Ajuste a un paso: promedio de los `ventana` días previos a cada día
+    ajuste = np.full((n, dias), np.nan)
+    if dias > ventana:
+        ajuste[:, ventana:] = (acumulado[:, ventana:dias] - acumulado[:, :dias - ventana]) / ventana
+
+    nivel = (acumulado[:, dias] - acumulado[:, dias - ventana]) / ventana
+    return np.repeat(nivel[:, None], horizonte, axis=1), ajuste
+
+
+def holt_winters(
+    historial: np.ndarray,
+    horizonte: int,
+    temporada: int = 7,
+    alfa: float = 0.3,
+    beta: float = 0.05,
+    gamma: float = 0.1,
+    amortiguamiento: float = 0.9
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Holt-Winters aditivo con tendencia amortiguada y estacionalidad semanal por defecto.
+
+    La amortiguación evita que una tendencia ruidosa se extrapole sin límite en
+    horizontes largos (trimestrales o anuales).
+    """
+    n, dias = historial.shape
+    temporada = max(1, min(temporada, dias))
+
+    nivel = historial[:, :temporada].mean(axis=1)
+    if dias >= 2 * temporada:
+        tendencia = (historial[:, temporada:2 * temporada].mean(axis=1) - nivel) / temporada
+    else:
+        tendencia = np.zeros(n)
+    estacional = historial[:, :temporada] - nivel[:, None]
+
+    ajuste = np.empty((n, dias))
+    for t in range(dias):
+        indice = t % temporada
+        componente = estacional[:, indice]
+        tendencia_amortiguada = amortiguamiento * tendencia
+        ajuste[:, t] = nivel + tendencia_amortiguada + componente
+        observado = historial[:, t]
+        nivel_nuevo = alfa * (observado - componente) + (1 - alfa) * (nivel + tendencia_amortiguada)
+        tendencia = beta * (nivel_nuevo - nivel) + (1 - beta) * tendencia_amortiguada
+        estacional[:, indice] = gamma * (observado - nivel_nuevo) + (1 - gamma) * componente
+        nivel = nivel_nuevo
+    # La primera temporada es la que inicializa los componentes: su ajuste no es un pronóstico
+    ajuste[:, :temporada] = np.nan
+
+    pasos = np.arange(1, horizonte + 1)
+    indices = (dias + pasos - 1) % temporada
+    factores = np.cumsum(amortiguamiento ** pasos)  # phi + phi^2 + ... + phi^h
+    pronostico = nivel[:, None] + tendencia[:, None] * factores[None, :] + estacional[:, indices]
+    return np.clip(pronostico, 0, None), ajuste
+
+
+def croston(historial: np.ndarray, horizonte: int, alfa: float = 0.1) -> Tuple[np.ndarray, np.ndarray]:
+    """Croston para demanda intermitente: suaviza por separado tamaño e intervalo de la demanda"""
+    n, dias = historial.shape
+    con_demanda = historial > 0
+    tiene = con_demanda.any(axis=1)
+
+    # Inicialización con la primera demanda de cada producto: tamaño y días hasta ella
+    primera = np.full(n, dias)
+    tamano = np.zeros(n)
+    if tiene.any():
+        primera[tiene] = con_demanda[tiene].argmax(axis=1)
+        tamano[tiene] = historial[tiene, primera[tiene]]
+    intervalo = np.where(tiene, primera + 1, 1).astype(np.float64)
+    desde_ultima = np.ones(n)
+
+    # Hasta la primera demanda inclusive no hay estimación previa (calentamiento)
+    ajuste = np.full((n, dias), np.nan)
+    for t in range(dias):
+        activo = t > primera
+        ajuste[:, t] = np.where(activo, tamano / intervalo, np.nan)
+        hay = con_demanda[:, t] & activo
+        tamano = np.where(hay, alfa * historial[:, t] + (1 - alfa) * tamano, tamano)
+        intervalo = np.where(hay, alfa * desde_ultima + (1 - alfa) * intervalo, intervalo)
+        desde_ultima = np.where(activo, np.where(hay, 1, desde_ultima + 1), desde_ultima)
+
+    tasa = tamano / intervalo
+    return np.repeat(tasa[:, None], horizonte, axis=1), ajuste
+
+
+METODOS = {
+    MEDIA_MOVIL: media_movil,
+    HOLT_WINTERS: holt_winters,
+    CROSTON: croston,
+}
+
+
+def confianza(historial: np.ndarray, ajuste: np.ndarray, ventana: int = VENTANA_CONFIANZA) -> np.ndarray:
+    """Confianza (%) = 100 - WAPE del ajuste a un paso en los últimos días.
+
+    Los días de calentamiento de cada método (ajuste NaN) no cuentan; sin días
+    válidos o sin demanda en ellos la confianza es 0 para todos los métodos.
+    """
+    reales = historial[:, -ventana:]
+    estimados = ajuste[:, -ventana:]
+    validos = ~np.isnan(estimados)
+    error = np.where(validos, np.abs(reales - np.nan_to_num(estimados)), 0).sum(axis=1)
+    volumen = np.where(validos, reales, 0).sum(axis=1)
+    wape = np.divide(error, volumen, out=np.ones_like(error), where=volumen > 0)
+    return np.where(validos.any(axis=1), np.clip(100 * (1 - wape), 0, 100), 0.0)
+
+
+def limites_periodos(fecha_inicio: date, dias: int, tipo_proyeccion: TipoProyeccion) -> Tuple[List[str], np.ndarray]:
+    """Etiquetas e índices de inicio de cada periodo calendario dentro del horizonte"""
+    etiquetas: List[str] = []
+    inicios: List[int] = []
+    for desplazamiento in range(dias):
+        dia = fecha_inicio + timedelta(days=desplazamiento)
+        etiqueta = etiqueta_periodo(dia, tipo_proyeccion)
+        if not etiquetas or etiquetas[-1] != etiqueta:
+            etiquetas.append(etiqueta)
+            inicios.append(desplazamiento)
+    return etiquetas, np.array(inicios, dtype=np.intp)
+
+
+def etiqueta_periodo(dia: date, tipo_proyeccion: TipoProyeccion) -> str:
+    """Etiqueta de periodo calendario: 2024-W1, 2024-01, 2024-Q1 o 2024"""
+    if tipo_proyeccion == TipoProyeccion.SEMANAL:
+        anio, semana, _ = dia.isocalendar()
+        return f"{anio}-W{semana}"
+    if tipo_proyeccion == TipoProyeccion.MENSUAL:
+        return f"{dia.year}-{dia.month:02d}"
+    if tipo_proyeccion == TipoProyeccion.TRIMESTRAL:
+        return f"{dia.year}-Q{(dia.month - 1) // 3 + 1}"
+    return str(dia.year)
+
+
+def pronosticar(
+    historial: np.ndarray,
+    metodologia: str,
+    fecha_inicio: date,
+    fecha_fin: date,
+    tipo_proyeccion: TipoProyeccion
+) -> Dict[str, np.ndarray]:
+    """Pronosticar [fecha_inicio, fecha_fin] para todos los productos del historial.
+
+    Devuelve la demanda diaria pronosticada, la demanda por periodo calendario
+    (con sus etiquetas), la demanda total y la confianza de cada producto.
+    """
+    horizonte = (fecha_fin - fecha_inicio).days + 1
+    historial = np.asarray(historial, dtype=np.float64)
+    diario, ajuste = METODOS[metodologia](historial, horizonte)
+
+    etiquetas, inicios = limites_periodos(fecha_inicio, horizonte, tipo_proyeccion)
+    por_periodo = np.rint(np.add.reduceat(diario, inicios, axis=1)).astype(np.int64)
+
+    return {
+        "diario": diario,
+        "etiquetas": etiquetas,
+        "por_periodo": por_periodo,
+        "total": por_periodo.sum(axis=1),
+        "confianza": np.round(confianza(historial, ajuste), 2),
+    }
+
+
+def matriz_historial(series: Dict[str, List[float]]) -> Tuple[List[str], np.ndarray]:
+    """Convertir series de distinta longitud en una matriz alineada al último día.
+
+    Las series más cortas se completan con ceros al inicio (sin demanda registrada).
+    """
+    ids = list(series)
+    dias = max((len(valores) for valores in series.values()), default=0)
+    matriz = np.zeros((len(ids), dias))
+    for fila, id_producto in enumerate(ids):
+        valores = series[id_producto]
+        if valores:
+            matriz[fila, dias - len(valores):] = valores
+    return ids, matriz
@@ -0,0 +1,77 @@
+"""Cálculo de reposición: stock de seguridad, punto de reorden y lote económico.
+
+Todos los productos se evalúan en una sola pasada con arreglos de NumPy:
+
+- stock de seguridad  SS  = z · σ · √L
+- punto de reorden    ROP = d · L + SS
+- lote económico      EOQ = √(2 · D · S / H)
+
+donde d y σ son la demanda diaria y su desviación, L el tiempo de entrega del
+proveedor en días, D la demanda anual, S el costo de emitir un pedido (el
+costo de envío del proveedor) y H el costo anual de mantener una unidad
+(precio × tasa de mantenimiento). Se repone cuando la posición de inventario
+(disponible + en tránsito) está en el punto de reorden o por debajo.
+"""
+from statistics import NormalDist
+from typing import Dict
+
+import numpy as np
+
+DIAS_ANIO = 365
+# Sin precio conocido el lote económico no está acotado: se cubre un mes de demanda
+DIAS_COBERTURA_SIN_COSTO = 30
+
+
+def factor_servicio(nivel_servicio: float) -> float:
+    """z de la normal estándar: probabilidad de no quebrar stock durante el tiempo de entrega"""
+    return NormalDist().inv_cdf(nivel_servicio)
+
+
+def desviacion_diaria(historial: np.ndarray) -> np.ndarray:
+    """Desviación estándar muestral de la demanda diaria de cada fila"""
+    if historial.shape[1] < 2:
+        return np.zeros(historial.shape[0])
+    return historial.astype(np.float64).std(axis=1, ddof=1)
+
+
+def calcular(
+    demanda_diaria: np.ndarray,
+    desviacion: np.ndarray,
+    tiempo_entrega: np.ndarray,
+    disponible: np.ndarray,
+    en_transito: np.ndarray,
+    precio: np.ndarray,
+    costo_pedido: np.ndarray,
+    cantidad_minima: np.ndarray,
+    nivel_servicio: float,
+    tasa_mantenimiento: float
+) -> Dict[str, np.ndarray]:
+    """Parámetros de reposición y cantidad a pedir de cada producto (0 si no requiere reposición)"""
+    demanda = np.asarray(demanda_diaria, dtype=np.float64)
+    plazo = np.maximum(np.asarray(tiempo_entrega, dtype=np.float64), 0)
+
+    stock_seguridad = factor_servicio(nivel_servicio) * np.asarray(desviacion, dtype=np.float64) * np.sqrt(plazo)
+    demanda_plazo = demanda * plazo
+    punto_reorden = demanda_plazo + stock_seguridad
+
+    mantenimiento = np.asarray(precio, dtype=np.float64) * tasa_mantenimiento
+    con_costo = mantenimiento > 0
+    lote_economico = np.sqrt(np.divide(
+        2 * demanda * DIAS_ANIO * np.asarray(costo_pedido, dtype=np.float64), mantenimiento,
+        out=np.zeros_like(demanda), where=con_costo
+    ))
+    lote_economico = np.where(con_costo, lote_economico, demanda * DIAS_COBERTURA_SIN_COSTO)
+
+    posicion = np.asarray(disponible, dtype=np.float64) + np.asarray(en_transito, dtype=np.float64)
+    reponer = (demanda > 0) & (posicion <= punto_reorden)
+    # Se pide el lote económico, o lo necesario para volver al punto de reorden si es mayor
+    cantidad = np.ceil(np.maximum(np.maximum(lote_economico, punto_reorden - posicion), cantidad_minima))
+
+    return {
+        "stock_seguridad": stock_seguridad,
+        "punto_reorden": punto_reorden,
+        "lote_economico": lote_economico,
+        "cantidad": np.where(reponer, cantidad, 0).astype(np.int64),
+        # Con la posición actual el stock se agota antes de que llegue el pedido
+        "urgente": reponer & (posicion < demanda_plazo),
+    }
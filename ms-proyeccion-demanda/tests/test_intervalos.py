@@ -0,0 +1,136 @@
+"""Árbol de intervalos: consultas contra fuerza bruta tras altas, lotes y bajas"""
+import random
+from datetime import date, timedelta
+from itertools import combinations
+
+import pytest
+
+from intervalos import ArbolIntervalos, IndiceProyecciones, solapamientos
+
+BASE = date(2026, 1, 1)
+
+
+def intervalo_aleatorio(azar: random.Random, id_intervalo: str):
+    inicio = BASE + timedelta(days=azar.randrange(365))
+    return inicio, inicio + timedelta(days=azar.choice([0, 1, 7, 30, 90, 400])), id_intervalo
+
+
+def lote_aleatorio(azar: random.Random, prefijo: str, cantidad: int):
+    return [intervalo_aleatorio(azar, f"{prefijo}{i}") for i in range(cantidad)]
+
+
+def comprobar(arbol: ArbolIntervalos, esperado: dict, azar: random.Random):
+    """Comparar consultar, solapados, vigentes y solapamientos con un recorrido de todos los intervalos"""
+    todos = sorted(((inicio, fin, id_intervalo) for id_intervalo, (inicio, fin) in esperado.items()),
+                   key=lambda i: (i[0], i[2]))
+    assert list(arbol.consultar()) == todos
+    assert len(arbol) == len(esperado)
+    assert all(id_intervalo in arbol for id_intervalo in esperado)
+
+    for _ in range(30):
+        desde = BASE + timedelta(days=azar.randrange(-30, 420))
+        hasta = desde + timedelta(days=azar.choice([0, 3, 45, 200]))
+        fin_desde = BASE + timedelta(days=azar.randrange(-30, 800))
+        assert list(arbol.consultar(desde, hasta, fin_desde)) == [
+            i for i in todos if desde <= i[0] <= hasta and i[1] >= fin_desde
+        ]
+        assert list(arbol.solapados(desde, hasta)) == [i for i in todos if i[0] <= hasta and i[1] >= desde]
+        assert list(arbol.vigentes(desde)) == [i for i in todos if i[0] <= desde <= i[1]]
+
+    pares = {frozenset((a[2], b[2])) for a, b in solapamientos(arbol.consultar())}
+    assert pares == {frozenset((a[2], b[2])) for a, b in combinations(todos, 2) if max(a[0], b[0]) <= min(a[1], b[1])}
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_altas_lotes_y_bajas_coinciden_con_fuerza_bruta(semilla):
+    azar = random.Random(semilla)
+    arbol = ArbolIntervalos()
+    esperado = {}
+
+    def insertar_lote(intervalos):
+        arbol.insertar_lote(intervalos)
+        esperado.update((i[2], i[:2]) for i in intervalos)
+
+    # Altas sueltas, incluida la reinserción de un id existente con otras fechas
+    for intervalo in lote_aleatorio(azar, "s", 40) + [intervalo_aleatorio(azar, "s3")]:
+        arbol.insertar(intervalo[2], intervalo[0], intervalo[1])
+        esperado[intervalo[2]] = intervalo[:2]
+    comprobar(arbol, esperado, azar)
+
+    # Lote chico: se inserta de a uno
+    insertar_lote(lote_aleatorio(azar, "c", 20))
+    comprobar(arbol, esperado, azar)
+
+    # Lote de 64 o más intervalos nuevos: se reconstruye el árbol
+    insertar_lote(lote_aleatorio(azar, "g", 150))
+    comprobar(arbol, esperado, azar)
+
+    # Lote grande con ids existentes: vuelve a la inserción de a uno
+    insertar_lote(lote_aleatorio(azar, "g", 10) + lote_aleatorio(azar, "m", 70))
+    comprobar(arbol, esperado, azar)
+
+    for id_intervalo in azar.sample(sorted(esperado), 120):
+        arbol.eliminar(id_intervalo)
+        del esperado[id_intervalo]
+    comprobar(arbol, esperado, azar)
+
+    # Reconstrucción después de bajas
+    insertar_lote(lote_aleatorio(azar, "r", 100))
+    comprobar(arbol, esperado, azar)
+
+
+def test_lote_chico_frente_a_un_arbol_grande_no_reconstruye():
+    azar = random.Random(7)
+    arbol = ArbolIntervalos()
+    base = lote_aleatorio(azar, "b", 700)
+    arbol.insertar_lote(base)
+    esperado = {i[2]: i[:2] for i in base}
+    # 64 nuevos × 8 < 700 existentes: se insertan de a uno
+    nuevos = lote_aleatorio(azar, "n", 64)
+    arbol.insertar_lote(nuevos)
+    esperado.update((i[2], i[:2]) for i in nuevos)
+    comprobar(arbol, esperado, azar)
+
+
+def test_con_lote_no_modifica_el_arbol_original():
+    azar = random.Random(11)
+    arbol = ArbolIntervalos()
+    base = lote_aleatorio(azar, "b", 80)
+    arbol.insertar_lote(base)
+    version = arbol.version
+
+    lote = lote_aleatorio(azar, "b", 5) + lote_aleatorio(azar, "n", 90)
+    nuevo = arbol.con_lote(lote)
+
+    assert arbol.version == version
+    comprobar(arbol, {i[2]: i[:2] for i in base}, azar)
+    esperado = {i[2]: i[:2] for i in base}
+    esperado.update((i[2], i[:2]) for i in lote)
+    comprobar(nuevo, esperado, azar)
+
+
+def proyeccion(id_proyeccion: str, id_producto: str, estado: str, intervalo) -> dict:
+    inicio, fin, _ = intervalo
+    return {"id": id_proyeccion, "id_producto": id_producto, "estado": estado, "fecha_inicio": inicio, "fecha_fin": fin}
+
+
+def test_aplicar_lote_conserva_cambios_hechos_mientras_se_preparaba():
+    azar = random.Random(3)
+    indice = IndiceProyecciones()
+    iniciales = [proyeccion(f"i{n}", f"p{n % 3}", "activa", intervalo_aleatorio(azar, "")) for n in range(30)]
+    indice.agregar_lote(iniciales)
+
+    lote = [proyeccion(f"n{n}", f"p{n % 4}", "activa", intervalo_aleatorio(azar, "")) for n in range(100)]
+    preparados = indice.preparar_lote(lote)
+
+    # Cambios concurrentes: una baja en un árbol que se reemplaza y un árbol creado entretanto
+    indice.quitar(iniciales[0])
+    tardia = proyeccion("t", "p3", "activa", intervalo_aleatorio(azar, ""))
+    indice.agregar(tardia)
+    indice.aplicar_lote(preparados)
+
+    vigentes = iniciales[1:] + lote + [tardia]
+    for clave, arbol in indice.por_producto.items():
+        comprobar(arbol, {p["id"]: (p["fecha_inicio"], p["fecha_fin"]) for p in vigentes if p["id_producto"] == clave}, azar)
+    comprobar(indice.arbol_estado("activa"), {p["id"]: (p["fecha_inicio"], p["fecha_fin"]) for p in vigentes}, azar)
+    assert sorted(indice.por_producto) == ["p0", "p1", "p2", "p3"]
@@ -0,0 +1,115 @@
+"""Ejecución de pronósticos masivos en un pool de procesos.
+
+El cálculo es intensivo en CPU: si corriera en el event loop bloquearía al
+resto de los endpoints. Los productos se dividen en fragmentos que se
+reparten entre procesos trabajadores (uno por núcleo); el event loop solo
+prepara cada fragmento, espera sus arreglos y actualiza el progreso.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+import pronostico
+
+PROCESOS = int(os.getenv("TRABAJOS_PROCESOS", "0")) or os.cpu_count() or 1
+TAMANO_FRAGMENTO = int(os.getenv("TRABAJOS_TAMANO_FRAGMENTO", "2000"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def obtener_pool() -> ProcessPoolExecutor:
+    """Pool de procesos compartido, creado al primer uso"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PROCESOS)
+    return _pool
+
+
+def cerrar_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def fragmentar(total: int, tamano: int = TAMANO_FRAGMENTO) -> List[Tuple[int, int]]:
+    """Rangos [inicio, fin) de productos; al menos un fragmento por proceso si hay suficientes productos"""
+    tamano = max(1, min(tamano, -(-total // PROCESOS)))
+    return [(inicio, min(inicio + tamano, total)) for inicio in range(0, total, tamano)]
+
+
+def pronosticar_fragmento(
+    historial: np.ndarray,
+    metodologia: str,
+    fecha_inicio: date,
+    fecha_fin: date,
+    tipo_proyeccion
+) -> dict:
+    """Se ejecuta en un proceso trabajador"""
+    calculo = pronostico.pronosticar(historial, metodologia, fecha_inicio, fecha_fin, tipo_proyeccion)
+    # Solo se devuelve lo que usa el proceso principal, para reducir la serialización entre procesos
+    return {
+        "etiquetas": calculo["etiquetas"],
+        "por_periodo": calculo["por_periodo"],
+        "total": calculo["total"],
+        "confianza": calculo["confianza"],
+    }
+
+
+def unir_fragmentos(calculos: List[dict]) -> dict:
+    """Unir en orden los resultados de pronosticar_fragmento en un solo cálculo"""
+    if not calculos:
+        return {
+            "etiquetas": [],
+            "por_periodo": np.zeros((0, 0), dtype=np.int64),
+            "total": np.zeros(0, dtype=np.int64),
+            "confianza": np.zeros(0),
+        }
+    return {
+        "etiquetas": calculos[0]["etiquetas"],
+        "por_periodo": np.concatenate([calculo["por_periodo"] for calculo in calculos]),
+        "total": np.concatenate([calculo["total"] for calculo in calculos]),
+        "confianza": np.concatenate([calculo["confianza"] for calculo in calculos]),
+    }
+
+
+async def ejecutar_fragmentos(
+    fragmentos: List[Tuple[int, int]],
+    preparar: Callable[[int, int], tuple],
+    al_completar: Callable[[int, int, dict], None]
+):
+    """Ejecutar los fragmentos en el pool, con a lo sumo dos en cola por proceso.
+
+    `preparar(inicio, fin)` devuelve los argumentos de pronosticar_fragmento y
+    `al_completar(inicio, fin, resultado)` se invoca en el event loop a medida
+    que terminan. Si la tarea se cancela, los fragmentos pendientes se descartan.
+    """
+    loop = asyncio.get_running_loop()
+    pool = obtener_pool()
+    limite = asyncio.Semaphore(2 * PROCESOS)
+    pendientes = set()
+
+    async def ejecutar(inicio: int, fin: int):
+        try:
+            resultado = await loop.run_in_executor(pool, pronosticar_fragmento, *preparar(inicio, fin))
+            al_completar(inicio, fin, resultado)
+        finally:
+            limite.release()
+
+    try:
+        for inicio, fin in fragmentos:
+            await limite.acquire()
+            # Un fragmento fallido detiene el trabajo sin esperar al resto
+            for terminada in [t for t in pendientes if t.done()]:
+                pendientes.discard(terminada)
+                terminada.result()
+            pendientes.add(asyncio.ensure_future(ejecutar(inicio, fin)))
+        await asyncio.gather(*pendientes)
+    except BaseException:
+        for tarea in pendientes:
+            tarea.cancel()
+        raise
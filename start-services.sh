@@ -16,6 +16,9 @@ run_service() {
     cd ..
 }
 
+# Los servicios importan el paquete compartido comun desde la raíz del repositorio
+export PYTHONPATH="$(pwd)${PYTHONPATH:+:$PYTHONPATH}"
+
 # Crear archivo para almacenar PIDs
 echo "# PIDs de microservicios" > services.pid
 